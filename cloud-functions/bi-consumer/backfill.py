@@ -0,0 +1,318 @@
+"""
+Backfill planning and checkpoints for the BI Consumer
+Re-reads a fixed range of the CDC topics into BigQuery, resumably
+
+The live consumer only moves forward from its group's committed offsets. A
+backfill reads a closed range instead: for every partition of the chosen
+topics, from a start (earliest, an offset, or the first message at or after
+a timestamp) up to an end (the log end when it is planned, an offset, or
+the first message at or after a timestamp). Partitions are assigned to the
+backfill's readers directly, never through the consumer group, so the live
+group's membership and committed offsets are untouched. Debezium's initial
+snapshot reads (op "r") go through the same transform as any other change.
+
+Ranges are resolved once, when a backfill is first planned, and saved with
+its progress in a checkpoint file. Running it again under the same name
+resumes from the saved positions, which (like committed offsets) never pass
+a row that is not yet durable in BigQuery.
+
+Request parameters:
+
+    topics        list (or comma-separated) of topic names, required
+    start_offset  "earliest" (default) or an offset applied to every partition
+    start_time    ISO-8601 text or epoch milliseconds, instead of start_offset
+    end_offset    "latest" (default) or an offset, exclusive
+    end_time      ISO-8601 text or epoch milliseconds, exclusive, instead of end_offset
+    name          checkpoint name; defaults to a hash of the other parameters
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from offsets import Partition, partition_key
+
+EARLIEST = 'earliest'
+LATEST = 'latest'
+
+# [start, end) offsets of a partition
+Range = Tuple[int, int]
+
+_NAME_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,128}$')
+
+
+def parse_partition_key(key: str) -> Partition:
+    """Inverse of offsets.partition_key"""
+    topic, partition = key.rsplit('-', 1)
+    return topic, int(partition)
+
+
+def parse_time_ms(value: Any) -> int:
+    """Epoch milliseconds from epoch milliseconds or ISO-8601 text (naive times are UTC)"""
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid backfill timestamp: {value!r}")
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    if text.isdigit():
+        return int(text)
+    try:
+        parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Invalid backfill timestamp: {value!r}") from None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def _offset(value: Any, default: str, what: str) -> Union[int, str]:
+    if value is None or value == '':
+        return default
+    if value == default:
+        return value
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    raise ValueError(f"Backfill {what} must be '{default}' or a non-negative offset, got {value!r}")
+
+
+class BackfillRequest:
+    """What to backfill: topics, and where to start and stop in each of their partitions"""
+
+    __slots__ = ('topics', 'start_offset', 'end_offset', 'start_time_ms', 'end_time_ms', 'name')
+
+    def __init__(self, topics: Iterable[str], start_offset: Union[int, str] = EARLIEST,
+                 end_offset: Union[int, str] = LATEST, start_time_ms: Optional[int] = None,
+                 end_time_ms: Optional[int] = None, name: Optional[str] = None):
+        self.topics = sorted(set(topics))
+        if not self.topics:
+            raise ValueError("Backfill needs at least one topic")
+        if start_time_ms is not None and start_offset != EARLIEST:
+            raise ValueError("Backfill takes start_offset or start_time, not both")
+        if end_time_ms is not None and end_offset != LATEST:
+            raise ValueError("Backfill takes end_offset or end_time, not both")
+        if start_time_ms is not None and end_time_ms is not None and end_time_ms <= start_time_ms:
+            raise ValueError("Backfill end_time must be after start_time")
+        if isinstance(start_offset, int) and isinstance(end_offset, int) and end_offset <= start_offset:
+            raise ValueError("Backfill end_offset must be after start_offset")
+        self.start_offset = start_offset
+        self.end_offset = end_offset
+        self.start_time_ms = start_time_ms
+        self.end_time_ms = end_time_ms
+        if name is None:
+            digest = hashlib.sha1(json.dumps(self.to_dict(), sort_keys=True).encode('utf-8')).hexdigest()
+            name = f"backfill-{digest[:12]}"
+        if not _NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid backfill name: {name!r}")
+        self.name = name
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'topics': self.topics,
+            'start_offset': self.start_offset,
+            'end_offset': self.end_offset,
+            'start_time_ms': self.start_time_ms,
+            'end_time_ms': self.end_time_ms,
+        }
+
+
+def parse_backfill_request(params: Dict[str, Any]) -> BackfillRequest:
+    """A BackfillRequest from request parameters (JSON body or query string)"""
+    unknown = sorted(set(params) - {'topics', 'start_offset', 'end_offset', 'start_time', 'end_time', 'name'})
+    if unknown:
+        raise ValueError(f"Backfill request has unknown parameters: {unknown}")
+    topics = params.get('topics') or []
+    if isinstance(topics, str):
+        topics = [topic.strip() for topic in topics.split(',') if topic.strip()]
+    if not isinstance(topics, list) or not all(isinstance(topic, str) and topic for topic in topics):
+        raise ValueError("Backfill topics must be a list of topic names")
+    start_time = params.get('start_time')
+    end_time = params.get('end_time')
+    return BackfillRequest(
+        topics,
+        start_offset=_offset(params.get('start_offset'), EARLIEST, 'start_offset'),
+        end_offset=_offset(params.get('end_offset'), LATEST, 'end_offset'),
+        start_time_ms=parse_time_ms(start_time) if start_time not in (None, '') else None,
+        end_time_ms=parse_time_ms(end_time) if end_time not in (None, '') else None,
+        name=params.get('name') or None
+    )
+
+
+def _bound(consumer: Any, partitions: List[Any], offset: Union[int, str], time_ms: Optional[int],
+           default: Dict[Any, int], log_end: Dict[Any, int]) -> Dict[Any, int]:
+    if time_ms is not None:
+        found = consumer.offsets_for_times({tp: time_ms for tp in partitions})
+        # No message at or after the timestamp: the bound is the end of the log
+        return {tp: found[tp].offset if found.get(tp) is not None else log_end[tp] for tp in partitions}
+    if isinstance(offset, int):
+        return {tp: offset for tp in partitions}
+    return default
+
+
+def resolve_ranges(consumer: Any, request: BackfillRequest,
+                   topic_partition: Callable[[str, int], Any]) -> Dict[Partition, Range]:
+    """Offset range of every partition of the request's topics, clamped to what the log still holds"""
+    partitions = []
+    for topic in request.topics:
+        ids = consumer.partitions_for_topic(topic)
+        if not ids:
+            raise ValueError(f"Unknown backfill topic: {topic}")
+        partitions.extend(topic_partition(topic, partition) for partition in sorted(ids))
+
+    log_start = consumer.beginning_offsets(partitions)
+    log_end = consumer.end_offsets(partitions)
+    starts = _bound(consumer, partitions, request.start_offset, request.start_time_ms, log_start, log_end)
+    ends = _bound(consumer, partitions, request.end_offset, request.end_time_ms, log_end, log_end)
+
+    ranges = {}
+    for tp in partitions:
+        start = min(max(starts[tp], log_start[tp]), log_end[tp])
+        ranges[(tp.topic, tp.partition)] = (start, min(max(ends[tp], start), log_end[tp]))
+    return ranges
+
+
+def split_ranges(ranges: Dict[Partition, Range], workers: int) -> List[Dict[Partition, Range]]:
+    """Spread partitions over at most `workers` readers, largest ranges first onto the least loaded"""
+    pending = {partition: bounds for partition, bounds in ranges.items() if bounds[0] < bounds[1]}
+    shares: List[Dict[Partition, Range]] = [{} for _ in range(min(max(1, workers), len(pending)))]
+    loads = [0] * len(shares)
+    for partition, (start, end) in sorted(pending.items(), key=lambda item: (item[1][0] - item[1][1], item[0])):
+        reader = loads.index(min(loads))
+        shares[reader][partition] = (start, end)
+        loads[reader] += end - start
+    return shares
+
+
+class BackfillCheckpoint:
+    """A backfill's parameters, ranges and resume positions, saved atomically as one JSON file"""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self.request: Optional[Dict[str, Any]] = None
+        self.ranges: Dict[Partition, Range] = {}
+        self.positions: Dict[Partition, int] = {}
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def load(self) -> bool:
+        """Read a saved checkpoint; False when there is none yet"""
+        try:
+            with open(self._path, 'r', encoding='utf-8') as saved:
+                state = json.load(saved)
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            raise ValueError(f"Backfill checkpoint {self._path} is not valid JSON: {e}") from None
+        with self._lock:
+            self.request = state['request']
+            self.ranges = {parse_partition_key(key): (start, end) for key, (start, end) in state['ranges'].items()}
+            self.positions = {parse_partition_key(key): position for key, position in state['positions'].items()}
+        return True
+
+    def start(self, request: BackfillRequest, ranges: Dict[Partition, Range]) -> None:
+        """Record a newly planned backfill"""
+        with self._lock:
+            self.request = request.to_dict()
+            self.ranges = dict(ranges)
+            self.positions = {partition: start for partition, (start, _) in ranges.items()}
+            self._write()
+
+    def save(self, positions: Dict[Partition, int]) -> None:
+        """Move partitions forward to positions whose rows are durable"""
+        with self._lock:
+            for partition, position in positions.items():
+                if partition in self.ranges and position > self.positions.get(partition, -1):
+                    self.positions[partition] = min(position, self.ranges[partition][1])
+            self._write()
+
+    def remaining(self) -> Dict[Partition, Range]:
+        """What is left of each partition's range"""
+        with self._lock:
+            return {partition: (max(start, self.positions.get(partition, start)), end)
+                    for partition, (start, end) in self.ranges.items()
+                    if self.positions.get(partition, start) < end}
+
+    @property
+    def complete(self) -> bool:
+        return not self.remaining()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        remaining = self.remaining()
+        with self._lock:
+            return {
+                'partitions': len(self.ranges),
+                'partitions_done': len(self.ranges) - len(remaining),
+                'offsets_total': sum(end - start for start, end in self.ranges.values()),
+                'offsets_remaining': sum(end - start for start, end in remaining.values()),
+            }
+
+    def _write(self) -> None:
+        state = {
+            'request': self.request,
+            'ranges': {partition_key(p): list(bounds) for p, bounds in sorted(self.ranges.items())},
+            'positions': {partition_key(p): position for p, position in sorted(self.positions.items())},
+            'updated_at': datetime.utcnow().isoformat(),
+        }
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self._path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as staged:
+            json.dump(state, staged)
+            staged.flush()
+            os.fsync(staged.fileno())
+        os.replace(temporary, self._path)
+
+
+class BackfillAssignment:
+    """One reader's share of a backfill: where each partition starts and ends, and which are done"""
+
+    def __init__(self, ranges: Dict[Partition, Range], checkpoint: BackfillCheckpoint):
+        self.ranges = dict(ranges)
+        self.checkpoint = checkpoint
+        self._open = {partition for partition, (start, end) in self.ranges.items() if start < end}
+        self._finished: List[Partition] = []
+
+    @property
+    def done(self) -> bool:
+        return not self._open
+
+    @property
+    def open_partitions(self) -> List[Partition]:
+        return sorted(self._open)
+
+    def trim(self, messages: List[Any]) -> List[Any]:
+        """One partition's messages that fall inside its range (the rest belong to the live consumer)"""
+        partition = (messages[0].topic, messages[0].partition)
+        end = self.ranges[partition][1]
+        if messages[-1].offset + 1 >= end:
+            self._finish(partition)
+        if messages[-1].offset < end:
+            return messages
+        return [message for message in messages if message.offset < end]
+
+    def reached(self, partition: Partition, position: int) -> bool:
+        """Whether a partition's read position has passed its end (e.g. over a trailing gap in the log)"""
+        if position >= self.ranges[partition][1]:
+            self._finish(partition)
+            return True
+        return False
+
+    def take_finished(self) -> List[Partition]:
+        """Partitions finished since the last call, to stop fetching them"""
+        finished, self._finished = self._finished, []
+        return finished
+
+    def _finish(self, partition: Partition) -> None:
+        if partition in self._open:
+            self._open.discard(partition)
+            self._finished.append(partition)
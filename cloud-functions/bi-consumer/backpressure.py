@@ -0,0 +1,96 @@
+"""
+Memory budget for the BI Consumer
+Bounds the bytes held by fetched records and unwritten batches
+
+Rows are built faster than a slow BigQuery accepts them, and every row
+waiting in a batch, the insert queue or a poll result costs memory. One
+budget per instance, shared by all consumer workers, counts those bytes
+(estimated JSON size, like the batcher's). Once it is exhausted each worker
+pauses its partitions, so the fetcher stops prefetching them, and keeps
+polling only for heartbeats and commit callbacks; once written batches
+bring it down to resume_ratio of the limit, the partitions are resumed.
+The gap between the two keeps workers from flapping between states.
+
+Workers take a lease on the budget so whatever they still hold when they
+stop (e.g. batches abandoned by a timed-out drain) is returned in full.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_RESUME_RATIO = 0.5
+
+
+class MemoryBudget:
+    """Process-wide count of buffered bytes against a limit; max_bytes <= 0 disables pausing"""
+
+    def __init__(self, max_bytes: int, resume_ratio: float = DEFAULT_RESUME_RATIO,
+                 on_change: Optional[Callable[[float], None]] = None):
+        if not 0 <= resume_ratio <= 1:
+            raise ValueError("resume_ratio must be between 0 and 1")
+
+        self.max_bytes = max_bytes
+        self._resume_bytes = max_bytes * resume_ratio
+        # Called with the new total, e.g. to export it as a gauge
+        self._on_change = on_change
+        self._lock = threading.Lock()
+        self._used = 0
+        self._peak = 0
+
+    @property
+    def used_bytes(self) -> int:
+        return self._used
+
+    @property
+    def exhausted(self) -> bool:
+        return self.max_bytes > 0 and self._used >= self.max_bytes
+
+    @property
+    def drained(self) -> bool:
+        return self._used <= self._resume_bytes
+
+    def lease(self) -> 'BudgetLease':
+        return BudgetLease(self)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'max_bytes': self.max_bytes, 'buffered_bytes': self._used, 'peak_bytes': self._peak}
+
+    def _add(self, delta: int) -> None:
+        with self._lock:
+            self._used += delta
+            self._peak = max(self._peak, self._used)
+            used = self._used
+        if self._on_change is not None:
+            self._on_change(used)
+
+
+class BudgetLease:
+    """One worker's share of a MemoryBudget, returned in full on close()"""
+
+    def __init__(self, budget: MemoryBudget):
+        self._budget = budget
+        self._lock = threading.Lock()
+        self._held = 0
+
+    @property
+    def held_bytes(self) -> int:
+        return self._held
+
+    def acquire(self, nbytes: int) -> None:
+        if nbytes <= 0:
+            return
+        with self._lock:
+            self._held += nbytes
+        self._budget._add(nbytes)
+
+    def release(self, nbytes: int) -> None:
+        with self._lock:
+            nbytes = min(nbytes, self._held)
+            self._held -= nbytes
+        if nbytes > 0:
+            self._budget._add(-nbytes)
+
+    def close(self) -> None:
+        self.release(self._held)
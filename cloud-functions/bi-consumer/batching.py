@@ -0,0 +1,159 @@
+"""
+Adaptive batching for the BI Consumer
+Seals batches on an estimated byte budget, a row cap or a linger time
+
+The byte target is tuned at runtime from insert feedback: failed inserts
+halve it, slow inserts shrink it and fast inserts grow it, always within
+[min_bytes, max_bytes]. max_bytes should stay well under BigQuery's 10MB
+request limit.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Per-row overhead for keys, quoting and separators in the JSON request body
+ROW_OVERHEAD_BYTES = 16
+FIELD_OVERHEAD_BYTES = 8
+
+# How many recent flush sizes to keep for the response stats
+FLUSH_HISTORY = 100
+
+FLUSH_REASON_BYTES = 'bytes'
+FLUSH_REASON_ROWS = 'rows'
+FLUSH_REASON_LINGER = 'linger'
+FLUSH_REASON_FINAL = 'final'
+
+
+def estimate_row_bytes(row: Dict[str, Any]) -> int:
+    """Cheap estimate of a row's serialized JSON size"""
+    size = ROW_OVERHEAD_BYTES
+    for key, value in row.items():
+        size += len(key) + FIELD_OVERHEAD_BYTES
+        if isinstance(value, str):
+            size += len(value)
+        else:
+            # datetimes, dates and numbers serialize to short fixed-width strings
+            size += 24
+    return size
+
+
+class AdaptiveBatcher:
+    """Accumulates rows and seals a batch when its byte, row or linger budget is spent"""
+
+    def __init__(self, max_rows: int = 500, max_bytes: int = 5 * 1024 * 1024,
+                 min_bytes: int = 256 * 1024, initial_bytes: int = 1024 * 1024,
+                 linger_ms: int = 1000, target_latency_ms: int = 1000,
+                 clock: Callable[[], float] = time.monotonic,
+                 on_seal: Optional[Callable[[float], None]] = None):
+        if min_bytes > max_bytes:
+            raise ValueError("min_bytes must not exceed max_bytes")
+
+        self._max_rows = max_rows
+        self._max_bytes = max_bytes
+        self._min_bytes = min_bytes
+        self._linger_s = linger_ms / 1000.0
+        self._target_latency_ms = target_latency_ms
+        self._clock = clock
+        # Called with the seconds a batch took to fill, from its first row to its seal
+        self._on_seal = on_seal
+        self._lock = threading.Lock()
+
+        self.target_bytes = min(max(initial_bytes, min_bytes), max_bytes)
+        self._rows: List[Dict[str, Any]] = []
+        self._bytes = 0
+        self._opened_at: Optional[float] = None
+
+        self._flushes = 0
+        self._flush_reasons = {
+            FLUSH_REASON_BYTES: 0,
+            FLUSH_REASON_ROWS: 0,
+            FLUSH_REASON_LINGER: 0,
+            FLUSH_REASON_FINAL: 0,
+        }
+        self._flush_rows: List[int] = []
+        self._flush_bytes: List[int] = []
+        self._adjustments = {'grow': 0, 'shrink': 0, 'backoff': 0}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def pending_bytes(self) -> int:
+        return self._bytes
+
+    def add(self, row: Dict[str, Any], size: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """Add a row, returning a sealed batch if this row filled the budget"""
+        if not self._rows:
+            self._opened_at = self._clock()
+        self._rows.append(row)
+        self._bytes += estimate_row_bytes(row) if size is None else size
+
+        if self._bytes >= self.target_bytes:
+            return self._seal(FLUSH_REASON_BYTES)
+        if len(self._rows) >= self._max_rows:
+            return self._seal(FLUSH_REASON_ROWS)
+        return None
+
+    def poll(self, expired: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """Return a sealed batch if the oldest pending row has lingered long enough
+
+        expired=True seals without consulting the clock, for callers that have
+        just waited out linger_remaining_s() elsewhere (e.g. in a broker poll).
+        """
+        if self._rows and (expired or self._clock() - self._opened_at >= self._linger_s):
+            return self._seal(FLUSH_REASON_LINGER)
+        return None
+
+    def linger_remaining_s(self) -> Optional[float]:
+        """Seconds until the pending batch is due, or None when nothing is pending"""
+        if not self._rows:
+            return None
+        return max(0.0, self._linger_s - (self._clock() - self._opened_at))
+
+    def flush(self) -> Optional[List[Dict[str, Any]]]:
+        """Seal whatever is pending"""
+        if not self._rows:
+            return None
+        return self._seal(FLUSH_REASON_FINAL)
+
+    def record_result(self, latency_ms: float, ok: bool) -> None:
+        """Feed back an insert outcome to tune the byte target (AIMD)"""
+        with self._lock:
+            if not ok:
+                self.target_bytes = max(self._min_bytes, self.target_bytes // 2)
+                self._adjustments['backoff'] += 1
+            elif latency_ms > self._target_latency_ms:
+                self.target_bytes = max(self._min_bytes, int(self.target_bytes * 0.8))
+                self._adjustments['shrink'] += 1
+            elif latency_ms < self._target_latency_ms / 2:
+                self.target_bytes = min(self._max_bytes, int(self.target_bytes * 1.25))
+                self._adjustments['grow'] += 1
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'flushes': self._flushes,
+                'flush_reasons': dict(self._flush_reasons),
+                'target_bytes': self.target_bytes,
+                'batch_rows': list(self._flush_rows),
+                'batch_bytes': list(self._flush_bytes),
+                'adjustments': dict(self._adjustments),
+            }
+
+    def _seal(self, reason: str) -> List[Dict[str, Any]]:
+        rows = self._rows
+        if self._on_seal is not None:
+            self._on_seal(self._clock() - self._opened_at)
+        with self._lock:
+            self._flushes += 1
+            self._flush_reasons[reason] += 1
+            self._flush_rows.append(len(rows))
+            self._flush_bytes.append(self._bytes)
+            del self._flush_rows[:-FLUSH_HISTORY]
+            del self._flush_bytes[:-FLUSH_HISTORY]
+        self._rows = []
+        self._bytes = 0
+        self._opened_at = None
+        return rows
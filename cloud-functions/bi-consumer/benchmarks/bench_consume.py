@@ -0,0 +1,249 @@
+"""
+End-to-end benchmark: consume_events against in-memory Kafka and BigQuery
+Events/s, p50/p99 event lag, peak RSS and CPU per event for a set of scenarios
+
+Each scenario runs consume_events in a fresh subprocess (so peak RSS is its
+own) against a FakeBroker loaded from the DebeziumGenerator and a
+FakeBigQueryClient with the scenario's latency and error injection.
+
+    events_per_s       events / (last accepted insert - start)
+    lag_p50_s/p99_s    change timestamp (ts_ms) to insert, per accepted row
+    peak_rss_mb        maximum resident set size of the scenario process
+    cpu_us_per_event   user + system CPU of the consume_events call per event
+
+Results are written as JSON. --compare reads an earlier file and prints the
+relative change per scenario and metric, so runs on two commits can be
+compared.
+
+Usage:
+    python benchmarks/bench_consume.py [--scenarios backlog steady] [--events 20000]
+                                       [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import types
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeBigQueryClient, FakeBroker, OffsetAndMetadata, TopicPartition
+from generator import DebeziumGenerator
+
+# Scenario name -> generator, broker, BigQuery and main settings
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    'backlog': {
+        'description': 'Catch up on a backlog; synchronous insertAll with 20ms latency',
+        'bigquery': {'latency_s': 0.02},
+    },
+    'backlog_pipelined': {
+        'description': 'Same backlog with slower inserts (60ms) overlapped by two insert workers',
+        'bigquery': {'latency_s': 0.06},
+        'main': {'INSERT_WORKERS': 2},
+    },
+    'backlog_spooled': {
+        'description': 'Same backlog with every sealed batch kept in the write-ahead spool until written',
+        'bigquery': {'latency_s': 0.02},
+        'spooled': True,
+    },
+    'steady': {
+        'description': 'Live traffic at 4000 events/s; lag is dominated by batching and insert latency',
+        'broker': {'rate': 4000},
+        'bigquery': {'latency_s': 0.02, 'jitter_s': 0.02},
+    },
+    'insert_errors': {
+        'description': 'Transient row errors (3%) and 503s (5% of requests) retried under the budget',
+        'bigquery': {'latency_s': 0.02, 'row_error_rate': 0.03, 'request_error_rate': 0.05},
+        'main': {'INSERT_RETRY_BASE_DELAY_MS': 20, 'INSERT_RETRY_BUDGET': 1000},
+    },
+    'invalid_storm': {
+        'description': '30% malformed or invalid events, dead-lettered to a local spool',
+        'generator': {'invalid_ratio': 0.3},
+        'bigquery': {'latency_s': 0.02},
+        'main': {'DEAD_LETTER_MODE': 'file'},
+    },
+    'wide_rows': {
+        'description': 'Rows of ~8KB across 10 tables',
+        'generator': {'row_bytes': 8000, 'tables': 10},
+        'bigquery': {'latency_s': 0.02},
+    },
+    'hot_rows': {
+        'description': 'Updates concentrated on a few hundred rows',
+        'generator': {'op_mix': {'c': 0.01, 'u': 0.98, 'd': 0.01}},
+        'bigquery': {'latency_s': 0.02},
+    },
+    'hot_rows_coalesced': {
+        'description': 'Same hot rows with every table opted in to change coalescing',
+        'generator': {'op_mix': {'c': 0.01, 'u': 0.98, 'd': 0.01}},
+        'bigquery': {'latency_s': 0.02},
+        'main': {'COALESCE_TABLES': frozenset({'*'})},
+    },
+    'wide_rows_routed': {
+        'description': 'Same wide rows with three hot tables routed to typed tables of 24 columns',
+        'generator': {'row_bytes': 8000, 'tables': 10},
+        'bigquery': {'latency_s': 0.02},
+        'routed': True,
+    },
+}
+
+METRICS = ('events_per_s', 'lag_p50_s', 'lag_p99_s', 'peak_rss_mb', 'cpu_us_per_event')
+# Direction in which each metric improves, for --compare
+HIGHER_IS_BETTER = {'events_per_s'}
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_scenario(name: str, events: int, workdir: str) -> Dict[str, Any]:
+    """Run one scenario in this process and return its measurements"""
+    scenario = SCENARIOS[name]
+    logging.disable(logging.WARNING)
+
+    import main
+
+    settings = {
+        'PROJECT_ID': 'bench-project',
+        'KAFKA_BOOTSTRAP_SERVERS': 'fake:9092',
+        'CONSUMER_TIMEOUT_MS': 300,
+        'DEAD_LETTER_SPOOL_DIR': os.path.join(workdir, 'dead-letters'),
+        'LOAD_JOB_STAGING_DIR': os.path.join(workdir, 'staging'),
+    }
+    if scenario.get('spooled'):
+        settings['WRITE_AHEAD_DIR'] = os.path.join(workdir, 'write-ahead')
+    settings.update(scenario.get('main', {}))
+    for key, value in settings.items():
+        setattr(main, key, value)
+    main.get_secret = lambda name: None
+
+    generator = DebeziumGenerator(**scenario.get('generator', {}))
+    if scenario.get('routed'):
+        from routing import parse_routes
+        main.TABLE_ROUTES = parse_routes({
+            table: {'table': f"{table}_changes", 'columns': dict(list(generator.columns(table).items())[:24])}
+            for table in generator.tables[:3]
+        })
+    broker = FakeBroker(**scenario.get('broker', {}))
+    broker.load(generator, events)
+    client = FakeBigQueryClient(**scenario.get('bigquery', {}))
+    consumer_factory = broker.consumer_factory()
+    main.kafka = types.SimpleNamespace(KafkaConsumer=consumer_factory, TopicPartition=TopicPartition,
+                                       OffsetAndMetadata=OffsetAndMetadata)
+    main.RESOURCES.get(main.RESOURCE_BIGQUERY_CLIENT, lambda: client)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    broker.start()
+    body, status = main.consume_events(None)
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    if status != 200:
+        raise RuntimeError(f"Scenario {name} failed: {body}")
+
+    finished = client.last_write or time.perf_counter()
+    cpu_s = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    rss_divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'description': scenario['description'],
+        'events': events,
+        'events_per_s': round(events / (finished - broker.started), 1),
+        'lag_p50_s': percentile(client.lags_s, 0.5),
+        'lag_p99_s': percentile(client.lags_s, 0.99),
+        'peak_rss_mb': round(usage_after.ru_maxrss / rss_divisor, 1),
+        'cpu_us_per_event': round(cpu_s / events * 1e6, 2),
+        'events_processed': body['events_processed'],
+        'events_failed': body['events_failed'],
+        'coalescing': body.get('coalescing'),
+        'bigquery': client.stats,
+        'kafka': consumer_factory.consumers[0].stats if consumer_factory.consumers else {},
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print(f"\nChange vs {baseline.get('commit') or 'baseline'} (+ is better)")
+    for name, current in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        changes = []
+        for metric in METRICS:
+            old, new = before.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            if metric not in HIGHER_IS_BETTER:
+                change = -change
+            changes.append(f"{metric} {change:+.1f}%")
+        print(f"{name:>18}  {', '.join(changes)}")
+
+
+def main_benchmark(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--run-scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', default='/tmp/bi-consumer-bench', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_scenario:
+        # Child process: one scenario, JSON on the last line of stdout
+        print(json.dumps(run_scenario(args.run_scenario, args.events, args.workdir)))
+        return 0
+
+    results: Dict[str, Any] = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'events': args.events,
+        'scenarios': {},
+    }
+    print(f"{'scenario':>18} {'events/s':>10} {'lag p50':>8} {'lag p99':>8} {'RSS MB':>7} {'CPU us/ev':>10}")
+    for name in args.scenarios:
+        workdir = os.path.join(args.workdir, name)
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run-scenario', name, '--events', str(args.events),
+             '--workdir', workdir],
+            capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"{name:>18} failed:\n{completed.stderr}", file=sys.stderr)
+            return 1
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results['scenarios'][name] = result
+        lag = lambda value: f"{value:>8.3f}" if value is not None else f"{'-':>8}"
+        print(f"{name:>18} {result['events_per_s']:>10.0f} {lag(result['lag_p50_s'])} {lag(result['lag_p99_s'])} "
+              f"{result['peak_rss_mb']:>7.1f} {result['cpu_us_per_event']:>10.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_benchmark())
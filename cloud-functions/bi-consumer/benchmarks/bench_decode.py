@@ -0,0 +1,118 @@
+"""
+Microbenchmark: Debezium decode + event_data construction
+Compares the legacy json.loads/json.dumps round trip with the fast decode path
+
+Usage:
+    python benchmarks/bench_decode.py [--events 20000] [--columns 8 40 200]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import decoding
+import main
+
+
+def make_envelope(rng: random.Random, columns: int) -> bytes:
+    """Build a compact Debezium envelope like the YugabyteDB connector emits"""
+    row = {'id': rng.randint(1, 10 ** 9), 'email': f"user{rng.randint(1, 10 ** 6)}@example.com"}
+    for i in range(columns):
+        kind = i % 4
+        if kind == 0:
+            row[f"col_{i}"] = rng.randint(0, 10 ** 12)
+        elif kind == 1:
+            row[f"col_{i}"] = round(rng.random() * 1000, 4)
+        elif kind == 2:
+            row[f"col_{i}"] = ''.join(rng.choice('abcdefghij klmnop') for _ in range(rng.randint(4, 40)))
+        else:
+            row[f"col_{i}"] = None
+    op = rng.choice('ccuuuuud')
+    envelope = {
+        'before': row if op == 'd' else None,
+        'after': None if op == 'd' else row,
+        'source': {
+            'version': '1.9.5.y.22', 'connector': 'yugabytedb', 'name': 'yugabytedb-multizone',
+            'ts_ms': 1640995200000, 'snapshot': 'false', 'db': 'yugabyte', 'schema': 'public',
+            'table': rng.choice(['customers', 'orders', 'products']), 'txId': '', 'lsn': '1:4::0:0',
+        },
+        'op': op,
+        'ts_ms': 1640995200000 + rng.randint(0, 10 ** 6),
+        'transaction': None,
+    }
+    return json.dumps(envelope, separators=(',', ':')).encode('utf-8')
+
+
+def legacy_path(raw: bytes) -> str:
+    """The original deserializer plus process_event's json.dumps of the payload"""
+    event = json.loads(raw.decode('utf-8'))
+    payload = event.get('after') or event.get('before') or {}
+    return json.dumps(payload)
+
+
+def fast_path(raw: bytes) -> str:
+    """decode_event plus the raw-slice reuse in process_event"""
+    event = decoding.decode_event(raw)
+    if event.get('after'):
+        return event.raw_after or decoding.dumps(event['after'])
+    return event.raw_before or decoding.dumps(event['before'])
+
+
+def measure(fn, messages, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for raw in messages:
+            fn(raw)
+        best = min(best, time.perf_counter() - started)
+    return best / len(messages) * 1e6
+
+
+def main_benchmark(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--columns', type=int, nargs='+', default=[8, 40, 200])
+    args = parser.parse_args(argv)
+
+    rng = random.Random(42)
+    backends = [('json', None)]
+    if decoding.orjson is not None:
+        backends.append(('orjson', decoding.orjson))
+
+    print(f"{'columns':>8} {'avg bytes':>10} {'path':>16} {'us/event':>10} {'speedup':>8}")
+    for columns in args.columns:
+        messages = [make_envelope(rng, columns) for _ in range(args.events)]
+        avg_bytes = sum(len(m) for m in messages) // len(messages)
+        baseline = measure(legacy_path, messages)
+        print(f"{columns:>8} {avg_bytes:>10} {'legacy':>16} {baseline:>10.2f} {1.0:>7.2f}x")
+
+        for name, module in backends:
+            decoding.orjson = module
+            for raw in messages[:100]:
+                assert json.loads(fast_path(raw)) == json.loads(legacy_path(raw))
+            elapsed = measure(fast_path, messages)
+            print(f"{columns:>8} {avg_bytes:>10} {'fast/' + name:>16} {elapsed:>10.2f} {baseline / elapsed:>7.2f}x")
+
+        # Full per-event transform for reference
+        events = [decoding.decode_event(m) for m in messages]
+        started = time.perf_counter()
+        for event in events:
+            main.process_event(event)
+        transform_us = (time.perf_counter() - started) / len(events) * 1e6
+        print(f"{columns:>8} {avg_bytes:>10} {'process_event':>16} {transform_us:>10.2f}")
+        started = time.perf_counter()
+        for i in range(0, len(events), 500):
+            main.process_events(events[i:i + 500])
+        batch_us = (time.perf_counter() - started) / len(events) * 1e6
+        print(f"{columns:>8} {avg_bytes:>10} {'process_events':>16} {batch_us:>10.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_benchmark())
@@ -0,0 +1,111 @@
+"""
+Benchmark: consume loop throughput against a fake broker
+Records/s of consume_worker across poll and fetch-sizing settings
+
+The fake broker (see fakes.py) serves generated Debezium envelopes and
+charges every fetch a round trip plus receive-window-limited transfer time;
+with --rate, records trickle in and a fetch waits for fetch_min_bytes or
+fetch_max_wait_ms like the broker would. Rows go to a sink that accepts
+everything, so the figures are Kafka plus transform cost only.
+
+Usage:
+    python benchmarks/bench_poll.py [--events 20000] [--partitions 6] [--rtt-ms 2] [--rate 0]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+import types
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from fakes import FakeBroker, OffsetAndMetadata, TopicPartition
+from generator import DebeziumGenerator
+from sinks import Sink
+
+# (name, max_poll_records, fetch_min_bytes, fetch_max_wait_ms, max_partition_fetch_bytes, receive_buffer_bytes)
+SETTINGS = [
+    ('one record per poll', 1, 1, 500, 1024 * 1024, 0),
+    ('kafka-python defaults', 500, 1, 500, 1024 * 1024, 0),
+    ('tuned defaults', main.DEFAULT_MAX_POLL_RECORDS, main.DEFAULT_FETCH_MIN_BYTES, main.DEFAULT_FETCH_MAX_WAIT_MS,
+     main.DEFAULT_MAX_PARTITION_FETCH_BYTES, main.DEFAULT_RECEIVE_BUFFER_BYTES),
+    ('small partition fetch', 500, main.DEFAULT_FETCH_MIN_BYTES, 500, 64 * 1024, main.DEFAULT_RECEIVE_BUFFER_BYTES),
+    ('large fetch and buffer', 2000, 256 * 1024, 500, 4 * 1024 * 1024, 4 * 1024 * 1024),
+]
+
+
+class NullSink(Sink):
+    """Accepts every batch immediately"""
+
+    name = 'null'
+
+    def write(self, rows):
+        self._record(len(rows), True, 0, time.monotonic())
+        return True
+
+
+def run_setting(broker: FakeBroker, setting) -> dict:
+    _, max_poll_records, fetch_min_bytes, fetch_max_wait_ms, partition_fetch_bytes, receive_buffer_bytes = setting
+    main.MAX_POLL_RECORDS = max_poll_records
+    main.FETCH_MIN_BYTES = fetch_min_bytes
+    main.FETCH_MAX_WAIT_MS = fetch_max_wait_ms
+    main.MAX_PARTITION_FETCH_BYTES = partition_fetch_bytes
+    main.RECEIVE_BUFFER_BYTES = receive_buffer_bytes
+
+    consumer_factory = broker.consumer_factory()
+    main.kafka = types.SimpleNamespace(
+        KafkaConsumer=consumer_factory,
+        TopicPartition=TopicPartition,
+        OffsetAndMetadata=OffsetAndMetadata,
+    )
+    broker.start()
+    stats = main.consume_worker(0, NullSink(), main.get_kafka_config(), main.create_scheduler(600000))
+    consumer = consumer_factory.consumers[0]
+    elapsed = (consumer.drained_at or time.perf_counter()) - broker.started
+    assert stats['events_processed'] == broker.total, stats
+    return {
+        'records_per_s': broker.total / elapsed,
+        'mb_per_s': consumer.stats['bytes'] / elapsed / (1024 * 1024),
+        'fetches': consumer.stats['fetches'],
+        'polls': consumer.stats['polls'],
+    }
+
+
+def main_benchmark(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--partitions', type=int, default=6)
+    parser.add_argument('--row-bytes', type=int, default=600)
+    parser.add_argument('--rtt-ms', type=float, default=2.0)
+    parser.add_argument('--rate', type=float, default=0, help='records/s produced; 0 = full backlog')
+    args = parser.parse_args(argv)
+
+    # Secret lookups without a project and per-invocation info logs are noise here
+    logging.disable(logging.WARNING)
+    main.PROJECT_ID = ''
+    main.REUSE_KAFKA_CONSUMER = False
+    main.CONSUMER_TIMEOUT_MS = 200
+    main.DEAD_LETTER_MODE = main.DEAD_LETTER_NONE
+    main.INSERT_WORKERS = 0
+
+    broker = FakeBroker(args.rate, args.rtt_ms / 1000.0)
+    generator = DebeziumGenerator(tables=1, row_bytes=args.row_bytes)
+    broker.load(generator, args.events, partitions_per_topic=args.partitions)
+    avg_bytes = broker.total_bytes // broker.total
+
+    print(f"{args.events} events of ~{avg_bytes} bytes over {args.partitions} partitions, "
+          f"RTT {args.rtt_ms}ms, {'backlog' if not args.rate else f'{args.rate:.0f} records/s'}")
+    print(f"{'setting':>24} {'records/s':>10} {'MB/s':>7} {'fetches':>8} {'polls':>7}")
+    for setting in SETTINGS:
+        result = run_setting(broker, setting)
+        print(f"{setting[0]:>24} {result['records_per_s']:>10.0f} {result['mb_per_s']:>7.2f} "
+              f"{result['fetches']:>8} {result['polls']:>7}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_benchmark())
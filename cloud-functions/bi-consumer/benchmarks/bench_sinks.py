@@ -0,0 +1,68 @@
+"""
+Benchmark: insertAll vs Storage Write API sink
+Rows/s and request bytes of both sinks on the same batches
+
+Both sinks run against local stand-ins (see fakes.py) that answer at once, so
+the rates are the sinks' own encoding cost: JSON for insertAll, protobuf for
+the Storage Write API. Bytes are what each would put on the wire.
+
+Usage:
+    python benchmarks/bench_sinks.py [--rows 5000] [--batch 500]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import decoding
+import main
+from fakes import FakeAppendRowsStream, FakeBigQueryClient, FakeBigQueryWriteClient
+from generator import DebeziumGenerator
+from sinks import InsertAllSink, StorageWriteSink
+
+TABLE_PATH = 'projects/bench/datasets/marketing_events/tables/user_events'
+
+
+def measure(sink, batches) -> float:
+    started = time.perf_counter()
+    for batch in batches:
+        assert sink.write(batch)
+    return sum(len(batch) for batch in batches) / (time.perf_counter() - started)
+
+
+def main_benchmark(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--row-bytes', type=int, default=400)
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    generator = DebeziumGenerator(tables=1, row_bytes=args.row_bytes)
+    rows, _ = main.process_events([decoding.decode_event(raw) for raw in generator.envelopes(args.rows)])
+    batches = [rows[i:i + args.batch] for i in range(0, len(rows), args.batch)]
+
+    insert_all = InsertAllSink(FakeBigQueryClient(latency_s=0), 'marketing_events.user_events')
+    insert_all_rate = measure(insert_all, batches)
+
+    write_client = FakeBigQueryWriteClient()
+    storage_write = StorageWriteSink(TABLE_PATH, main.get_bigquery_schema(), write_client=write_client,
+                                     append_stream_factory=FakeAppendRowsStream)
+    storage_write_rate = measure(storage_write, batches)
+    storage_write.close()
+
+    print(f"{len(rows)} rows in batches of {args.batch}")
+    print(f"{'sink':>14} {'rows/s':>10} {'bytes':>12} {'bytes/row':>10}")
+    for name, rate, sent in (('insert_all', insert_all_rate, insert_all.stats['bytes_sent']),
+                             ('storage_write', storage_write_rate, write_client.wire_bytes)):
+        print(f"{name:>14} {rate:>10.0f} {sent:>12,} {sent / len(rows):>10.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_benchmark())
@@ -0,0 +1,322 @@
+"""
+In-memory Kafka and BigQuery stand-ins for benchmarks
+A fake broker and KafkaConsumer, and a bigquery.Client with injectable latency and errors
+
+FakeBroker holds envelope templates per topic partition and "produces" them
+at a fixed rate (or all at once), stamping ts_ms with the production time.
+FakeKafkaConsumer implements the part of KafkaConsumer the consume loop
+uses. Each fetch costs a round trip plus transfer time, and throughput is
+capped by the receive window (receive_buffer_bytes / RTT, 64KB when unset).
+A fetch returns at most max_partition_fetch_bytes per partition and
+fetch_max_bytes in total, and waits for fetch_min_bytes or fetch_max_wait_ms.
+
+FakeBigQueryClient answers insert_rows_json after a configurable latency,
+can fail requests or rows (transiently or for good), and records the event
+lag of every row it accepts. FakeBigQueryWriteClient and FakeAppendRowsStream
+stand in for the Storage Write API, counting the bytes each append would send.
+"""
+
+import bisect
+import collections
+import random
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from generator import stamp
+
+ConsumerRecord = collections.namedtuple('ConsumerRecord', 'topic partition offset value')
+TopicPartition = collections.namedtuple('TopicPartition', 'topic partition')
+OffsetAndMetadata = collections.namedtuple('OffsetAndMetadata', 'offset metadata')
+
+RECORD_OVERHEAD_BYTES = 70  # Batch and record headers per message on the wire
+DEFAULT_RECEIVE_WINDOW_BYTES = 64 * 1024
+LINK_BYTES_PER_S = 125 * 1024 * 1024  # 1 Gbit/s
+
+
+class FakeBroker:
+    """Topic partitions of envelope templates produced at a fixed rate (0 = all at once)"""
+
+    def __init__(self, rate: float = 0, rtt_s: float = 0.002, fetch_jitter_s: float = 0.0, seed: int = 7):
+        self.rate = rate
+        self.rtt_s = rtt_s
+        self.fetch_jitter_s = fetch_jitter_s
+        self._rng = random.Random(seed)
+        self.partitions: List[Tuple[str, int]] = []
+        # Per partition: production sequence numbers and templates
+        self._sequence: List[List[int]] = []
+        self._templates: List[List[bytes]] = []
+        self._index: Dict[Tuple[str, int], int] = {}
+        self.total = 0
+        self.total_bytes = 0
+        self.started: Optional[float] = None
+        self._started_ms = 0
+
+    def append(self, topic: str, partition: int, template: bytes) -> None:
+        key = (topic, partition)
+        if key not in self._index:
+            self._index[key] = len(self.partitions)
+            self.partitions.append(key)
+            self._sequence.append([])
+            self._templates.append([])
+        index = self._index[key]
+        self._sequence[index].append(self.total)
+        self._templates[index].append(template)
+        self.total += 1
+        self.total_bytes += len(template) + 14
+
+    def load(self, generator: Any, count: int, partitions_per_topic: int = 3) -> None:
+        """Queue count changes from a DebeziumGenerator, spread over each table's partitions"""
+        for i in range(count):
+            table, template = generator.template()
+            self.append(generator.topic(table), i % partitions_per_topic, template)
+
+    def start(self) -> None:
+        """Production begins now"""
+        self.started = time.perf_counter()
+        self._started_ms = int(time.time() * 1000)
+
+    def available(self, index: int, now: float) -> int:
+        """How many messages of a partition have been produced by now"""
+        if not self.rate:
+            return len(self._sequence[index])
+        produced = int((now - self.started) * self.rate)
+        return bisect.bisect_left(self._sequence[index], produced)
+
+    def message(self, index: int, offset: int) -> bytes:
+        """A partition's message, stamped with the time it was produced"""
+        sequence = self._sequence[index][offset]
+        ts_ms = self._started_ms + (int(sequence * 1000 / self.rate) if self.rate else 0)
+        return stamp(self._templates[index][offset], ts_ms)
+
+    def size(self, index: int, offset: int) -> int:
+        return len(self._templates[index][offset]) + 14 + RECORD_OVERHEAD_BYTES
+
+    def fetch_delay_s(self, fetched_bytes: int, bytes_per_s: float) -> float:
+        jitter = self._rng.uniform(0, self.fetch_jitter_s) if self.fetch_jitter_s else 0.0
+        return self.rtt_s + jitter + fetched_bytes / bytes_per_s
+
+    def consumer_factory(self, commit_error_rate: float = 0.0):
+        """KafkaConsumer replacement bound to this broker; created consumers are kept in .consumers"""
+        consumers: List[FakeKafkaConsumer] = []
+
+        def create(**config: Any) -> 'FakeKafkaConsumer':
+            consumers.append(FakeKafkaConsumer(self, commit_error_rate=commit_error_rate, **config))
+            return consumers[-1]
+
+        create.consumers = consumers
+        return create
+
+
+class FakeKafkaConsumer:
+    """The slice of KafkaConsumer the consume loop uses, fetching from a FakeBroker"""
+
+    def __init__(self, broker: FakeBroker, commit_error_rate: float = 0.0, **config: Any):
+        self._broker = broker
+        self._commit_error_rate = commit_error_rate
+        self._rng = random.Random(11)
+        self._deserialize = config.get('value_deserializer') or (lambda raw: raw)
+        self._fetch_min_bytes = config.get('fetch_min_bytes', 1)
+        self._fetch_max_wait_s = config.get('fetch_max_wait_ms', 500) / 1000.0
+        self._fetch_max_bytes = config.get('fetch_max_bytes', 50 * 1024 * 1024)
+        self._partition_fetch_bytes = config.get('max_partition_fetch_bytes', 1024 * 1024)
+        window = config.get('receive_buffer_bytes') or DEFAULT_RECEIVE_WINDOW_BYTES
+        self._bytes_per_s = min(LINK_BYTES_PER_S, window / max(broker.rtt_s, 1e-6))
+        self._positions = [0] * len(broker.partitions)
+        self._buffer: collections.deque = collections.deque()
+        self._closed = False
+        self.delivered = 0
+        self.drained_at: Optional[float] = None
+        self.stats = {'fetches': 0, 'polls': 0, 'bytes': 0, 'commits': 0, 'commit_errors': 0}
+
+    def subscribe(self, pattern: Optional[str] = None, topics: Sequence[str] = ()) -> None:
+        pass
+
+    def assignment(self) -> set:
+        return {TopicPartition(*partition) for partition in self._broker.partitions}
+
+    def poll(self, timeout_ms: int = 0, max_records: Optional[int] = None) -> Dict[TopicPartition, List[Any]]:
+        self.stats['polls'] += 1
+        if self.delivered == self._broker.total and self.drained_at is None:
+            # Everything handed out has been transformed and batched by now
+            self.drained_at = time.perf_counter()
+        if not self._buffer:
+            self._fetch(timeout_ms / 1000.0)
+        records: Dict[TopicPartition, List[Any]] = {}
+        for _ in range(min(max_records or len(self._buffer), len(self._buffer))):
+            record = self._buffer.popleft()
+            records.setdefault(TopicPartition(record.topic, record.partition), []).append(record)
+            self.delivered += 1
+        return records
+
+    def commit(self, offsets: Any = None) -> None:
+        self.stats['commits'] += 1
+        if self._commit_error_rate and self._rng.random() < self._commit_error_rate:
+            self.stats['commit_errors'] += 1
+            raise RuntimeError("Injected commit failure")
+
+    def commit_async(self, offsets: Any = None, callback: Any = None) -> None:
+        error = None
+        try:
+            self.commit(offsets)
+        except RuntimeError as e:
+            error = e
+        if callback is not None:
+            callback(offsets, error)
+
+    def seek(self, partition: Any, offset: int) -> None:
+        index = self._broker.partitions.index(tuple(partition))
+        self._positions[index] = offset
+
+    def close(self) -> None:
+        self._closed = True
+
+    def _fetch(self, timeout_s: float) -> None:
+        broker = self._broker
+        if self.delivered == broker.total:
+            time.sleep(min(timeout_s, 0.01))
+            return
+        # The broker holds the fetch until fetch_min_bytes are ready or fetch_max_wait_ms passes
+        wait_until = time.perf_counter() + min(timeout_s, self._fetch_max_wait_s)
+        while self._ready_bytes(time.perf_counter()) < self._fetch_min_bytes and time.perf_counter() < wait_until:
+            time.sleep(0.001)
+
+        now = time.perf_counter()
+        fetched_bytes = 0
+        fetched = []
+        for index, (topic, partition) in enumerate(broker.partitions):
+            position = self._positions[index]
+            end = broker.available(index, now)
+            partition_bytes = 0
+            while position < end:
+                size = broker.size(index, position)
+                # Like the broker, always return at least one record so large ones cannot stall
+                if partition_bytes and (partition_bytes + size > self._partition_fetch_bytes
+                                        or fetched_bytes + size > self._fetch_max_bytes):
+                    break
+                fetched.append((topic, partition, index, position))
+                partition_bytes += size
+                fetched_bytes += size
+                position += 1
+            self._positions[index] = position
+
+        time.sleep(broker.fetch_delay_s(fetched_bytes, self._bytes_per_s))
+        self.stats['fetches'] += 1
+        self.stats['bytes'] += fetched_bytes
+        for topic, partition, index, offset in fetched:
+            self._buffer.append(ConsumerRecord(topic, partition, offset,
+                                               self._deserialize(broker.message(index, offset))))
+
+    def _ready_bytes(self, now: float) -> int:
+        ready = 0
+        for index in range(len(self._broker.partitions)):
+            for offset in range(self._positions[index], self._broker.available(index, now)):
+                ready += self._broker.size(index, offset)
+                if ready >= self._fetch_min_bytes:
+                    return ready
+        return ready
+
+
+class InjectedServerError(Exception):
+    """Stands in for a 503 from the BigQuery API"""
+
+    code = 503
+
+
+class FakeBigQueryClient:
+    """insert_rows_json with latency, request and row errors, recording each accepted row's lag"""
+
+    def __init__(self, latency_s: float = 0.02, jitter_s: float = 0.0, request_error_rate: float = 0.0,
+                 row_error_rate: float = 0.0, rejected_rate: float = 0.0, seed: int = 13):
+        self._latency_s = latency_s
+        self._jitter_s = jitter_s
+        self._request_error_rate = request_error_rate
+        self._row_error_rate = row_error_rate
+        self._rejected_rate = rejected_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.lags_s: List[float] = []
+        self.last_write: Optional[float] = None
+        self.stats = {'requests': 0, 'request_errors': 0, 'rows_accepted': 0, 'row_errors': 0, 'rows_rejected': 0}
+
+    def insert_rows_json(self, table: str, rows: List[Dict[str, Any]], row_ids: Any = None) -> List[Dict[str, Any]]:
+        time.sleep(self._latency_s + (self._rng.uniform(0, self._jitter_s) if self._jitter_s else 0.0))
+        with self._lock:
+            self.stats['requests'] += 1
+            if self._request_error_rate and self._rng.random() < self._request_error_rate:
+                self.stats['request_errors'] += 1
+                raise InjectedServerError("Injected 503 from insertAll")
+
+            errors = []
+            now = datetime.utcnow()
+            for index, row in enumerate(rows):
+                draw = self._rng.random()
+                if draw < self._rejected_rate:
+                    errors.append({'index': index, 'errors': [{'reason': 'invalid'}]})
+                    self.stats['rows_rejected'] += 1
+                elif draw < self._rejected_rate + self._row_error_rate:
+                    errors.append({'index': index, 'errors': [{'reason': 'backendError'}]})
+                    self.stats['row_errors'] += 1
+                else:
+                    self.stats['rows_accepted'] += 1
+                    timestamp = row.get('event_timestamp')
+                    if isinstance(timestamp, datetime):
+                        self.lags_s.append((now - timestamp).total_seconds())
+            self.last_write = time.perf_counter()
+            return errors
+
+    # Table setup and health check
+
+    def create_dataset(self, dataset: Any, exists_ok: bool = False) -> Any:
+        return dataset
+
+    def create_table(self, table: Any, exists_ok: bool = False) -> Any:
+        return table
+
+    def get_table(self, table: Any) -> Any:
+        return table
+
+    def query(self, sql: str) -> Any:
+        return collections.namedtuple('Job', 'result')(lambda: [])
+
+    def close(self) -> None:
+        pass
+
+
+class FakeBigQueryWriteClient:
+    """BigQueryWriteClient that creates, finalizes and commits streams locally"""
+
+    def __init__(self):
+        self.wire_bytes = 0
+        self.appends = 0
+        self._streams = 0
+
+    def create_write_stream(self, parent: str, write_stream: Any) -> Any:
+        self._streams += 1
+        write_stream.name = f"{parent}/streams/s{self._streams}"
+        return write_stream
+
+    def finalize_write_stream(self, name: str) -> None:
+        pass
+
+    def batch_commit_write_streams(self, request: Any) -> Any:
+        return collections.namedtuple('Response', 'stream_errors')([])
+
+
+class FakeAppendRowsStream:
+    """writer.AppendRowsStream that acknowledges every request, counting its serialized size"""
+
+    def __init__(self, client: FakeBigQueryWriteClient, template: Any):
+        self._client = client
+
+    def send(self, request: Any) -> Future:
+        self._client.wire_bytes += len(type(request).serialize(request))
+        self._client.appends += 1
+        future: Future = Future()
+        future.set_result(None)
+        return future
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,118 @@
+"""
+Synthetic Debezium change events for benchmarks
+Envelopes shaped like the YugabyteDB connector's, with tunable size, op mix and table count
+
+Every table gets a fixed column layout (ints, decimals, text, booleans and
+nulls) sized so a row serialises to roughly row_bytes. Inserts take new
+primary keys, updates and deletes pick existing ones, and a share of
+messages can be made invalid (malformed JSON or a missing op) to exercise
+the rejection and dead-letter paths.
+
+ts_ms is left open: template() returns the envelope up to its final
+"ts_ms": value and stamp() completes it, so a fake broker can stamp each
+message at the moment it is "produced" and event lag is measured from there.
+"""
+
+import json
+import random
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_OP_MIX = {'c': 0.3, 'u': 0.6, 'd': 0.1}
+
+
+def stamp(template: bytes, ts_ms: int) -> bytes:
+    """Complete an envelope template with its change timestamp"""
+    return template + b'%d}' % ts_ms
+
+
+class DebeziumGenerator:
+    """Deterministic stream of Debezium envelopes across several tables"""
+
+    def __init__(self, tables: int = 3, row_bytes: int = 400, op_mix: Optional[Dict[str, float]] = None,
+                 invalid_ratio: float = 0.0, seed: int = 42, topic_prefix: str = 'codet.prod'):
+        self._rng = random.Random(seed)
+        self._op_mix = op_mix or DEFAULT_OP_MIX
+        self._invalid_ratio = invalid_ratio
+        self.tables = [f"table_{i}" if i else 'users' for i in range(tables)]
+        self.topic_prefix = topic_prefix
+        self._layouts = {table: self._layout(row_bytes) for table in self.tables}
+        self._next_id = {table: 1 for table in self.tables}
+
+    def topic(self, table: str) -> str:
+        return f"{self.topic_prefix}.{table}"
+
+    def columns(self, table: str) -> Dict[str, str]:
+        """BigQuery column types of a table's row image, e.g. for a routing config"""
+        types = {'int': 'INT64', 'decimal': 'FLOAT64', 'text': 'STRING', 'bool': 'BOOL', 'null': 'STRING'}
+        columns = {'id': 'INT64', 'email': 'STRING'}
+        columns.update((name, types[kind]) for name, kind in self._layouts[table])
+        return columns
+
+    def template(self, table: Optional[str] = None) -> Tuple[str, bytes]:
+        """(table, envelope without its ts_ms value) for the next change"""
+        table = table or self._rng.choice(self.tables)
+        if self._invalid_ratio and self._rng.random() < self._invalid_ratio:
+            return table, self._invalid(table)
+
+        op = self._op(table)
+        key = self._key(table, op)
+        row = self._row(table, key)
+        envelope = {
+            'before': row if op in ('u', 'd') else None,
+            'after': None if op == 'd' else row,
+            'source': {
+                'version': '1.9.5.y.22', 'connector': 'yugabytedb', 'name': 'yugabytedb-multizone',
+                'ts_ms': 0, 'snapshot': 'false', 'db': 'yugabyte', 'schema': 'public', 'table': table,
+                'txId': '', 'lsn': f"1:{key}::0:0",
+            },
+            'op': op,
+            'transaction': None,
+        }
+        text = json.dumps(envelope, separators=(',', ':'))
+        return table, (text[:-1] + ',"ts_ms":').encode('utf-8')
+
+    def envelopes(self, count: int, ts_ms: int = 1640995200000) -> List[bytes]:
+        """count complete envelopes, all stamped with ts_ms"""
+        return [stamp(self.template()[1], ts_ms) for _ in range(count)]
+
+    def _layout(self, row_bytes: int) -> List[Tuple[str, str]]:
+        # Column kinds cycle so every table mixes types; roughly 20 bytes of JSON per column
+        kinds = ('int', 'decimal', 'text', 'bool', 'null', 'text')
+        count = max(1, (row_bytes - 60) // 20)
+        return [(f"col_{i}", kinds[i % len(kinds)]) for i in range(count)]
+
+    def _op(self, table: str) -> str:
+        ops = list(self._op_mix)
+        op = self._rng.choices(ops, weights=[self._op_mix[o] for o in ops])[0]
+        # Nothing to update or delete yet
+        return 'c' if op in ('u', 'd') and self._next_id[table] == 1 else op
+
+    def _key(self, table: str, op: str) -> int:
+        if op in ('c', 'r'):
+            key = self._next_id[table]
+            self._next_id[table] += 1
+            return key
+        return self._rng.randint(1, self._next_id[table] - 1)
+
+    def _row(self, table: str, key: int) -> Dict[str, object]:
+        rng = self._rng
+        row: Dict[str, object] = {'id': key, 'email': f"user{key}@example.com"}
+        for name, kind in self._layouts[table]:
+            if kind == 'int':
+                row[name] = rng.randint(0, 10 ** 9)
+            elif kind == 'decimal':
+                row[name] = round(rng.random() * 1000, 2)
+            elif kind == 'text':
+                row[name] = ''.join(rng.choice('abcdefghij klmnop') for _ in range(rng.randint(4, 16)))
+            elif kind == 'bool':
+                row[name] = rng.random() < 0.5
+            else:
+                row[name] = None
+        return row
+
+    def _invalid(self, table: str) -> bytes:
+        if self._rng.random() < 0.5:
+            # Truncated mid-document; stamp() still appends a timestamp and brace
+            return b'{"before":null,"after":{"id":1,"email":"trunc'
+        text = json.dumps({'after': {'id': 1}, 'source': {'table': table}}, separators=(',', ':'))
+        return (text[:-1] + ',"ts_ms":').encode('utf-8')
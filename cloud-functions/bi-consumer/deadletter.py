@@ -0,0 +1,346 @@
+"""
+Dead-letter handling for the BI Consumer
+Keeps messages that cannot be loaded, with the reason, so they can be replayed
+
+A message is dead-lettered when it is not valid JSON, fails validation, or
+BigQuery rejects its row for its content. Records are buffered and written in
+batches either to a Kafka topic (KafkaDeadLetterWriter) or to size-capped
+JSON-lines segments on local disk (FileDeadLetterSpool).
+
+Records that cannot be written are reported to on_write_failure so the
+caller can stop its offsets from moving past them. Records over the spool's
+size cap are dropped on purpose and counted, so a flood of bad messages
+cannot fill the instance's disk or memory.
+
+Replay reads records back in batches and hands them to a handler (normally
+the regular transform and sink path); a batch is only removed once the
+handler reports success. A spool segment that fails part way is rewritten
+with just the records not yet replayed.
+"""
+
+import base64
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_NONE = 'none'
+DEAD_LETTER_KAFKA = 'kafka'
+DEAD_LETTER_FILE = 'file'
+
+STAGE_DECODE = 'decode'
+STAGE_VALIDATE = 'validate'
+STAGE_INSERT = 'insert'
+
+# Spool segments are written under an in-progress suffix and renamed once sealed
+_SEGMENT_PREFIX = 'dead-letters-'
+_SEGMENT_SUFFIX = '.jsonl'
+_OPEN_SUFFIX = '.open'
+
+
+class DeadLetter:
+    """A failed message: where it came from, its raw value and why it failed"""
+
+    __slots__ = ('topic', 'partition', 'offset', 'value', 'stage', 'reason', 'failed_at')
+
+    def __init__(self, topic: Optional[str], partition: Optional[int], offset: Optional[int], value: bytes,
+                 stage: str, reason: str, failed_at: Optional[str] = None):
+        self.topic = topic
+        self.partition = partition
+        self.offset = offset
+        self.value = value
+        self.stage = stage
+        self.reason = reason
+        self.failed_at = failed_at or datetime.utcnow().isoformat()
+
+    @property
+    def key(self) -> str:
+        return f"{self.topic}:{self.partition}:{self.offset}"
+
+    def to_json(self) -> str:
+        record: Dict[str, Any] = {
+            'topic': self.topic,
+            'partition': self.partition,
+            'offset': self.offset,
+            'stage': self.stage,
+            'reason': self.reason,
+            'failed_at': self.failed_at,
+        }
+        try:
+            record['value'] = self.value.decode('utf-8')
+        except UnicodeDecodeError:
+            record['value_b64'] = base64.b64encode(self.value).decode('ascii')
+        return json.dumps(record, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text: str) -> 'DeadLetter':
+        record = json.loads(text)
+        if 'value_b64' in record:
+            value = base64.b64decode(record['value_b64'])
+        else:
+            value = record.get('value', '').encode('utf-8')
+        return cls(record.get('topic'), record.get('partition'), record.get('offset'), value,
+                   record.get('stage', ''), record.get('reason', ''), record.get('failed_at'))
+
+
+class KafkaDeadLetterWriter:
+    """Produces dead letters to a Kafka topic, keyed by their original position"""
+
+    name = DEAD_LETTER_KAFKA
+
+    def __init__(self, producer: Any, topic: str, flush_timeout_s: float = 10.0):
+        self._producer = producer
+        self._topic = topic
+        self._flush_timeout_s = flush_timeout_s
+
+    def write(self, records: List[DeadLetter]) -> List[DeadLetter]:
+        """Send a batch and wait for it; returns the records that were not acknowledged"""
+        sent = []
+        failed = []
+        for record in records:
+            try:
+                sent.append((record, self._producer.send(
+                    self._topic, key=record.key.encode('utf-8'), value=record.to_json().encode('utf-8'))))
+            except Exception as e:
+                logger.error(f"Could not queue dead letter {record.key}: {e}")
+                failed.append(record)
+
+        try:
+            self._producer.flush(timeout=self._flush_timeout_s)
+        except Exception as e:
+            logger.error(f"Dead-letter producer flush failed: {e}")
+
+        for record, future in sent:
+            if not future.is_done or future.failed():
+                failed.append(record)
+        return failed
+
+    def close(self) -> None:
+        pass
+
+
+class FileDeadLetterSpool:
+    """Size-capped JSON-lines spool on local disk, split into segments"""
+
+    name = DEAD_LETTER_FILE
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024,
+                 segment_bytes: int = 4 * 1024 * 1024):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._open_path: Optional[str] = None
+        self._open_bytes = 0
+        self.stats = {'records_spooled': 0, 'records_dropped': 0, 'segments_sealed': 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self._seal_leftovers()
+        self._total_bytes = sum(os.path.getsize(path) for path in self._segments())
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def write(self, records: List[DeadLetter]) -> List[DeadLetter]:
+        """Append a batch; records beyond the size cap are dropped and counted"""
+        lines = []
+        dropped = 0
+        with self._lock:
+            budget = self._max_bytes - self._total_bytes
+            for record in records:
+                line = (record.to_json() + '\n').encode('utf-8')
+                if len(line) > budget:
+                    dropped += 1
+                    continue
+                budget -= len(line)
+                lines.append(line)
+
+            if lines:
+                if self._open_path is None:
+                    self._open_path = os.path.join(
+                        self._directory, f"{_SEGMENT_PREFIX}{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+                                         f"{_SEGMENT_SUFFIX}{_OPEN_SUFFIX}")
+                    self._open_bytes = 0
+                data = b''.join(lines)
+                with open(self._open_path, 'ab') as f:
+                    f.write(data)
+                self._open_bytes += len(data)
+                self._total_bytes += len(data)
+                self.stats['records_spooled'] += len(lines)
+                if self._open_bytes >= self._segment_bytes:
+                    self._seal()
+
+            if dropped:
+                self.stats['records_dropped'] += dropped
+                logger.error(f"Dead-letter spool is full ({self._total_bytes} bytes): dropped {dropped} records")
+        return []
+
+    def close(self) -> None:
+        with self._lock:
+            self._seal()
+
+    def replay(self, handler: Callable[[List[DeadLetter]], bool], batch_size: int = 500) -> Dict[str, int]:
+        """Feed sealed segments to handler in batches, deleting each segment once all its batches succeed"""
+        self.close()
+        stats = {'segments_replayed': 0, 'segments_kept': 0, 'records_replayed': 0}
+        for path in sorted(self._segments()):
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = [line for line in f if line.strip()]
+            records = [DeadLetter.from_json(line) for line in lines]
+
+            replayed = 0
+            for start in range(0, len(records), batch_size):
+                if not handler(records[start:start + batch_size]):
+                    break
+                replayed = min(start + batch_size, len(records))
+            stats['records_replayed'] += replayed
+            if replayed < len(records):
+                stats['segments_kept'] += 1
+                if replayed:
+                    # Drop the batches already written, so the next replay does not send them again
+                    self._rewrite(path, lines[replayed:])
+                logger.warning(f"Replay of {os.path.basename(path)} failed; keeping {len(records) - replayed} "
+                               f"records for the next replay")
+                continue
+
+            size = os.path.getsize(path)
+            os.remove(path)
+            with self._lock:
+                self._total_bytes -= size
+            stats['segments_replayed'] += 1
+        return stats
+
+    def _rewrite(self, path: str, lines: List[str]) -> None:
+        size = os.path.getsize(path)
+        temporary = path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(temporary, path)
+        with self._lock:
+            self._total_bytes += os.path.getsize(path) - size
+
+    def _segments(self) -> List[str]:
+        return [os.path.join(self._directory, name) for name in os.listdir(self._directory)
+                if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX)]
+
+    def _seal(self) -> None:
+        if self._open_path is None:
+            return
+        os.rename(self._open_path, self._open_path[:-len(_OPEN_SUFFIX)])
+        self.stats['segments_sealed'] += 1
+        self._open_path = None
+        self._open_bytes = 0
+
+    def _seal_leftovers(self) -> None:
+        # Segments left open by a previous instance are complete up to their last full line
+        for name in os.listdir(self._directory):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX + _OPEN_SUFFIX):
+                path = os.path.join(self._directory, name)
+                os.rename(path, path[:-len(_OPEN_SUFFIX)])
+
+
+class DeadLetterQueue:
+    """Buffers dead letters and writes them in batches"""
+
+    def __init__(self, writer: Any, batch_size: int = 100,
+                 on_write_failure: Optional[Callable[[List[DeadLetter]], None]] = None):
+        self._writer = writer
+        self._batch_size = batch_size
+        self._on_write_failure = on_write_failure
+        self._lock = threading.Lock()
+        self._buffer: List[DeadLetter] = []
+        self.stats: Dict[str, Any] = {
+            'writer': writer.name,
+            'records': 0,
+            'batches': 0,
+            'write_failures': 0,
+            'by_stage': {},
+        }
+
+    def add(self, record: DeadLetter) -> None:
+        """Buffer a record, writing the batch once it is full"""
+        with self._lock:
+            self._buffer.append(record)
+            self.stats['records'] += 1
+            self.stats['by_stage'][record.stage] = self.stats['by_stage'].get(record.stage, 0) + 1
+            if len(self._buffer) >= self._batch_size:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        """Write whatever is buffered (call before committing offsets)"""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        self.flush()
+        self._writer.close()
+
+    def _flush_locked(self) -> None:
+        if not self._buffer:
+            return
+        records = self._buffer
+        self._buffer = []
+        try:
+            failed = self._writer.write(records)
+        except Exception as e:
+            logger.error(f"Dead-letter write of {len(records)} records failed: {e}")
+            failed = records
+        self.stats['batches'] += 1
+        if failed:
+            self.stats['write_failures'] += len(failed)
+            if self._on_write_failure is not None:
+                self._on_write_failure(failed)
+
+
+def replay_from_consumer(consumer: Iterable[Any], handler: Callable[[List[DeadLetter]], bool],
+                         batch_size: int = 500,
+                         commit: Optional[Callable[[Dict[Tuple[str, int], int]], None]] = None,
+                         until: Optional[str] = None) -> Dict[str, int]:
+    """Feed a dead-letter topic to handler in batches, committing after each successful batch
+
+    Stops at the first batch the handler cannot write so its offsets stay
+    uncommitted, and at the first record that failed at or after `until`
+    (e.g. one the replay itself dead-lettered again). commit gets the next
+    offset per (topic, partition) of the records read so far, never the
+    consumer's position, which may already be past the record it stopped at.
+    """
+    stats = {'batches_replayed': 0, 'records_replayed': 0, 'batches_failed': 0}
+    positions: Dict[Tuple[str, int], int] = {}
+
+    def run(batch: List[DeadLetter]) -> bool:
+        if not handler(batch):
+            stats['batches_failed'] += 1
+            return False
+        if commit is not None and positions:
+            commit(dict(positions))
+        stats['batches_replayed'] += 1
+        stats['records_replayed'] += len(batch)
+        return True
+
+    batch: List[DeadLetter] = []
+    for message in consumer:
+        try:
+            record = DeadLetter.from_json(message.value.decode('utf-8'))
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Skipping unreadable dead letter at offset {getattr(message, 'offset', '?')}: {e}")
+            record = None
+        if record is not None and until is not None and record.failed_at >= until:
+            break
+        positions[(message.topic, message.partition)] = message.offset + 1
+        if record is None:
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            if not run(batch):
+                return stats
+            batch = []
+    if batch:
+        run(batch)
+    return stats
@@ -0,0 +1,126 @@
+"""
+Fast decode path for Debezium envelopes
+Decodes each Kafka message once and keeps the raw JSON text of its row images
+
+With the standard library backend, the top-level envelope is walked with the
+C scanner from the json module, recording where the `after` and `before`
+values start and end. process_event can then reuse that text for
+`event_data` instead of re-encoding the decoded payload with json.dumps.
+Row images spread over several lines (a pretty-printed envelope) are not
+kept: event_data is spliced into NDJSON load files, one row per line.
+
+When orjson is installed it is used instead: it decodes and re-encodes fast
+enough that slicing buys nothing.
+"""
+
+import json
+import re
+from typing import Any, Optional
+
+try:
+    import orjson
+except ImportError:  # optional fast backend
+    orjson = None
+
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+_decoder = json.JSONDecoder()
+_scan_once = _decoder.scan_once
+# Match the opening brace before the first top-level key, and the separating comma before the others
+_match_first_key = re.compile(r'\s*\{\s*"([^"\\]*)"\s*:\s*').match
+_match_key = re.compile(r'\s*,\s*"([^"\\]*)"\s*:\s*').match
+_match_close = re.compile(r'\s*}\s*$').match
+
+
+class UndecodableMessage:
+    """Stand-in value for a Kafka message that is not valid JSON"""
+
+    __slots__ = ('raw', 'error')
+
+    def __init__(self, raw: bytes, error: str):
+        self.raw = raw
+        self.error = error
+
+    def __repr__(self) -> str:
+        return f"UndecodableMessage({self.error!r}, {len(self.raw)} bytes)"
+
+
+class DebeziumEvent(dict):
+    """Decoded envelope that remembers the raw JSON text of its row images"""
+
+    # Class-level defaults keep construction in C; the walk sets them per instance
+    raw_after: Optional[str] = None
+    raw_before: Optional[str] = None
+
+
+def dumps(value: Any) -> str:
+    """Serialize a value to JSON text with the fastest available backend"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(value)
+
+
+def _single_line(raw: str) -> Optional[str]:
+    # Line breaks in JSON text are whitespace outside strings; such text is re-encoded compactly instead
+    return None if '\n' in raw or '\r' in raw else raw
+
+
+def _walk_envelope(text: str) -> Optional[DebeziumEvent]:
+    """Decode a top-level JSON object, recording the spans of `after` and `before`"""
+    event = DebeziumEvent()
+    position = 0
+    while True:
+        match = (_match_key if position else _match_first_key)(text, position)
+        if match is None:
+            break
+        key = match.group(1)
+        start = match.end()
+        value, position = _scan_once(text, start)
+        event[key] = value
+        if key == 'after':
+            event.raw_after = _single_line(text[start:position])
+        elif key == 'before':
+            event.raw_before = _single_line(text[start:position])
+
+    # Anything unexpected (escaped keys, empty objects, trailing data) takes the slow path
+    if not event or _match_close(text, position) is None:
+        return None
+    return event
+
+
+def decode_event(raw: bytes) -> Any:
+    """Kafka value deserializer for Debezium JSON envelopes"""
+    if orjson is not None:
+        try:
+            value = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # orjson rejects some inputs the json module accepts (e.g. integers beyond 64 bits)
+            value = json.loads(raw.decode('utf-8'))
+        return DebeziumEvent(value) if isinstance(value, dict) else value
+
+    text = raw.decode('utf-8')
+    try:
+        event = _walk_envelope(text)
+    except (StopIteration, ValueError):
+        # Malformed input: let json.loads raise a proper JSONDecodeError
+        event = None
+    if event is not None:
+        return event
+
+    value = json.loads(text)
+    return DebeziumEvent(value) if isinstance(value, dict) else value
+
+
+def decode_event_or_error(raw: bytes) -> Any:
+    """Like decode_event, but returns an UndecodableMessage instead of raising
+
+    kafka-python raises deserializer errors out of the consumer iterator,
+    which would end the whole poll loop on a single bad message.
+    """
+    try:
+        return decode_event(raw)
+    except ValueError as e:  # JSONDecodeError and UnicodeDecodeError
+        return UndecodableMessage(raw, f"{type(e).__name__}: {e}")
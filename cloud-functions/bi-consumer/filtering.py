@@ -0,0 +1,144 @@
+"""
+Event filtering and column projection for the BI Consumer
+Drops tables, operations and columns marketing does not use, as early as possible
+
+The topic pattern subscribes to every CDC table. A filter config narrows
+that down in three places:
+
+    tables   allow_tables / deny_tables, checked against the topic name
+             (its last segment is the table) before a message is decoded, and
+             against source.table once it is
+    ops      Debezium op codes to keep ("c", "u", "d", "r"), globally or per
+             table, checked right after decoding
+    columns  per-table include_columns or exclude_columns, applied to the row
+             image before event_data (or a route's typed columns) is built
+
+Filtered messages are neither processed nor failed: their offsets move on and
+they are counted as filtered. Keep the key columns (id / user_id) in include
+lists, since user_id and change coalescing read them.
+
+Config is JSON, inline or the path of a file:
+
+    {"deny_tables": ["audit_log"],
+     "ops": ["c", "u", "d"],
+     "tables": {"users": {"exclude_columns": ["password_hash"], "ops": ["c", "u"]},
+                "orders": {"include_columns": ["id", "user_id", "total", "status"]}}}
+"""
+
+from typing import Any, Dict, FrozenSet, Iterable, Optional
+
+from routing import read_json_config
+
+OPERATIONS = frozenset({'c', 'u', 'd', 'r'})
+
+
+def table_of_topic(topic: str) -> str:
+    """Source table of a CDC topic (<prefix>.<table>)"""
+    return topic.rsplit('.', 1)[-1]
+
+
+def _names(value: Any, what: str) -> Optional[FrozenSet[str]]:
+    if value is None:
+        return None
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise ValueError(f"Event filter {what} must be a list of names")
+    return frozenset(value)
+
+
+def _ops(value: Any, what: str) -> Optional[FrozenSet[str]]:
+    ops = _names(value, what)
+    if ops is not None and not ops <= OPERATIONS:
+        raise ValueError(f"Event filter {what} has unknown op codes: {sorted(ops - OPERATIONS)}")
+    return ops
+
+
+class EventFilter:
+    """Table, op and column filters; an empty config lets everything through untouched"""
+
+    def __init__(self, allow_tables: Optional[Iterable[str]] = None, deny_tables: Optional[Iterable[str]] = None,
+                 ops: Optional[Iterable[str]] = None, tables: Optional[Dict[str, Dict[str, Any]]] = None):
+        self._allow = frozenset(allow_tables) if allow_tables is not None else None
+        self._deny = frozenset(deny_tables or ())
+        self._ops = frozenset(ops) if ops is not None else None
+        self._table_ops: Dict[str, FrozenSet[str]] = {}
+        self._include: Dict[str, FrozenSet[str]] = {}
+        self._exclude: Dict[str, FrozenSet[str]] = {}
+        for table, spec in (tables or {}).items():
+            if not isinstance(spec, dict):
+                raise ValueError(f"Event filter for {table} must be an object")
+            include = _names(spec.get('include_columns'), f"include_columns of {table}")
+            exclude = _names(spec.get('exclude_columns'), f"exclude_columns of {table}")
+            if include is not None and exclude is not None:
+                raise ValueError(f"Event filter for {table} sets both include_columns and exclude_columns")
+            if include is not None:
+                self._include[table] = include
+            if exclude:
+                self._exclude[table] = exclude
+            table_ops = _ops(spec.get('ops'), f"ops of {table}")
+            if table_ops is not None:
+                self._table_ops[table] = table_ops
+        # Topic decisions are made once per topic
+        self._topics: Dict[str, bool] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._allow is not None or self._deny or self._ops is not None
+                    or self._table_ops or self._include or self._exclude)
+
+    def allows_table(self, table: Any) -> bool:
+        if self._allow is not None and table not in self._allow:
+            return False
+        return table not in self._deny
+
+    def allows_topic(self, topic: str) -> bool:
+        """Whether messages of a topic are worth decoding"""
+        allowed = self._topics.get(topic)
+        if allowed is None:
+            allowed = self._topics[topic] = self.allows_table(table_of_topic(topic))
+        return allowed
+
+    def allows_event(self, event: Any) -> bool:
+        """Whether a decoded event's table and op are kept (malformed events are left to validation)"""
+        if not isinstance(event, dict) or not isinstance(event.get('source'), dict):
+            return True
+        table = event['source'].get('table')
+        if not self.allows_table(table):
+            return False
+        ops = self._table_ops.get(table, self._ops)
+        return ops is None or 'op' not in event or event['op'] in ops
+
+    def projects(self, table: Any) -> bool:
+        return table in self._include or table in self._exclude
+
+    def project(self, table: Any, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """A table's row image narrowed to its included (or without its excluded) columns"""
+        include = self._include.get(table)
+        if include is not None:
+            return {name: value for name, value in payload.items() if name in include}
+        exclude = self._exclude.get(table)
+        if exclude:
+            return {name: value for name, value in payload.items() if name not in exclude}
+        return payload
+
+
+def parse_event_filter(config: Dict[str, Any]) -> EventFilter:
+    """An EventFilter from a decoded filter config"""
+    if not isinstance(config, dict):
+        raise ValueError("Event filter must be a JSON object")
+    unknown = sorted(set(config) - {'allow_tables', 'deny_tables', 'ops', 'tables'})
+    if unknown:
+        raise ValueError(f"Event filter has unknown keys: {unknown}")
+    tables = config.get('tables', {})
+    if not isinstance(tables, dict):
+        raise ValueError("Event filter tables must be an object keyed by source table")
+    return EventFilter(
+        allow_tables=_names(config.get('allow_tables'), 'allow_tables'),
+        deny_tables=_names(config.get('deny_tables'), 'deny_tables'),
+        ops=_ops(config.get('ops'), 'ops'),
+        tables=tables
+    )
+
+
+def load_event_filter(value: str) -> EventFilter:
+    """Filter from inline JSON or the path of a JSON file; empty means keep everything"""
+    config = read_json_config(value, 'Event filters')
+    return EventFilter() if config is None else parse_event_filter(config)
@@ -0,0 +1,48 @@
+"""
+Lazy imports for the BI Consumer
+Defers heavy client libraries until an entry point actually needs them
+
+google-cloud-bigquery, google-cloud-secret-manager and kafka-python pull in
+gRPC, protobuf and requests and take hundreds of milliseconds to import.
+A LazyModule stands in for the module and imports it on first attribute
+access, so a cold start that only serves health_check never pays for Kafka.
+
+Attributes set on the proxy (e.g. by unittest.mock.patch) shadow the real
+module's attributes until they are deleted again.
+"""
+
+import importlib
+import threading
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyModule:
+    """Proxy that imports the named module the first time it is used"""
+
+    def __init__(self, name: str):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self) -> ModuleType:
+        """Import the module now (e.g. to warm it up off the request path)"""
+        module: Optional[ModuleType] = self._module
+        if module is None:
+            with self._lock:
+                module = self._module
+                if module is None:
+                    module = importlib.import_module(self._name)
+                    self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.load(), attr)
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f"<LazyModule {self._name!r} ({state})>"
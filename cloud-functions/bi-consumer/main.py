@@ -5,29 +5,66 @@ Consumes events from Kafka and sends to Google Sheets/BigQuery for Marketing
 Security: Uses Google Cloud Secret Manager for sensitive configuration
 Error Handling: Comprehensive try/catch with proper logging
 Monitoring: Structured logging with correlation IDs
+Cold start: client libraries are imported and clients built on first use
 """
 
+from __future__ import annotations
+
 import os
 import json
-import base64
-import traceback
+import hashlib
+import threading
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Union, Tuple
-from google.cloud import bigquery, secretmanager
-from google.oauth2 import service_account
-from kafka import KafkaConsumer
-from kafka.errors import KafkaError, KafkaTimeoutError
+from typing import Dict, Any, Callable, Iterable, Optional, List, Set, Tuple
 import logging
-import uuid
+import time
 from functools import wraps
 
-# Configure structured logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s - %(correlation_id)s'
+from backfill import BackfillAssignment, BackfillCheckpoint, parse_backfill_request, resolve_ranges, split_ranges
+from backpressure import MemoryBudget
+from batching import AdaptiveBatcher, estimate_row_bytes
+from coalescing import CHANGE_COUNT_FIELD, ROW_KEY_FIELD, ChangeCoalescer, parse_coalesce_tables, reduction_ratio
+from deadletter import (
+    DEAD_LETTER_FILE, DEAD_LETTER_KAFKA, DEAD_LETTER_NONE, STAGE_DECODE, STAGE_INSERT, STAGE_VALIDATE,
+    DeadLetter, DeadLetterQueue, FileDeadLetterSpool, KafkaDeadLetterWriter, replay_from_consumer,
+)
+from decoding import UndecodableMessage, decode_event_or_error, dumps
+from filtering import EventFilter, load_event_filter
+from lazy_imports import LazyModule
+from metrics import CONTENT_TYPE, LAG_BUCKETS, MetricsRegistry
+from offsets import OffsetTracker, partition_key
+from pipeline import InsertPipeline
+from resources import ResourceRegistry
+from retry import RetryBudget, RetryPolicy
+from routing import METADATA_FIELDS as ROUTE_METADATA_FIELDS, Route, load_routes
+from runner import ConsumerGroupRunner, merge_stats
+from scheduler import DeadlineScheduler
+from secret_cache import SecretCache
+from sinks import (
+    LOAD_FORMAT_NDJSON, SINK_INSERT_ALL, SINK_LOAD_JOB, SINK_STORAGE_WRITE, STREAM_TYPE_COMMITTED,
+    InsertAllSink, LoadJobSink, Sink, StorageWriteSink, arrow_schema,
+)
+from structured_logging import (
+    LOG_FORMAT_TEXT, EventLogLimiter, configure_logging, correlation_context,
 )
+from writeahead import SpooledBatch, WriteAheadSpool
+
+# Heavy client libraries, imported on first use (see lazy_imports)
+bigquery = LazyModule('google.cloud.bigquery')
+secretmanager = LazyModule('google.cloud.secretmanager')
+kafka = LazyModule('kafka')
+kafka_errors = LazyModule('kafka.errors')
+
+# Configure structured logging ('text' or 'json' lines for Cloud Logging)
+LOG_FORMAT = os.environ.get('LOG_FORMAT', LOG_FORMAT_TEXT).lower()
+configure_logging(level=logging.INFO, log_format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
+# Per-event warnings: at most EVENT_LOG_BURST of each kind per interval, the rest counted
+EVENT_LOG_BURST = int(os.environ.get('EVENT_LOG_BURST', '5'))
+EVENT_LOG_INTERVAL_S = float(os.environ.get('EVENT_LOG_INTERVAL_S', '10'))
+EVENT_LOG = EventLogLimiter(logger, burst=EVENT_LOG_BURST, interval_s=EVENT_LOG_INTERVAL_S)
+
 # Constants for configuration
 DEFAULT_KAFKA_SERVERS = 'redpanda.codet-prod.svc.cluster.local:9092'
 DEFAULT_KAFKA_TOPIC_PATTERN = 'codet.prod.*'
@@ -35,10 +72,53 @@ DEFAULT_KAFKA_GROUP_ID = 'marketing-bi-consumer'
 DEFAULT_BIGQUERY_DATASET = 'marketing_events'
 DEFAULT_BIGQUERY_TABLE = 'user_events'
 DEFAULT_ENVIRONMENT = 'production'
-DEFAULT_MAX_BATCH_SIZE = 50
+DEFAULT_MAX_BATCH_SIZE = 500  # Row cap; batches normally seal on the byte budget first
+DEFAULT_BATCH_MAX_BYTES = 5 * 1024 * 1024  # Well under BigQuery's 10MB request limit
+DEFAULT_BATCH_MIN_BYTES = 256 * 1024
+DEFAULT_BATCH_INITIAL_BYTES = 1024 * 1024
+DEFAULT_BATCH_LINGER_MS = 1000
+DEFAULT_BATCH_TARGET_LATENCY_MS = 1000
 DEFAULT_CONSUMER_TIMEOUT_MS = 10000
-DEFAULT_MAX_POLL_RECORDS = 100
+DEFAULT_OFFSET_COMMIT_INTERVAL_MS = 5000
+DEFAULT_INSERT_RETRY_MAX_ATTEMPTS = 5
+DEFAULT_INSERT_RETRY_BASE_DELAY_MS = 200
+DEFAULT_INSERT_RETRY_MAX_DELAY_MS = 10000
+DEFAULT_INSERT_RETRY_BUDGET = 50  # Retry requests per invocation, across all workers
+DEFAULT_MAX_POLL_RECORDS = 500  # Records per poll(), transformed per partition in one pass
+DEFAULT_FETCH_MIN_BYTES = 16 * 1024  # Broker holds a fetch until this much is ready...
+DEFAULT_FETCH_MAX_WAIT_MS = 500  # ...or this long has passed (well under BATCH_LINGER_MS)
+DEFAULT_FETCH_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_MAX_PARTITION_FETCH_BYTES = 1024 * 1024
+DEFAULT_RECEIVE_BUFFER_BYTES = 1024 * 1024  # Socket SO_RCVBUF; 0 keeps the OS default
 DEFAULT_CLOUD_FUNCTION_TIMEOUT_MS = 540000  # 9 minutes (Cloud Functions have 10min max)
+DEFAULT_SECRET_CACHE_TTL_S = 300
+DEFAULT_SECRET_CACHE_STALE_TTL_S = 3600
+DEFAULT_SECRET_CACHE_NEGATIVE_TTL_S = 30
+DEFAULT_CONSUMER_WORKERS = 1
+DEFAULT_INSERT_WORKERS = 0  # 0 = synchronous inserts on the consumer thread
+DEFAULT_PIPELINE_MAX_PENDING_BATCHES = 4
+DEFAULT_PIPELINE_DRAIN_TIMEOUT_S = 20
+DEFAULT_DRAIN_RESERVE_BASE_MS = 10000  # Time kept back before the deadline to close the sink and commit
+DEFAULT_DRAIN_RESERVE_PER_ROW_MS = 1.0  # Plus this much for every row still buffered or in flight
+DEFAULT_MEMORY_BUDGET_BYTES = 64 * 1024 * 1024  # Estimated JSON bytes; Python objects take a few times more
+DEFAULT_MEMORY_RESUME_RATIO = 0.5
+DEFAULT_BACKPRESSURE_POLL_MS = 100
+DEFAULT_BIGQUERY_SINK = SINK_INSERT_ALL
+DEFAULT_STORAGE_WRITE_STREAM_TYPE = STREAM_TYPE_COMMITTED
+DEFAULT_LOAD_JOB_FORMAT = LOAD_FORMAT_NDJSON
+DEFAULT_LOAD_JOB_STAGING_DIR = '/tmp/bi-consumer-staging'
+DEFAULT_LOAD_JOB_MAX_FILE_BYTES = 64 * 1024 * 1024
+DEFAULT_LOAD_JOB_MAX_FILE_AGE_S = 60
+DEFAULT_DEAD_LETTER_MODE = DEAD_LETTER_NONE
+DEFAULT_DEAD_LETTER_TOPIC = 'codet.dlq.marketing-bi-consumer'  # Must not match KAFKA_TOPIC_PATTERN
+DEFAULT_DEAD_LETTER_SPOOL_DIR = '/tmp/bi-consumer-dead-letters'
+DEFAULT_DEAD_LETTER_SPOOL_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_DEAD_LETTER_BATCH_SIZE = 100
+DEFAULT_BACKFILL_WORKERS = 4
+DEFAULT_BACKFILL_CHECKPOINT_DIR = '/tmp/bi-consumer-backfill'
+DEFAULT_BACKFILL_CHECKPOINT_INTERVAL_S = 120  # Each checkpoint also waits for the open load jobs
+DEFAULT_WRITE_AHEAD_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_WRITE_AHEAD_SEGMENT_BYTES = 8 * 1024 * 1024
 
 # Configuration from environment with secure defaults
 KAFKA_BOOTSTRAP_SERVERS = os.environ.get('KAFKA_BOOTSTRAP_SERVERS', DEFAULT_KAFKA_SERVERS)
@@ -49,41 +129,187 @@ BIGQUERY_TABLE = os.environ.get('BIGQUERY_TABLE', DEFAULT_BIGQUERY_TABLE)
 PROJECT_ID = os.environ.get('GCP_PROJECT', os.environ.get('GOOGLE_CLOUD_PROJECT', ''))
 ENVIRONMENT = os.environ.get('ENVIRONMENT', DEFAULT_ENVIRONMENT)
 
-# Security: Use Secret Manager for sensitive configuration
-SECRET_CLIENT = secretmanager.SecretManagerServiceClient()
+# Per-table routing (see routing.py): JSON, or the path of a JSON file, mapping source tables to
+# typed destination tables in the same dataset. Unrouted tables go to BIGQUERY_TABLE.
+TABLE_ROUTES = load_routes(os.environ.get('TABLE_ROUTES', ''))
+
+# Change coalescing (see coalescing.py): comma-separated source tables, or '*', whose repeated
+# updates of one row within a batch are merged into the latest row image with a change_count
+COALESCE_TABLES = parse_coalesce_tables(os.environ.get('COALESCE_TABLES', ''))
+
+# Event filters (see filtering.py): JSON, or the path of a JSON file, with table allow/deny lists
+# checked before decoding, op filters, and per-table column include/exclude lists
+EVENT_FILTER = load_event_filter(os.environ.get('EVENT_FILTERS', ''))
+
+# Warm-instance reuse: keep the Kafka consumer (and its group membership) open between invocations
+REUSE_KAFKA_CONSUMER = os.environ.get('REUSE_KAFKA_CONSUMER', 'true').lower() in ('1', 'true', 'yes')
+
+# Security: Use Secret Manager for sensitive configuration (client built on first lookup)
+SECRET_CLIENT = None
+SECRET_CLIENT_LOCK = threading.Lock()
+SECRET_CACHE_TTL_S = int(os.environ.get('SECRET_CACHE_TTL_S', str(DEFAULT_SECRET_CACHE_TTL_S)))
+SECRET_CACHE_STALE_TTL_S = int(os.environ.get('SECRET_CACHE_STALE_TTL_S', str(DEFAULT_SECRET_CACHE_STALE_TTL_S)))
+SECRET_CACHE_NEGATIVE_TTL_S = int(os.environ.get('SECRET_CACHE_NEGATIVE_TTL_S', str(DEFAULT_SECRET_CACHE_NEGATIVE_TTL_S)))
+
+# Kafka credentials in Secret Manager
+KAFKA_SECRET_NAMES = ('kafka-username', 'kafka-password')
+
+# Broker errors that may mean our cached credentials were rotated (resolved lazily from kafka.errors)
+KAFKA_AUTH_ERROR_NAMES = ('AuthenticationFailedError', 'AuthenticationMethodNotSupported', 'NoBrokersAvailable')
 
 # Constants with proper defaults
 MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', str(DEFAULT_MAX_BATCH_SIZE)))
+BATCH_MAX_BYTES = int(os.environ.get('BATCH_MAX_BYTES', str(DEFAULT_BATCH_MAX_BYTES)))
+BATCH_MIN_BYTES = int(os.environ.get('BATCH_MIN_BYTES', str(DEFAULT_BATCH_MIN_BYTES)))
+BATCH_INITIAL_BYTES = int(os.environ.get('BATCH_INITIAL_BYTES', str(DEFAULT_BATCH_INITIAL_BYTES)))
+BATCH_LINGER_MS = int(os.environ.get('BATCH_LINGER_MS', str(DEFAULT_BATCH_LINGER_MS)))
+BATCH_TARGET_LATENCY_MS = int(os.environ.get('BATCH_TARGET_LATENCY_MS', str(DEFAULT_BATCH_TARGET_LATENCY_MS)))
 CONSUMER_TIMEOUT_MS = int(os.environ.get('CONSUMER_TIMEOUT_MS', str(DEFAULT_CONSUMER_TIMEOUT_MS)))
+# Offsets are committed by hand, at most this often, and only past rows BigQuery has accepted
+OFFSET_COMMIT_INTERVAL_MS = int(os.environ.get('OFFSET_COMMIT_INTERVAL_MS', str(DEFAULT_OFFSET_COMMIT_INTERVAL_MS)))
 MAX_POLL_RECORDS = int(os.environ.get('MAX_POLL_RECORDS', str(DEFAULT_MAX_POLL_RECORDS)))
+FETCH_MIN_BYTES = int(os.environ.get('FETCH_MIN_BYTES', str(DEFAULT_FETCH_MIN_BYTES)))
+FETCH_MAX_WAIT_MS = int(os.environ.get('FETCH_MAX_WAIT_MS', str(DEFAULT_FETCH_MAX_WAIT_MS)))
+FETCH_MAX_BYTES = int(os.environ.get('FETCH_MAX_BYTES', str(DEFAULT_FETCH_MAX_BYTES)))
+MAX_PARTITION_FETCH_BYTES = int(os.environ.get('MAX_PARTITION_FETCH_BYTES', str(DEFAULT_MAX_PARTITION_FETCH_BYTES)))
+RECEIVE_BUFFER_BYTES = int(os.environ.get('RECEIVE_BUFFER_BYTES', str(DEFAULT_RECEIVE_BUFFER_BYTES)))
 CLOUD_FUNCTION_TIMEOUT_MS = int(os.environ.get('CLOUD_FUNCTION_TIMEOUT_MS', str(DEFAULT_CLOUD_FUNCTION_TIMEOUT_MS)))
 
+# Row-level retries of transient insertAll errors, with jittered exponential backoff
+INSERT_RETRY_MAX_ATTEMPTS = int(os.environ.get('INSERT_RETRY_MAX_ATTEMPTS', str(DEFAULT_INSERT_RETRY_MAX_ATTEMPTS)))
+INSERT_RETRY_BASE_DELAY_MS = int(os.environ.get('INSERT_RETRY_BASE_DELAY_MS', str(DEFAULT_INSERT_RETRY_BASE_DELAY_MS)))
+INSERT_RETRY_MAX_DELAY_MS = int(os.environ.get('INSERT_RETRY_MAX_DELAY_MS', str(DEFAULT_INSERT_RETRY_MAX_DELAY_MS)))
+INSERT_RETRY_BUDGET = int(os.environ.get('INSERT_RETRY_BUDGET', str(DEFAULT_INSERT_RETRY_BUDGET)))
+
+# Partition-parallel mode: consumer group members run side by side, each with its own sink
+CONSUMER_WORKERS = int(os.environ.get('CONSUMER_WORKERS', str(DEFAULT_CONSUMER_WORKERS)))
+
+# Pipelined mode: insert workers share one BigQuery client while the consumer keeps polling
+INSERT_WORKERS = int(os.environ.get('INSERT_WORKERS', str(DEFAULT_INSERT_WORKERS)))
+PIPELINE_MAX_PENDING_BATCHES = int(os.environ.get('PIPELINE_MAX_PENDING_BATCHES', str(DEFAULT_PIPELINE_MAX_PENDING_BATCHES)))
+PIPELINE_DRAIN_TIMEOUT_S = int(os.environ.get('PIPELINE_DRAIN_TIMEOUT_S', str(DEFAULT_PIPELINE_DRAIN_TIMEOUT_S)))
+
+# Drain phase: consuming stops early enough to flush, close and commit what is in flight
+DRAIN_RESERVE_BASE_MS = int(os.environ.get('DRAIN_RESERVE_BASE_MS', str(DEFAULT_DRAIN_RESERVE_BASE_MS)))
+DRAIN_RESERVE_PER_ROW_MS = float(os.environ.get('DRAIN_RESERVE_PER_ROW_MS', str(DEFAULT_DRAIN_RESERVE_PER_ROW_MS)))
+
+# Backpressure: partitions pause while fetched records and unwritten batches exceed the budget
+# (0 disables), and resume once they are back under MEMORY_RESUME_RATIO of it
+MEMORY_BUDGET_BYTES = int(os.environ.get('MEMORY_BUDGET_BYTES', str(DEFAULT_MEMORY_BUDGET_BYTES)))
+MEMORY_RESUME_RATIO = float(os.environ.get('MEMORY_RESUME_RATIO', str(DEFAULT_MEMORY_RESUME_RATIO)))
+BACKPRESSURE_POLL_MS = int(os.environ.get('BACKPRESSURE_POLL_MS', str(DEFAULT_BACKPRESSURE_POLL_MS)))
+
+# Write backend: 'insert_all' (legacy streaming inserts) or 'storage_write' (Storage Write API)
+BIGQUERY_SINK = os.environ.get('BIGQUERY_SINK', DEFAULT_BIGQUERY_SINK)
+STORAGE_WRITE_STREAM_TYPE = os.environ.get('STORAGE_WRITE_STREAM_TYPE', DEFAULT_STORAGE_WRITE_STREAM_TYPE).upper()
+
+# Load job mode ('load_job' sink): staged files rotate by size or age, one load job per file.
+# Point the staging dir at a Cloud Storage FUSE mount and set the URI prefix to load straight from GCS.
+LOAD_JOB_FORMAT = os.environ.get('LOAD_JOB_FORMAT', DEFAULT_LOAD_JOB_FORMAT).lower()
+LOAD_JOB_STAGING_DIR = os.environ.get('LOAD_JOB_STAGING_DIR', DEFAULT_LOAD_JOB_STAGING_DIR)
+LOAD_JOB_SOURCE_URI_PREFIX = os.environ.get('LOAD_JOB_SOURCE_URI_PREFIX', '')
+LOAD_JOB_MAX_FILE_BYTES = int(os.environ.get('LOAD_JOB_MAX_FILE_BYTES', str(DEFAULT_LOAD_JOB_MAX_FILE_BYTES)))
+LOAD_JOB_MAX_FILE_AGE_S = int(os.environ.get('LOAD_JOB_MAX_FILE_AGE_S', str(DEFAULT_LOAD_JOB_MAX_FILE_AGE_S)))
+
+# Dead letters ('none', 'kafka' or 'file'): undecodable, invalid and BigQuery-rejected messages with the reason.
+# The file spool is capped; on Cloud Functions /tmp is memory-backed, so keep the cap small there.
+DEAD_LETTER_MODE = os.environ.get('DEAD_LETTER_MODE', DEFAULT_DEAD_LETTER_MODE).lower()
+DEAD_LETTER_TOPIC = os.environ.get('DEAD_LETTER_TOPIC', DEFAULT_DEAD_LETTER_TOPIC)
+DEAD_LETTER_SPOOL_DIR = os.environ.get('DEAD_LETTER_SPOOL_DIR', DEFAULT_DEAD_LETTER_SPOOL_DIR)
+DEAD_LETTER_SPOOL_MAX_BYTES = int(os.environ.get('DEAD_LETTER_SPOOL_MAX_BYTES', str(DEFAULT_DEAD_LETTER_SPOOL_MAX_BYTES)))
+DEAD_LETTER_BATCH_SIZE = int(os.environ.get('DEAD_LETTER_BATCH_SIZE', str(DEFAULT_DEAD_LETTER_BATCH_SIZE)))
+
+# Backfills (see backfill.py): partitions read in parallel by up to BACKFILL_WORKERS readers and
+# loaded with load jobs. Keep checkpoints somewhere that outlives the instance (e.g. a GCS FUSE mount).
+BACKFILL_WORKERS = int(os.environ.get('BACKFILL_WORKERS', str(DEFAULT_BACKFILL_WORKERS)))
+BACKFILL_CHECKPOINT_DIR = os.environ.get('BACKFILL_CHECKPOINT_DIR', DEFAULT_BACKFILL_CHECKPOINT_DIR)
+BACKFILL_CHECKPOINT_INTERVAL_S = int(os.environ.get('BACKFILL_CHECKPOINT_INTERVAL_S', str(DEFAULT_BACKFILL_CHECKPOINT_INTERVAL_S)))
+
+# Write-ahead spool (see writeahead.py), off unless a directory is set: sealed batches are kept on disk
+# until written and replayed by the next run. Use a persistent disk for the service, /tmp for warm instances.
+WRITE_AHEAD_DIR = os.environ.get('WRITE_AHEAD_DIR', '')
+WRITE_AHEAD_MAX_BYTES = int(os.environ.get('WRITE_AHEAD_MAX_BYTES', str(DEFAULT_WRITE_AHEAD_MAX_BYTES)))
+WRITE_AHEAD_SEGMENT_BYTES = int(os.environ.get('WRITE_AHEAD_SEGMENT_BYTES', str(DEFAULT_WRITE_AHEAD_SEGMENT_BYTES)))
+WRITE_AHEAD_FSYNC = os.environ.get('WRITE_AHEAD_FSYNC', 'false').lower() in ('1', 'true', 'yes')
+
+# Hot-path metrics, cumulative per instance; scraped via export_metrics and summarized per invocation
+METRICS = MetricsRegistry()
+POLL_WAIT_SECONDS = METRICS.histogram(
+    'bi_consumer_poll_wait_seconds', 'Time blocked in consumer.poll(), including the fetch')
+DESERIALIZE_SECONDS = METRICS.histogram(
+    'bi_consumer_deserialize_seconds', 'Decode time of a Kafka message value')
+TRANSFORM_SECONDS = METRICS.histogram(
+    'bi_consumer_transform_seconds', 'Validation and transform time of an event into a row')
+BATCH_FILL_SECONDS = METRICS.histogram(
+    'bi_consumer_batch_fill_seconds', 'Time from the first row of a batch to its seal')
+INSERT_SECONDS = METRICS.histogram(
+    'bi_consumer_insert_seconds', 'BigQuery write latency per batch', labelnames=('sink',))
+EVENT_LAG_SECONDS = METRICS.histogram(
+    'bi_consumer_event_lag_seconds', 'Time from the source change (ts_ms) to its row being written', LAG_BUCKETS)
+EVENTS_TOTAL = METRICS.counter(
+    'bi_consumer_events_total', 'Kafka messages consumed, by topic and outcome', ('topic', 'status'))
+ROWS_TOTAL = METRICS.counter(
+    'bi_consumer_rows_total', 'Rows handed to the sink, by sink and outcome', ('sink', 'status'))
+ROWS_COALESCED_TOTAL = METRICS.counter(
+    'bi_consumer_rows_coalesced_total', 'Update rows merged into a later change of the same row', ('table',))
+BUFFERED_BYTES = METRICS.gauge(
+    'bi_consumer_buffered_bytes', 'Estimated bytes of fetched records and unwritten batches, all workers')
+
+# One memory budget per instance, shared by every consumer worker
+MEMORY_BUDGET = MemoryBudget(MEMORY_BUDGET_BYTES, resume_ratio=MEMORY_RESUME_RATIO, on_change=BUFFERED_BYTES.set)
+
+# Clients created once per instance and reused by warm invocations
+RESOURCES = ResourceRegistry()
+RESOURCE_BIGQUERY_CLIENT = 'bigquery_client'
+RESOURCE_BIGQUERY_TABLE = 'bigquery_table'
+RESOURCE_KAFKA_CONSUMER = 'kafka_consumer'
+RESOURCE_DEAD_LETTER_WRITER = 'dead_letter_writer'
+RESOURCE_WRITE_AHEAD_SPOOL = 'write_ahead_spool'
+
+# Debezium operation codes
+OPERATION_MAP = {
+    'c': 'INSERT',
+    'u': 'UPDATE',
+    'd': 'DELETE',
+    'r': 'READ'
+}
+
+# Column order of the events table (matches get_bigquery_schema)
+ROW_FIELDS = (
+    'event_id', 'event_type', 'event_timestamp', 'user_id', 'user_email', 'event_data',
+    'source_table', 'operation', 'ingested_at', 'partition_date', 'environment',
+)
+
+# process_events output formats
+OUTPUT_ROWS = 'rows'
+OUTPUT_COLUMNS = 'columns'
+OUTPUT_ARROW = 'arrow'
+
 def correlation_logger(func):
-    """Decorator to add correlation ID to logs"""
+    """Decorator to run each invocation under its own correlation ID"""
     @wraps(func)
     def wrapper(*args, **kwargs):
-        correlation_id = str(uuid.uuid4())
-        # Add correlation ID to all log records
-        old_factory = logging.getLogRecordFactory()
-        def record_factory(*args, **kwargs):
-            record = old_factory(*args, **kwargs)
-            record.correlation_id = correlation_id
-            return record
-        logging.setLogRecordFactory(record_factory)
-        
-        try:
-            logger.info(f"Starting function {func.__name__}")
-            result = func(*args, **kwargs)
-            logger.info(f"Completed function {func.__name__}")
-            return result
-        except Exception as e:
-            logger.error(f"Error in function {func.__name__}: {str(e)}", exc_info=True)
-            raise
-        finally:
-            logging.setLogRecordFactory(old_factory)
+        # A context variable, so concurrent invocations and their worker threads keep their own ID
+        with correlation_context():
+            try:
+                logger.info(f"Starting function {func.__name__}")
+                result = func(*args, **kwargs)
+                logger.info(f"Completed function {func.__name__}")
+                return result
+            except Exception as e:
+                logger.error(f"Error in function {func.__name__}: {str(e)}", exc_info=True)
+                raise
     return wrapper
 
-def get_secret(secret_name: str) -> Optional[str]:
+def get_secret_client():
+    """Create the Secret Manager client on first use"""
+    global SECRET_CLIENT
+    with SECRET_CLIENT_LOCK:
+        if SECRET_CLIENT is None:
+            SECRET_CLIENT = secretmanager.SecretManagerServiceClient()
+        return SECRET_CLIENT
+
+def _fetch_secret(secret_name: str) -> Optional[str]:
     """Securely retrieve secrets from Google Secret Manager"""
     if not PROJECT_ID:
         logger.warning("No PROJECT_ID available for secret retrieval")
@@ -91,12 +317,23 @@ def get_secret(secret_name: str) -> Optional[str]:
         
     try:
         name = f"projects/{PROJECT_ID}/secrets/{secret_name}/versions/latest"
-        response = SECRET_CLIENT.access_secret_version(request={"name": name})
+        response = get_secret_client().access_secret_version(request={"name": name})
         return response.payload.data.decode("UTF-8")
     except Exception as e:
         logger.warning(f"Could not retrieve secret {secret_name}: {e}")
         return None
 
+SECRET_CACHE = SecretCache(
+    _fetch_secret,
+    ttl_s=SECRET_CACHE_TTL_S,
+    stale_ttl_s=SECRET_CACHE_STALE_TTL_S,
+    negative_ttl_s=SECRET_CACHE_NEGATIVE_TTL_S
+)
+
+def get_secret(secret_name: str) -> Optional[str]:
+    """Retrieve a secret through the in-process cache"""
+    return SECRET_CACHE.get(secret_name)
+
 def validate_environment() -> bool:
     """Validate required environment variables and dependencies"""
     required_vars = ['KAFKA_BOOTSTRAP_SERVERS']
@@ -111,11 +348,70 @@ def validate_environment() -> bool:
     
     return True
 
-def create_bigquery_table_if_not_exists(bq_client: bigquery.Client) -> bool:
-    """Create BigQuery table if it doesn't exist with proper error handling."""
+def get_table_id(table: Optional[str] = None) -> str:
+    """Fully qualified BigQuery table ID for the events table (or a routed destination table)"""
+    table = table or BIGQUERY_TABLE
+    return f"{PROJECT_ID}.{BIGQUERY_DATASET}.{table}" if PROJECT_ID else f"{BIGQUERY_DATASET}.{table}"
+
+def get_bigquery_schema(route: Optional[Route] = None) -> List[bigquery.SchemaField]:
+    """Schema of the events table or a route's table, shared by table creation and the write sinks"""
+    schema = [
+        bigquery.SchemaField("event_id", "STRING", mode="REQUIRED", description="Unique event identifier"),
+        bigquery.SchemaField("event_type", "STRING", mode="REQUIRED", description="Type of database operation"),
+        bigquery.SchemaField("event_timestamp", "TIMESTAMP", mode="REQUIRED", description="When the event occurred"),
+        bigquery.SchemaField("user_id", "STRING", description="User identifier"),
+        bigquery.SchemaField("user_email", "STRING", description="User email address"),
+        bigquery.SchemaField("event_data", "JSON", description="Full event payload"),
+        bigquery.SchemaField("source_table", "STRING", description="Source database table"),
+        bigquery.SchemaField("operation", "STRING", description="Database operation type"),
+        bigquery.SchemaField("ingested_at", "TIMESTAMP", mode="REQUIRED", description="When data was ingested"),
+        bigquery.SchemaField("partition_date", "DATE", mode="REQUIRED", description="Date for partitioning"),
+        bigquery.SchemaField("environment", "STRING", mode="REQUIRED", description="Environment (dev/staging/prod)"),
+    ]
+    if route is not None:
+        # Routed tables keep the event metadata and replace the payload blob with typed columns
+        metadata = {field.name: field for field in schema}
+        schema = [
+            metadata[name] if name in metadata else
+            bigquery.SchemaField(name, route.columns[name], description=f"{route.source_table}.{name}")
+            for name in route.fields
+        ]
+    if COALESCE_TABLES:
+        schema.append(bigquery.SchemaField(CHANGE_COUNT_FIELD, "INTEGER",
+                                           description="Changes merged into this row by coalescing"))
+    return schema
+
+def table_resource(route: Optional[Route] = None) -> str:
+    """Registry name of the readiness flag of the events table or a routed table"""
+    return RESOURCE_BIGQUERY_TABLE if route is None else f"{RESOURCE_BIGQUERY_TABLE}:{route.table}"
+
+def get_bigquery_client() -> bigquery.Client:
+    """BigQuery client shared by every invocation on this instance"""
+    return RESOURCES.get(RESOURCE_BIGQUERY_CLIENT, bigquery.Client, close=lambda client: client.close())
+
+def ensure_bigquery_table(bq_client: bigquery.Client) -> bool:
+    """Create dataset, events table and routed tables once per instance, remembering success"""
+    if not RESOURCES.is_ready(RESOURCE_BIGQUERY_TABLE):
+        if not create_bigquery_table_if_not_exists(bq_client):
+            # The client may be the problem (expired credentials, dead connection): rebuild it next time
+            RESOURCES.invalidate(RESOURCE_BIGQUERY_CLIENT)
+            return False
+        RESOURCES.mark_ready(RESOURCE_BIGQUERY_TABLE)
+    
+    for route in TABLE_ROUTES.values():
+        if RESOURCES.is_ready(table_resource(route)):
+            continue
+        if not create_bigquery_table_if_not_exists(bq_client, route):
+            RESOURCES.invalidate(RESOURCE_BIGQUERY_CLIENT)
+            return False
+        RESOURCES.mark_ready(table_resource(route))
+    return True
+
+def create_bigquery_table_if_not_exists(bq_client: bigquery.Client, route: Optional[Route] = None) -> bool:
+    """Create BigQuery table (the events table or a route's) if it doesn't exist with proper error handling."""
     try:
         dataset_id = f"{PROJECT_ID}.{BIGQUERY_DATASET}" if PROJECT_ID else BIGQUERY_DATASET
-        table_id = f"{dataset_id}.{BIGQUERY_TABLE}"
+        table_id = get_table_id(route.table if route else None)
         
         # Create dataset if not exists
         dataset = bigquery.Dataset(dataset_id)
@@ -125,19 +421,7 @@ def create_bigquery_table_if_not_exists(bq_client: bigquery.Client) -> bool:
         logger.info(f"Dataset {dataset_id} ready")
         
         # Define comprehensive table schema
-        schema = [
-            bigquery.SchemaField("event_id", "STRING", mode="REQUIRED", description="Unique event identifier"),
-            bigquery.SchemaField("event_type", "STRING", mode="REQUIRED", description="Type of database operation"),
-            bigquery.SchemaField("event_timestamp", "TIMESTAMP", mode="REQUIRED", description="When the event occurred"),
-            bigquery.SchemaField("user_id", "STRING", description="User identifier"),
-            bigquery.SchemaField("user_email", "STRING", description="User email address"),
-            bigquery.SchemaField("event_data", "JSON", description="Full event payload"),
-            bigquery.SchemaField("source_table", "STRING", description="Source database table"),
-            bigquery.SchemaField("operation", "STRING", description="Database operation type"),
-            bigquery.SchemaField("ingested_at", "TIMESTAMP", mode="REQUIRED", description="When data was ingested"),
-            bigquery.SchemaField("partition_date", "DATE", mode="REQUIRED", description="Date for partitioning"),
-            bigquery.SchemaField("environment", "STRING", mode="REQUIRED", description="Environment (dev/staging/prod)"),
-        ]
+        schema = get_bigquery_schema(route)
         
         # Create table with partitioning and clustering
         table = bigquery.Table(table_id, schema=schema)
@@ -146,10 +430,15 @@ def create_bigquery_table_if_not_exists(bq_client: bigquery.Client) -> bool:
             field="partition_date",
             expiration_ms=None  # Don't auto-delete partitions
         )
-        table.clustering_fields = ["source_table", "operation", "environment"]
-        table.description = f"User events from YugabyteDB CDC for {ENVIRONMENT}"
+        if route is None:
+            table.clustering_fields = ["source_table", "operation", "environment"]
+            table.description = f"User events from YugabyteDB CDC for {ENVIRONMENT}"
+        else:
+            table.clustering_fields = route.clustering or None
+            table.description = f"Changes to {route.source_table} from YugabyteDB CDC for {ENVIRONMENT}"
         
         table = bq_client.create_table(table, exists_ok=True)
+        add_missing_columns(bq_client, table, schema)
         logger.info(f"Table {table_id} ready with partitioning")
         return True
         
@@ -157,92 +446,259 @@ def create_bigquery_table_if_not_exists(bq_client: bigquery.Client) -> bool:
         logger.error(f"Error creating BigQuery table: {e}", exc_info=True)
         return False
 
+def add_missing_columns(bq_client: bigquery.Client, table: bigquery.Table, schema: List[bigquery.SchemaField]) -> None:
+    """Add columns introduced since an existing table was created, e.g. change_count (all NULLABLE)"""
+    try:
+        existing = {field.name for field in table.schema}
+        missing = [field for field in schema if field.name not in existing]
+        if missing:
+            table.schema = list(table.schema) + missing
+            bq_client.update_table(table, ['schema'])
+            logger.info(f"Added columns {[field.name for field in missing]} to {table.table_id}")
+    except Exception as e:
+        logger.warning(f"Could not add missing columns to the BigQuery table: {e}")
+
 def validate_event(event: Dict[str, Any]) -> bool:
     """Validate event structure before processing"""
     if not isinstance(event, dict):
-        logger.warning("Event is not a dictionary")
+        EVENT_LOG.warning('event_not_dict', "Event is not a dictionary")
         return False
     
     required_fields = ['op', 'source']
     for field in required_fields:
         if field not in event:
-            logger.warning(f"Event missing required field: {field}")
+            EVENT_LOG.warning('event_missing_field', "Event missing required field: %s", field)
             return False
     
     return True
 
-def process_event(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    """Process Kafka event and transform for BigQuery with validation."""
-    try:
-        if not validate_event(event):
-            return None
-        
-        # Extract event metadata safely
-        event_type = event.get('op', 'unknown')
-        source_info = event.get('source', {})
-        source_table = source_info.get('table', 'unknown')
-        
-        # Map operation types
-        operation_map = {
-            'c': 'INSERT',
-            'u': 'UPDATE', 
-            'd': 'DELETE',
-            'r': 'READ'
-        }
-        operation = operation_map.get(event_type, 'UNKNOWN')
-        
-        # Extract payload (after transformation)
-        payload = event.get('after', event.get('before', {}))
+def make_event_id(position: Optional[Tuple[str, int, int]], source_table: str, op: Any, ts_ms: Any,
+                  event_data: str) -> str:
+    """Stable event ID: the Kafka position when known, else a digest of the change itself"""
+    if position is not None:
+        return f"{position[0]}:{position[1]}:{position[2]}"
+    digest = hashlib.blake2b(f"{source_table}|{op}|{ts_ms}|".encode('utf-8'), digest_size=8)
+    digest.update(event_data.encode('utf-8'))
+    return f"{ts_ms}-{digest.hexdigest()}"
+
+def process_events(events: Iterable[Any], output: str = OUTPUT_ROWS,
+                   positions: Optional[Iterable[Optional[Tuple[str, int, int]]]] = None,
+                   on_rejected: Optional[Callable[[int, Any, str], None]] = None,
+                   routes: Optional[Dict[str, Route]] = None,
+                   event_filter: Optional[EventFilter] = None,
+                   coalescer: Optional[ChangeCoalescer] = None) -> Tuple[Any, int]:
+    """
+    Transform a batch of Kafka events for BigQuery.
+    Returns (rows, failed_count); rows is a list of dicts, a dict of column
+    lists (output='columns') or a pyarrow RecordBatch (output='arrow').
+    positions, aligned with events, are the (topic, partition, offset) the
+    events were read from; they make event_id unique and stable across retries.
+    on_rejected(index, event, reason) is called for every event that yields no row.
+    routes (row output only) turn events of routed source tables into rows of
+    their destination table, with typed columns instead of event_data.
+    event_filter narrows row images to each table's configured columns.
+    coalescer (row output only) gets the source row's id carried on rows of
+    its tables, to key them on; it removes it again when coalescing.
+    """
+    # Read the clock once per batch
+    now = datetime.utcnow()
+    now_ms = int(time.time() * 1000)
+    today = now.date()
+    columnar = output != OUTPUT_ROWS
+    if columnar:
+        routes = None
+        coalescer = None
+    
+    rows = []
+    columns = {name: [] for name in ROW_FIELDS} if columnar else None
+    timestamps_ms = []
+    rejected: Dict[str, int] = {}
+    failed_count = 0
+    event_count = 0
+    positions = list(positions) if positions is not None else None
+    
+    for event in events:
+        position = positions[event_count] if positions is not None else None
+        event_count += 1
         
-        # Generate unique event ID if not present
-        event_id = str(event.get('ts_ms', int(datetime.utcnow().timestamp() * 1000)))
+        # Inline validation: one summary warning per batch instead of one per event
+        if not isinstance(event, dict):
+            reason = 'not_a_dict'
+        elif 'op' not in event:
+            reason = 'missing_op'
+        elif 'source' not in event:
+            reason = 'missing_source'
+        else:
+            reason = None
+        if reason:
+            rejected[reason] = rejected.get(reason, 0) + 1
+            failed_count += 1
+            if on_rejected is not None:
+                on_rejected(event_count - 1, event, reason)
+            continue
         
-        # Get timestamp and handle potential conversion errors
         try:
-            ts_ms = event.get('ts_ms', int(datetime.utcnow().timestamp() * 1000))
-            event_timestamp = datetime.utcfromtimestamp(ts_ms / 1000)
-        except (ValueError, TypeError):
-            event_timestamp = datetime.utcnow()
-            logger.warning(f"Invalid timestamp in event, using current time: {ts_ms}")
+            source_table = event['source'].get('table', 'unknown')
+            operation = OPERATION_MAP.get(event['op'], 'UNKNOWN')
+            
+            # Extract payload (after transformation); deletes carry "after": null
+            if event.get('after'):
+                payload = event['after']
+                raw_payload = getattr(event, 'raw_after', None)
+            elif event.get('before'):
+                payload = event['before']
+                raw_payload = getattr(event, 'raw_before', None)
+            else:
+                payload = {}
+                raw_payload = None
+            if event_filter and event_filter.projects(source_table):
+                # Dropped columns never reach event_data, so the original text cannot be reused
+                payload = event_filter.project(source_table, payload)
+                raw_payload = None
+            
+            ts_ms = event.get('ts_ms', now_ms)
+            route = routes.get(source_table) if routes else None
+            if route is None or route.keep_event_data or position is None:
+                # Reuse the original JSON text of the row image when the decoder kept it
+                event_data = raw_payload or (dumps(payload) if payload else '{}')
+            else:
+                # Typed columns replace the blob, so it is not serialized at all
+                event_data = None
+            # Unique per Kafka record and identical on every retry (sent as the insertId)
+            event_id = make_event_id(position, source_table, event['op'], ts_ms, event_data)
+            
+            # Get timestamp and handle potential conversion errors
+            try:
+                event_timestamp = datetime.utcfromtimestamp(ts_ms / 1000)
+            except (ValueError, TypeError, OverflowError, OSError):
+                event_timestamp = now
+                ts_ms = now_ms
+                rejected['invalid_timestamp'] = rejected.get('invalid_timestamp', 0) + 1
+            
+            if route is not None:
+                typed, unconverted = route.project(payload)
+                if unconverted:
+                    rejected['unconverted_value'] = rejected.get('unconverted_value', 0) + unconverted
+            
+            values = (
+                event_id,
+                f"{source_table}.{operation}",
+                event_timestamp,
+                str(payload.get('user_id', payload.get('id', ''))),
+                payload.get('email', ''),
+                event_data,
+                source_table,
+                operation,
+            )
+        except Exception as e:
+            EVENT_LOG.error('transform_error', "Error processing event: %s", e, exc_info=True)
+            failed_count += 1
+            if on_rejected is not None:
+                on_rejected(event_count - 1, event, f"transform_error: {e}")
+            continue
         
-        # Build BigQuery row with comprehensive data
-        row = {
-            'event_id': event_id,
-            'event_type': f"{source_table}.{operation}",
-            'event_timestamp': event_timestamp,
-            'user_id': str(payload.get('user_id', payload.get('id', ''))),
-            'user_email': payload.get('email', ''),
-            'event_data': json.dumps(payload) if payload else '{}',
-            'source_table': source_table,
-            'operation': operation,
-            'ingested_at': datetime.utcnow(),
-            'partition_date': datetime.utcnow().date(),
-            'environment': ENVIRONMENT,
-        }
+        if columnar:
+            for name, value in zip(ROW_FIELDS, values):
+                columns[name].append(value)
+            timestamps_ms.append(ts_ms)
+        elif route is not None:
+            row = {
+                'event_id': event_id,
+                'event_type': values[1],
+                'event_timestamp': event_timestamp,
+                'source_table': source_table,
+                'operation': operation,
+            }
+            row.update(typed)
+            if route.keep_event_data:
+                row['event_data'] = event_data
+            row['ingested_at'] = now
+            row['partition_date'] = today
+            row['environment'] = ENVIRONMENT
+            rows.append(row)
+        else:
+            # Build BigQuery row with comprehensive data
+            row = dict(zip(ROW_FIELDS, values))
+            row['ingested_at'] = now
+            row['partition_date'] = today
+            row['environment'] = ENVIRONMENT
+            rows.append(row)
         
-        return row
+        if coalescer and coalescer.enabled_for(source_table) and payload.get('id') not in (None, ''):
+            row[ROW_KEY_FIELD] = payload['id']
+    
+    if rejected:
+        EVENT_LOG.warning('events_rejected', "Rejected or repaired %d of %d events: %s",
+                          sum(rejected.values()), event_count, rejected)
+    
+    if not columnar:
+        return rows, failed_count
+    
+    row_count = len(columns['event_id'])
+    if output == OUTPUT_COLUMNS:
+        columns['ingested_at'] = [now] * row_count
+        columns['partition_date'] = [today] * row_count
+        columns['environment'] = [ENVIRONMENT] * row_count
+        return columns, failed_count
+    
+    if output == OUTPUT_ARROW:
+        import pyarrow as pa
         
-    except Exception as e:
-        logger.error(f"Error processing event: {e}", exc_info=True)
-        return None
+        schema = arrow_schema(get_bigquery_schema())
+        timestamp_type = schema.field('event_timestamp').type
+        # Build timestamp and constant columns in bulk rather than per row
+        columns['event_timestamp'] = pa.array(timestamps_ms, pa.int64()).cast(pa.timestamp('ms', tz='UTC')).cast(timestamp_type)
+        columns['ingested_at'] = pa.repeat(pa.scalar(now, timestamp_type), row_count)
+        columns['partition_date'] = pa.repeat(pa.scalar(today, pa.date32()), row_count)
+        columns['environment'] = pa.repeat(pa.scalar(ENVIRONMENT, pa.string()), row_count)
+        # Rows are not coalesced here, so change_count (when in the schema) stays NULL
+        columns.setdefault(CHANGE_COUNT_FIELD, pa.nulls(row_count, pa.int64()))
+        arrays = [columns[field.name] if isinstance(columns[field.name], pa.Array)
+                  else pa.array(columns[field.name], field.type) for field in schema]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema), failed_count
+    
+    raise ValueError(f"Unknown process_events output: {output}")
+
+def process_event(event: Dict[str, Any], position: Optional[Tuple[str, int, int]] = None,
+                  on_rejected: Optional[Callable[[int, Any, str], None]] = None) -> Optional[Dict[str, Any]]:
+    """Process Kafka event and transform for BigQuery with validation."""
+    rows, _ = process_events((event,), positions=None if position is None else (position,), on_rejected=on_rejected)
+    return rows[0] if rows else None
+
+def decode_message_value(raw: Any) -> Any:
+    """Decode a raw Kafka value (bad JSON becomes an UndecodableMessage, not a loop abort), timed"""
+    if not isinstance(raw, (bytes, bytearray)):
+        # Already decoded, or a tombstone
+        return raw
+    started = time.perf_counter()
+    event = decode_event_or_error(raw)
+    DESERIALIZE_SECONDS.observe(time.perf_counter() - started)
+    return event
 
 def get_kafka_config() -> Dict[str, Any]:
     """Get Kafka configuration with secure credential handling"""
     config = {
         'bootstrap_servers': KAFKA_BOOTSTRAP_SERVERS.split(','),
         'group_id': KAFKA_GROUP_ID,
-        'value_deserializer': lambda m: json.loads(m.decode('utf-8')),
         'auto_offset_reset': 'latest',
-        'enable_auto_commit': True,
+        'enable_auto_commit': False,  # committed after flush, see commit_offsets
         'max_poll_records': MAX_POLL_RECORDS,
+        # Fetch sizing: fewer, fuller fetches per partition instead of a round trip per trickle
+        'fetch_min_bytes': FETCH_MIN_BYTES,
+        'fetch_max_wait_ms': FETCH_MAX_WAIT_MS,
+        'fetch_max_bytes': FETCH_MAX_BYTES,
+        'max_partition_fetch_bytes': MAX_PARTITION_FETCH_BYTES,
         'session_timeout_ms': 30000,
         'consumer_timeout_ms': CONSUMER_TIMEOUT_MS,
         'api_version': (0, 10, 1),  # Explicit API version
     }
     
+    if RECEIVE_BUFFER_BYTES > 0:
+        config['receive_buffer_bytes'] = RECEIVE_BUFFER_BYTES
+    
     # Add authentication if credentials are available
-    kafka_username = get_secret('kafka-username') or os.environ.get('KAFKA_USERNAME')
-    kafka_password = get_secret('kafka-password') or os.environ.get('KAFKA_PASSWORD')
+    kafka_username = get_secret(KAFKA_SECRET_NAMES[0]) or os.environ.get('KAFKA_USERNAME')
+    kafka_password = get_secret(KAFKA_SECRET_NAMES[1]) or os.environ.get('KAFKA_PASSWORD')
     
     if kafka_username and kafka_password:
         config.update({
@@ -259,25 +715,831 @@ def get_kafka_config() -> Dict[str, Any]:
 
 def insert_rows_to_bigquery(bq_client: bigquery.Client, rows: List[Dict[str, Any]]) -> bool:
     """Insert rows to BigQuery with proper error handling."""
-    if not rows:
+    return InsertAllSink(bq_client, get_table_id()).write(rows)
+
+def create_retry_policy(budget: Optional[RetryBudget] = None) -> RetryPolicy:
+    """Retry policy for row-level insert errors, drawing on the invocation's budget"""
+    return RetryPolicy(
+        max_attempts=INSERT_RETRY_MAX_ATTEMPTS,
+        base_delay_ms=INSERT_RETRY_BASE_DELAY_MS,
+        max_delay_ms=INSERT_RETRY_MAX_DELAY_MS,
+        budget=budget
+    )
+
+def create_sink(bq_client: bigquery.Client, worker: int = 0, retry_budget: Optional[RetryBudget] = None,
+                route: Optional[Route] = None, sink_type: Optional[str] = None,
+                staging_subdir: Optional[str] = None) -> Sink:
+    """Create the BigQuery write backend selected by BIGQUERY_SINK (or sink_type), for the events table or a route's table"""
+    table = route.table if route else BIGQUERY_TABLE
+    sink_type = sink_type or BIGQUERY_SINK
+    if sink_type == SINK_INSERT_ALL:
+        return InsertAllSink(bq_client, get_table_id(table), retry_policy=create_retry_policy(retry_budget))
+    
+    if sink_type == SINK_STORAGE_WRITE:
+        if not PROJECT_ID:
+            raise ValueError("Storage Write API sink requires GCP_PROJECT")
+        table_path = f"projects/{PROJECT_ID}/datasets/{BIGQUERY_DATASET}/tables/{table}"
+        return StorageWriteSink(table_path, get_bigquery_schema(route), stream_type=STORAGE_WRITE_STREAM_TYPE)
+    
+    if sink_type == SINK_LOAD_JOB:
+        # Backfills, routed tables and extra consumer workers stage into their own subdirectory,
+        # so a sink only deletes the leftovers of its own share, route and worker
+        staging_dir = LOAD_JOB_STAGING_DIR
+        source_uri_prefix = LOAD_JOB_SOURCE_URI_PREFIX or None
+        if staging_subdir:
+            staging_dir = os.path.join(staging_dir, staging_subdir)
+            if source_uri_prefix:
+                source_uri_prefix = f"{source_uri_prefix.rstrip('/')}/{staging_subdir}"
+        if route:
+            staging_dir = os.path.join(staging_dir, f"table-{route.table}")
+            if source_uri_prefix:
+                source_uri_prefix = f"{source_uri_prefix.rstrip('/')}/table-{route.table}"
+        if worker:
+            staging_dir = os.path.join(staging_dir, f"worker-{worker}")
+            if source_uri_prefix:
+                source_uri_prefix = f"{source_uri_prefix.rstrip('/')}/worker-{worker}"
+        return LoadJobSink(
+            bq_client, get_table_id(table), get_bigquery_schema(route), staging_dir,
+            file_format=LOAD_JOB_FORMAT,
+            max_file_bytes=LOAD_JOB_MAX_FILE_BYTES,
+            max_file_age_s=LOAD_JOB_MAX_FILE_AGE_S,
+            source_uri_prefix=source_uri_prefix
+        )
+    
+    raise ValueError(f"Unknown BIGQUERY_SINK: {sink_type}")
+
+def is_kafka_auth_error(error: Exception) -> bool:
+    """Check whether a broker error may mean the cached credentials are stale"""
+    return isinstance(error, tuple(getattr(kafka_errors, name) for name in KAFKA_AUTH_ERROR_NAMES))
+
+def create_rebalance_listener() -> Any:
+    """Rebalance listener handing revoked partitions to the worker polling the consumer, if any"""
+    class RebalanceListener(kafka.ConsumerRebalanceListener):
+        # Set by consume_worker for the duration of an invocation; runs on its thread, inside poll()
+        on_revoked: Optional[Callable[[List[Any]], None]] = None
+        
+        def on_partitions_revoked(self, revoked):
+            if self.on_revoked is not None and revoked:
+                self.on_revoked(list(revoked))
+        
+        def on_partitions_assigned(self, assigned):
+            pass
+    
+    return RebalanceListener()
+
+def create_kafka_consumer(consumer_config: Dict[str, Any]) -> kafka.KafkaConsumer:
+    """Create a Kafka consumer subscribed to the CDC topic pattern"""
+    logger.info(f"Creating Kafka consumer with config for topics: {KAFKA_TOPIC_PATTERN}")
+    consumer = kafka.KafkaConsumer(**consumer_config)
+    
+    # Subscribe to topics with error handling; warm consumers keep their listener across invocations
+    consumer.rebalance_listener = create_rebalance_listener()
+    consumer.subscribe(pattern=KAFKA_TOPIC_PATTERN, listener=consumer.rebalance_listener)
+    logger.info(f"Subscribed to topics matching: {KAFKA_TOPIC_PATTERN}")
+    return consumer
+
+def commit_offsets(consumer: kafka.KafkaConsumer, tracker: OffsetTracker, sync: bool = False) -> None:
+    """Commit every partition position the tracker considers durable"""
+    positions = tracker.committable()
+    if not positions:
+        return
+    
+    request = {
+        kafka.TopicPartition(topic, partition): kafka.OffsetAndMetadata(position, '')
+        for (topic, partition), position in positions.items()
+    }
+    try:
+        if sync:
+            consumer.commit(offsets=request)
+            tracker.committed(positions)
+        else:
+            # The callback runs on the consumer thread during a later poll
+            consumer.commit_async(
+                offsets=request,
+                callback=lambda _, response: tracker.committed(
+                    positions, response if isinstance(response, BaseException) else None)
+            )
+    except Exception as e:
+        logger.warning(f"Offset commit failed: {e}")
+        tracker.committed(positions, e)
+
+def checkpoint_offsets(backfill: BackfillAssignment, tracker: OffsetTracker) -> None:
+    """Save every partition position the tracker considers durable to the backfill's checkpoint"""
+    positions = tracker.committable()
+    if not positions:
+        return
+    
+    try:
+        backfill.checkpoint.save(positions)
+        tracker.committed(positions)
+    except OSError as e:
+        logger.warning(f"Backfill checkpoint failed: {e}")
+        tracker.committed(positions, e)
+
+def create_backfill_consumer(consumer_config: Dict[str, Any], backfill: BackfillAssignment) -> kafka.KafkaConsumer:
+    """Create a consumer assigned a backfill share's partitions directly, positioned at their start"""
+    consumer = kafka.KafkaConsumer(**consumer_config)
+    starts = {kafka.TopicPartition(*partition): start for partition, (start, _) in backfill.ranges.items()}
+    consumer.assign(list(starts))
+    for topic_partition, start in starts.items():
+        consumer.seek(topic_partition, start)
+    logger.info(f"Backfill consumer assigned {len(starts)} partitions")
+    return consumer
+
+def get_backfill_kafka_config() -> Dict[str, Any]:
+    """Kafka configuration for backfill readers: no consumer group, positions set by seek"""
+    config = get_kafka_config()
+    config.update({
+        'group_id': None,
+        'auto_offset_reset': 'earliest',
+        'enable_auto_commit': False,
+    })
+    return config
+
+def resume_partitions(consumer: kafka.KafkaConsumer, partitions: Iterable[Any]) -> None:
+    """Resume paused partitions the consumer still owns (a rebalance may have taken some away)"""
+    try:
+        owned = set(partitions) & set(consumer.assignment())
+        if owned:
+            consumer.resume(*owned)
+    except Exception as e:
+        logger.warning(f"Could not resume paused partitions: {e}")
+
+def kafka_consumer_resource(worker: int = 0) -> str:
+    """Registry name of a consumer group worker's warm consumer"""
+    return RESOURCE_KAFKA_CONSUMER if worker == 0 else f"{RESOURCE_KAFKA_CONSUMER}-{worker}"
+
+def get_kafka_consumer(consumer_config: Optional[Dict[str, Any]] = None, worker: int = 0) -> kafka.KafkaConsumer:
+    """Warm consumer kept open between invocations, rebuilt once it has been closed"""
+    return RESOURCES.get(
+        kafka_consumer_resource(worker),
+        lambda: create_kafka_consumer(consumer_config if consumer_config is not None else get_kafka_config()),
+        health_check=lambda consumer: not getattr(consumer, '_closed', False),
+        close=lambda consumer: consumer.close()
+    )
+
+def create_kafka_producer() -> kafka.KafkaProducer:
+    """Create a producer with the consumer's brokers and credentials"""
+    config = get_kafka_config()
+    producer_config = {key: config[key] for key in (
+        'bootstrap_servers', 'api_version', 'security_protocol', 'sasl_mechanism',
+        'sasl_plain_username', 'sasl_plain_password'
+    ) if key in config}
+    return kafka.KafkaProducer(acks='all', linger_ms=50, **producer_config)
+
+def create_dead_letter_writer() -> Any:
+    """Create the dead-letter destination selected by DEAD_LETTER_MODE"""
+    if DEAD_LETTER_MODE == DEAD_LETTER_KAFKA:
+        return KafkaDeadLetterWriter(create_kafka_producer(), DEAD_LETTER_TOPIC)
+    if DEAD_LETTER_MODE == DEAD_LETTER_FILE:
+        return FileDeadLetterSpool(DEAD_LETTER_SPOOL_DIR, max_bytes=DEAD_LETTER_SPOOL_MAX_BYTES)
+    raise ValueError(f"Unknown DEAD_LETTER_MODE: {DEAD_LETTER_MODE}")
+
+def get_dead_letter_writer() -> Optional[Any]:
+    """Warm dead-letter writer shared by all consumer workers, or None when disabled"""
+    if DEAD_LETTER_MODE == DEAD_LETTER_NONE:
+        return None
+    return RESOURCES.get(RESOURCE_DEAD_LETTER_WRITER, create_dead_letter_writer)
+
+def create_write_ahead_spool() -> WriteAheadSpool:
+    """Open the write-ahead spool in WRITE_AHEAD_DIR, picking up what a previous run left"""
+    return WriteAheadSpool(WRITE_AHEAD_DIR, max_bytes=WRITE_AHEAD_MAX_BYTES,
+                           segment_bytes=WRITE_AHEAD_SEGMENT_BYTES, fsync=WRITE_AHEAD_FSYNC)
+
+def get_write_ahead_spool() -> Optional[WriteAheadSpool]:
+    """Warm write-ahead spool shared by all consumer workers, or None when disabled"""
+    if not WRITE_AHEAD_DIR:
+        return None
+    return RESOURCES.get(RESOURCE_WRITE_AHEAD_SPOOL, create_write_ahead_spool, close=WriteAheadSpool.close)
+
+def row_position(row: Dict[str, Any]) -> Optional[Tuple[str, int, int]]:
+    """Kafka position of a row read from Kafka, which carries it in the event_id ("topic:partition:offset")"""
+    parts = str(row.get('event_id', '')).rsplit(':', 2)
+    if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+        return parts[0], int(parts[1]), int(parts[2])
+    return None
+
+def raw_value(event: Any) -> bytes:
+    """Serialize a decoded event back to bytes for the dead-letter queue"""
+    try:
+        return dumps(event).encode('utf-8')
+    except (TypeError, ValueError):
+        return repr(event).encode('utf-8')
+
+def row_to_dead_letter(row: Dict[str, Any], reason: str) -> DeadLetter:
+    """Rebuild a Debezium-style envelope from a row BigQuery rejected"""
+    operations = {name: op for op, name in OPERATION_MAP.items()}
+    operation = row.get('operation')
+    if 'event_data' in row:
+        try:
+            payload = json.loads(row.get('event_data') or '{}')
+        except ValueError:
+            payload = {}
+    else:
+        # Routed rows carry the row image as typed columns
+        payload = {key: value.isoformat() if hasattr(value, 'isoformat') else value
+                   for key, value in row.items() if key not in ROUTE_METADATA_FIELDS and key != CHANGE_COUNT_FIELD}
+    envelope: Dict[str, Any] = {
+        'op': operations.get(operation, operation),
+        'source': {'table': row.get('source_table')},
+        'before' if operation == 'DELETE' else 'after': payload,
+    }
+    event_timestamp = row.get('event_timestamp')
+    if isinstance(event_timestamp, datetime):
+        envelope['ts_ms'] = int((event_timestamp - datetime(1970, 1, 1)).total_seconds() * 1000)
+    
+    topic, partition, offset = row_position(row) or (None, None, None)
+    return DeadLetter(topic, partition, offset, raw_value(envelope), STAGE_INSERT, reason)
+
+def create_scheduler(timeout_ms: Optional[int] = None) -> DeadlineScheduler:
+    """Deadline scheduler for an invocation (or service round) starting now"""
+    return DeadlineScheduler(
+        CLOUD_FUNCTION_TIMEOUT_MS if timeout_ms is None else timeout_ms,
+        drain_base_ms=DRAIN_RESERVE_BASE_MS,
+        drain_per_row_ms=DRAIN_RESERVE_PER_ROW_MS
+    )
+
+def consume_worker(worker: int, sink: Sink, consumer_config: Optional[Dict[str, Any]],
+                   scheduler: DeadlineScheduler, stop_event: Optional[threading.Event] = None,
+                   route_sinks: Optional[Dict[str, Sink]] = None,
+                   backfill: Optional[BackfillAssignment] = None,
+                   replayed: Optional[Dict[Tuple[str, int], Set[int]]] = None) -> Dict[str, Any]:
+    """
+    Consume one consumer group member's partitions into its sink.
+    Rows of routed tables go to route_sinks (keyed by destination table),
+    each through its own batch buffer. Runs until the consumer goes idle,
+    the drain phase is due or stop_event is set; the sinks are closed and
+    the consumer released either way.
+    With a backfill share, reads its partitions' ranges instead (assigned
+    directly, outside the group) and saves progress to its checkpoint.
+    Messages at the replayed positions (offsets per partition, written by
+    the write-ahead replay) are skipped without being decoded.
+    """
+    processed_count = 0
+    error_count = 0
+    filtered_count = 0
+    event_filter = EVENT_FILTER
+    
+    # One sink and batch buffer per destination; None is the events table
+    sinks: Dict[Optional[str], Sink] = {None: sink}
+    sinks.update(route_sinks or {})
+    
+    # Batches seal on a byte budget tuned from insert latency, a row cap or a linger time
+    batchers = {
+        destination: AdaptiveBatcher(
+            max_rows=MAX_BATCH_SIZE,
+            max_bytes=BATCH_MAX_BYTES,
+            min_bytes=BATCH_MIN_BYTES,
+            initial_bytes=BATCH_INITIAL_BYTES,
+            linger_ms=BATCH_LINGER_MS,
+            target_latency_ms=BATCH_TARGET_LATENCY_MS,
+            on_seal=BATCH_FILL_SECONDS.observe
+        )
+        for destination in sinks
+    }
+    # Source tables whose rows leave the events table; routes without a sink here stay unrouted
+    routes = {source: route for source, route in TABLE_ROUTES.items() if route.table in sinks}
+    # Opted-in tables' repeated updates of a row collapse when their batch is sealed
+    coalescer = ChangeCoalescer(COALESCE_TABLES)
+    
+    # Offsets only advance past rows the sink has made durable
+    offsets = OffsetTracker()
+    awaiting_close: Dict[Optional[str], List[Any]] = {destination: [] for destination in sinks}
+    batch_destinations: Dict[int, Optional[str]] = {}
+    deferred_rows = 0
+    # Insert threads add deferred batches while the consumer thread reads the count
+    deferred_lock = threading.Lock()
+    
+    # Sealed batches stay in the write-ahead spool until their sink is done with them;
+    # backfills resume from their checkpoint instead
+    spool = get_write_ahead_spool() if backfill is None else None
+    batch_sequences: Dict[int, int] = {}
+    skipped_replayed = 0
+    
+    # Bytes this worker holds against the instance's memory budget, per open buffer and sealed batch
+    budget = MEMORY_BUDGET.lease()
+    open_bytes: Dict[Optional[str], int] = {destination: 0 for destination in sinks}
+    batch_bytes: Dict[int, int] = {}
+    throttled = set()
+    throttled_since = 0.0
+    backpressure = {'pauses': 0, 'paused_ms': 0}
+    
+    # Messages that cannot be loaded are kept with their reason; if that fails their partition stays put
+    dead_letters = None
+    dead_letter_writer = get_dead_letter_writer()
+    if dead_letter_writer is not None:
+        dead_letters = DeadLetterQueue(
+            dead_letter_writer,
+            batch_size=DEAD_LETTER_BATCH_SIZE,
+            on_write_failure=lambda records: [
+                offsets.pin((record.topic, record.partition), record.offset)
+                for record in records if record.offset is not None
+            ]
+        )
+        for destination_sink in sinks.values():
+            destination_sink.on_rejected = lambda rows, reasons: [
+                dead_letters.add(row_to_dead_letter(row, reason)) for row, reason in zip(rows, reasons)
+            ]
+    
+    def write_batch(rows: List[Dict[str, Any]]) -> bool:
+        nonlocal deferred_rows
+        destination = batch_destinations.pop(id(rows), None)
+        destination_sink = sinks[destination]
+        write_start = time.monotonic()
+        ok = False
+        try:
+            ok = destination_sink.write(rows)
+        finally:
+            sequence = batch_sequences.pop(id(rows), None)
+            if ok and not destination_sink.durable_on_write:
+                # Load jobs and pending streams land when the sink closes; the rows are already
+                # staged, so only a stand-in for the batch is kept until then
+                staged = object()
+                offsets.rekey(rows, staged)
+                with deferred_lock:
+                    awaiting_close[destination].append(staged)
+                    deferred_rows += len(rows)
+                if sequence is not None:
+                    batch_sequences[id(staged)] = sequence
+            else:
+                offsets.complete(rows, ok)
+                if sequence is not None:
+                    # A failed batch pins its partitions, so it is read from Kafka again rather than replayed
+                    spool.ack(sequence)
+            budget.release(batch_bytes.pop(id(rows), 0))
+        write_s = time.monotonic() - write_start
+        batchers[destination].record_result(write_s * 1000, ok)
+        INSERT_SECONDS.observe(write_s, destination_sink.name)
+        ROWS_TOTAL.inc(len(rows), destination_sink.name, 'written' if ok else 'failed')
+        if ok:
+            now = datetime.utcnow()
+            EVENT_LAG_SECONDS.observe_many([(now - row['event_timestamp']).total_seconds() for row in rows])
+        return ok
+    
+    # Pipelined mode: sealed batches are inserted by worker threads while we keep polling.
+    # Backfills stage rows for load jobs, a local append, so they write on the consumer thread.
+    pipeline = None
+    if INSERT_WORKERS > 0 and backfill is None:
+        pipeline = InsertPipeline(
+            write_batch,
+            workers=INSERT_WORKERS,
+            max_pending_batches=PIPELINE_MAX_PENDING_BATCHES
+        )
+        logger.info(f"Pipelined inserts enabled with {INSERT_WORKERS} workers")
+    pipeline_stats = None
+    
+    def dispatch(rows: List[Dict[str, Any]], destination: Optional[str] = None) -> bool:
+        nonlocal error_count
+        # Positions are taken before coalescing merges rows away
+        positions = [row_position(row) for row in rows] if spool else None
+        if coalescer:
+            rows, merged = coalescer.coalesce(rows)
+            for table, count in merged.items():
+                ROWS_COALESCED_TOTAL.inc(count, table)
+        offsets.seal(rows, destination)
+        batch_destinations[id(rows)] = destination
+        batch_bytes[id(rows)] = open_bytes[destination]
+        open_bytes[destination] = 0
+        if spool:
+            sequence = spool.append(rows, destination, positions)
+            if sequence is not None:
+                batch_sequences[id(rows)] = sequence
+        if pipeline:
+            # Blocks only when the batch queue is full
+            pipeline.submit(rows)
+            return True
+        if not write_batch(rows):
+            error_count += len(rows)
+            return False
         return True
     
-    table_id = f"{PROJECT_ID}.{BIGQUERY_DATASET}.{BIGQUERY_TABLE}" if PROJECT_ID else f"{BIGQUERY_DATASET}.{BIGQUERY_TABLE}"
+    def rows_in_flight() -> int:
+        # Everything the drain phase still has to make durable
+        buffered = sum(len(batcher) for batcher in batchers.values())
+        with deferred_lock:
+            deferred = deferred_rows
+        return buffered + (pipeline.rows_in_flight if pipeline else 0) + deferred
+    
+    def handle_batch(messages: List[Any]) -> None:
+        # One partition's share of a poll: filtered, decoded and transformed here in one pass
+        nonlocal processed_count, error_count, filtered_count, skipped_replayed
+        if backfill and messages:
+            # Messages past the end of the range are left to the live consumer
+            messages = backfill.trim(messages)
+        if not messages:
+            return
+        topic = messages[0].topic
+        written = replayed.get((topic, messages[0].partition)) if replayed else None
+        if written:
+            # The write-ahead replay already wrote these rows; only their offsets move on
+            kept = []
+            for message in messages:
+                if message.offset in written:
+                    written.discard(message.offset)
+                    offsets.consumed((message.topic, message.partition), message.offset, buffered=False)
+                else:
+                    kept.append(message)
+            skipped_replayed += len(messages) - len(kept)
+            EVENTS_TOTAL.inc(len(messages) - len(kept), topic, 'replayed')
+            messages = kept
+            if not messages:
+                return
+        if event_filter and not event_filter.allows_topic(topic):
+            # Unwanted tables are skipped before any JSON is parsed
+            for message in messages:
+                offsets.consumed((message.topic, message.partition), message.offset, buffered=False)
+            filtered_count += len(messages)
+            EVENTS_TOTAL.inc(len(messages), topic, 'filtered')
+            return
+        
+        values = [decode_message_value(message.value) for message in messages]
+        try:
+            transform_started = time.perf_counter()
+            events = []
+            positions = []
+            skipped = set()
+            for index, (message, value) in enumerate(zip(messages, values)):
+                if isinstance(value, UndecodableMessage):
+                    continue
+                if event_filter and not event_filter.allows_event(value):
+                    skipped.add(index)
+                    continue
+                events.append(value)
+                positions.append((message.topic, message.partition, message.offset))
+            
+            rejected = set()
+            def on_rejected(index: int, event: Any, reason: str) -> None:
+                rejected.add(index)
+                if dead_letters:
+                    dead_letters.add(DeadLetter(*positions[index], raw_value(event), STAGE_VALIDATE, reason))
+            
+            rows, _ = process_events(events, positions=positions, on_rejected=on_rejected, routes=routes,
+                                     event_filter=event_filter, coalescer=coalescer)
+            elapsed = time.perf_counter() - transform_started
+            TRANSFORM_SECONDS.observe_many([elapsed / len(messages)] * len(messages))
+        except Exception as e:
+            EVENT_LOG.error('message_error', "Error processing messages from %s: %s", topic, e)
+            error_count += len(messages)
+            EVENTS_TOTAL.inc(len(messages), topic, 'failed')
+            return
+        
+        # Record offsets and fill the batches in Kafka order
+        row_sizes = [estimate_row_bytes(row) for row in rows]
+        budget.acquire(sum(row_sizes))
+        rows = iter(rows)
+        sizes = iter(row_sizes)
+        index = 0
+        failed = 0
+        for message_index, (message, value) in enumerate(zip(messages, values)):
+            partition = (message.topic, message.partition)
+            if isinstance(value, UndecodableMessage):
+                EVENT_LOG.warning('undecodable_message', "Invalid JSON in message at %s:%d: %s",
+                                  partition_key(partition), message.offset, value.error)
+                if dead_letters:
+                    dead_letters.add(DeadLetter(*partition, message.offset, value.raw, STAGE_DECODE, value.error))
+                offsets.consumed(partition, message.offset, buffered=False)
+                failed += 1
+                continue
+            if message_index in skipped:
+                offsets.consumed(partition, message.offset, buffered=False)
+                continue
+            if index in rejected:
+                index += 1
+                offsets.consumed(partition, message.offset, buffered=False)
+                failed += 1
+                continue
+            index += 1
+            row = next(rows)
+            size = next(sizes)
+            route = routes.get(row['source_table']) if routes else None
+            destination = route.table if route else None
+            offsets.consumed(partition, message.offset, buffer=destination)
+            open_bytes[destination] += size
+            batch = batchers[destination].add(row, size)
+            if batch:
+                dispatch(batch, destination)
+        
+        processed = len(messages) - failed - len(skipped)
+        processed_count += processed
+        error_count += failed
+        filtered_count += len(skipped)
+        if processed:
+            EVENTS_TOTAL.inc(processed, topic, 'processed')
+        if failed:
+            EVENTS_TOTAL.inc(failed, topic, 'failed')
+        if skipped:
+            EVENTS_TOTAL.inc(len(skipped), topic, 'filtered')
+    
+    rejected_counted = {destination: 0 for destination in sinks}
+    
+    def close_sinks() -> None:
+        # Pending streams commit and load jobs complete here; their batches become durable or failed
+        nonlocal error_count, deferred_rows
+        # Batches staged before this point are the ones the close below decides
+        with deferred_lock:
+            closing = {destination: awaiting_close[destination] for destination in sinks}
+            for destination in sinks:
+                awaiting_close[destination] = []
+            deferred_rows = 0
+        for destination, destination_sink in sinks.items():
+            sink_failed_before_close = destination_sink.stats['rows_failed']
+            sink_closed = destination_sink.close()
+            if not sink_closed:
+                error_count += destination_sink.stats.get('rows_pending_commit', 0)
+                error_count += destination_sink.stats['rows_failed'] - sink_failed_before_close
+            # Rows BigQuery refused for their content are dropped from otherwise successful batches
+            rejected = destination_sink.stats.get('rows_rejected', 0)
+            error_count += rejected - rejected_counted[destination]
+            rejected_counted[destination] = rejected
+            for batch in closing[destination]:
+                offsets.complete(batch, sink_closed)
+                sequence = batch_sequences.pop(id(batch), None)
+                if sequence is not None:
+                    spool.ack(sequence)
+    
+    def handle_revoked(revoked: List[Any]) -> None:
+        # Before the partitions move to another member: make what was read durable, commit it
+        # and forget them, so this worker cannot later commit over the new owner's progress
+        for destination, batcher in batchers.items():
+            batch = batcher.flush()
+            if batch:
+                dispatch(batch, destination)
+        if pipeline is None or pipeline.wait_idle(timeout=min(PIPELINE_DRAIN_TIMEOUT_S, scheduler.remaining_s())):
+            close_sinks()
+        if dead_letters:
+            dead_letters.flush()
+        commit_offsets(consumer, offsets, sync=True)
+        given_up = [(tp.topic, tp.partition) for tp in revoked]
+        offsets.drop(given_up)
+        throttled.difference_update(revoked)
+        logger.info(f"Consumer worker {worker} gave up partitions {sorted(partition_key(p) for p in given_up)}")
     
+    consumer = None
+    rebalance_listener = None
+    consumer_failed = False
+    partitions = []
+    last_commit = time.monotonic()
+    last_checkpoint = time.monotonic()
     try:
-        # Use streaming insert (not load job) for real-time data
-        errors = bq_client.insert_rows_json(table_id, rows)
+        # Create consumer with timeout and error handling
+        if backfill:
+            consumer = create_backfill_consumer(consumer_config, backfill)
+        elif REUSE_KAFKA_CONSUMER:
+            consumer = get_kafka_consumer(consumer_config, worker)
+        else:
+            consumer = create_kafka_consumer(consumer_config)
+        if not backfill:
+            rebalance_listener = getattr(consumer, 'rebalance_listener', None)
+            if rebalance_listener is not None:
+                rebalance_listener.on_revoked = handle_revoked
         
-        if errors:
-            logger.error(f"BigQuery insert errors: {errors}")
-            return False
+        # Broker waits end at the earliest pending batch's linger time, the idle timeout or the start of the drain phase
+        idle_s = CONSUMER_TIMEOUT_MS / 1000.0
+        last_message = time.monotonic()
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                logger.info(f"Consumer worker {worker} asked to stop, finishing processing")
+                break
+            if throttled:
+                # Paused partitions return nothing, which is not the topic going quiet
+                last_message = time.monotonic()
+            in_flight = rows_in_flight()
+            if scheduler.should_drain(in_flight):
+                logger.info(f"Approaching Cloud Function timeout with {in_flight} rows in flight, finishing processing")
+                break
+            
+            idle_remaining_s = idle_s - (time.monotonic() - last_message)
+            lingers = {destination: batcher.linger_remaining_s() for destination, batcher in batchers.items()}
+            pending_lingers = [linger for linger in lingers.values() if linger is not None]
+            linger_remaining_s = min(pending_lingers) if pending_lingers else None
+            timeout_s = scheduler.poll_timeout_s(in_flight, linger_remaining_s, idle_remaining_s)
+            if throttled:
+                # Keep polling for heartbeats and commit callbacks, and to resume promptly
+                timeout_s = min(timeout_s, BACKPRESSURE_POLL_MS / 1000.0)
+            poll_started = time.perf_counter()
+            records = consumer.poll(timeout_ms=int(timeout_s * 1000), max_records=MAX_POLL_RECORDS)
+            POLL_WAIT_SECONDS.observe(time.perf_counter() - poll_started)
+            
+            if records:
+                last_message = time.monotonic()
+                # Polled records count against the budget until they are rows in a batch
+                fetched = sum(len(message.value) for messages in records.values() for message in messages
+                              if isinstance(message.value, (bytes, bytearray)))
+                budget.acquire(fetched)
+                for messages in records.values():
+                    handle_batch(messages)
+                budget.release(fetched)
+                if MEMORY_BUDGET.exhausted:
+                    # Stop fetching until written batches have freed enough of the budget
+                    unpaused = set(consumer.assignment()) - set(consumer.paused())
+                    if unpaused:
+                        if not throttled:
+                            backpressure['pauses'] += 1
+                            throttled_since = time.monotonic()
+                            logger.info(f"Memory budget exhausted ({MEMORY_BUDGET.used_bytes} bytes buffered), "
+                                        f"pausing {len(unpaused)} partitions")
+                        consumer.pause(*unpaused)
+                        throttled.update(unpaused)
+            elif backfill:
+                # Compaction or transaction markers can leave the last offsets of a range without a message
+                for partition in backfill.open_partitions:
+                    backfill.reached(partition, consumer.position(kafka.TopicPartition(*partition)))
+            if backfill:
+                # Finished partitions stop taking fetch bandwidth from the rest
+                finished = backfill.take_finished()
+                if finished:
+                    finished = [kafka.TopicPartition(*partition) for partition in finished]
+                    consumer.pause(*finished)
+                    throttled.difference_update(finished)
+            
+            # Insert batches whose oldest row has lingered, even when the topic is quiet
+            for destination, batcher in batchers.items():
+                linger = lingers[destination]
+                batch = batcher.poll(expired=not records and linger is not None and timeout_s >= linger)
+                if batch:
+                    dispatch(batch, destination)
+            
+            if throttled and MEMORY_BUDGET.drained:
+                resume_partitions(consumer, throttled)
+                backpressure['paused_ms'] += int((time.monotonic() - throttled_since) * 1000)
+                throttled.clear()
+            
+            if backfill:
+                if backfill.done:
+                    logger.info(f"Backfill worker {worker} reached the end of its ranges, finishing processing")
+                    break
+                if time.monotonic() - last_checkpoint >= BACKFILL_CHECKPOINT_INTERVAL_S:
+                    # Staged rows only become durable when their load jobs complete
+                    for destination, batcher in batchers.items():
+                        batch = batcher.flush()
+                        if batch:
+                            dispatch(batch, destination)
+                    close_sinks()
+                    if dead_letters:
+                        dead_letters.flush()
+                    checkpoint_offsets(backfill, offsets)
+                    last_checkpoint = time.monotonic()
+            elif time.monotonic() - last_commit >= OFFSET_COMMIT_INTERVAL_MS / 1000:
+                # Dead letters must be stored before their offsets are committed
+                if dead_letters:
+                    dead_letters.flush()
+                commit_offsets(consumer, offsets)
+                last_commit = time.monotonic()
+            
+            if not records and timeout_s >= idle_remaining_s:
+                logger.info("Kafka consumer idle, finishing processing")
+                break
+        
+        # Insert remaining rows
+        for destination, batcher in batchers.items():
+            final_batch = batcher.flush()
+            if final_batch and dispatch(final_batch, destination) and not pipeline:
+                logger.info(f"Inserted final batch of {len(final_batch)} rows"
+                            + (f" into {destination}" if destination else ""))
+        
+        try:
+            partitions = sorted(f"{tp.topic}-{tp.partition}" for tp in consumer.assignment())
+        except Exception:
+            partitions = []
+            
+    except kafka_errors.KafkaTimeoutError:
+        logger.info("Kafka consumer timeout reached, finishing processing")
+    except Exception:
+        consumer_failed = True
+        raise
+    finally:
+        # Drain queued batches before the consumer goes away
+        drained = True
+        if pipeline:
+            pipeline_stats = pipeline.drain(timeout=min(PIPELINE_DRAIN_TIMEOUT_S, scheduler.remaining_s()))
+            error_count += pipeline_stats['rows_failed']
+            logger.info(f"Insert pipeline drained: {pipeline_stats}")
+            drained = pipeline.rows_in_flight == 0
+        if drained:
+            close_sinks()
         else:
-            logger.info(f"Successfully inserted {len(rows)} rows to BigQuery")
+            # Insert threads may still be writing to the sinks; their batches stay unfinished and are rewound
+            logger.warning(f"Insert pipeline did not drain in time with {pipeline.rows_in_flight} rows in flight, "
+                           f"leaving the sinks open")
+        budget.close()
+        if throttled and consumer:
+            # A warm consumer must not start the next invocation with paused partitions
+            resume_partitions(consumer, throttled)
+            backpressure['paused_ms'] += int((time.monotonic() - throttled_since) * 1000)
+        if dead_letters:
+            dead_letters.close()
+        if backfill:
+            # Progress is kept in the checkpoint; the next run resumes from there, failed partitions included
+            checkpoint_offsets(backfill, offsets)
+        elif consumer:
+            # Final commit of everything now durable; failed partitions are re-read next time
+            commit_offsets(consumer, offsets, sync=True)
+            rewind = offsets.rewind_positions()
+            if rewind and REUSE_KAFKA_CONSUMER and not consumer_failed:
+                for (topic, partition), position in rewind.items():
+                    try:
+                        consumer.seek(kafka.TopicPartition(topic, partition), position)
+                    except Exception as e:
+                        logger.warning(f"Could not rewind {topic}-{partition} to {position}: {e}")
+                logger.info(f"Rewound partitions with failed or unfinished batches: "
+                            f"{ {partition_key(p): position for p, position in rewind.items()} }")
+        if rebalance_listener is not None:
+            rebalance_listener.on_revoked = None
+        if sink.stats['rows_failed']:
+            # Insert failures may mean the table was dropped: re-check it next invocation
+            RESOURCES.mark_ready(RESOURCE_BIGQUERY_TABLE, False)
+        for route in routes.values():
+            if sinks[route.table].stats['rows_failed']:
+                RESOURCES.mark_ready(table_resource(route), False)
+        if REUSE_KAFKA_CONSUMER and not backfill:
+            if consumer_failed:
+                RESOURCES.invalidate(kafka_consumer_resource(worker))
+                logger.info("Discarded failed Kafka consumer; it will be rebuilt on the next invocation")
+            elif consumer:
+                logger.info("Kafka consumer kept open for the next invocation")
+        elif consumer:
+            try:
+                consumer.close()
+                logger.info("Kafka consumer closed successfully")
+            except Exception as e:
+                logger.warning(f"Error closing consumer: {e}")
+    
+    stats = {
+        'worker': worker,
+        'partitions': partitions,
+        'events_processed': processed_count,
+        'events_failed': error_count,
+        'events_filtered': filtered_count,
+        'sink': dict(sink.stats),
+        'batching': batchers[None].stats,
+        'offsets': offsets.stats,
+    }
+    logger.info(f"Consumer worker {worker} committed offsets: {stats['offsets']['committed']}")
+    if routes:
+        stats['routes'] = {
+            route.table: {'sink': dict(sinks[route.table].stats), 'batching': batchers[route.table].stats}
+            for route in routes.values()
+        }
+    if coalescer:
+        stats['coalescing'] = coalescer.stats
+    if MEMORY_BUDGET.max_bytes > 0:
+        stats['backpressure'] = backpressure
+    if spool:
+        stats['write_ahead'] = {'events_skipped': skipped_replayed}
+    if pipeline_stats is not None:
+        stats['pipeline'] = pipeline_stats
+    if dead_letters:
+        stats['dead_letters'] = dead_letters.stats
+    return stats
+
+def replay_write_ahead(spool: WriteAheadSpool, bq_client: bigquery.Client, retry_budget: RetryBudget,
+                       scheduler: DeadlineScheduler) -> Tuple[Dict[str, Any], Dict[Tuple[str, int], Set[int]]]:
+    """
+    Write the batches a previous run spooled but did not finish, and return
+    the positions they cover so consumers skip them when Kafka delivers them
+    again. Like dead-letter replays they always go through insertAll,
+    deduplicated by event_id, since some of them may have landed already.
+    """
+    routes = {route.table: route for route in TABLE_ROUTES.values()}
+    sinks: Dict[Optional[str], Sink] = {}
+    replayed: Dict[Tuple[str, int], Set[int]] = {}
+    dead_letters = None
+    dead_letter_writer = get_dead_letter_writer()
+    if dead_letter_writer is not None:
+        dead_letters = DeadLetterQueue(dead_letter_writer, batch_size=DEAD_LETTER_BATCH_SIZE)
+    
+    def handler(batch: SpooledBatch) -> bool:
+        if scheduler.should_drain(len(batch.rows)):
+            return False
+        if batch.destination is not None and batch.destination not in routes:
+            # Routes only change with a redeploy, which reads from the committed offsets again
+            logger.warning(f"Dropping spooled batch {batch.sequence} for unrouted table {batch.destination}")
             return True
-            
-    except Exception as e:
-        logger.error(f"Error inserting to BigQuery: {e}", exc_info=True)
-        return False
+        sink = sinks.get(batch.destination)
+        if sink is None:
+            sink = InsertAllSink(bq_client, get_table_id(batch.destination),
+                                 retry_policy=create_retry_policy(retry_budget))
+            if dead_letters:
+                sink.on_rejected = lambda rows, reasons: [
+                    dead_letters.add(row_to_dead_letter(row, reason)) for row, reason in zip(rows, reasons)
+                ]
+            sinks[batch.destination] = sink
+        if not sink.write(batch.rows):
+            return False
+        if dead_letters:
+            # Rejected rows must be stored before the batch leaves the spool
+            dead_letters.flush()
+            if dead_letters.stats['write_failures']:
+                return False
+        for topic, partition, offset in batch.positions:
+            replayed.setdefault((topic, partition), set()).add(offset)
+        return True
+    
+    replay_stats = spool.replay(handler)
+    if replay_stats['batches_replayed']:
+        logger.info(f"Replayed {replay_stats['batches_replayed']} spooled batches "
+                    f"({replay_stats['rows_replayed']} rows) before consuming")
+    return replay_stats, replayed
 
 @correlation_logger
 def consume_events(request) -> Tuple[Dict[str, Any], int]:
@@ -285,110 +1547,386 @@ def consume_events(request) -> Tuple[Dict[str, Any], int]:
     Cloud Function entry point.
     Consumes events from Kafka and writes to BigQuery.
     """
-    start_time = datetime.utcnow()
+    return run_consumers(create_scheduler())
+
+def run_consumers(scheduler: DeadlineScheduler,
+                  stop_event: Optional[threading.Event] = None) -> Tuple[Dict[str, Any], int]:
+    """
+    Consume until the scheduler's deadline, idle timeout or stop_event, then drain.
+    Shared by the Cloud Function and each round of the streaming service.
+    """
+    metrics_snapshot = METRICS.snapshot()
     
     # Validate environment before starting
     if not validate_environment():
         return {'error': 'Environment validation failed'}, 500
     
-    # Initialize BigQuery client with error handling
+    # Initialize BigQuery client with error handling (reused on warm instances)
     try:
-        bq_client = bigquery.Client()
+        bq_client = get_bigquery_client()
     except Exception as e:
         logger.error(f"Failed to initialize BigQuery client: {e}")
         return {'error': 'BigQuery client initialization failed'}, 500
     
-    # Initialize table
-    if not create_bigquery_table_if_not_exists(bq_client):
+    # Initialize table (once per instance)
+    if not ensure_bigquery_table(bq_client):
         return {'error': 'BigQuery table initialization failed'}, 500
     
-    # Configure Kafka consumer
+    # Select write backend, one sink per consumer worker and destination table; all of them share one retry budget
+    worker_count = max(1, CONSUMER_WORKERS)
+    retry_budget = RetryBudget(INSERT_RETRY_BUDGET)
+    sinks = []
+    route_sinks: List[Dict[str, Sink]] = []
+    try:
+        for worker in range(worker_count):
+            sinks.append(create_sink(bq_client, worker, retry_budget))
+            route_sinks.append({})
+            for route in TABLE_ROUTES.values():
+                route_sinks[worker][route.table] = create_sink(bq_client, worker, retry_budget, route)
+        logger.info(f"Writing to BigQuery through the {sinks[0].name} sink"
+                    + (f", routing {len(TABLE_ROUTES)} tables" if TABLE_ROUTES else ""))
+    except Exception as e:
+        logger.error(f"Failed to initialize BigQuery sink: {e}")
+        for sink in sinks + [sink for worker_sinks in route_sinks for sink in worker_sinks.values()]:
+            sink.close()
+        return {'error': 'BigQuery sink initialization failed'}, 500
+    
+    # Batches a previous run spooled but did not finish are written before anything new is read
+    replay_stats = None
+    replayed = None
     try:
-        consumer_config = get_kafka_config()
+        spool = get_write_ahead_spool()
+        if spool is not None:
+            replay_stats, replayed = replay_write_ahead(spool, bq_client, retry_budget, scheduler)
+    except Exception as e:
+        logger.error(f"Failed to replay the write-ahead spool: {e}", exc_info=True)
+        for sink in sinks + [sink for worker_sinks in route_sinks for sink in worker_sinks.values()]:
+            sink.close()
+        return {'error': 'Write-ahead spool replay failed'}, 500
+    
+    # Configure Kafka consumers; warm consumers need no new configuration or secrets
+    consumer_config = None
+    try:
+        if not REUSE_KAFKA_CONSUMER or any(RESOURCES.peek(kafka_consumer_resource(worker)) is None
+                                           for worker in range(worker_count)):
+            consumer_config = get_kafka_config()
     except Exception as e:
         logger.error(f"Failed to get Kafka configuration: {e}")
+        for sink in sinks + [sink for worker_sinks in route_sinks for sink in worker_sinks.values()]:
+            sink.close()
         return {'error': 'Kafka configuration failed'}, 500
     
-    rows_to_insert = []
-    processed_count = 0
-    error_count = 0
+    try:
+        if worker_count == 1:
+            worker_stats = [consume_worker(0, sinks[0], consumer_config, scheduler, stop_event, route_sinks[0],
+                                           replayed=replayed)]
+        else:
+            # Partition-parallel mode: every worker is a member of the same consumer group
+            runner = ConsumerGroupRunner(
+                lambda worker, stop_event: consume_worker(worker, sinks[worker], consumer_config, scheduler, stop_event,
+                                                          route_sinks[worker], replayed=replayed),
+                workers=worker_count
+            )
+            logger.info(f"Running {worker_count} consumer workers in group {KAFKA_GROUP_ID}")
+            worker_stats = runner.run(stop_event)
+    except kafka_errors.KafkaError as e:
+        logger.error(f"Kafka error: {e}")
+        if is_kafka_auth_error(e):
+            # Credentials may have been rotated: fetch them again on the next attempt
+            SECRET_CACHE.invalidate(*KAFKA_SECRET_NAMES)
+        return {'error': f'Kafka error: {str(e)}'}, 500
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}", exc_info=True)
+        return {'error': f'Unexpected error: {str(e)}'}, 500
+    
+    # Return comprehensive status
+    totals = merge_stats(worker_stats)
+    response = {
+        'status': 'success',
+        'events_processed': totals['events_processed'],
+        'events_failed': totals['events_failed'],
+        'events_filtered': totals['events_filtered'],
+        'environment': ENVIRONMENT,
+        'execution_time_ms': int(scheduler.elapsed_s() * 1000),
+        'timestamp': datetime.utcnow().isoformat()
+    }
+    if 'pipeline' in totals:
+        response['pipeline'] = totals['pipeline']
+    response['sink'] = totals['sink']
+    if 'routes' in totals:
+        response['routes'] = totals['routes']
+    if 'coalescing' in totals:
+        response['coalescing'] = dict(totals['coalescing'], reduction_ratio=reduction_ratio(totals['coalescing']))
+    if 'backpressure' in totals:
+        response['backpressure'] = dict(totals['backpressure'], **MEMORY_BUDGET.stats)
+    if spool is not None:
+        response['write_ahead'] = dict(spool.stats, pending_batches=spool.pending, replay=replay_stats,
+                                       **totals.get('write_ahead', {}))
+    response['warm_resources'] = dict(RESOURCES.stats)
+    response['secret_cache'] = SECRET_CACHE.stats
+    response['batching'] = totals['batching']
+    response['offsets'] = totals['offsets']
+    response['retries'] = dict(retry_budget.stats, budget_remaining=retry_budget.remaining)
+    if 'dead_letters' in totals:
+        response['dead_letters'] = totals['dead_letters']
+    # What this invocation added to the instance's metrics
+    response['metrics'] = METRICS.summary(since=metrics_snapshot)
+    if worker_count > 1:
+        response['workers'] = [
+            {key: stats[key] for key in ('worker', 'partitions', 'events_processed', 'events_failed')}
+            for stats in worker_stats
+        ]
+    return response, 200
+
+def create_dead_letter_consumer() -> kafka.KafkaConsumer:
+    """Consumer for the dead-letter topic with its own group, read from the beginning"""
+    config = get_kafka_config()
+    config.update({
+        'group_id': f"{KAFKA_GROUP_ID}-dead-letter-replay",
+        'auto_offset_reset': 'earliest',
+        'enable_auto_commit': False,
+    })
+    return kafka.KafkaConsumer(DEAD_LETTER_TOPIC, **config)
+
+@correlation_logger
+def replay_dead_letters(request) -> Tuple[Dict[str, Any], int]:
+    """
+    Dead-letter replay entry point.
+    Sends dead letters back through the regular transform and sink; records
+    that fail again are dead-lettered anew and left for the next replay.
+    """
+    start_time = datetime.utcnow()
+    if DEAD_LETTER_MODE == DEAD_LETTER_NONE:
+        return {'error': 'Dead-letter queue is not enabled'}, 400
+    if not validate_environment():
+        return {'error': 'Environment validation failed'}, 500
     
-    consumer = None
     try:
-        # Create consumer with timeout and error handling
-        logger.info(f"Creating Kafka consumer with config for topics: {KAFKA_TOPIC_PATTERN}")
-        consumer = KafkaConsumer(**consumer_config)
+        bq_client = get_bigquery_client()
+        if not ensure_bigquery_table(bq_client):
+            return {'error': 'BigQuery table initialization failed'}, 500
+        # Replays are small and need per-row outcomes: always use insertAll, deduplicated by event_id
+        retry_budget = RetryBudget(INSERT_RETRY_BUDGET)
+        sink = InsertAllSink(bq_client, get_table_id(), retry_policy=create_retry_policy(retry_budget))
+        sinks: Dict[Optional[str], Sink] = {None: sink}
+        for route in TABLE_ROUTES.values():
+            sinks[route.table] = InsertAllSink(bq_client, get_table_id(route.table),
+                                               retry_policy=create_retry_policy(retry_budget))
+        writer = get_dead_letter_writer()
+    except Exception as e:
+        logger.error(f"Failed to initialize dead-letter replay: {e}")
+        return {'error': 'Dead-letter replay initialization failed'}, 500
+    
+    dead_letters = DeadLetterQueue(writer, batch_size=DEAD_LETTER_BATCH_SIZE)
+    for destination_sink in sinks.values():
+        destination_sink.on_rejected = lambda rows, reasons: [
+            dead_letters.add(row_to_dead_letter(row, reason)) for row, reason in zip(rows, reasons)
+        ]
+    counts = {'rows_written': 0, 'still_failing': 0}
+    
+    def handler(records: List[DeadLetter]) -> bool:
+        events = []
+        positions = []
+        for record in records:
+            event = decode_event_or_error(record.value)
+            if isinstance(event, UndecodableMessage):
+                counts['still_failing'] += 1
+                dead_letters.add(DeadLetter(record.topic, record.partition, record.offset, record.value,
+                                            STAGE_DECODE, event.error))
+                continue
+            events.append((record, event))
+            # The original position keeps the event_id, so BigQuery drops rows that did land before
+            positions.append((record.topic, record.partition, record.offset) if record.offset is not None else None)
         
-        # Subscribe to topics with error handling
-        consumer.subscribe(pattern=KAFKA_TOPIC_PATTERN)
-        logger.info(f"Subscribed to topics matching: {KAFKA_TOPIC_PATTERN}")
+        def rejected(index: int, event: Any, reason: str) -> None:
+            record = events[index][0]
+            counts['still_failing'] += 1
+            dead_letters.add(DeadLetter(record.topic, record.partition, record.offset, raw_value(event),
+                                        STAGE_VALIDATE, reason))
         
-        # Consume messages with Cloud Function timeout awareness
-        for message in consumer:
-            # Check if we're approaching Cloud Function timeout
-            elapsed_time = (datetime.utcnow() - start_time).total_seconds() * 1000
-            if elapsed_time > CLOUD_FUNCTION_TIMEOUT_MS - 30000:  # Leave 30s buffer
-                logger.info("Approaching Cloud Function timeout, finishing processing")
-                break
-                
+        rows, _ = process_events([event for _, event in events], positions=positions, on_rejected=rejected,
+                                 routes=TABLE_ROUTES, event_filter=EVENT_FILTER)
+        batches: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for row in rows:
+            route = TABLE_ROUTES.get(row['source_table'])
+            batches.setdefault(route.table if route else None, []).append(row)
+        # Write every destination's rows, even after one of them failed
+        ok = all([sinks[destination].write(batch) for destination, batch in batches.items()])
+        # Re-dead-lettered records must be stored before the batch is dropped from the queue
+        dead_letters.flush()
+        if ok:
+            counts['rows_written'] += len(rows)
+        return ok and dead_letters.stats['write_failures'] == 0
+    
+    try:
+        if DEAD_LETTER_MODE == DEAD_LETTER_FILE:
+            replay_stats = writer.replay(handler, batch_size=MAX_BATCH_SIZE)
+        else:
+            consumer = create_dead_letter_consumer()
             try:
-                # Process event with validation
-                row = process_event(message.value)
-                if row:
-                    rows_to_insert.append(row)
-                    processed_count += 1
-                else:
-                    error_count += 1
-                
-                # Batch insert when we have enough rows or timeout
-                if len(rows_to_insert) >= MAX_BATCH_SIZE:
-                    if insert_rows_to_bigquery(bq_client, rows_to_insert):
-                        rows_to_insert = []
-                    else:
-                        error_count += len(rows_to_insert)
-                        rows_to_insert = []
-                    
-            except json.JSONDecodeError as e:
-                logger.warning(f"Invalid JSON in message: {e}")
-                error_count += 1
-                continue
-            except Exception as e:
-                logger.error(f"Error processing message: {e}")
-                error_count += 1
-                continue
-        
-        # Insert remaining rows
-        if rows_to_insert:
-            if insert_rows_to_bigquery(bq_client, rows_to_insert):
-                logger.info(f"Inserted final batch of {len(rows_to_insert)} rows")
-            else:
-                error_count += len(rows_to_insert)
-            
-    except KafkaTimeoutError:
-        logger.info("Kafka consumer timeout reached, finishing processing")
-    except KafkaError as e:
-        logger.error(f"Kafka error: {e}")
+                # Stop at records dead-lettered again by this replay
+                replay_stats = replay_from_consumer(
+                    consumer, handler, batch_size=MAX_BATCH_SIZE, until=start_time.isoformat(),
+                    commit=lambda positions: consumer.commit(offsets={
+                        kafka.TopicPartition(topic, partition): kafka.OffsetAndMetadata(position, '')
+                        for (topic, partition), position in positions.items()
+                    }))
+            finally:
+                consumer.close()
+    except kafka_errors.KafkaError as e:
+        logger.error(f"Kafka error during dead-letter replay: {e}")
         return {'error': f'Kafka error: {str(e)}'}, 500
     except Exception as e:
-        logger.error(f"Unexpected error: {e}", exc_info=True)
+        logger.error(f"Unexpected error during dead-letter replay: {e}", exc_info=True)
         return {'error': f'Unexpected error: {str(e)}'}, 500
     finally:
-        if consumer:
-            try:
-                consumer.close()
-                logger.info("Kafka consumer closed successfully")
-            except Exception as e:
-                logger.warning(f"Error closing consumer: {e}")
+        for destination_sink in sinks.values():
+            destination_sink.close()
+        dead_letters.close()
     
-    # Return comprehensive status
-    return {
+    response = {
         'status': 'success',
-        'events_processed': processed_count,
-        'events_failed': error_count,
-        'environment': ENVIRONMENT,
+        'dead_letter_mode': DEAD_LETTER_MODE,
+        'replay': replay_stats,
+        'rows_written': counts['rows_written'],
+        'still_failing': counts['still_failing'],
+        'sink': dict(sink.stats),
+        'dead_letters': dead_letters.stats,
         'execution_time_ms': int((datetime.utcnow() - start_time).total_seconds() * 1000),
         'timestamp': datetime.utcnow().isoformat()
-    }, 200
+    }
+    if TABLE_ROUTES:
+        response['routes'] = {route.table: {'sink': dict(sinks[route.table].stats)} for route in TABLE_ROUTES.values()}
+    return response, 200
+
+def request_params(request) -> Dict[str, Any]:
+    """Parameters of an HTTP request: its JSON body, overridden by the query string"""
+    params: Dict[str, Any] = {}
+    body = request.get_json(silent=True) if hasattr(request, 'get_json') else None
+    if isinstance(body, dict):
+        params.update(body)
+    params.update(dict(getattr(request, 'args', None) or {}))
+    return params
+
+def plan_backfill(consumer_config: Dict[str, Any], backfill_request) -> Dict[Tuple[str, int], Tuple[int, int]]:
+    """Resolve a backfill's offset ranges with a short-lived, unassigned consumer"""
+    consumer = kafka.KafkaConsumer(**consumer_config)
+    try:
+        return resolve_ranges(consumer, backfill_request, kafka.TopicPartition)
+    finally:
+        consumer.close()
+
+@correlation_logger
+def backfill_events(request) -> Tuple[Dict[str, Any], int]:
+    """
+    Backfill entry point.
+    Re-reads topics between two offsets or timestamps (see backfill.py) into
+    BigQuery through load jobs, partitions in parallel. Stops at the end of
+    the ranges or the function deadline; calling it again resumes from the
+    checkpoint until the response says it is complete.
+    """
+    scheduler = create_scheduler()
+    try:
+        backfill_request = parse_backfill_request(request_params(request))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    if not validate_environment():
+        return {'error': 'Environment validation failed'}, 500
+    
+    try:
+        bq_client = get_bigquery_client()
+        if not ensure_bigquery_table(bq_client):
+            return {'error': 'BigQuery table initialization failed'}, 500
+        consumer_config = get_backfill_kafka_config()
+    except Exception as e:
+        logger.error(f"Failed to initialize backfill: {e}")
+        return {'error': 'Backfill initialization failed'}, 500
+    
+    # Ranges are fixed when a backfill is first planned; later calls resume within them
+    checkpoint = BackfillCheckpoint(os.path.join(BACKFILL_CHECKPOINT_DIR, f"{backfill_request.name}.json"))
+    try:
+        resumed = checkpoint.load()
+        if resumed and checkpoint.request != backfill_request.to_dict():
+            return {'error': f'Backfill {backfill_request.name} exists with different parameters'}, 409
+        if not resumed:
+            checkpoint.start(backfill_request, plan_backfill(consumer_config, backfill_request))
+            logger.info(f"Planned backfill {backfill_request.name}: {checkpoint.stats}")
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    except OSError as e:
+        logger.error(f"Backfill checkpoint unavailable: {e}")
+        return {'error': 'Backfill checkpoint unavailable'}, 500
+    except kafka_errors.KafkaError as e:
+        logger.error(f"Kafka error while planning backfill: {e}")
+        return {'error': f'Kafka error: {str(e)}'}, 500
+    
+    shares = split_ranges(checkpoint.remaining(), BACKFILL_WORKERS)
+    retry_budget = RetryBudget(INSERT_RETRY_BUDGET)
+    sinks = []
+    route_sinks: List[Dict[str, Sink]] = []
+    staging = f"backfill-{backfill_request.name}"
+    try:
+        for worker in range(len(shares)):
+            sinks.append(create_sink(bq_client, worker, retry_budget, sink_type=SINK_LOAD_JOB, staging_subdir=staging))
+            route_sinks.append({
+                route.table: create_sink(bq_client, worker, retry_budget, route, sink_type=SINK_LOAD_JOB,
+                                         staging_subdir=staging)
+                for route in TABLE_ROUTES.values()
+            })
+    except Exception as e:
+        logger.error(f"Failed to initialize backfill sink: {e}")
+        for sink in sinks + [sink for worker_sinks in route_sinks for sink in worker_sinks.values()]:
+            sink.close()
+        return {'error': 'BigQuery sink initialization failed'}, 500
+    
+    worker_stats = []
+    try:
+        if shares:
+            logger.info(f"Backfill {backfill_request.name}: {len(shares)} readers over "
+                        f"{sum(len(share) for share in shares)} partitions")
+            runner = ConsumerGroupRunner(
+                lambda worker, stop_event: consume_worker(
+                    worker, sinks[worker], consumer_config, scheduler, stop_event, route_sinks[worker],
+                    backfill=BackfillAssignment(shares[worker], checkpoint)),
+                workers=len(shares),
+                name='backfill-worker'
+            )
+            worker_stats = runner.run()
+    except kafka_errors.KafkaError as e:
+        logger.error(f"Kafka error during backfill: {e}")
+        return {'error': f'Kafka error: {str(e)}'}, 500
+    except Exception as e:
+        logger.error(f"Unexpected error during backfill: {e}", exc_info=True)
+        return {'error': f'Unexpected error: {str(e)}'}, 500
+    
+    totals = merge_stats(worker_stats)
+    response = {
+        'status': 'success',
+        'backfill': backfill_request.name,
+        'resumed': resumed,
+        'complete': checkpoint.complete,
+        'progress': checkpoint.stats,
+        'events_processed': totals.get('events_processed', 0),
+        'events_failed': totals.get('events_failed', 0),
+        'events_filtered': totals.get('events_filtered', 0),
+        'environment': ENVIRONMENT,
+        'execution_time_ms': int(scheduler.elapsed_s() * 1000),
+        'timestamp': datetime.utcnow().isoformat()
+    }
+    if worker_stats:
+        response['sink'] = totals['sink']
+        if 'routes' in totals:
+            response['routes'] = totals['routes']
+        response['offsets'] = totals['offsets']
+        response['workers'] = [
+            {key: stats[key] for key in ('worker', 'partitions', 'events_processed', 'events_failed')}
+            for stats in worker_stats
+        ]
+    return response, 200
+
+def export_metrics(request) -> Tuple[str, int, Dict[str, str]]:
+    """Prometheus scrape endpoint for this instance's metrics"""
+    return METRICS.render(), 200, {'Content-Type': CONTENT_TYPE}
 
 # Health check endpoint
 def health_check(request) -> Tuple[Dict[str, Any], int]:
@@ -400,8 +1938,12 @@ def health_check(request) -> Tuple[Dict[str, Any], int]:
         
         # Test BigQuery connectivity if PROJECT_ID is available
         if PROJECT_ID:
-            bq_client = bigquery.Client()
-            bq_client.query("SELECT 1").result()
+            bq_client = get_bigquery_client()
+            try:
+                bq_client.query("SELECT 1").result()
+            except Exception:
+                RESOURCES.invalidate(RESOURCE_BIGQUERY_CLIENT)
+                raise
         
         return {
             'status': 'healthy',
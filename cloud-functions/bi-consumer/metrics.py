@@ -0,0 +1,254 @@
+"""
+Prometheus-style metrics for the BI Consumer
+Counters, gauges and histograms cheap enough for the per-event hot path
+
+Metrics live in a process-wide registry and accumulate across warm
+invocations, like any Prometheus client. render() produces the text
+exposition format; summary() condenses the registry (or just what changed
+since a snapshot) into count, sum and estimated p50/p99 for the function
+response.
+
+Observations are a bisect and a few additions under a lock; there is no
+dependency on prometheus_client so cold starts stay lean.
+"""
+
+import bisect
+import math
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Sub-millisecond to multi-second: per-event stages, polls and inserts
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Seconds to an hour: change capture to BigQuery
+LAG_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+Labels = Tuple[str, ...]
+
+
+def _sorted(series: Dict[Labels, Any]) -> List[Tuple[Labels, Any]]:
+    return sorted(series.items(), key=lambda item: tuple(map(str, item[0])))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> Dict[Labels, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in _sorted(self.snapshot())]
+
+    def summarize(self, since: Optional[Dict[Labels, float]] = None) -> Dict[str, float]:
+        since = since or {}
+        summary = {}
+        for labels, value in _sorted(self.snapshot()):
+            delta = value - since.get(labels, 0)
+            if delta:
+                summary[','.join(map(str, labels)) or 'total'] = delta
+        return summary
+
+
+class Gauge:
+    """Value that goes up and down, optionally split by labels"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> Dict[Labels, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in _sorted(self.snapshot())]
+
+    def summarize(self, since: Optional[Dict[Labels, float]] = None) -> Dict[str, float]:
+        # A gauge's current value is the summary, whatever it was before
+        return {','.join(map(str, labels)) or 'total': value for labels, value in _sorted(self.snapshot())}
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # Per label set: [count per bucket (last is +Inf), sum]
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def observe_many(self, values: Sequence[float], *labels: str) -> None:
+        """Record a batch of observations under one lock acquisition"""
+        indexes = [bisect.bisect_left(self.buckets, value) for value in values]
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts = series[0]
+            for index in indexes:
+                counts[index] += 1
+            series[1][0] += sum(values)
+
+    def snapshot(self) -> Dict[Labels, Tuple[List[int], float]]:
+        with self._lock:
+            return {labels: (list(counts), total[0]) for labels, (counts, total) in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = []
+        bounds = [*self.buckets, math.inf]
+        for labels, (counts, total) in _sorted(self.snapshot()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+    def summarize(self, since: Optional[Dict[Labels, Tuple[List[int], float]]] = None) -> Dict[str, Any]:
+        """Count, sum and bucket-interpolated p50/p99 over all label sets"""
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for labels, (series_counts, series_total) in self.snapshot().items():
+            before_counts, before_total = (since or {}).get(labels, (None, 0.0))
+            for i, count in enumerate(series_counts):
+                counts[i] += count - (before_counts[i] if before_counts else 0)
+            total += series_total - before_total
+
+        count = sum(counts)
+        if not count:
+            return {'count': 0}
+        return {
+            'count': count,
+            'sum': round(total, 6),
+            'p50': round(self._quantile(counts, count, 0.5), 6),
+            'p99': round(self._quantile(counts, count, 0.99), 6),
+        }
+
+    def _quantile(self, counts: List[int], count: int, q: float) -> float:
+        # Same linear interpolation within a bucket as PromQL's histogram_quantile
+        rank = q * count
+        cumulative = 0
+        for i, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Named metrics with text exposition and response summaries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(name, lambda: Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(name, lambda: Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  labelnames: Sequence[str] = ()) -> Histogram:
+        return self._register(name, lambda: Histogram(name, documentation, buckets, labelnames))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current values, to summarize only what an invocation added"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def summary(self, since: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        since = since or {}
+        return {metric.name: metric.summarize(since.get(metric.name)) for metric in metrics}
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, name: str, factory: Any) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
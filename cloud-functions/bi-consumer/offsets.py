@@ -0,0 +1,148 @@
+"""
+Commit-after-flush offset tracking for the BI Consumer
+Only lets a partition's committed position advance past rows that are durable
+
+Every consumed message is recorded against its partition. Rows sit in the
+open batch until it is sealed, then the sealed batch is in flight until its
+sink reports it written (or, for sinks that only make rows durable on close,
+until close succeeds). A partition's committable position is the lowest
+offset still open, in flight or failed, or one past the highest consumed
+offset when nothing is outstanding.
+
+When rows are routed to several destination tables, each destination fills
+its own batch: consumed() and seal() take the destination as buffer, so a
+sealed batch only carries the offsets of the rows it actually holds.
+
+A failed batch pins its partitions at the batch's first offset for the rest
+of the invocation. rewind_positions() tells the caller where to seek so the
+next invocation re-reads only those partitions from the failure onwards,
+instead of replaying whole topics. Batches still unfinished when the
+invocation ends (e.g. left to insert threads after a drain timed out) are
+rewound the same way, since a warm consumer has already fetched past them. pin() does the same for a single message
+that could not be handed off (e.g. to the dead-letter queue).
+
+After a rebalance revokes partitions, drop() forgets them: their new owner
+commits them from then on, and nothing this worker still has in flight may
+move them again.
+"""
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# (topic, partition); kafka.TopicPartition is a namedtuple and compares equal
+Partition = Tuple[str, int]
+
+
+def partition_key(partition: Partition) -> str:
+    """Render a partition for logs and response stats"""
+    return f"{partition[0]}-{partition[1]}"
+
+
+class OffsetTracker:
+    """Per-partition commit positions that never run ahead of unflushed rows"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Next offset to read per partition (highest consumed + 1)
+        self._consumed: Dict[Partition, int] = {}
+        # First offset per partition of rows in each batch being filled, keyed by buffer
+        self._open: Dict[Optional[str], Dict[Partition, int]] = {}
+        # First offset per partition of each sealed batch not yet durable, keyed by id(batch)
+        self._in_flight: Dict[int, Dict[Partition, int]] = {}
+        # Lowest offset per partition of a batch that failed
+        self._failed: Dict[Partition, int] = {}
+        self._committed: Dict[Partition, int] = {}
+        self._stats = {'commits': 0, 'commit_failures': 0, 'batches_acked': 0, 'batches_failed': 0}
+
+    def consumed(self, partition: Partition, offset: int, buffered: bool = True,
+                 buffer: Optional[str] = None) -> None:
+        """Record a consumed message; buffered=False means nothing of it will be written"""
+        with self._lock:
+            if offset + 1 > self._consumed.get(partition, -1):
+                self._consumed[partition] = offset + 1
+            if buffered:
+                self._open.setdefault(buffer, {}).setdefault(partition, offset)
+
+    def seal(self, batch: List[Any], buffer: Optional[str] = None) -> None:
+        """Move a buffer's open rows into flight as the given sealed batch"""
+        with self._lock:
+            self._in_flight[id(batch)] = self._open.pop(buffer, {})
+
+    def rekey(self, batch: List[Any], token: Any) -> None:
+        """Track a sealed batch under another object, so its rows can be freed while it is still in flight"""
+        with self._lock:
+            offsets = self._in_flight.pop(id(batch), None)
+            if offsets is not None:
+                self._in_flight[id(token)] = offsets
+
+    def complete(self, batch: List[Any], ok: bool) -> None:
+        """Mark a sealed batch durable (ok) or failed"""
+        with self._lock:
+            offsets = self._in_flight.pop(id(batch), None)
+            if offsets is None:
+                return
+            if ok:
+                self._stats['batches_acked'] += 1
+                return
+            self._stats['batches_failed'] += 1
+            for partition, offset in offsets.items():
+                self._failed[partition] = min(offset, self._failed.get(partition, offset))
+
+    def pin(self, partition: Partition, offset: int) -> None:
+        """Hold a partition at or before offset, as if a batch containing it had failed"""
+        with self._lock:
+            self._failed[partition] = min(offset, self._failed.get(partition, offset))
+
+    def committable(self) -> Dict[Partition, int]:
+        """Positions that are safe to commit and ahead of what is already committed"""
+        with self._lock:
+            positions = self._positions()
+            return {partition: position for partition, position in positions.items()
+                    if position > self._committed.get(partition, -1)}
+
+    def committed(self, offsets: Dict[Partition, int], error: Optional[BaseException] = None) -> None:
+        """Record the outcome of a commit request"""
+        with self._lock:
+            if error is not None:
+                self._stats['commit_failures'] += 1
+                return
+            self._stats['commits'] += 1
+            for partition, position in offsets.items():
+                if position > self._committed.get(partition, -1):
+                    self._committed[partition] = position
+
+    def drop(self, partitions: Iterable[Partition]) -> None:
+        """Forget revoked partitions, so they are neither committed nor rewound by this tracker again"""
+        with self._lock:
+            dropped = set(partitions)
+            tracked = [self._consumed, self._failed, self._committed, *self._open.values(),
+                       *self._in_flight.values()]
+            for offsets in tracked:
+                for partition in dropped:
+                    offsets.pop(partition, None)
+
+    def rewind_positions(self) -> Dict[Partition, int]:
+        """Where partitions with failed or unfinished batches should be re-read from"""
+        with self._lock:
+            positions = self._positions()
+            partitions = set(self._failed)
+            for offsets in [*self._open.values(), *self._in_flight.values()]:
+                partitions.update(offsets)
+            return {partition: positions[partition] for partition in partitions}
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats['committed'] = {partition_key(p): position for p, position in sorted(self._committed.items())}
+            stats['failed_partitions'] = sorted(partition_key(p) for p in self._failed)
+            return stats
+
+    def _positions(self) -> Dict[Partition, int]:
+        positions = dict(self._consumed)
+        outstanding = [*self._open.values(), self._failed, *self._in_flight.values()]
+        for offsets in outstanding:
+            for partition, offset in offsets.items():
+                if offset < positions.get(partition, offset + 1):
+                    positions[partition] = offset
+        return positions
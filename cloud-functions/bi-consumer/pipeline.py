@@ -0,0 +1,152 @@
+"""
+Pipelined insert stage for the BI Consumer
+Overlaps Kafka polling with BigQuery writes using a bounded batch queue
+
+Ordering: rows keep their Kafka order inside a sealed batch, but batches are
+handed to a pool of insert workers and may complete out of order. With a
+single worker, batches are inserted strictly in submission order.
+
+Offsets: the consumer keeps polling while batches are queued, so the caller
+must not commit offsets for rows that are still waiting in the queue. The
+consumer loop tracks them with offsets.OffsetTracker, which only advances a
+partition past batches the insert function reported durable, and drains the
+pipeline before its final commit.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from structured_logging import run_in_context
+
+logger = logging.getLogger(__name__)
+
+# Sentinel placed on the queue to tell a worker to exit
+_STOP = object()
+# How often an idle worker checks whether the pipeline was drained without room for its sentinel
+_IDLE_CHECK_S = 0.1
+
+
+class InsertPipeline:
+    """Bounded queue of sealed batches drained by a small pool of insert workers"""
+
+    def __init__(self, insert_fn: Callable[[List[Dict[str, Any]]], bool],
+                 workers: int = 2, max_pending_batches: int = 4):
+        if workers < 1:
+            raise ValueError("InsertPipeline needs at least one worker")
+        if max_pending_batches < 1:
+            raise ValueError("max_pending_batches must be at least 1")
+
+        self._insert_fn = insert_fn
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_pending_batches)
+        self._lock = threading.Lock()
+        # Signalled whenever the last row in flight has been inserted
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        self._rows_in_flight = 0
+        self._stats = {
+            'batches_submitted': 0,
+            'batches_inserted': 0,
+            'batches_failed': 0,
+            'rows_inserted': 0,
+            'rows_failed': 0,
+            'backpressure_waits': 0,
+            'backpressure_ms': 0,
+            'max_queue_depth': 0,
+        }
+        self._workers = [
+            threading.Thread(target=run_in_context(self._run), name=f"bq-insert-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, rows: List[Dict[str, Any]]) -> None:
+        """Queue a sealed batch, blocking while the queue is full (backpressure)"""
+        if self._closed:
+            raise RuntimeError("Cannot submit to a drained pipeline")
+        if not rows:
+            return
+
+        with self._lock:
+            self._rows_in_flight += len(rows)
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+            wait_start = time.monotonic()
+            self._queue.put(rows)
+            waited_ms = int((time.monotonic() - wait_start) * 1000)
+            with self._lock:
+                self._stats['backpressure_waits'] += 1
+                self._stats['backpressure_ms'] += waited_ms
+
+        with self._lock:
+            self._stats['batches_submitted'] += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queue.qsize())
+
+    def drain(self, timeout: Optional[float] = None) -> Dict[str, int]:
+        """Wait for queued batches to be inserted, stop the workers and return stats"""
+        if not self._closed:
+            self._closed = True
+            # Never block here: with the queue full and the workers stuck in a sink call, the
+            # timeout would not hold. Workers without a sentinel exit once the queue is empty.
+            for _ in self._workers:
+                try:
+                    self._queue.put_nowait(_STOP)
+                except queue.Full:
+                    break
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self._workers:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            worker.join(remaining)
+            if worker.is_alive():
+                logger.warning(f"Insert worker {worker.name} still running after drain timeout")
+
+        return self.stats
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Wait until nothing is queued or being inserted, keeping the workers running"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._rows_in_flight == 0, timeout)
+
+    @property
+    def rows_in_flight(self) -> int:
+        """Rows queued or being inserted"""
+        with self._lock:
+            return self._rows_in_flight
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                batch = self._queue.get(timeout=_IDLE_CHECK_S)
+            except queue.Empty:
+                if self._closed:
+                    return
+                continue
+            if batch is _STOP:
+                return
+
+            try:
+                ok = self._insert_fn(batch)
+            except Exception as e:
+                logger.error(f"Insert worker failed on batch of {len(batch)} rows: {e}", exc_info=True)
+                ok = False
+
+            with self._lock:
+                self._rows_in_flight -= len(batch)
+                if self._rows_in_flight == 0:
+                    self._idle.notify_all()
+                if ok:
+                    self._stats['batches_inserted'] += 1
+                    self._stats['rows_inserted'] += len(batch)
+                else:
+                    self._stats['batches_failed'] += 1
+                    self._stats['rows_failed'] += len(batch)
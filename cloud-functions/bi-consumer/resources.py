@@ -0,0 +1,96 @@
+"""
+Warm-instance resource registry for the BI Consumer
+Keeps expensive clients alive across invocations served by the same instance
+
+Resources are created lazily by a factory on first use and reused while
+their health check passes. Callers invalidate a resource when they observe
+a failure, so it is rebuilt on the next acquire. Readiness flags (e.g.
+"table exists") are remembered the same way.
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceRegistry:
+    """Lazily created, health-checked resources shared by warm invocations"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._resources: Dict[str, Any] = {}
+        self._closers: Dict[str, Optional[Callable[[Any], None]]] = {}
+        self._ready: Dict[str, bool] = {}
+        self.stats = {'created': 0, 'reused': 0, 'rebuilt': 0, 'invalidated': 0}
+
+    def get(self, name: str, factory: Callable[[], Any],
+            health_check: Optional[Callable[[Any], bool]] = None,
+            close: Optional[Callable[[Any], None]] = None) -> Any:
+        """Return the cached resource, creating or rebuilding it when needed"""
+        with self._lock:
+            if name in self._resources:
+                resource = self._resources[name]
+                healthy = True
+                if health_check is not None:
+                    try:
+                        healthy = health_check(resource)
+                    except Exception as e:
+                        logger.warning(f"Health check for {name} raised: {e}")
+                        healthy = False
+                if healthy:
+                    self.stats['reused'] += 1
+                    return resource
+
+                logger.info(f"Cached {name} failed its health check, rebuilding")
+                self._discard(name)
+                self.stats['rebuilt'] += 1
+
+            resource = factory()
+            self._resources[name] = resource
+            self._closers[name] = close
+            self.stats['created'] += 1
+            return resource
+
+    def peek(self, name: str) -> Any:
+        """Return the cached resource without creating it"""
+        with self._lock:
+            return self._resources.get(name)
+
+    def invalidate(self, name: str) -> None:
+        """Drop (and close) a resource so the next get() rebuilds it"""
+        with self._lock:
+            if name in self._resources:
+                self._discard(name)
+                self.stats['invalidated'] += 1
+            self._ready.pop(name, None)
+
+    def is_ready(self, name: str) -> bool:
+        with self._lock:
+            return self._ready.get(name, False)
+
+    def mark_ready(self, name: str, ready: bool = True) -> None:
+        with self._lock:
+            if ready:
+                self._ready[name] = True
+            else:
+                self._ready.pop(name, None)
+
+    def clear(self) -> None:
+        """Close and forget everything (instance shutdown and tests)"""
+        with self._lock:
+            for name in list(self._resources):
+                self._discard(name)
+            self._ready.clear()
+            self.stats = {'created': 0, 'reused': 0, 'rebuilt': 0, 'invalidated': 0}
+
+    def _discard(self, name: str) -> None:
+        resource = self._resources.pop(name)
+        close = self._closers.pop(name, None)
+        if close is None:
+            return
+        try:
+            close(resource)
+        except Exception as e:
+            logger.warning(f"Error closing {name}: {e}")
@@ -0,0 +1,100 @@
+"""
+Retry engine for BigQuery writes
+Decides which failed rows are worth re-sending and how long to wait first
+
+insertAll reports failures per row. Rows rejected for transient reasons
+(backend errors, rate limits, or "stopped" because another row in the same
+request was invalid) are re-sent on their own after a jittered exponential
+backoff; rows rejected for their content fail immediately.
+
+A RetryBudget caps the number of retry requests across one invocation so a
+struggling backend cannot stall the consumer until its deadline.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# insertAll error reasons that can succeed when the row is sent again
+RETRYABLE_REASONS = frozenset({
+    'backendError', 'internalError', 'rateLimitExceeded', 'quotaExceeded', 'timeout', 'stopped',
+})
+
+# HTTP statuses of request-level errors worth retrying
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+def is_retryable_reason(reasons: Iterable[str]) -> bool:
+    """A row is retried only if every error reported for it is transient"""
+    reasons = list(reasons)
+    return bool(reasons) and all(reason in RETRYABLE_REASONS for reason in reasons)
+
+
+def is_retryable_exception(error: BaseException) -> bool:
+    """Check whether a failed request (not a row) should be sent again"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    code = getattr(error, 'code', None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+
+class RetryBudget:
+    """Retry requests allowed for the rest of an invocation, shared by all writers"""
+
+    def __init__(self, max_retries: int):
+        self._lock = threading.Lock()
+        self._remaining = max_retries
+        self.stats = {'retries': 0, 'retries_denied': 0}
+
+    @property
+    def remaining(self) -> int:
+        return self._remaining
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._remaining <= 0:
+                self.stats['retries_denied'] += 1
+                return False
+            self._remaining -= 1
+            self.stats['retries'] += 1
+            return True
+
+
+class RetryPolicy:
+    """Attempt limit and full-jitter exponential backoff between attempts"""
+
+    def __init__(self, max_attempts: int = 5, base_delay_ms: int = 200, max_delay_ms: int = 10000,
+                 budget: Optional[RetryBudget] = None, sleep: Callable[[float], None] = time.sleep,
+                 rng: Optional[random.Random] = None):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+
+        self.max_attempts = max_attempts
+        self.base_delay_ms = base_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.budget = budget
+        self._sleep = sleep
+        self._random = rng or random.Random()
+
+    def backoff_s(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (1-based): uniform in [0, min(max, base * 2^(attempt-1))]"""
+        ceiling = min(self.max_delay_ms, self.base_delay_ms * (2 ** (attempt - 1)))
+        return self._random.uniform(0, ceiling) / 1000.0
+
+    def allow_retry(self, attempt: int) -> bool:
+        """Check the attempt limit and take a retry from the budget; sleeps the backoff when allowed"""
+        if attempt >= self.max_attempts:
+            return False
+        if self.budget is not None and not self.budget.try_acquire():
+            return False
+        self._sleep(self.backoff_s(attempt))
+        return True
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {'max_attempts': self.max_attempts}
+        if self.budget is not None:
+            stats.update(self.budget.stats)
+            stats['budget_remaining'] = self.budget.remaining
+        return stats
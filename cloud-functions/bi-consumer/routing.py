@@ -0,0 +1,195 @@
+"""
+Per-table routing for the BI Consumer
+Sends the CDC events of chosen source tables to their own typed destination tables
+
+By default every change lands in the events table, with the row image as a
+JSON blob in event_data. A route maps a source table (the Debezium
+source.table) to a destination table whose columns are typed copies of
+selected payload fields, so inserts carry less data and queries read plain
+columns instead of parsing JSON. Every routed row keeps the event metadata
+(event_id, event_type, event_timestamp, source_table, operation,
+ingested_at, partition_date, environment); event_data is only kept when the
+route asks for it. Tables without a route keep going to the events table.
+
+Routes are configured as JSON, inline or as the path of a file (e.g. a
+mounted ConfigMap), keyed by source table:
+
+    {"users": {"table": "users_changes",
+               "columns": {"id": "INT64", "email": "STRING", "created_at": "TIMESTAMP"},
+               "keep_event_data": false,
+               "clustering": ["operation"]}}
+
+A payload value that cannot be converted to its column type is written as
+NULL and counted, rather than failing the row.
+"""
+
+import json
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from decoding import dumps
+
+# Event metadata every routed row carries, ahead of its typed columns
+METADATA_FIELDS = (
+    'event_id', 'event_type', 'event_timestamp', 'source_table', 'operation',
+    'ingested_at', 'partition_date', 'environment',
+)
+EVENT_DATA_FIELD = 'event_data'
+DEFAULT_CLUSTERING = ('operation', 'environment')
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_DATE = date(1970, 1, 1)
+
+
+def _to_timestamp(value: Any) -> datetime:
+    # Debezium sends timestamps as ISO text (timestamptz) or as epoch seconds, milliseconds
+    # or microseconds depending on the column type and connector settings; the last three
+    # are told apart by magnitude. Like the rest of the row, the result is naive UTC.
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(f"not a timestamp: {value!r}")
+    if abs(value) >= 1e14:
+        return _EPOCH + timedelta(microseconds=value)
+    if abs(value) >= 1e11:
+        return _EPOCH + timedelta(milliseconds=value)
+    return _EPOCH + timedelta(seconds=value)
+
+
+def _to_date(value: Any) -> date:
+    # io.debezium.time.Date is days since the epoch
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise TypeError(f"not a date: {value!r}")
+    return _EPOCH_DATE + timedelta(days=value)
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    text = str(value).lower()
+    if text in ('true', 't', '1', 'yes'):
+        return True
+    if text in ('false', 'f', '0', 'no'):
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+
+def _to_string(value: Any) -> str:
+    return value if isinstance(value, str) else dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+
+def _to_json(value: Any) -> str:
+    return value if isinstance(value, str) else dumps(value)
+
+
+# Values already of the column's Python type are taken as they are
+NATIVE_TYPES: Dict[str, type] = {
+    'STRING': str, 'INT64': int, 'INTEGER': int, 'FLOAT64': float, 'FLOAT': float, 'BOOL': bool, 'BOOLEAN': bool,
+}
+
+# BigQuery column type -> converter from a decoded payload value
+CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    'STRING': _to_string,
+    'INT64': int,
+    'INTEGER': int,
+    'FLOAT64': float,
+    'FLOAT': float,
+    'BOOL': _to_bool,
+    'BOOLEAN': _to_bool,
+    'TIMESTAMP': _to_timestamp,
+    'DATE': _to_date,
+    'JSON': _to_json,
+}
+
+
+class Route:
+    """A source table's destination table and its typed columns"""
+
+    __slots__ = ('source_table', 'table', 'columns', 'keep_event_data', 'clustering', '_converters')
+
+    def __init__(self, source_table: str, table: str, columns: Dict[str, str], keep_event_data: bool = False,
+                 clustering: Optional[List[str]] = None):
+        if not columns:
+            raise ValueError(f"Route for {source_table} has no columns")
+        reserved = set(METADATA_FIELDS) | {EVENT_DATA_FIELD}
+        clashes = sorted(reserved.intersection(columns))
+        if clashes:
+            raise ValueError(f"Route for {source_table} uses reserved column names: {clashes}")
+        self.source_table = source_table
+        self.table = table
+        self.columns = {name: field_type.upper() for name, field_type in columns.items()}
+        unknown = sorted(t for t in self.columns.values() if t not in CONVERTERS)
+        if unknown:
+            raise ValueError(f"Route for {source_table} has unsupported column types: {unknown}")
+        self.keep_event_data = keep_event_data
+        self.clustering = list(clustering) if clustering is not None else list(DEFAULT_CLUSTERING)
+        self._converters = [(name, NATIVE_TYPES.get(field_type), CONVERTERS[field_type])
+                            for name, field_type in self.columns.items()]
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        """Column order of the destination table"""
+        extra = (EVENT_DATA_FIELD,) if self.keep_event_data else ()
+        return METADATA_FIELDS[:5] + tuple(self.columns) + extra + METADATA_FIELDS[5:]
+
+    def project(self, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+        """Typed column values from a row image, and how many could not be converted"""
+        values: Dict[str, Any] = {}
+        failed = 0
+        for name, native, convert in self._converters:
+            value = payload.get(name)
+            if value is not None and type(value) is not native:
+                try:
+                    value = convert(value)
+                except (TypeError, ValueError, OverflowError):
+                    value = None
+                    failed += 1
+            values[name] = value
+        return values, failed
+
+
+def parse_routes(config: Dict[str, Any]) -> Dict[str, Route]:
+    """Routes keyed by source table from a decoded routing config"""
+    if not isinstance(config, dict):
+        raise ValueError("Table routes must be a JSON object keyed by source table")
+    routes = {}
+    destinations: Dict[str, str] = {}
+    for source_table, spec in config.items():
+        if not isinstance(spec, dict) or not spec.get('table'):
+            raise ValueError(f"Route for {source_table} needs a destination table")
+        table = spec['table']
+        if table in destinations:
+            raise ValueError(f"Tables {destinations[table]} and {source_table} are both routed to {table}")
+        destinations[table] = source_table
+        routes[source_table] = Route(
+            source_table, table, spec.get('columns') or {},
+            keep_event_data=bool(spec.get('keep_event_data', False)),
+            clustering=spec.get('clustering')
+        )
+    return routes
+
+
+def read_json_config(value: str, name: str) -> Optional[Any]:
+    """Decode inline JSON or the JSON file at a path; None when the value is empty"""
+    value = value.strip()
+    if not value:
+        return None
+    if not value.startswith('{') and os.path.isfile(value):
+        with open(value) as f:
+            value = f.read()
+    try:
+        return json.loads(value)
+    except ValueError as e:
+        raise ValueError(f"{name} are not valid JSON: {e}") from e
+
+
+def load_routes(value: str) -> Dict[str, Route]:
+    """Routes from inline JSON or the path of a JSON file; empty means no routing"""
+    config = read_json_config(value, 'Table routes')
+    return {} if config is None else parse_routes(config)
@@ -0,0 +1,106 @@
+"""
+Consumer group runner for the BI Consumer
+Runs several consumers of the same group side by side, one per worker thread
+
+Kafka spreads the partitions of the subscribed topics across the members of
+a consumer group, so a spike on one CDC table only slows the worker that owns
+its partitions. Each worker owns its consumer, batcher and sink; the runner
+only starts them, shares a stop event and collects their stats.
+
+Shutdown is cooperative: stop() (or the first worker failure) sets the stop
+event, every worker flushes what it has buffered, and run() returns once all
+of them have finished. A worker failure is re-raised from run() after that.
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from structured_logging import run_in_context
+
+logger = logging.getLogger(__name__)
+
+# Stats where the aggregate is the largest per-worker value rather than the sum
+MAX_MERGED_STATS = ('max_queue_depth', 'target_bytes')
+# Dicts of Kafka positions per partition: after a rebalance two workers may report the same
+# partition, and its position is the furthest one, not their sum
+POSITION_STATS = ('committed',)
+
+
+def merge_stats(stats: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-worker stats: numbers add up, dicts merge, lists concatenate, positions take the maximum"""
+    merged: Dict[str, Any] = {}
+    for item in stats:
+        for key, value in item.items():
+            if key not in merged:
+                merged[key] = merge_stats([value]) if isinstance(value, dict) else (
+                    list(value) if isinstance(value, list) else value)
+            elif isinstance(value, bool) or value is None:
+                continue
+            elif isinstance(value, (int, float)) and isinstance(merged[key], (int, float)):
+                merged[key] = max(merged[key], value) if key in MAX_MERGED_STATS else merged[key] + value
+            elif isinstance(value, dict) and isinstance(merged[key], dict) and key in POSITION_STATS:
+                merged[key] = dict(merged[key])
+                for partition, position in value.items():
+                    merged[key][partition] = max(merged[key].get(partition, position), position)
+            elif isinstance(value, dict) and isinstance(merged[key], dict):
+                merged[key] = merge_stats([merged[key], value])
+            elif isinstance(value, list) and isinstance(merged[key], list):
+                merged[key].extend(value)
+    return merged
+
+
+class ConsumerGroupRunner:
+    """Runs worker_fn(worker, stop_event) on N threads and gathers what each returns"""
+
+    def __init__(self, worker_fn: Callable[[int, threading.Event], Dict[str, Any]], workers: int = 2,
+                 name: str = 'consumer-worker'):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+
+        self._worker_fn = worker_fn
+        self._workers = workers
+        self._name = name
+        self._stop = threading.Event()
+        self._results: List[Optional[Dict[str, Any]]] = [None] * workers
+        self._errors: List[Optional[BaseException]] = [None] * workers
+
+    @property
+    def stop_event(self) -> threading.Event:
+        return self._stop
+
+    def stop(self) -> None:
+        """Ask every worker to flush and return"""
+        self._stop.set()
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> List[Dict[str, Any]]:
+        """Start the workers, wait for all of them and return their stats in worker order
+
+        Setting stop_event (e.g. from a signal handler) stops the workers as stop() would.
+        """
+        threads = [
+            threading.Thread(target=run_in_context(self._run_worker), args=(worker,), name=f"{self._name}-{worker}",
+                             daemon=True)
+            for worker in range(self._workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(None if stop_event is None else 0.5)
+                if stop_event is not None and stop_event.is_set():
+                    self.stop()
+
+        for worker, error in enumerate(self._errors):
+            if error is not None:
+                raise error
+        return [result or {} for result in self._results]
+
+    def _run_worker(self, worker: int) -> None:
+        try:
+            self._results[worker] = self._worker_fn(worker, self._stop)
+        except BaseException as e:
+            logger.error(f"Consumer worker {worker} failed: {e}")
+            self._errors[worker] = e
+            # Let the other workers flush what they have and exit
+            self._stop.set()
@@ -0,0 +1,67 @@
+"""
+Invocation scheduling for the BI Consumer
+Decides how long to wait for Kafka and when to stop consuming, on a monotonic clock
+
+Every invocation has a hard deadline. Before it, the consumer must leave
+enough time to drain: insert the rows it is still holding, close the sink and
+commit offsets. That reserve is a fixed base plus a per-row allowance for
+every row in flight, so a worker holding a full pipeline of batches stops
+earlier than an idle one.
+
+Waits on the broker are bounded by whichever comes first: the pending
+batch's linger time (so rows on quiet topics are flushed promptly instead of
+waiting for the consumer to go idle), the idle timeout, or the start of the
+drain phase.
+"""
+
+import time
+from typing import Callable, Dict, Optional
+
+
+class DeadlineScheduler:
+    """Invocation deadline, drain reserve and broker wait budgets"""
+
+    def __init__(self, timeout_ms: int, drain_base_ms: int = 10000, drain_per_row_ms: float = 1.0,
+                 drain_max_ms: Optional[int] = None, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.started = clock()
+        self.deadline = self.started + timeout_ms / 1000.0
+        self._drain_base_s = drain_base_ms / 1000.0
+        self._drain_per_row_s = drain_per_row_ms / 1000.0
+        # The reserve never takes more than half the invocation by default
+        self._drain_max_s = (drain_max_ms if drain_max_ms is not None else timeout_ms / 2) / 1000.0
+
+    def elapsed_s(self) -> float:
+        return self._clock() - self.started
+
+    def remaining_s(self) -> float:
+        """Seconds until the hard deadline"""
+        return max(0.0, self.deadline - self._clock())
+
+    def drain_reserve_s(self, rows_in_flight: int = 0) -> float:
+        """Time to keep back for flushing, closing and committing rows_in_flight rows"""
+        return min(self._drain_max_s, self._drain_base_s + rows_in_flight * self._drain_per_row_s)
+
+    def consume_remaining_s(self, rows_in_flight: int = 0) -> float:
+        """Seconds left before the drain phase has to start"""
+        return max(0.0, self.remaining_s() - self.drain_reserve_s(rows_in_flight))
+
+    def should_drain(self, rows_in_flight: int = 0) -> bool:
+        """Whether consuming must stop now to drain in time"""
+        return self.consume_remaining_s(rows_in_flight) <= 0
+
+    def poll_timeout_s(self, rows_in_flight: int = 0, linger_remaining_s: Optional[float] = None,
+                       idle_remaining_s: Optional[float] = None) -> float:
+        """How long the next broker poll may block"""
+        timeout = self.consume_remaining_s(rows_in_flight)
+        for bound in (linger_remaining_s, idle_remaining_s):
+            if bound is not None:
+                timeout = min(timeout, bound)
+        return max(0.0, timeout)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            'elapsed_ms': int(self.elapsed_s() * 1000),
+            'remaining_ms': int(self.remaining_s() * 1000),
+        }
@@ -0,0 +1,131 @@
+"""
+In-process secret cache for the BI Consumer
+Takes Secret Manager latency and quota off the invocation hot path
+
+- Fresh entries (younger than ttl_s) are served from memory.
+- Stale entries (younger than stale_ttl_s) are served immediately while a
+  single background thread refreshes them (stale-while-revalidate).
+- Concurrent misses for the same secret share one lookup (single flight).
+- Missing secrets are cached for negative_ttl_s so fallbacks stay cheap.
+- invalidate() drops entries, e.g. after the broker rejects credentials.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ('value', 'loaded_at')
+
+    def __init__(self, value: Optional[str], loaded_at: float):
+        self.value = value
+        self.loaded_at = loaded_at
+
+
+class SecretCache:
+    """TTL cache with single-flight loads and stale-while-revalidate refresh"""
+
+    def __init__(self, loader: Callable[[str], Optional[str]], ttl_s: float = 300.0,
+                 stale_ttl_s: float = 3600.0, negative_ttl_s: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self._loader = loader
+        self._ttl_s = ttl_s
+        self._stale_ttl_s = max(stale_ttl_s, ttl_s)
+        self._negative_ttl_s = negative_ttl_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self._inflight: Dict[str, threading.Event] = {}
+        self._generation = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stale_hits': 0,
+            'coalesced': 0,
+            'refreshes': 0,
+            'refresh_failures': 0,
+            'invalidations': 0,
+        }
+
+    def get(self, name: str) -> Optional[str]:
+        """Return a secret, loading it on a miss"""
+        while True:
+            with self._lock:
+                entry = self._entries.get(name)
+                now = self._clock()
+                if entry is not None:
+                    age = now - entry.loaded_at
+                    ttl = self._ttl_s if entry.value is not None else self._negative_ttl_s
+                    if age < ttl:
+                        self._stats['hits'] += 1
+                        return entry.value
+                    if entry.value is not None and age < self._stale_ttl_s:
+                        self._stats['stale_hits'] += 1
+                        if name not in self._inflight:
+                            self._inflight[name] = threading.Event()
+                            threading.Thread(target=self._refresh, args=(name, self._generation),
+                                             name=f"secret-refresh-{name}", daemon=True).start()
+                        return entry.value
+
+                waiter = self._inflight.get(name)
+                if waiter is None:
+                    self._stats['misses'] += 1
+                    self._inflight[name] = threading.Event()
+                    generation = self._generation
+                    break
+                self._stats['coalesced'] += 1
+
+            # Another caller is already loading this secret: wait for it and re-check
+            waiter.wait()
+
+        return self._load(name, generation)
+
+    def invalidate(self, *names: str) -> None:
+        """Drop the given secrets (or all of them) so the next get() reloads"""
+        with self._lock:
+            if names:
+                for name in names:
+                    self._entries.pop(name, None)
+            else:
+                self._entries.clear()
+            # Loads started before the invalidation must not repopulate the cache
+            self._generation += 1
+            self._stats['invalidations'] += 1
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            return stats
+
+    def _load(self, name: str, generation: int) -> Optional[str]:
+        value = None
+        try:
+            value = self._loader(name)
+            return value
+        finally:
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[name] = _Entry(value, self._clock())
+                self._inflight.pop(name).set()
+
+    def _refresh(self, name: str, generation: int) -> None:
+        try:
+            value = self._loader(name)
+        except Exception as e:
+            value = None
+            logger.warning(f"Background refresh of secret {name} raised: {e}")
+
+        with self._lock:
+            self._stats['refreshes'] += 1
+            if value is None:
+                # Keep serving the stale value until it ages out completely
+                self._stats['refresh_failures'] += 1
+            elif generation == self._generation:
+                self._entries[name] = _Entry(value, self._clock())
+            self._inflight.pop(name).set()
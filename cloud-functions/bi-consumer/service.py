@@ -0,0 +1,234 @@
+"""
+Streaming service mode for the BI Consumer
+Runs the consumer continuously (e.g. as a Kubernetes Deployment next to Redpanda)
+
+The Cloud Function consumes for one invocation and exits, so every run pays
+for rejoining the consumer group and leaves a gap until the next one. The
+service runs the same transform, sink and offset code back to back in
+rounds: each round is a main.run_consumers() call bounded by
+SERVICE_ROUND_MS, and the Kafka consumers stay open between rounds (they
+are warm resources), so the group is joined once per pod.
+
+SIGTERM and SIGINT set a stop event: the running round stops polling,
+inserts what it has buffered, commits and returns, and the consumers are
+closed so the group rebalances straight away. Give the pod a termination
+grace period longer than the drain (poll wait plus insert time).
+
+HTTP endpoints, on SERVICE_PORT:
+    /livez    the consume loop is making progress
+    /healthz  main.health_check (environment and BigQuery), cached briefly
+    /metrics  Prometheus text exposition of main.METRICS
+    POST /replay-dead-letters
+              main.replay_dead_letters, one at a time, next to the consume rounds
+"""
+
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+import main
+from structured_logging import correlation_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVICE_PORT = 8080
+DEFAULT_SERVICE_ROUND_MS = 60000
+DEFAULT_SERVICE_ERROR_BACKOFF_S = 1.0
+DEFAULT_SERVICE_MAX_BACKOFF_S = 60.0
+DEFAULT_SERVICE_HEALTH_CACHE_S = 15.0
+
+SERVICE_PORT = int(os.environ.get('SERVICE_PORT', str(DEFAULT_SERVICE_PORT)))
+SERVICE_ROUND_MS = int(os.environ.get('SERVICE_ROUND_MS', str(DEFAULT_SERVICE_ROUND_MS)))
+SERVICE_ERROR_BACKOFF_S = float(os.environ.get('SERVICE_ERROR_BACKOFF_S', str(DEFAULT_SERVICE_ERROR_BACKOFF_S)))
+SERVICE_MAX_BACKOFF_S = float(os.environ.get('SERVICE_MAX_BACKOFF_S', str(DEFAULT_SERVICE_MAX_BACKOFF_S)))
+SERVICE_HEALTH_CACHE_S = float(os.environ.get('SERVICE_HEALTH_CACHE_S', str(DEFAULT_SERVICE_HEALTH_CACHE_S)))
+
+ROUNDS_TOTAL = main.METRICS.counter(
+    'bi_consumer_service_rounds_total', 'Service consume rounds by outcome', ('status',))
+
+
+class ConsumerService:
+    """Runs consume rounds until stopped, backing off after failed rounds"""
+
+    def __init__(self, round_ms: int = DEFAULT_SERVICE_ROUND_MS,
+                 error_backoff_s: float = DEFAULT_SERVICE_ERROR_BACKOFF_S,
+                 max_backoff_s: float = DEFAULT_SERVICE_MAX_BACKOFF_S,
+                 health_cache_s: float = DEFAULT_SERVICE_HEALTH_CACHE_S):
+        self._round_ms = round_ms
+        self._error_backoff_s = error_backoff_s
+        self._max_backoff_s = max_backoff_s
+        self._health_cache_s = health_cache_s
+        self._stop = threading.Event()
+        self._health_lock = threading.Lock()
+        self._health: Optional[Tuple[float, Tuple[Dict[str, Any], int]]] = None
+        self._round_started: Optional[float] = None
+        self._replay_lock = threading.Lock()
+        self.stats: Dict[str, Any] = {
+            'rounds': 0,
+            'failed_rounds': 0,
+            'events_processed': 0,
+            'events_failed': 0,
+        }
+
+    @property
+    def stop_event(self) -> threading.Event:
+        return self._stop
+
+    def stop(self, signum: Optional[int] = None, frame: Any = None) -> None:
+        """Finish the current round and exit (usable as a signal handler)"""
+        if signum is not None:
+            logger.info(f"Received signal {signum}, draining")
+        self._stop.set()
+
+    def run(self) -> None:
+        """Consume in rounds until stop() is called"""
+        backoff_s = self._error_backoff_s
+        while not self._stop.is_set():
+            if self.run_round():
+                backoff_s = self._error_backoff_s
+                continue
+            # Configuration, broker or BigQuery trouble: retry without spinning
+            self._stop.wait(backoff_s)
+            backoff_s = min(self._max_backoff_s, backoff_s * 2)
+        self._round_started = None
+
+    def run_round(self) -> bool:
+        """One bounded consume round; returns whether it succeeded"""
+        self._round_started = time.monotonic()
+        with correlation_context():
+            try:
+                response, status = main.run_consumers(main.create_scheduler(self._round_ms), self._stop)
+            except Exception as e:
+                logger.error(f"Consume round failed: {e}", exc_info=True)
+                response, status = {'error': str(e)}, 500
+
+        self.stats['rounds'] += 1
+        if status != 200:
+            self.stats['failed_rounds'] += 1
+            ROUNDS_TOTAL.inc(1, 'failed')
+            logger.error(f"Consume round failed: {response.get('error')}")
+            return False
+
+        ROUNDS_TOTAL.inc(1, 'success')
+        self.stats['events_processed'] += response['events_processed']
+        self.stats['events_failed'] += response['events_failed']
+        if response['events_processed'] or response['events_failed']:
+            logger.info(f"Round processed {response['events_processed']} events "
+                        f"({response['events_failed']} failed) in {response['execution_time_ms']}ms")
+        return True
+
+    def replay_dead_letters(self) -> Tuple[Dict[str, Any], int]:
+        """main.replay_dead_letters, refused while another replay is still running"""
+        if not self._replay_lock.acquire(blocking=False):
+            return {'error': 'A dead-letter replay is already running'}, 409
+        try:
+            return main.replay_dead_letters(None)
+        except Exception as e:
+            logger.error(f"Dead-letter replay failed: {e}", exc_info=True)
+            return {'error': str(e)}, 500
+        finally:
+            self._replay_lock.release()
+
+    def live(self) -> bool:
+        """False once a round has overrun its budget by a full round (the loop is stuck)"""
+        started = self._round_started
+        if started is None:
+            return True
+        overrun_s = 2 * self._round_ms / 1000.0 + self._max_backoff_s
+        return time.monotonic() - started < overrun_s
+
+    def health(self) -> Tuple[Dict[str, Any], int]:
+        """main.health_check, cached so frequent probes do not each query BigQuery"""
+        with self._health_lock:
+            now = time.monotonic()
+            if self._health is None or now - self._health[0] >= self._health_cache_s:
+                self._health = (now, main.health_check(None))
+            return self._health[1]
+
+
+def make_handler(service: ConsumerService) -> type:
+    """HTTP handler serving the probes and metrics of a service"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            path = self.path.split('?', 1)[0]
+            if path == '/metrics':
+                body, status, headers = main.export_metrics(None)
+                self._send(status, body.encode('utf-8'), headers['Content-Type'])
+            elif path == '/healthz':
+                body, status = service.health()
+                self._send_json(status, body)
+            elif path == '/livez':
+                live = service.live()
+                self._send_json(200 if live else 503, dict(service.stats, status='live' if live else 'stuck'))
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self) -> None:
+            path = self.path.split('?', 1)[0]
+            if path == '/replay-dead-letters':
+                body, status = service.replay_dead_letters()
+                self._send_json(status, body)
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def log_message(self, format: str, *args: Any) -> None:
+            # Probes and scrapes every few seconds would drown the consumer's own logs
+            logger.debug(format, *args)
+
+        def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+            self._send(status, json.dumps(body, default=str).encode('utf-8'), 'application/json')
+
+        def _send(self, status: int, body: bytes, content_type: str) -> None:
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def start_http_server(service: ConsumerService, port: int = DEFAULT_SERVICE_PORT) -> ThreadingHTTPServer:
+    """Serve the probes and metrics from a daemon thread"""
+    server = ThreadingHTTPServer(('', port), make_handler(service))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='http', daemon=True).start()
+    logger.info(f"Serving /livez, /healthz, /metrics and /replay-dead-letters on port {server.server_address[1]}")
+    return server
+
+
+def run() -> int:
+    """Service entry point; returns the process exit code"""
+    if not main.validate_environment():
+        logger.error("Environment validation failed")
+        return 1
+    if not main.REUSE_KAFKA_CONSUMER:
+        # Closing the consumers after every round would rejoin the group each time
+        logger.warning("REUSE_KAFKA_CONSUMER is off; keeping consumers open anyway in service mode")
+        main.REUSE_KAFKA_CONSUMER = True
+
+    service = ConsumerService(SERVICE_ROUND_MS, SERVICE_ERROR_BACKOFF_S, SERVICE_MAX_BACKOFF_S,
+                              SERVICE_HEALTH_CACHE_S)
+    signal.signal(signal.SIGTERM, service.stop)
+    signal.signal(signal.SIGINT, service.stop)
+    server = start_http_server(service, SERVICE_PORT)
+    logger.info(f"BI consumer service started in {main.ENVIRONMENT}, group {main.KAFKA_GROUP_ID}")
+    try:
+        service.run()
+    finally:
+        # Leave the consumer group now rather than after the session timeout
+        main.RESOURCES.clear()
+        server.shutdown()
+        logger.info(f"BI consumer service stopped: {service.stats}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,634 @@
+"""
+BigQuery sinks for the BI Consumer
+Pluggable write backends: legacy streaming inserts, the Storage Write API
+and micro-batch load jobs from staged files
+
+Every sink exposes write(rows) -> bool and close() -> bool, and keeps simple
+counters (rows, requests, payload bytes, write time) so backends can be
+compared on the same workload.
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from retry import RetryPolicy, is_retryable_exception, is_retryable_reason
+
+logger = logging.getLogger(__name__)
+
+SINK_INSERT_ALL = 'insert_all'
+SINK_STORAGE_WRITE = 'storage_write'
+SINK_LOAD_JOB = 'load_job'
+
+STREAM_TYPE_COMMITTED = 'COMMITTED'
+STREAM_TYPE_PENDING = 'PENDING'
+
+LOAD_FORMAT_NDJSON = 'ndjson'
+LOAD_FORMAT_PARQUET = 'parquet'
+
+ROW_MESSAGE_NAME = 'BiConsumerRow'
+
+# Staged files are written under an in-progress suffix and renamed once sealed
+_OPEN_SUFFIX = '.open'
+_STAGED_EXTENSIONS = {
+    LOAD_FORMAT_NDJSON: '.ndjson.gz',
+    LOAD_FORMAT_PARQUET: '.parquet',
+}
+
+_EPOCH_DATE = date(1970, 1, 1)
+
+
+class Sink:
+    """Base class for BigQuery row sinks"""
+
+    name = 'sink'
+    # Whether a successful write() makes rows durable, or only a successful close()
+    durable_on_write = True
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        # Called with rows the destination refused for their content and one reason per row
+        self.on_rejected: Optional[Callable[[List[Dict[str, Any]], List[str]], None]] = None
+        self.stats = {
+            'sink': self.name,
+            'rows_written': 0,
+            'rows_failed': 0,
+            'requests': 0,
+            'bytes_sent': 0,
+            'write_ms': 0,
+        }
+
+    def write(self, rows: List[Dict[str, Any]]) -> bool:
+        """Write a batch of rows, returning True when every row was accepted"""
+        raise NotImplementedError
+
+    def close(self) -> bool:
+        """Flush and release resources, returning False if buffered rows were lost"""
+        return True
+
+    def _record(self, rows: int, ok: bool, payload_bytes: int, started: float, requests: int = 1) -> None:
+        with self._stats_lock:
+            self.stats['requests'] += requests
+            self.stats['bytes_sent'] += payload_bytes
+            self.stats['write_ms'] += int((time.monotonic() - started) * 1000)
+            if ok:
+                self.stats['rows_written'] += rows
+            else:
+                self.stats['rows_failed'] += rows
+
+
+class InsertAllSink(Sink):
+    """Legacy streaming inserts through insert_rows_json (tabledata.insertAll)
+
+    Each row is sent with its event_id as insertId, so BigQuery drops
+    duplicates of retried or replayed rows. Rows that fail for transient
+    reasons are re-sent on their own under the retry policy; rows rejected for
+    their content are counted as rows_rejected, handed to on_rejected, and do
+    not fail the batch. Errors that cannot be attributed to rows fail the whole batch.
+    """
+
+    name = SINK_INSERT_ALL
+
+    def __init__(self, bq_client: Any, table_id: str, retry_policy: Optional[RetryPolicy] = None):
+        super().__init__()
+        self._client = bq_client
+        self._table_id = table_id
+        self._retry = retry_policy or RetryPolicy()
+        self.stats.update({'rows_retried': 0, 'rows_rejected': 0, 'retry_requests': 0})
+
+    def write(self, rows: List[Dict[str, Any]]) -> bool:
+        if not rows:
+            return True
+
+        started = time.monotonic()
+        payload_bytes = 0
+        pending = list(range(len(rows)))
+        rejected = 0
+        attempt = 1
+
+        while True:
+            batch = [rows[i] for i in pending]
+            # Approximate request body size: every row travels as JSON over REST
+            payload_bytes += len(json.dumps(batch, default=str).encode('utf-8'))
+            row_ids = [row.get('event_id') for row in batch]
+
+            try:
+                # Use streaming insert (not load job) for real-time data
+                if all(row_ids):
+                    errors = self._client.insert_rows_json(self._table_id, batch, row_ids=row_ids)
+                else:
+                    errors = self._client.insert_rows_json(self._table_id, batch)
+            except Exception as e:
+                logger.error(f"Error inserting to BigQuery: {e}", exc_info=True)
+                if is_retryable_exception(e) and self._retry.allow_retry(attempt):
+                    attempt += 1
+                    self._count_retry(len(pending))
+                    continue
+                return self._finish(rows, len(pending), rejected, payload_bytes, started, attempt)
+
+            if not errors:
+                break
+
+            failed = self._failed_rows(errors, len(batch))
+            if failed is None:
+                logger.error(f"BigQuery insert errors: {errors}")
+                return self._finish(rows, len(pending), rejected, payload_bytes, started, attempt)
+
+            retryable = []
+            rejected_rows = []
+            rejected_reasons = []
+            for index, reasons in failed.items():
+                if is_retryable_reason(reasons):
+                    retryable.append(pending[index])
+                else:
+                    rejected_rows.append(rows[pending[index]])
+                    rejected_reasons.append(reasons)
+            if rejected_reasons:
+                rejected += len(rejected_reasons)
+                logger.warning(f"BigQuery rejected {len(rejected_reasons)} rows: {rejected_reasons[:5]}")
+                if self.on_rejected is not None:
+                    self.on_rejected(rejected_rows, [','.join(reasons) or 'unknown' for reasons in rejected_reasons])
+            if not retryable:
+                break
+            if not self._retry.allow_retry(attempt):
+                logger.error(f"Giving up on {len(retryable)} rows after {attempt} attempts")
+                return self._finish(rows, len(retryable), rejected, payload_bytes, started, attempt)
+
+            logger.info(f"Retrying {len(retryable)} rows with transient insert errors (attempt {attempt + 1})")
+            attempt += 1
+            pending = retryable
+            self._count_retry(len(pending))
+
+        logger.info(f"Successfully inserted {len(rows) - rejected} rows to BigQuery")
+        return self._finish(rows, 0, rejected, payload_bytes, started, attempt)
+
+    @staticmethod
+    def _reasons(error: Dict[str, Any]) -> List[str]:
+        return [item.get('reason', '') if isinstance(item, dict) else str(item) for item in error.get('errors', [])]
+
+    def _failed_rows(self, errors: List[Dict[str, Any]], batch_size: int) -> Optional[Dict[int, List[str]]]:
+        """Map request row index to error reasons, or None if the errors do not name rows"""
+        failed: Dict[int, List[str]] = {}
+        for error in errors:
+            index = error.get('index') if isinstance(error, dict) else None
+            if not isinstance(index, int) or not 0 <= index < batch_size:
+                return None
+            failed.setdefault(index, []).extend(self._reasons(error))
+        return failed
+
+    def _count_retry(self, rows: int) -> None:
+        with self._stats_lock:
+            self.stats['rows_retried'] += rows
+            self.stats['retry_requests'] += 1
+
+    def _finish(self, rows: List[Dict[str, Any]], failed: int, rejected: int, payload_bytes: int,
+                started: float, attempts: int) -> bool:
+        written = len(rows) - failed - rejected
+        self._record(written, True, payload_bytes, started, requests=attempts)
+        with self._stats_lock:
+            self.stats['rows_failed'] += failed
+            self.stats['rows_rejected'] += rejected
+        return failed == 0
+
+
+def build_row_message_class(schema: List[Any]) -> Any:
+    """Build a protobuf message class matching a list of BigQuery SchemaFields"""
+    from google.protobuf import descriptor_pb2, descriptor_pool
+
+    field_types = {
+        'STRING': descriptor_pb2.FieldDescriptorProto.TYPE_STRING,
+        'JSON': descriptor_pb2.FieldDescriptorProto.TYPE_STRING,
+        'INTEGER': descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+        'INT64': descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+        'FLOAT': descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE,
+        'FLOAT64': descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE,
+        'BOOLEAN': descriptor_pb2.FieldDescriptorProto.TYPE_BOOL,
+        'BOOL': descriptor_pb2.FieldDescriptorProto.TYPE_BOOL,
+        # Storage Write API encodes TIMESTAMP as epoch micros and DATE as epoch days
+        'TIMESTAMP': descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+        'DATE': descriptor_pb2.FieldDescriptorProto.TYPE_INT32,
+    }
+
+    file_proto = descriptor_pb2.FileDescriptorProto()
+    file_proto.name = 'bi_consumer_row.proto'
+    file_proto.syntax = 'proto2'
+    message_proto = file_proto.message_type.add()
+    message_proto.name = ROW_MESSAGE_NAME
+
+    for number, field in enumerate(schema, start=1):
+        if field.field_type not in field_types:
+            raise ValueError(f"Unsupported BigQuery type for Storage Write API: {field.field_type}")
+        field_proto = message_proto.field.add()
+        field_proto.name = field.name
+        field_proto.number = number
+        field_proto.type = field_types[field.field_type]
+        field_proto.label = descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    descriptor = pool.FindMessageTypeByName(ROW_MESSAGE_NAME)
+
+    try:
+        from google.protobuf.message_factory import GetMessageClass
+        return GetMessageClass(descriptor)
+    except ImportError:  # protobuf < 4.21
+        from google.protobuf import message_factory
+        return message_factory.MessageFactory(pool).GetPrototype(descriptor)
+
+
+def arrow_schema(schema: List[Any]) -> Any:
+    """Build a pyarrow schema matching a list of BigQuery SchemaFields"""
+    import pyarrow as pa
+
+    arrow_types = {
+        'STRING': pa.string(),
+        'JSON': pa.string(),
+        'INTEGER': pa.int64(),
+        'INT64': pa.int64(),
+        'FLOAT': pa.float64(),
+        'FLOAT64': pa.float64(),
+        'BOOLEAN': pa.bool_(),
+        'BOOL': pa.bool_(),
+        'TIMESTAMP': pa.timestamp('us', tz='UTC'),
+        'DATE': pa.date32(),
+    }
+    return pa.schema([pa.field(field.name, arrow_types[field.field_type]) for field in schema])
+
+
+def _to_proto_value(field_type: str, value: Any) -> Any:
+    """Convert a dict-row value into the wire type expected by the Storage Write API"""
+    if field_type == 'TIMESTAMP':
+        if isinstance(value, datetime):
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            return int(value.timestamp() * 1_000_000)
+        return int(value)
+    if field_type == 'DATE':
+        if isinstance(value, datetime):
+            value = value.date()
+        if isinstance(value, date):
+            return (value - _EPOCH_DATE).days
+        return int(value)
+    if field_type in ('STRING', 'JSON') and not isinstance(value, str):
+        return json.dumps(value, default=str) if field_type == 'JSON' else str(value)
+    return value
+
+
+class StorageWriteSink(Sink):
+    """Storage Write API sink sending protobuf-encoded rows over gRPC"""
+
+    name = SINK_STORAGE_WRITE
+
+    def __init__(self, table_path: str, schema: List[Any], write_client: Any = None,
+                 stream_type: str = STREAM_TYPE_COMMITTED,
+                 append_stream_factory: Optional[Callable[[Any, Any], Any]] = None):
+        super().__init__()
+        if stream_type not in (STREAM_TYPE_COMMITTED, STREAM_TYPE_PENDING):
+            raise ValueError(f"Unsupported write stream type: {stream_type}")
+
+        from google.cloud.bigquery_storage_v1 import types, writer
+        from google.protobuf import descriptor_pb2
+
+        self._types = types
+        self._table_path = table_path
+        self._stream_type = stream_type
+        # PENDING streams only become visible once close() commits them
+        self.durable_on_write = stream_type == STREAM_TYPE_COMMITTED
+        self._field_types = [(field.name, field.field_type) for field in schema]
+        self._message_cls = build_row_message_class(schema)
+        self._client = write_client
+        if self._client is None:
+            from google.cloud import bigquery_storage_v1
+            self._client = bigquery_storage_v1.BigQueryWriteClient()
+
+        write_stream = types.WriteStream()
+        write_stream.type_ = getattr(types.WriteStream.Type, stream_type)
+        self._write_stream = self._client.create_write_stream(parent=table_path, write_stream=write_stream)
+
+        # The schema travels once, on the first request of the connection
+        proto_descriptor = descriptor_pb2.DescriptorProto()
+        self._message_cls.DESCRIPTOR.CopyToProto(proto_descriptor)
+        template = types.AppendRowsRequest()
+        template.write_stream = self._write_stream.name
+        proto_data = types.AppendRowsRequest.ProtoData()
+        proto_data.writer_schema = types.ProtoSchema(proto_descriptor=proto_descriptor)
+        template.proto_rows = proto_data
+
+        self._template = template
+        self._append_stream_factory = append_stream_factory or writer.AppendRowsStream
+        self._append_stream = self._append_stream_factory(self._client, template)
+        self._send_lock = threading.Lock()
+        self._next_offset = 0
+        self._closed = False
+        self.stats['stream_type'] = stream_type
+        self.stats['rows_pending_commit'] = 0
+
+    def serialize_rows(self, rows: List[Dict[str, Any]]) -> List[bytes]:
+        """Encode dict rows as serialized protobuf messages"""
+        serialized = []
+        for row in rows:
+            message = self._message_cls()
+            for name, field_type in self._field_types:
+                value = row.get(name)
+                if value is None:
+                    continue
+                setattr(message, name, _to_proto_value(field_type, value))
+            serialized.append(message.SerializeToString())
+        return serialized
+
+    def write(self, rows: List[Dict[str, Any]]) -> bool:
+        if not rows:
+            return True
+
+        started = time.monotonic()
+        try:
+            serialized = self.serialize_rows(rows)
+        except Exception as e:
+            logger.error(f"Error encoding rows for Storage Write API: {e}", exc_info=True)
+            self._record(len(rows), False, 0, started)
+            return False
+
+        payload_bytes = sum(len(row) for row in serialized)
+        proto_rows = self._types.ProtoRows()
+        proto_rows.serialized_rows.extend(serialized)
+        proto_data = self._types.AppendRowsRequest.ProtoData()
+        proto_data.rows = proto_rows
+        request = self._types.AppendRowsRequest()
+        request.proto_rows = proto_data
+
+        try:
+            # Explicit offsets make appends idempotent: a resent batch is rejected, not duplicated.
+            # The offset only moves once BigQuery has accepted the rows, so appends go one at a time.
+            with self._send_lock:
+                request.offset = self._next_offset
+                try:
+                    self._append_stream.send(request).result()
+                except Exception:
+                    self._reopen_append_stream()
+                    raise
+                self._next_offset += len(rows)
+        except Exception as e:
+            logger.error(f"Storage Write API append failed: {e}", exc_info=True)
+            self._record(len(rows), False, payload_bytes, started)
+            return False
+
+        self._record(len(rows), True, payload_bytes, started)
+        if self._stream_type == STREAM_TYPE_PENDING:
+            with self._stats_lock:
+                self.stats['rows_pending_commit'] += len(rows)
+        logger.info(f"Appended {len(rows)} rows to {self._write_stream.name}")
+        return True
+
+    def _reopen_append_stream(self) -> None:
+        # A failed append shuts the connection down; the next append resends from the same offset
+        try:
+            self._append_stream.close()
+        except Exception as e:
+            logger.warning(f"Error closing failed Storage Write connection: {e}")
+        self._append_stream = self._append_stream_factory(self._client, self._template)
+
+    def close(self) -> bool:
+        if self._closed:
+            return True
+        self._closed = True
+
+        try:
+            self._append_stream.close()
+            self._client.finalize_write_stream(name=self._write_stream.name)
+            if self._stream_type == STREAM_TYPE_PENDING:
+                request = self._types.BatchCommitWriteStreamsRequest()
+                request.parent = self._table_path
+                request.write_streams = [self._write_stream.name]
+                response = self._client.batch_commit_write_streams(request)
+                if getattr(response, 'stream_errors', None):
+                    logger.error(f"Pending stream commit errors: {response.stream_errors}")
+                    return False
+                with self._stats_lock:
+                    self.stats['rows_pending_commit'] = 0
+            return True
+        except Exception as e:
+            logger.error(f"Error closing Storage Write stream: {e}", exc_info=True)
+            return False
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class LoadJobSink(Sink):
+    """Micro-batch sink staging rows to compressed files and loading each file with one load job
+
+    Rows are appended to a staging file which is sealed once it exceeds
+    max_file_bytes (uncompressed) or max_file_age_s. Each sealed file is
+    submitted as a single BigQuery load job and deleted once the job succeeds.
+    Load jobs do not deduplicate, so a file is never loaded twice: when its job
+    fails or cannot be submitted the file is deleted, close() reports failure
+    and the rows are re-read from Kafka (or the backfill checkpoint) instead.
+    Files a previous run left behind are deleted for the same reason.
+
+    When source_uri_prefix is set, the staging directory is treated as a
+    mounted bucket (e.g. Cloud Storage FUSE) and jobs load from
+    f"{source_uri_prefix}/{file name}" instead of uploading the file.
+    """
+
+    name = SINK_LOAD_JOB
+    durable_on_write = False
+
+    def __init__(self, bq_client: Any, table_id: str, schema: List[Any], staging_dir: str,
+                 file_format: str = LOAD_FORMAT_NDJSON, max_file_bytes: int = 64 * 1024 * 1024,
+                 max_file_age_s: float = 60.0, source_uri_prefix: Optional[str] = None):
+        super().__init__()
+        if file_format not in _STAGED_EXTENSIONS:
+            raise ValueError(f"Unsupported load job file format: {file_format}")
+        if file_format == LOAD_FORMAT_PARQUET:
+            import pyarrow  # noqa: F401  (optional dependency, fail fast when missing)
+
+        self._client = bq_client
+        self._table_id = table_id
+        self._schema = schema
+        self._json_fields = {field.name for field in schema if field.field_type == 'JSON'}
+        self._staging_dir = staging_dir
+        self._format = file_format
+        self._max_file_bytes = max_file_bytes
+        self._max_file_age_s = max_file_age_s
+        self._source_uri_prefix = source_uri_prefix.rstrip('/') if source_uri_prefix else None
+        self._lock = threading.Lock()
+        self._writer: Any = None
+        self._open_path: Optional[str] = None
+        self._open_rows = 0
+        self._open_bytes = 0
+        self._opened_at = 0.0
+        self._jobs: List[Any] = []
+        # Files of this sink's rows whose job could not be submitted since the last close
+        self._submit_failures = 0
+        self._arrow: Any = None
+        self.stats.update({'files_staged': 0, 'load_jobs': 0, 'load_jobs_failed': 0, 'files_discarded': 0})
+
+        os.makedirs(staging_dir, exist_ok=True)
+        self._discard_leftover_files()
+
+    def write(self, rows: List[Dict[str, Any]]) -> bool:
+        if not rows:
+            return True
+
+        started = time.monotonic()
+        with self._lock:
+            try:
+                if self._writer is None:
+                    self._open_file()
+                written = self._append(rows)
+            except Exception as e:
+                logger.error(f"Error staging rows for load job: {e}", exc_info=True)
+                self._record(len(rows), False, 0, started)
+                return False
+
+            self._open_rows += len(rows)
+            self._open_bytes += written
+            self._record(len(rows), True, written, started)
+            self._rotate_if_due()
+        return True
+
+    def maybe_rotate(self) -> None:
+        """Seal the staging file if it has grown too large or too old"""
+        with self._lock:
+            self._rotate_if_due()
+
+    def close(self) -> bool:
+        """Seal the open file and wait for all submitted load jobs"""
+        with self._lock:
+            if self._writer is not None:
+                self._seal_and_submit()
+
+        # Rows whose job was never submitted are only in the staging file, not in BigQuery
+        ok = self._submit_failures == 0
+        self._submit_failures = 0
+        for job, path, rows in self._jobs:
+            try:
+                job.result()
+                os.remove(path)
+                logger.info(f"Load job {job.job_id} loaded {rows} rows from {os.path.basename(path)}")
+            except Exception as e:
+                ok = False
+                with self._stats_lock:
+                    self.stats['load_jobs_failed'] += 1
+                    self.stats['rows_written'] -= rows
+                    self.stats['rows_failed'] += rows
+                logger.error(f"Load job for {os.path.basename(path)} failed, its rows are re-read: {e}")
+                self._discard(path)
+        self._jobs = []
+        return ok
+
+    def _open_file(self) -> None:
+        extension = _STAGED_EXTENSIONS[self._format]
+        name = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}{extension}"
+        self._open_path = os.path.join(self._staging_dir, name + _OPEN_SUFFIX)
+        if self._format == LOAD_FORMAT_NDJSON:
+            self._writer = gzip.open(self._open_path, 'wb')
+        else:
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(self._open_path, self._arrow_schema(), compression='snappy')
+        self._open_rows = 0
+        self._open_bytes = 0
+        self._opened_at = time.monotonic()
+
+    def _append(self, rows: List[Dict[str, Any]]) -> int:
+        if self._format == LOAD_FORMAT_NDJSON:
+            data = b''.join(self._ndjson_line(row) for row in rows)
+            self._writer.write(data)
+            return len(data)
+
+        import pyarrow as pa
+        table = pa.Table.from_pylist(rows, schema=self._arrow_schema())
+        self._writer.write_table(table)
+        return table.nbytes
+
+    def _ndjson_line(self, row: Dict[str, Any]) -> bytes:
+        # JSON columns already hold serialized JSON text: splice it in rather than re-encoding
+        parts = []
+        for key, value in row.items():
+            if value is None:
+                continue
+            if key in self._json_fields and isinstance(value, str):
+                parts.append(f"{json.dumps(key)}: {value}")
+            else:
+                parts.append(f"{json.dumps(key)}: {json.dumps(_json_value(value))}")
+        return ('{' + ', '.join(parts) + '}\n').encode('utf-8')
+
+    def _arrow_schema(self) -> Any:
+        if self._arrow is None:
+            self._arrow = arrow_schema(self._schema)
+        return self._arrow
+
+    def _rotate_if_due(self) -> None:
+        if self._writer is None:
+            return
+        too_big = self._open_bytes >= self._max_file_bytes
+        too_old = time.monotonic() - self._opened_at >= self._max_file_age_s
+        if too_big or too_old:
+            self._seal_and_submit()
+
+    def _seal_and_submit(self) -> None:
+        self._writer.close()
+        sealed_path = self._open_path[:-len(_OPEN_SUFFIX)]
+        os.replace(self._open_path, sealed_path)
+        rows = self._open_rows
+        self._writer = None
+        self._open_path = None
+        with self._stats_lock:
+            self.stats['files_staged'] += 1
+        self._submit(sealed_path, rows)
+
+    def _discard_leftover_files(self) -> None:
+        # Their batches were never reported durable, so their offsets were not committed either
+        extension = _STAGED_EXTENSIONS[self._format]
+        for name in sorted(os.listdir(self._staging_dir)):
+            if name.endswith(extension) or name.endswith(extension + _OPEN_SUFFIX):
+                logger.warning(f"Deleting staged file left by a previous run, its rows are re-read: {name}")
+                self._discard(os.path.join(self._staging_dir, name))
+
+    def _discard(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        with self._stats_lock:
+            self.stats['files_discarded'] += 1
+
+    def _submit(self, path: str, rows: int) -> None:
+        from google.cloud import bigquery
+
+        job_config = bigquery.LoadJobConfig(
+            schema=self._schema,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+            source_format=(bigquery.SourceFormat.NEWLINE_DELIMITED_JSON
+                           if self._format == LOAD_FORMAT_NDJSON else bigquery.SourceFormat.PARQUET),
+        )
+        try:
+            if self._source_uri_prefix:
+                uri = f"{self._source_uri_prefix}/{os.path.basename(path)}"
+                job = self._client.load_table_from_uri(uri, self._table_id, job_config=job_config)
+            else:
+                with open(path, 'rb') as staged:
+                    job = self._client.load_table_from_file(staged, self._table_id, job_config=job_config)
+        except Exception as e:
+            logger.error(f"Could not submit load job for {os.path.basename(path)}, its rows are re-read: {e}")
+            with self._stats_lock:
+                self.stats['load_jobs_failed'] += 1
+                self.stats['rows_written'] -= rows
+                self.stats['rows_failed'] += rows
+            self._submit_failures += 1
+            self._discard(path)
+            return
+
+        with self._stats_lock:
+            self.stats['load_jobs'] += 1
+        self._jobs.append((job, path, rows))
+        logger.info(f"Submitted load job for {os.path.basename(path)} ({rows} rows)")
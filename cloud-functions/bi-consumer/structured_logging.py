@@ -0,0 +1,142 @@
+"""
+Structured logging for the BI Consumer
+Correlation IDs through contextvars, JSON output and rate-limited per-event warnings
+
+The correlation ID of the running invocation lives in a ContextVar, so
+concurrent invocations and their worker threads (which run in a copy of the
+invoking context) each log their own ID. Formatters read it when a record is
+formatted; nothing is patched into the logging module.
+
+Warnings about individual events go through EventLogLimiter: each kind of
+warning may be emitted a few times per interval, the rest are counted and
+reported with the next emission. Arguments are formatted lazily, so a storm of
+invalid events costs a dict lookup per event rather than a formatted string.
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, Optional
+
+LOG_FORMAT_TEXT = 'text'
+LOG_FORMAT_JSON = 'json'
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s - %(correlation_id)s'
+
+NO_CORRELATION_ID = '-'
+
+correlation_id_var: contextvars.ContextVar[str] = contextvars.ContextVar('correlation_id', default=NO_CORRELATION_ID)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def get_correlation_id() -> str:
+    return correlation_id_var.get()
+
+
+@contextlib.contextmanager
+def correlation_context(correlation_id: Optional[str] = None) -> Iterator[str]:
+    """Run the block under a correlation ID (a new one unless given)"""
+    correlation_id = correlation_id or str(uuid.uuid4())
+    token = correlation_id_var.set(correlation_id)
+    try:
+        yield correlation_id
+    finally:
+        correlation_id_var.reset(token)
+
+
+def run_in_context(target: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a thread target so it runs in a copy of the caller's context"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(target, *args, **kwargs)
+
+
+class ContextFormatter(logging.Formatter):
+    """Text formatter that fills %(correlation_id)s from the current context"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.correlation_id = correlation_id_var.get()
+        return super().format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the fields Cloud Logging picks up"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'severity': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'correlation_id': correlation_id_var.get(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and key != 'correlation_id':
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: int = logging.INFO, log_format: str = LOG_FORMAT_TEXT) -> None:
+    """Install a stdout handler on the root logger unless one is already configured (like basicConfig)"""
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    if log_format not in (LOG_FORMAT_TEXT, LOG_FORMAT_JSON):
+        raise ValueError(f"Unknown log format: {log_format}")
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if log_format == LOG_FORMAT_JSON else ContextFormatter(TEXT_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+class EventLogLimiter:
+    """Per-key cap on how often a repeated warning is emitted"""
+
+    def __init__(self, logger: logging.Logger, burst: int = 5, interval_s: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self._logger = logger
+        self._burst = burst
+        self._interval_s = interval_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> [window start, emitted in window, suppressed since last emission]
+        self._windows: Dict[str, list] = {}
+        self.stats = {'emitted': 0, 'suppressed': 0}
+
+    def warning(self, key: str, msg: str, *args: Any, exc_info: bool = False) -> None:
+        self.log(logging.WARNING, key, msg, *args, exc_info=exc_info)
+
+    def error(self, key: str, msg: str, *args: Any, exc_info: bool = False) -> None:
+        self.log(logging.ERROR, key, msg, *args, exc_info=exc_info)
+
+    def log(self, level: int, key: str, msg: str, *args: Any, exc_info: bool = False) -> None:
+        """Emit unless this key is over its burst for the interval; args are only formatted when emitted"""
+        if not self._logger.isEnabledFor(level):
+            return
+        now = self._clock()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self._interval_s:
+                window = self._windows[key] = [now, 0, window[2] if window else 0]
+            if window[1] >= self._burst:
+                window[2] += 1
+                self.stats['suppressed'] += 1
+                return
+            window[1] += 1
+            suppressed = window[2]
+            window[2] = 0
+            self.stats['emitted'] += 1
+
+        if suppressed:
+            self._logger.log(level, msg + ' (%d similar suppressed)', *args, suppressed, exc_info=exc_info)
+        else:
+            self._logger.log(level, msg, *args, exc_info=exc_info)
@@ -0,0 +1,22 @@
+"""
+Shared test fixtures for the BI Consumer
+"""
+
+import sys
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def reset_warm_instance_state():
+    """Give every test a cold instance: no cached clients, consumers, secrets or memos"""
+    _reset()
+    yield
+    _reset()
+
+
+def _reset():
+    main = sys.modules.get('main')
+    if main is not None:
+        main.RESOURCES.clear()
+        main.SECRET_CACHE.invalidate()
@@ -0,0 +1,174 @@
+"""
+Unit tests for backfill planning and checkpoints
+"""
+
+import json
+import os
+import sys
+from collections import namedtuple
+from unittest.mock import MagicMock, Mock
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backfill import (
+    BackfillAssignment, BackfillCheckpoint, BackfillRequest, parse_backfill_request, parse_time_ms, resolve_ranges,
+    split_ranges,
+)
+
+TopicPartition = namedtuple('TopicPartition', ['topic', 'partition'])
+OffsetAndTimestamp = namedtuple('OffsetAndTimestamp', ['offset', 'timestamp'])
+
+USERS = 'codet.prod.users'
+
+
+def planning_consumer(log_start=(0, 10), log_end=(100, 50), at_time=None):
+    """Consumer stand-in with two partitions of the users topic"""
+    consumer = MagicMock()
+    consumer.partitions_for_topic.side_effect = lambda topic: {0, 1} if topic == USERS else None
+    consumer.beginning_offsets.side_effect = lambda tps: {tp: log_start[tp.partition] for tp in tps}
+    consumer.end_offsets.side_effect = lambda tps: {tp: log_end[tp.partition] for tp in tps}
+    consumer.offsets_for_times.side_effect = lambda times: {
+        tp: None if at_time[tp.partition] is None else OffsetAndTimestamp(at_time[tp.partition], ts)
+        for tp, ts in times.items()
+    }
+    return consumer
+
+
+class TestBackfillRequest:
+    """Test parsing and validation of backfill parameters"""
+
+    def test_defaults_and_stable_name(self):
+        """Test that the range defaults to earliest..latest and the name follows the parameters"""
+        request = parse_backfill_request({'topics': f"{USERS}, codet.prod.orders"})
+
+        assert request.topics == ['codet.prod.orders', USERS]
+        assert (request.start_offset, request.end_offset) == ('earliest', 'latest')
+        assert request.name == parse_backfill_request({'topics': ['codet.prod.orders', USERS]}).name
+        assert request.name != parse_backfill_request({'topics': [USERS]}).name
+        assert parse_backfill_request({'topics': [USERS], 'name': 'rebuild-1'}).name == 'rebuild-1'
+
+    def test_timestamps(self):
+        """Test that times are accepted as ISO-8601 text or epoch milliseconds"""
+        request = parse_backfill_request({'topics': [USERS], 'start_time': '2022-01-01T00:00:00Z',
+                                          'end_time': '1641081600000'})
+
+        assert (request.start_time_ms, request.end_time_ms) == (1640995200000, 1641081600000)
+        assert parse_time_ms('2022-01-01T00:00:00') == parse_time_ms('2022-01-01T01:00:00+01:00') == 1640995200000
+
+    @pytest.mark.parametrize('params, message', [
+        ({}, 'at least one topic'),
+        ({'topics': [USERS], 'start_offset': -1}, 'non-negative offset'),
+        ({'topics': [USERS], 'start_offset': 5, 'start_time': 1}, 'not both'),
+        ({'topics': [USERS], 'start_offset': 5, 'end_offset': 5}, 'after start_offset'),
+        ({'topics': [USERS], 'start_time': 'yesterday'}, 'Invalid backfill timestamp'),
+        ({'topics': [USERS], 'name': '../etc'}, 'Invalid backfill name'),
+        ({'topics': [USERS], 'from': 0}, 'unknown parameters'),
+    ])
+    def test_invalid_request_rejected(self, params, message):
+        """Test that bad parameters fail before anything is read"""
+        with pytest.raises(ValueError, match=message):
+            parse_backfill_request(params)
+
+
+class TestResolveRanges:
+    """Test offset range resolution per partition"""
+
+    def test_earliest_to_latest(self):
+        """Test that the default range is the whole log as of planning"""
+        ranges = resolve_ranges(planning_consumer(), BackfillRequest([USERS]), TopicPartition)
+
+        assert ranges == {(USERS, 0): (0, 100), (USERS, 1): (10, 50)}
+
+    def test_offsets_clamped_to_log(self):
+        """Test that fixed offsets are clamped to what the log still holds"""
+        ranges = resolve_ranges(planning_consumer(), BackfillRequest([USERS], start_offset=5, end_offset=80),
+                                TopicPartition)
+
+        assert ranges == {(USERS, 0): (5, 80), (USERS, 1): (10, 50)}
+
+    def test_timestamps_use_offsets_for_times(self):
+        """Test that timestamps map to the first offset at or after them, or the log end"""
+        consumer = planning_consumer(at_time={0: 40, 1: None})
+        ranges = resolve_ranges(consumer, BackfillRequest([USERS], start_time_ms=1000), TopicPartition)
+
+        consumer.offsets_for_times.assert_called_once_with({TopicPartition(USERS, 0): 1000,
+                                                            TopicPartition(USERS, 1): 1000})
+        assert ranges == {(USERS, 0): (40, 100), (USERS, 1): (50, 50)}
+
+    def test_unknown_topic_rejected(self):
+        """Test that a topic without partitions is reported"""
+        with pytest.raises(ValueError, match='Unknown backfill topic'):
+            resolve_ranges(planning_consumer(), BackfillRequest(['codet.prod.nope']), TopicPartition)
+
+
+class TestSplitRanges:
+    """Test how partitions are spread over readers"""
+
+    def test_balanced_and_empty_ranges_skipped(self):
+        """Test that the largest ranges are spread first and empty ones get no reader"""
+        ranges = {('t', 0): (0, 100), ('t', 1): (0, 60), ('t', 2): (0, 50), ('t', 3): (7, 7)}
+        shares = split_ranges(ranges, 2)
+
+        assert shares == [{('t', 0): (0, 100)}, {('t', 1): (0, 60), ('t', 2): (0, 50)}]
+        assert len(split_ranges(ranges, 8)) == 3
+        assert split_ranges({('t', 0): (5, 5)}, 4) == []
+
+
+class TestBackfillCheckpoint:
+    """Test saving and resuming backfill progress"""
+
+    def test_save_and_resume(self, tmp_path):
+        """Test that saved positions survive a reload and narrow the remaining ranges"""
+        path = str(tmp_path / 'checkpoints' / 'rebuild.json')
+        request = BackfillRequest([USERS], name='rebuild')
+        checkpoint = BackfillCheckpoint(path)
+        assert not checkpoint.load()
+        checkpoint.start(request, {(USERS, 0): (0, 100), (USERS, 1): (10, 50)})
+        checkpoint.save({(USERS, 0): 60, (USERS, 1): 50, ('other', 0): 3})
+
+        resumed = BackfillCheckpoint(path)
+        assert resumed.load()
+        assert resumed.request == request.to_dict()
+        assert resumed.remaining() == {(USERS, 0): (60, 100)}
+        assert resumed.stats == {'partitions': 2, 'partitions_done': 1, 'offsets_total': 140,
+                                 'offsets_remaining': 40}
+        assert not resumed.complete
+        assert json.loads(open(path).read())['positions'] == {f"{USERS}-0": 60, f"{USERS}-1": 50}
+
+    def test_positions_never_move_back(self, tmp_path):
+        """Test that a stale save cannot undo progress"""
+        checkpoint = BackfillCheckpoint(str(tmp_path / 'rebuild.json'))
+        checkpoint.start(BackfillRequest([USERS]), {(USERS, 0): (0, 100)})
+        checkpoint.save({(USERS, 0): 100})
+        checkpoint.save({(USERS, 0): 20})
+
+        assert checkpoint.complete
+
+
+class TestBackfillAssignment:
+    """Test range trimming and completion of a reader's partitions"""
+
+    def _messages(self, offsets):
+        return [Mock(topic=USERS, partition=0, offset=offset) for offset in offsets]
+
+    def test_trim_and_finish(self):
+        """Test that messages past the end are dropped and the partition reported finished once"""
+        assignment = BackfillAssignment({(USERS, 0): (0, 5), (USERS, 1): (3, 3)}, checkpoint=None)
+
+        assert len(assignment.trim(self._messages([0, 1, 2]))) == 3
+        assert assignment.take_finished() == []
+        assert [m.offset for m in assignment.trim(self._messages([3, 4, 5, 6]))] == [3, 4]
+        assert assignment.take_finished() == [(USERS, 0)]
+        assert assignment.take_finished() == []
+        assert assignment.done
+
+    def test_position_past_end_finishes(self):
+        """Test that a partition ending in a gap finishes on its read position"""
+        assignment = BackfillAssignment({(USERS, 0): (0, 5)}, checkpoint=None)
+
+        assert not assignment.reached((USERS, 0), 4)
+        assert assignment.reached((USERS, 0), 5)
+        assert assignment.open_partitions == []
@@ -0,0 +1,58 @@
+"""
+Unit tests for the memory budget behind partition backpressure
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backpressure import MemoryBudget
+
+
+class TestMemoryBudget:
+    """Test exhaustion, hysteresis and lease accounting"""
+
+    def test_exhausted_until_drained_below_resume_ratio(self):
+        """Test that the budget pauses at the limit and resumes only at the low watermark"""
+        changes = []
+        budget = MemoryBudget(100, resume_ratio=0.5, on_change=changes.append)
+        lease = budget.lease()
+
+        lease.acquire(100)
+        assert budget.exhausted and not budget.drained
+        lease.release(30)
+        assert not budget.exhausted and not budget.drained
+        lease.release(20)
+        assert budget.drained
+        assert changes == [100, 70, 50]
+        assert budget.stats == {'max_bytes': 100, 'buffered_bytes': 50, 'peak_bytes': 100}
+
+    def test_leases_share_the_budget(self):
+        """Test that workers' leases add up and each returns only what it holds"""
+        budget = MemoryBudget(100)
+        first, second = budget.lease(), budget.lease()
+
+        first.acquire(60)
+        second.acquire(50)
+        assert budget.exhausted
+        second.release(80)
+        assert (second.held_bytes, budget.used_bytes) == (0, 60)
+        first.close()
+        assert budget.used_bytes == 0
+
+    def test_zero_disables_pausing(self):
+        """Test that a zero limit still counts bytes but never exhausts"""
+        budget = MemoryBudget(0)
+        budget.lease().acquire(10 ** 9)
+
+        assert not budget.exhausted
+        assert budget.used_bytes == 10 ** 9
+
+    def test_invalid_resume_ratio(self):
+        """Test that the resume ratio must be a fraction of the limit"""
+        with pytest.raises(ValueError):
+            MemoryBudget(100, resume_ratio=1.5)
@@ -0,0 +1,127 @@
+"""
+Unit tests for adaptive batching
+Tests byte, row and linger flush triggers and latency-driven target tuning
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import AdaptiveBatcher, estimate_row_bytes
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_batcher(clock=None, **kwargs):
+    defaults = dict(max_rows=100, max_bytes=10000, min_bytes=1000, initial_bytes=2000,
+                    linger_ms=500, target_latency_ms=1000)
+    defaults.update(kwargs)
+    return AdaptiveBatcher(clock=clock or FakeClock(), **defaults)
+
+
+class TestRowEstimate:
+    """Test serialized row size estimation"""
+
+    def test_estimate_grows_with_payload(self):
+        """Test that large event_data payloads dominate the estimate"""
+        small = estimate_row_bytes({'event_id': '1', 'event_data': '{}'})
+        large = estimate_row_bytes({'event_id': '1', 'event_data': 'x' * 10000})
+
+        assert large - small == 10000 - 2
+
+
+class TestAdaptiveBatcher:
+    """Test the adaptive batcher flush triggers"""
+
+    def test_flush_on_byte_budget(self):
+        """Test that a batch seals once the byte target is reached"""
+        batcher = make_batcher()
+
+        assert batcher.add({'n': 1}, size=1500) is None
+        batch = batcher.add({'n': 2}, size=600)
+
+        assert batch == [{'n': 1}, {'n': 2}]
+        assert len(batcher) == 0
+        assert batcher.stats['flush_reasons']['bytes'] == 1
+        assert batcher.stats['batch_bytes'] == [2100]
+
+    def test_flush_on_row_cap(self):
+        """Test that small rows still seal at the row cap"""
+        batcher = make_batcher(max_rows=3)
+
+        assert batcher.add({'n': 1}, size=1) is None
+        assert batcher.add({'n': 2}, size=1) is None
+        assert len(batcher.add({'n': 3}, size=1)) == 3
+        assert batcher.stats['flush_reasons']['rows'] == 1
+
+    def test_flush_on_linger(self):
+        """Test that a quiet batch seals after the linger time"""
+        clock = FakeClock()
+        batcher = make_batcher(clock)
+
+        batcher.add({'n': 1}, size=10)
+        clock.now += 0.4
+        assert batcher.poll() is None
+        assert batcher.linger_remaining_s() == pytest.approx(0.1)
+        clock.now += 0.1
+        assert batcher.poll() == [{'n': 1}]
+        assert batcher.linger_remaining_s() is None
+        assert batcher.stats['flush_reasons']['linger'] == 1
+
+    def test_final_flush(self):
+        """Test that flush seals pending rows and is a no-op when empty"""
+        batcher = make_batcher()
+        assert batcher.flush() is None
+
+        batcher.add({'n': 1}, size=10)
+        assert batcher.flush() == [{'n': 1}]
+        assert batcher.stats['flush_reasons']['final'] == 1
+
+    def test_fill_time_reported_on_seal(self):
+        """Test that on_seal receives the time from the first row to the seal"""
+        clock = FakeClock()
+        fills = []
+        batcher = make_batcher(clock, on_seal=fills.append)
+
+        batcher.add({'n': 1}, size=10)
+        clock.now += 0.25
+        batcher.flush()
+
+        assert fills == [pytest.approx(0.25)]
+
+    def test_target_adapts_to_latency_and_errors(self):
+        """Test AIMD tuning of the byte target within its bounds"""
+        batcher = make_batcher()
+
+        batcher.record_result(latency_ms=100, ok=True)
+        assert batcher.target_bytes == 2500
+        batcher.record_result(latency_ms=2000, ok=True)
+        assert batcher.target_bytes == 2000
+        batcher.record_result(latency_ms=700, ok=True)
+        assert batcher.target_bytes == 2000
+        batcher.record_result(latency_ms=100, ok=False)
+        assert batcher.target_bytes == 1000
+        batcher.record_result(latency_ms=100, ok=False)
+        assert batcher.target_bytes == 1000
+
+        for _ in range(20):
+            batcher.record_result(latency_ms=10, ok=True)
+        assert batcher.target_bytes == 10000
+        assert batcher.stats['adjustments'] == {'grow': 21, 'shrink': 1, 'backoff': 2}
+
+    def test_invalid_bounds(self):
+        """Test that inverted byte bounds are rejected"""
+        with pytest.raises(ValueError):
+            make_batcher(min_bytes=20000)
@@ -0,0 +1,87 @@
+"""
+Unit tests for in-batch change coalescing
+"""
+
+import os
+import sys
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coalescing import ChangeCoalescer, parse_coalesce_tables, reduction_ratio
+
+
+def row(operation, key, version=0, table='users'):
+    return {'source_table': table, 'operation': operation, 'user_id': str(key), 'version': version}
+
+
+class TestChangeCoalescer:
+    """Test which rows merge and what the merged row carries"""
+
+    def test_updates_merge_into_latest(self):
+        """Test that repeated updates of a key become the latest image with a change count"""
+        coalescer = ChangeCoalescer({'users'})
+        rows, merged = coalescer.coalesce([row('UPDATE', 1, 1), row('UPDATE', 2, 1), row('UPDATE', 1, 2),
+                                           row('UPDATE', 1, 3)])
+
+        assert [(r['user_id'], r['version'], r['change_count']) for r in rows] == [('1', 3, 3), ('2', 1, 1)]
+        assert merged == {'users': 2}
+
+    def test_inserts_and_deletes_are_boundaries(self):
+        """Test that c/d pass through and updates are not merged across them"""
+        coalescer = ChangeCoalescer({'users'})
+        rows, _ = coalescer.coalesce([
+            row('INSERT', 1), row('UPDATE', 1, 1), row('UPDATE', 1, 2),
+            row('DELETE', 1), row('UPDATE', 1, 3), row('INSERT', 1, 4), row('UPDATE', 1, 5),
+        ])
+
+        assert [(r['operation'], r['version'], r['change_count']) for r in rows] == [
+            ('INSERT', 0, 1), ('UPDATE', 2, 2), ('DELETE', 0, 1), ('UPDATE', 3, 1), ('INSERT', 4, 1), ('UPDATE', 5, 1),
+        ]
+
+    def test_only_opted_in_tables(self):
+        """Test that other tables and rows without a key are left alone"""
+        coalescer = ChangeCoalescer({'users'})
+        orders = [row('UPDATE', 1, table='orders'), row('UPDATE', 1, table='orders')]
+        keyless = [row('UPDATE', ''), row('UPDATE', '')]
+        rows, merged = coalescer.coalesce(orders + keyless)
+
+        assert rows == orders + keyless
+        assert 'change_count' not in rows[0]
+        assert merged == {}
+
+    def test_typed_id_and_all_tables(self):
+        """Test that routed rows key on their id column and '*' opts every table in"""
+        coalescer = ChangeCoalescer({'*'})
+        typed = [{'source_table': 'orders', 'operation': 'UPDATE', 'id': 7, 'total': total} for total in (1, 2)]
+        rows, _ = coalescer.coalesce(typed)
+
+        assert rows == [{'source_table': 'orders', 'operation': 'UPDATE', 'id': 7, 'total': 2, 'change_count': 2}]
+
+    def test_source_id_before_user_id(self):
+        """Test that rows sharing a user_id but not a source row id are not merged"""
+        coalescer = ChangeCoalescer({'orders'})
+        orders = [dict(row('UPDATE', 7, table='orders'), _row_key=order_id) for order_id in (1, 2)]
+        rows, merged = coalescer.coalesce(orders)
+
+        assert [(r['user_id'], r['change_count']) for r in rows] == [('7', 1), ('7', 1)]
+        assert not any('_row_key' in r for r in rows)
+        assert merged == {}
+
+    def test_stats_and_reduction_ratio(self):
+        """Test the counts behind the reported reduction ratio"""
+        coalescer = ChangeCoalescer({'users'})
+        coalescer.coalesce([row('UPDATE', 1, version) for version in range(3)] + [row('INSERT', 2)])
+
+        assert coalescer.stats == {'rows_in': 4, 'rows_out': 2, 'tables': {'users': 2}}
+        assert reduction_ratio(coalescer.stats) == 0.5
+        assert reduction_ratio({'rows_in': 0, 'rows_out': 0}) == 0.0
+
+    def test_disabled_without_tables(self):
+        """Test that an empty table list turns coalescing off"""
+        coalescer = ChangeCoalescer(parse_coalesce_tables(''))
+        rows = [row('UPDATE', 1), row('UPDATE', 1)]
+
+        assert not coalescer
+        assert coalescer.coalesce(rows) == (rows, {})
+        assert parse_coalesce_tables(' users, orders ,') == {'users', 'orders'}
@@ -0,0 +1,237 @@
+"""
+Unit tests for dead-letter batching, spooling and replay
+"""
+
+import os
+import sys
+from unittest.mock import Mock
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deadletter import (
+    STAGE_DECODE, STAGE_VALIDATE, DeadLetter, DeadLetterQueue, FileDeadLetterSpool, KafkaDeadLetterWriter,
+    replay_from_consumer,
+)
+
+
+DEAD_LETTER_TOPIC = 'bi-consumer-dead-letters'
+
+
+def dead_letter(offset, value=b'{"op": "c"}', stage=STAGE_VALIDATE, failed_at=None):
+    return DeadLetter('codet.prod.users', 0, offset, value, stage, 'missing_source', failed_at)
+
+
+class FakeFuture:
+    def __init__(self, ok):
+        self.is_done = True
+        self._ok = ok
+
+    def failed(self):
+        return not self._ok
+
+
+class FakeProducer:
+    """Records sends; values listed in fail_keys are not acknowledged"""
+
+    def __init__(self, fail_keys=()):
+        self.sent = []
+        self.flushes = 0
+        self._fail_keys = set(fail_keys)
+
+    def send(self, topic, key=None, value=None):
+        self.sent.append((topic, key, value))
+        return FakeFuture(key not in self._fail_keys)
+
+    def flush(self, timeout=None):
+        self.flushes += 1
+
+
+class RecordingWriter:
+    name = 'memory'
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.closed = False
+        self._fail = fail
+
+    def write(self, records):
+        self.batches.append(list(records))
+        return list(records) if self._fail else []
+
+    def close(self):
+        self.closed = True
+
+
+class TestDeadLetter:
+    """Test the record format"""
+
+    def test_round_trip_text_and_binary(self):
+        """Test that UTF-8 values stay readable and other bytes survive base64"""
+        for value in (b'{"op": "c", "note": "\xc3\xa9t\xc3\xa9"}', b'\xff\xfe not utf-8'):
+            record = dead_letter(7, value, STAGE_DECODE)
+            copy = DeadLetter.from_json(record.to_json())
+
+            assert copy.value == value
+            assert (copy.topic, copy.partition, copy.offset) == ('codet.prod.users', 0, 7)
+            assert copy.stage == STAGE_DECODE
+            assert copy.failed_at == record.failed_at
+        assert '"value":' in dead_letter(1).to_json()
+
+
+class TestKafkaDeadLetterWriter:
+    """Test producing dead letters to a topic"""
+
+    def test_batch_sent_keyed_and_flushed_once(self):
+        """Test that a batch is keyed by original position and flushed in one round trip"""
+        producer = FakeProducer(fail_keys={b'codet.prod.users:0:2'})
+        writer = KafkaDeadLetterWriter(producer, 'codet.dlq.test')
+
+        failed = writer.write([dead_letter(offset) for offset in range(3)])
+
+        assert [key for _, key, _ in producer.sent] == [b'codet.prod.users:0:0', b'codet.prod.users:0:1',
+                                                        b'codet.prod.users:0:2']
+        assert {topic for topic, _, _ in producer.sent} == {'codet.dlq.test'}
+        assert producer.flushes == 1
+        assert [record.offset for record in failed] == [2]
+
+
+class TestFileDeadLetterSpool:
+    """Test the size-capped local spool and its replay"""
+
+    def test_spool_is_capped(self, tmp_path):
+        """Test that records beyond the byte cap are dropped and counted"""
+        line_bytes = len(dead_letter(0).to_json()) + 1
+        spool = FileDeadLetterSpool(str(tmp_path), max_bytes=line_bytes * 3)
+
+        assert spool.write([dead_letter(offset) for offset in range(5)]) == []
+        assert spool.stats['records_spooled'] == 3
+        assert spool.stats['records_dropped'] == 2
+        assert spool.total_bytes <= line_bytes * 3
+
+    def test_replay_deletes_only_successful_segments(self, tmp_path):
+        """Test that a segment whose batch fails is kept for the next replay"""
+        spool = FileDeadLetterSpool(str(tmp_path))
+        spool.write([dead_letter(0), dead_letter(1)])
+        spool.close()
+        spool.write([dead_letter(2)])
+        spool.close()
+
+        seen = []
+        stats = spool.replay(lambda records: seen.extend(r.offset for r in records) or records[0].offset != 2)
+
+        assert seen == [0, 1, 2]
+        assert stats == {'segments_replayed': 1, 'segments_kept': 1, 'records_replayed': 2}
+        assert len(os.listdir(tmp_path)) == 1
+
+        stats = spool.replay(lambda records: True)
+        assert stats['records_replayed'] == 1
+        assert os.listdir(tmp_path) == []
+        assert spool.total_bytes == 0
+
+    def test_partly_replayed_segment_keeps_only_the_rest(self, tmp_path):
+        """Test that batches written before a failure in the same segment are not replayed again"""
+        spool = FileDeadLetterSpool(str(tmp_path))
+        spool.write([dead_letter(offset) for offset in range(5)])
+        spool.close()
+
+        stats = spool.replay(lambda records: records[0].offset < 2, batch_size=2)
+        assert stats == {'segments_replayed': 0, 'segments_kept': 1, 'records_replayed': 2}
+
+        seen = []
+        spool.replay(lambda records: seen.extend(r.offset for r in records) or True, batch_size=2)
+        assert seen == [2, 3, 4]
+        assert os.listdir(tmp_path) == []
+        assert spool.total_bytes == 0
+
+    def test_open_segment_from_previous_instance_is_replayed(self, tmp_path):
+        """Test that a segment left open by a crashed instance is sealed on start"""
+        FileDeadLetterSpool(str(tmp_path)).write([dead_letter(0)])
+
+        replayed = []
+        FileDeadLetterSpool(str(tmp_path)).replay(lambda records: replayed.extend(records) or True)
+
+        assert [record.offset for record in replayed] == [0]
+
+
+class TestDeadLetterQueue:
+    """Test batching in front of a writer"""
+
+    def test_writes_in_batches(self):
+        """Test that records are written once a batch fills and on flush"""
+        writer = RecordingWriter()
+        queue = DeadLetterQueue(writer, batch_size=2)
+        for offset in range(3):
+            queue.add(dead_letter(offset, stage=STAGE_DECODE if offset == 0 else STAGE_VALIDATE))
+        assert len(writer.batches) == 1
+
+        queue.close()
+
+        assert [len(batch) for batch in writer.batches] == [2, 1]
+        assert writer.closed
+        assert queue.stats == {'writer': 'memory', 'records': 3, 'batches': 2, 'write_failures': 0,
+                               'by_stage': {STAGE_DECODE: 1, STAGE_VALIDATE: 2}}
+
+    def test_write_failures_reported(self):
+        """Test that records the writer could not store are handed to on_write_failure"""
+        lost = []
+        queue = DeadLetterQueue(RecordingWriter(fail=True), batch_size=10, on_write_failure=lost.extend)
+        queue.add(dead_letter(5))
+        queue.flush()
+
+        assert [record.offset for record in lost] == [5]
+        assert queue.stats['write_failures'] == 1
+
+
+class TestReplayFromConsumer:
+    """Test replaying a dead-letter topic"""
+
+    def _messages(self, records):
+        return [Mock(value=record.to_json().encode('utf-8'), topic=DEAD_LETTER_TOPIC, partition=0, offset=i)
+                for i, record in enumerate(records)]
+
+    def test_commits_each_successful_batch_and_stops_on_failure(self):
+        """Test that offsets are committed per written batch and not past a failed one"""
+        commit = Mock()
+        messages = self._messages([dead_letter(offset) for offset in range(5)])
+        handled = []
+
+        def handler(records):
+            handled.append([record.offset for record in records])
+            return records[0].offset != 2
+
+        stats = replay_from_consumer(messages, handler, batch_size=2, commit=commit)
+
+        assert handled == [[0, 1], [2, 3]]
+        commit.assert_called_once_with({(DEAD_LETTER_TOPIC, 0): 2})
+        assert stats == {'batches_replayed': 1, 'records_replayed': 2, 'batches_failed': 1}
+
+    def test_stops_at_records_newer_than_replay(self):
+        """Test that records dead-lettered again by the replay are not read back in the same run"""
+        messages = self._messages([dead_letter(0, failed_at='2026-01-01T00:00:00'),
+                                   dead_letter(1, failed_at='2026-01-02T00:00:00')])
+        handled = []
+
+        replay_from_consumer(messages, lambda records: handled.extend(records) or True,
+                             until='2026-01-01T12:00:00')
+
+        assert [record.offset for record in handled] == [0]
+
+    def test_redead_lettered_record_stays_on_topic(self):
+        """Test that commits stop short of a record the replay dead-lettered again, though it was read"""
+        messages = self._messages([dead_letter(0, failed_at='2026-01-01T00:00:00'),
+                                   dead_letter(1, failed_at='2026-01-01T00:00:00')])
+        again = self._messages([dead_letter(0), dead_letter(1), dead_letter(1, failed_at='2026-01-01T12:30:00')])[2]
+        commit = Mock()
+
+        def handler(records):
+            # The second record fails again and lands at the end of the topic being read
+            if records[0].offset == 1:
+                messages.append(again)
+            return True
+
+        stats = replay_from_consumer(messages, handler, batch_size=1, commit=commit, until='2026-01-01T12:00:00')
+
+        assert stats['records_replayed'] == 2
+        assert [call.args[0] for call in commit.call_args_list] == [{(DEAD_LETTER_TOPIC, 0): 1},
+                                                                    {(DEAD_LETTER_TOPIC, 0): 2}]
@@ -0,0 +1,136 @@
+"""
+Unit tests for the fast Debezium decode path
+Tests both JSON backends and raw row-image reuse for event_data
+"""
+
+import json
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import decoding
+import main
+
+ENVELOPE = {
+    'before': None,
+    'after': {'id': 7, 'email': 'a@example.com', 'tags': ['x', 'y'], 'note': 'say "hi", été'},
+    'source': {'connector': 'yugabytedb', 'db': 'yugabyte', 'schema': 'public', 'table': 'users'},
+    'op': 'u',
+    'ts_ms': 1640995200000,
+    'transaction': None,
+}
+
+
+def encode(value, **kwargs):
+    return json.dumps(value, **kwargs).encode('utf-8')
+
+
+@pytest.fixture(params=['json', 'orjson'])
+def backend(request):
+    """Run each test with the standard library backend and, when installed, orjson"""
+    if request.param == 'orjson':
+        if decoding.orjson is None:
+            pytest.skip("orjson not installed")
+        yield request.param
+    else:
+        with patch.object(decoding, 'orjson', None):
+            yield request.param
+
+
+class TestDecodeEvent:
+    """Test the Kafka value deserializer"""
+
+    @pytest.mark.parametrize('separators', [(',', ':'), (', ', ': ')])
+    def test_decodes_envelope(self, backend, separators):
+        """Test that compact and spaced envelopes decode to the same event"""
+        event = decoding.decode_event(encode(ENVELOPE, separators=separators))
+
+        assert event == ENVELOPE
+        assert isinstance(event, dict)
+
+    def test_keeps_raw_after_text(self):
+        """Test that the stdlib walk keeps the exact text of the row images"""
+        raw = encode(ENVELOPE, separators=(',', ':'))
+        with patch.object(decoding, 'orjson', None):
+            event = decoding.decode_event(raw)
+
+        assert event.raw_after == json.dumps(ENVELOPE['after'], separators=(',', ':'))
+        assert event.raw_before == 'null'
+
+    @pytest.mark.parametrize('indent', [2, '\r\n'])
+    def test_multiline_row_image_not_kept(self, indent):
+        """Test that row images with line breaks are re-encoded rather than reused"""
+        with patch.object(decoding, 'orjson', None):
+            event = decoding.decode_event(encode(ENVELOPE, indent=indent))
+
+        assert event == ENVELOPE
+        assert event.raw_after is None
+        assert event.raw_before == 'null'
+
+    @pytest.mark.parametrize('raw', [b'{}', b'[1, 2]', b'"text"', b'{"op": "c", "source": {}} trailing',
+                                     b'{"o\\u0070": "c"}'])
+    def test_unusual_documents_fall_back(self, backend, raw):
+        """Test that documents the walk cannot handle match json.loads"""
+        try:
+            expected = json.loads(raw)
+        except json.JSONDecodeError:
+            with pytest.raises(json.JSONDecodeError):
+                decoding.decode_event(raw)
+            return
+
+        assert decoding.decode_event(raw) == expected
+
+    @pytest.mark.parametrize('raw', [b'{"op": "c", "after": {"id": }', b'not json', b'{"op": "c",',
+                                     b'{"a":1{"b":2}', b'{"op": "c" {"after": {"id": 1}}'])
+    def test_invalid_json_raises(self, backend, raw):
+        """Test that malformed messages still raise JSONDecodeError"""
+        with pytest.raises(json.JSONDecodeError):
+            decoding.decode_event(raw)
+
+    def test_undecodable_message_kept_for_dead_letters(self, backend):
+        """Test that the consumer deserializer returns bad bytes with the error instead of raising"""
+        raw = b'\xff{"op": "c"'
+        result = decoding.decode_event_or_error(raw)
+
+        assert isinstance(result, decoding.UndecodableMessage)
+        assert result.raw == raw
+        assert result.error
+        assert decoding.decode_event_or_error(encode(ENVELOPE)) == ENVELOPE
+
+
+class TestRawEventData:
+    """Test process_event with decoded envelopes"""
+
+    def test_event_data_reuses_raw_text(self, backend):
+        """Test that event_data carries the original payload JSON"""
+        row = main.process_event(decoding.decode_event(encode(ENVELOPE)))
+
+        assert json.loads(row['event_data']) == ENVELOPE['after']
+        assert row['user_id'] == '7'
+        assert row['user_email'] == 'a@example.com'
+        assert row['source_table'] == 'users'
+
+    def test_pretty_printed_envelope_stays_one_ndjson_line(self, backend, tmp_path):
+        """Test that a pretty-printed envelope's event_data does not break the load file's lines"""
+        from sinks import LoadJobSink
+
+        row = main.process_event(decoding.decode_event(encode(ENVELOPE, indent=2)))
+        sink = LoadJobSink(None, 'marketing_events.user_events', main.get_bigquery_schema(), str(tmp_path))
+        line = sink._ndjson_line(row)
+
+        assert line.count(b'\n') == 1 and line.endswith(b'\n')
+        assert json.loads(line)['event_data'] == ENVELOPE['after']
+
+    def test_delete_with_null_after_uses_before(self, backend):
+        """Test that Debezium deletes (after: null) take the before image"""
+        delete = dict(ENVELOPE, op='d', before=ENVELOPE['after'], after=None)
+        row = main.process_event(decoding.decode_event(encode(delete)))
+
+        assert row['operation'] == 'DELETE'
+        assert json.loads(row['event_data']) == ENVELOPE['after']
+        assert row['user_id'] == '7'
@@ -0,0 +1,91 @@
+"""
+Unit tests for event filtering and column projection
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filtering import EventFilter, load_event_filter, parse_event_filter, table_of_topic
+
+
+def event(table, op='u'):
+    return {'op': op, 'source': {'table': table}, 'after': {'id': 1}}
+
+
+class TestEventFilter:
+    """Test table, op and column decisions"""
+
+    def test_empty_filter_keeps_everything(self):
+        """Test that no config means no filtering and no projection"""
+        event_filter = load_event_filter('')
+        payload = {'id': 1, 'secret': 'x'}
+
+        assert not event_filter
+        assert event_filter.allows_topic('codet.prod.users')
+        assert event_filter.allows_event(event('users', 'r'))
+        assert event_filter.project('users', payload) is payload
+
+    def test_allow_and_deny_tables(self):
+        """Test that topics and events are checked against the allow and deny lists"""
+        event_filter = EventFilter(allow_tables=['users', 'orders'], deny_tables=['orders'])
+
+        assert table_of_topic('codet.prod.users') == 'users'
+        assert event_filter.allows_topic('codet.prod.users')
+        assert not event_filter.allows_topic('codet.prod.orders')
+        assert not event_filter.allows_topic('codet.prod.audit_log')
+        assert not event_filter.allows_event(event('audit_log'))
+
+    def test_ops_global_and_per_table(self):
+        """Test that per-table op lists override the global one"""
+        event_filter = parse_event_filter({'ops': ['c', 'u', 'd'], 'tables': {'users': {'ops': ['c']}}})
+
+        assert event_filter.allows_event(event('orders', 'u'))
+        assert not event_filter.allows_event(event('orders', 'r'))
+        assert event_filter.allows_event(event('users', 'c'))
+        assert not event_filter.allows_event(event('users', 'u'))
+
+    def test_malformed_events_left_to_validation(self):
+        """Test that events without a source or op are not silently filtered"""
+        event_filter = EventFilter(ops=['c'])
+
+        assert event_filter.allows_event({'op': 'u'})
+        assert event_filter.allows_event({'source': {'table': 'users'}})
+        assert event_filter.allows_event('not a dict')
+
+    def test_include_and_exclude_columns(self):
+        """Test per-table column projection"""
+        event_filter = parse_event_filter({'tables': {
+            'users': {'exclude_columns': ['password_hash']},
+            'orders': {'include_columns': ['id', 'total']},
+        }})
+        payload = {'id': 1, 'total': 2.5, 'password_hash': 'x', 'notes': 'long'}
+
+        assert event_filter.projects('users') and not event_filter.projects('events')
+        assert event_filter.project('users', payload) == {'id': 1, 'total': 2.5, 'notes': 'long'}
+        assert event_filter.project('orders', payload) == {'id': 1, 'total': 2.5}
+        assert event_filter.project('events', payload) is payload
+
+    def test_load_from_file(self, tmp_path):
+        """Test that the config loads from a file path"""
+        path = tmp_path / 'filters.json'
+        path.write_text(json.dumps({'deny_tables': ['audit_log']}))
+
+        assert not load_event_filter(str(path)).allows_topic('codet.prod.audit_log')
+
+    @pytest.mark.parametrize('config, message', [
+        ({'deny': ['x']}, 'unknown keys'),
+        ({'allow_tables': 'users'}, 'must be a list'),
+        ({'ops': ['c', 'x']}, 'unknown op codes'),
+        ({'tables': {'users': {'include_columns': ['id'], 'exclude_columns': ['a']}}}, 'both'),
+        ({'tables': []}, 'keyed by source table'),
+    ])
+    def test_invalid_config_rejected(self, config, message):
+        """Test that a bad filter config fails loudly"""
+        with pytest.raises(ValueError, match=message):
+            parse_event_filter(config)
@@ -0,0 +1,113 @@
+"""
+Unit tests for lazy imports and the cold-start import budget
+"""
+
+import os
+import subprocess
+import sys
+from unittest.mock import Mock, patch
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FUNCTION_DIR)
+
+from lazy_imports import LazyModule
+
+# Cumulative `python -X importtime` cost of `import main`, in milliseconds.
+# Importing main currently takes well under 100ms; the client libraries alone cost several seconds.
+IMPORT_TIME_BUDGET_MS = int(os.environ.get('IMPORT_TIME_BUDGET_MS', '250'))
+
+# Modules that must only be imported once an entry point needs them
+HEAVY_MODULES = ('google.cloud.bigquery', 'google.cloud.secretmanager', 'kafka', 'grpc')
+
+
+def measure_import(module: str = 'main'):
+    """Import a module in a fresh interpreter and return (cumulative_ms, imported module names)"""
+    env = {k: v for k, v in os.environ.items() if k != 'GOOGLE_APPLICATION_CREDENTIALS'}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=FUNCTION_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+
+    cumulative_ms = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        name = name.strip()
+        imported.add(name)
+        if name == module:
+            cumulative_ms = int(cumulative) / 1000.0
+    return cumulative_ms, imported
+
+
+class TestLazyModule:
+    """Test deferred imports through the module proxy"""
+
+    def test_imports_on_first_attribute_access(self):
+        """Test that the module is only imported when used"""
+        proxy = LazyModule('json')
+        assert not proxy.loaded
+
+        assert proxy.dumps({'a': 1}) == '{"a": 1}'
+        assert proxy.loaded
+        assert proxy.load() is sys.modules['json']
+
+    def test_missing_module_raises_on_use(self):
+        """Test that a missing dependency surfaces at first use, not at construction"""
+        proxy = LazyModule('module_that_does_not_exist')
+
+        with pytest.raises(ImportError):
+            proxy.anything
+
+    def test_patch_shadows_and_restores_attribute(self):
+        """Test that mock.patch on the proxy replaces and then restores the real attribute"""
+        proxy = LazyModule('json')
+        real_dumps = proxy.dumps
+        replacement = Mock(return_value='patched')
+
+        with patch.object(proxy, 'dumps', replacement):
+            assert proxy.dumps({}) == 'patched'
+
+        assert proxy.dumps is real_dumps
+
+
+class TestColdStart:
+    """Test that importing main stays cheap"""
+
+    def test_import_does_not_load_client_libraries(self):
+        """Test that BigQuery, Secret Manager, Kafka and gRPC are not imported with main"""
+        _, imported = measure_import()
+
+        loaded = sorted(name for name in imported
+                        if any(name == heavy or name.startswith(heavy + '.') for heavy in HEAVY_MODULES))
+        assert loaded == []
+
+    def test_import_time_budget(self):
+        """Test that `import main` stays within the cold-start budget (best of three runs)"""
+        best_ms = min(measure_import()[0] for _ in range(3))
+
+        assert best_ms is not None
+        assert best_ms < IMPORT_TIME_BUDGET_MS, (
+            f"import main took {best_ms:.1f}ms, budget is {IMPORT_TIME_BUDGET_MS}ms"
+        )
+
+    def test_no_clients_constructed_at_import(self):
+        """Test that clients are only created on first use"""
+        import main
+
+        with patch.object(main, 'SECRET_CLIENT', None), \
+                patch.object(main.secretmanager, 'SecretManagerServiceClient') as mock_client_cls:
+            mock_client_cls.assert_not_called()
+
+            first = main.get_secret_client()
+            second = main.get_secret_client()
+
+        assert first is second
+        mock_client_cls.assert_called_once_with()
@@ -8,12 +8,34 @@ import json
 import os
 from unittest.mock import Mock, patch, MagicMock
 from datetime import datetime
+import itertools
 import sys
+import threading
 
 # Add the parent directory to the path so we can import main
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import main
+from routing import parse_routes
+from structured_logging import get_correlation_id
+
+
+def kafka_message(value, topic='codet.prod.users', partition=0, offset=0):
+    """Consumer record stand-in carrying the fields the consumer loop reads"""
+    return Mock(value=value, topic=topic, partition=partition, offset=offset)
+
+
+def serve(consumer, messages, per_poll=None):
+    """Make consumer.poll() return the messages grouped by partition, per_poll at a time, then nothing"""
+    per_poll = per_poll or max(1, len(messages))
+    results = []
+    for start in range(0, len(messages), per_poll):
+        records = {}
+        for message in messages[start:start + per_poll]:
+            records.setdefault((message.topic, message.partition), []).append(message)
+        results.append(records)
+    polls = itertools.chain(results, itertools.repeat({}))
+    consumer.poll.side_effect = lambda **_: next(polls)
 
 
 class TestEnvironmentValidation:
@@ -171,6 +193,88 @@ class TestEventProcessing:
         assert isinstance(result['event_timestamp'], datetime)
 
 
+class TestBatchProcessing:
+    """Test batch-oriented event transformation"""
+    
+    def _events(self):
+        return [
+            {'op': 'c', 'source': {'table': 'users'}, 'after': {'id': 1, 'email': 'a@example.com'}, 'ts_ms': 1640995200000},
+            {'invalid': 'data'},
+            {'op': 'd', 'source': {'table': 'users'}, 'before': {'user_id': 2}, 'ts_ms': 1640995201000},
+            "not a dict",
+            {'op': 'u', 'source': {'table': 'orders'}, 'after': {'id': 3}, 'ts_ms': 'invalid-timestamp'},
+        ]
+    
+    def test_process_events_rows_match_single_event(self):
+        """Test that batch rows match the single-event wrapper"""
+        events = self._events()
+        rows, failed = main.process_events(events)
+        
+        assert failed == 2
+        assert len(rows) == 3
+        for row, event in zip(rows, [events[0], events[2], events[4]]):
+            single = main.process_event(event)
+            for field in ('event_id', 'event_type', 'user_id', 'user_email', 'event_data', 'source_table', 'operation'):
+                assert row[field] == single[field]
+        assert list(rows[0].keys()) == list(main.ROW_FIELDS)
+    
+    def test_event_ids_follow_kafka_position(self):
+        """Test that event IDs come from topic/partition/offset and do not collide on ts_ms"""
+        event = {'op': 'c', 'source': {'table': 'users'}, 'after': {'id': 1}, 'ts_ms': 1640995200000}
+        rows, _ = main.process_events([event, event], positions=[('codet.prod.users', 2, 41), ('codet.prod.users', 2, 42)])
+        
+        assert [row['event_id'] for row in rows] == ['codet.prod.users:2:41', 'codet.prod.users:2:42']
+        assert main.process_event(event, ('codet.prod.users', 2, 41))['event_id'] == 'codet.prod.users:2:41'
+    
+    def test_event_ids_without_position_are_stable(self):
+        """Test that events without a Kafka position get a deterministic, content-based ID"""
+        first = {'op': 'c', 'source': {'table': 'users'}, 'after': {'id': 1}, 'ts_ms': 1640995200000}
+        second = {'op': 'c', 'source': {'table': 'users'}, 'after': {'id': 2}, 'ts_ms': 1640995200000}
+        
+        assert main.process_event(first)['event_id'] == main.process_event(dict(first))['event_id']
+        assert main.process_event(first)['event_id'] != main.process_event(second)['event_id']
+    
+    def test_process_events_reads_clock_once(self):
+        """Test that every row in a batch shares one ingestion timestamp"""
+        rows, _ = main.process_events(self._events())
+        
+        assert len({row['ingested_at'] for row in rows}) == 1
+        assert rows[2]['event_timestamp'] == rows[0]['ingested_at']
+    
+    @patch('main.EVENT_LOG')
+    def test_process_events_logs_one_summary(self, mock_event_log):
+        """Test that rejected events produce a single rate-limited warning per batch"""
+        main.process_events(self._events())
+        
+        assert mock_event_log.warning.call_count == 1
+        assert 'missing_op' in mock_event_log.warning.call_args[0][-1]
+    
+    def test_process_events_columns(self):
+        """Test column-oriented output"""
+        columns, failed = main.process_events(self._events(), output=main.OUTPUT_COLUMNS)
+        
+        assert failed == 2
+        assert set(columns) == set(main.ROW_FIELDS)
+        assert columns['operation'] == ['INSERT', 'DELETE', 'UPDATE']
+        assert columns['environment'] == ['production'] * 3
+    
+    def test_process_events_arrow(self):
+        """Test Arrow record batch output with bulk-built timestamps"""
+        pa = pytest.importorskip('pyarrow')
+        batch, failed = main.process_events(self._events(), output=main.OUTPUT_ARROW)
+        
+        assert isinstance(batch, pa.RecordBatch)
+        assert batch.num_rows == 3
+        assert batch.schema.names == list(main.ROW_FIELDS)
+        assert batch.column('event_timestamp')[0].as_py().isoformat() == '2022-01-01T00:00:00+00:00'
+        assert batch.column('user_id').to_pylist() == ['1', '2', '3']
+    
+    def test_process_events_unknown_output(self):
+        """Test that unknown output formats are rejected"""
+        with pytest.raises(ValueError):
+            main.process_events([], output='xml')
+
+
 class TestBigQueryIntegration:
     """Test BigQuery integration functionality"""
     
@@ -255,7 +359,19 @@ class TestKafkaConfiguration:
         assert config['bootstrap_servers'] == ['test-server:9092']
         assert config['group_id'] == 'test-group'
         assert config['auto_offset_reset'] == 'earliest'
-        assert config['enable_auto_commit'] is True
+        assert config['enable_auto_commit'] is False
+    
+    @patch('main.FETCH_MIN_BYTES', 65536)
+    @patch('main.MAX_PARTITION_FETCH_BYTES', 2097152)
+    @patch('main.RECEIVE_BUFFER_BYTES', 0)
+    def test_get_kafka_config_fetch_tuning(self):
+        """Test that fetch sizing is passed through and a zero receive buffer keeps the OS default"""
+        config = main.get_kafka_config()
+        
+        assert config['fetch_min_bytes'] == 65536
+        assert config['max_partition_fetch_bytes'] == 2097152
+        assert config['fetch_max_wait_ms'] == main.FETCH_MAX_WAIT_MS
+        assert 'receive_buffer_bytes' not in config
     
     @patch('main.get_secret')
     @patch.dict(os.environ, {
@@ -293,6 +409,17 @@ class TestCorrelationLogging:
         
         with pytest.raises(ValueError):
             failing_function()
+    
+    def test_correlation_id_scoped_to_invocation(self):
+        """Test that each invocation gets its own correlation ID, cleared afterwards"""
+        @main.correlation_logger
+        def current_id():
+            return get_correlation_id()
+        
+        first, second = current_id(), current_id()
+        
+        assert first != second
+        assert get_correlation_id() == '-'
 
 
 class TestHealthCheck:
@@ -339,6 +466,962 @@ class TestMainFunction:
         assert result[1] == 500
 
 
+class TestPipelinedConsume:
+    """Test consume_events in pipelined insert mode"""
+    
+    @patch('main.INSERT_WORKERS', 2)
+    @patch('main.MAX_BATCH_SIZE', 2)
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_consume_events_pipelined(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that pipelined mode inserts every batch and reports pipeline stats"""
+        messages = [
+            kafka_message({'op': 'c', 'source': {'table': 'users'}, 'after': {'id': i}, 'ts_ms': 1640995200000 + i}, offset=i)
+            for i in range(5)
+        ]
+        consumer = MagicMock()
+        serve(consumer, messages)
+        mock_consumer_cls.return_value = consumer
+        mock_bq_client.return_value.insert_rows_json.return_value = []
+        
+        body, status = main.consume_events(Mock())
+        
+        assert status == 200
+        assert body['events_processed'] == 5
+        assert body['events_failed'] == 0
+        assert body['pipeline']['batches_inserted'] == 3
+        assert body['pipeline']['rows_inserted'] == 5
+        assert body['batching']['batch_rows'] == [2, 2, 1]
+        # The consumer stays open for the next warm invocation
+        consumer.close.assert_not_called()
+
+
+class TestMetrics:
+    """Test per-stage metrics in the response and the Prometheus export"""
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_invocation_summary_and_export(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that the response summarizes only this invocation and the export covers every stage"""
+        messages = [
+            kafka_message({'op': 'c', 'source': {'table': 'users'}, 'after': {'id': 1}, 'ts_ms': 1640995200000}),
+            kafka_message({'op': 'c'}, topic='codet.prod.orders', offset=1),
+        ]
+        consumer = MagicMock()
+        serve(consumer, messages)
+        mock_consumer_cls.return_value = consumer
+        mock_bq_client.return_value.insert_rows_json.return_value = []
+        main.consume_events(Mock())
+        serve(consumer, messages)
+
+        body, status = main.consume_events(Mock())
+
+        assert status == 200
+        metrics = body['metrics']
+        assert metrics['bi_consumer_events_total'] == {'codet.prod.users,processed': 1, 'codet.prod.orders,failed': 1}
+        assert metrics['bi_consumer_rows_total'] == {'insert_all,written': 1}
+        assert metrics['bi_consumer_transform_seconds']['count'] == 2
+        assert metrics['bi_consumer_insert_seconds']['count'] == 1
+        # ts_ms is years old, so the lag lands in the overflow bucket
+        assert metrics['bi_consumer_event_lag_seconds']['p99'] == main.EVENT_LAG_SECONDS.buckets[-1]
+
+        text, status, headers = main.export_metrics(Mock())
+        assert status == 200
+        assert headers['Content-Type'].startswith('text/plain; version=0.0.4')
+        for stage in ('poll_wait', 'transform', 'batch_fill', 'insert', 'event_lag'):
+            assert f"# TYPE bi_consumer_{stage}_seconds histogram" in text
+        assert 'bi_consumer_insert_seconds_bucket{sink="insert_all",le="+Inf"}' in text
+
+
+class TestWarmInstanceReuse:
+    """Test resource reuse across invocations on a warm instance"""
+    
+    def _consumer(self, messages):
+        consumer = MagicMock()
+        consumer._closed = False
+        serve(consumer, messages)
+        return consumer
+    
+    def _event(self, i):
+        return kafka_message({'op': 'c', 'source': {'table': 'users'}, 'after': {'id': i}, 'ts_ms': 1640995200000 + i}, offset=i)
+    
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_resources_reused_across_invocations(self, mock_bq_client, mock_consumer_cls, mock_create_table,
+                                                 mock_kafka_config, _):
+        """Test that the client, table check and consumer are set up once per instance"""
+        consumer = self._consumer([self._event(1), self._event(2)])
+        mock_consumer_cls.return_value = consumer
+        mock_bq_client.return_value.insert_rows_json.return_value = []
+        
+        first, _ = main.consume_events(Mock())
+        serve(consumer, [self._event(1), self._event(2)])
+        second, _ = main.consume_events(Mock())
+        
+        assert first['events_processed'] == second['events_processed'] == 2
+        assert mock_bq_client.call_count == 1
+        assert mock_create_table.call_count == 1
+        assert mock_kafka_config.call_count == 1
+        assert mock_consumer_cls.call_count == 1
+        consumer.subscribe.assert_called_once()
+        consumer.close.assert_not_called()
+        assert second['warm_resources']['reused'] >= 2
+    
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_failed_consumer_rebuilt(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that a consumer that hit a Kafka error is closed and rebuilt"""
+        broken = self._consumer([])
+        broken.poll.side_effect = main.kafka_errors.KafkaError("broker went away")
+        healthy = self._consumer([self._event(1)])
+        mock_consumer_cls.side_effect = [broken, healthy]
+        mock_bq_client.return_value.insert_rows_json.return_value = []
+        
+        _, status = main.consume_events(Mock())
+        assert status == 500
+        broken.close.assert_called_once()
+        
+        body, status = main.consume_events(Mock())
+        assert status == 200
+        assert body['events_processed'] == 1
+        assert mock_consumer_cls.call_count == 2
+    
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_insert_failure_rechecks_table(self, mock_bq_client, mock_consumer_cls, mock_create_table, *_):
+        """Test that insert failures clear the table-ready memo"""
+        mock_consumer_cls.return_value = self._consumer([self._event(1)])
+        mock_bq_client.return_value.insert_rows_json.return_value = [{'errors': ['notFound']}]
+        
+        main.consume_events(Mock())
+        main.consume_events(Mock())
+        
+        assert mock_create_table.call_count == 2
+    
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.PROJECT_ID', 'test-project')
+    @patch('main.SECRET_CLIENT')
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_auth_failure_invalidates_kafka_secrets(self, mock_bq_client, mock_consumer_cls, mock_secret_client, *_):
+        """Test that rejected credentials are fetched again on the next invocation"""
+        mock_secret_client.access_secret_version.return_value.payload.data.decode.return_value = 'credential'
+        mock_consumer_cls.side_effect = [main.kafka_errors.NoBrokersAvailable(), self._consumer([])]
+        
+        _, status = main.consume_events(Mock())
+        assert status == 500
+        assert mock_secret_client.access_secret_version.call_count == 2
+        
+        body, status = main.consume_events(Mock())
+        assert status == 200
+        assert mock_secret_client.access_secret_version.call_count == 4
+        assert body['secret_cache']['invalidations'] >= 1
+    
+    @patch('main.REUSE_KAFKA_CONSUMER', False)
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_reuse_disabled_closes_consumer(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that REUSE_KAFKA_CONSUMER=false keeps the old close-per-invocation behaviour"""
+        consumer = self._consumer([])
+        mock_consumer_cls.return_value = consumer
+        
+        main.consume_events(Mock())
+        main.consume_events(Mock())
+        
+        assert mock_consumer_cls.call_count == 2
+        assert consumer.close.call_count == 2
+
+
+class TestConsumerGroupWorkers:
+    """Test partition-parallel consumption with several consumer group members"""
+
+    def _consumer(self, topic, messages):
+        consumer = MagicMock()
+        consumer._closed = False
+        serve(consumer, messages)
+        consumer.assignment.return_value = {Mock(topic=topic, partition=0)}
+        return consumer
+
+    def _events(self, table, count):
+        return [
+            kafka_message({'op': 'c', 'source': {'table': table}, 'after': {'id': i}, 'ts_ms': 1640995200000 + i},
+                          topic=f'codet.prod.{table}', offset=i)
+            for i in range(count)
+        ]
+
+    @patch('main.CONSUMER_WORKERS', 3)
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_workers_aggregated_into_response(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that each worker consumes its own partitions and the totals add up"""
+        consumers = [
+            self._consumer('codet.prod.customers', self._events('customers', 5)),
+            self._consumer('codet.prod.orders', self._events('orders', 2)),
+            self._consumer('codet.prod.products', []),
+        ]
+        mock_consumer_cls.side_effect = consumers
+        mock_bq_client.return_value.insert_rows_json.return_value = []
+
+        body, status = main.consume_events(Mock())
+
+        assert status == 200
+        assert body['events_processed'] == 7
+        assert body['events_failed'] == 0
+        assert body['sink']['rows_written'] == 7
+        assert body['sink']['requests'] == 2
+        assert sorted(body['batching']['batch_rows']) == [2, 5]
+        assert sorted(sum((w['partitions'] for w in body['workers']), [])) == [
+            'codet.prod.customers-0', 'codet.prod.orders-0', 'codet.prod.products-0'
+        ]
+        assert sorted(w['events_processed'] for w in body['workers']) == [0, 2, 5]
+        for consumer in consumers:
+            consumer.subscribe.assert_called_once()
+            consumer.close.assert_not_called()
+
+    @patch('main.CONSUMER_WORKERS', 2)
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_failed_worker_fails_invocation(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that a worker's Kafka error returns 500 and only its consumer is rebuilt"""
+        healthy = self._consumer('codet.prod.orders', self._events('orders', 1))
+        broken = self._consumer('codet.prod.customers', [])
+        broken.poll.side_effect = main.kafka_errors.KafkaError("broker went away")
+        consumers = [healthy, broken]
+        mock_consumer_cls.side_effect = lambda **config: consumers.pop(0)
+        mock_bq_client.return_value.insert_rows_json.return_value = []
+
+        _, status = main.consume_events(Mock())
+
+        assert status == 500
+        broken.close.assert_called_once()
+        healthy.close.assert_not_called()
+        # The healthy worker still flushed what it had consumed
+        assert mock_bq_client.return_value.insert_rows_json.call_count == 1
+
+
+class TestDeadlineScheduling:
+    """Test that broker waits and shutdown follow the invocation deadline"""
+
+    def _consumer(self, messages):
+        consumer = MagicMock()
+        consumer._closed = False
+        serve(consumer, messages)
+        return consumer
+
+    @patch('main.BATCH_LINGER_MS', 200)
+    @patch('main.CONSUMER_TIMEOUT_MS', 10000)
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_quiet_topic_flushed_after_linger(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that a lone row is inserted after the linger time instead of the idle timeout"""
+        consumer = self._consumer([kafka_message({'op': 'c', 'source': {'table': 'users'}, 'after': {'id': 1}})])
+        mock_consumer_cls.return_value = consumer
+        mock_bq_client.return_value.insert_rows_json.return_value = []
+
+        body, status = main.consume_events(Mock())
+
+        assert status == 200
+        timeouts = [call.kwargs['timeout_ms'] for call in consumer.poll.call_args_list]
+        # Idle wait, then a wait bounded by the pending row's linger, then idle again
+        assert len(timeouts) == 3
+        assert timeouts[0] > 9000 and timeouts[2] > 9000
+        assert timeouts[1] <= 200
+        assert body['batching']['flush_reasons']['linger'] == 1
+        assert body['sink']['rows_written'] == 1
+
+    @patch('main.CLOUD_FUNCTION_TIMEOUT_MS', 0)
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_no_poll_once_drain_is_due(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that a worker with no time left before its drain phase stops before polling"""
+        consumer = self._consumer([kafka_message({'op': 'c', 'source': {'table': 'users'}, 'after': {'id': 1}})])
+        mock_consumer_cls.return_value = consumer
+
+        body, status = main.consume_events(Mock())
+
+        assert status == 200
+        consumer.poll.assert_not_called()
+        assert body['events_processed'] == 0
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_stop_event_ends_round_and_keeps_consumer(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that a service round stops on its stop event and leaves the consumer open for the next"""
+        consumer = self._consumer([kafka_message({'op': 'c', 'source': {'table': 'users'}, 'after': {'id': 1}})])
+        mock_consumer_cls.return_value = consumer
+        stop_event = threading.Event()
+        stop_event.set()
+
+        body, status = main.run_consumers(main.create_scheduler(60000), stop_event)
+
+        assert status == 200
+        consumer.poll.assert_not_called()
+        consumer.close.assert_not_called()
+        assert body['execution_time_ms'] < 60000
+
+
+class TestPartitionBatches:
+    """Test that each partition's share of a poll is transformed in one pass"""
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_one_transform_per_partition(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test batch transforms keep Kafka order and skip undecodable and invalid messages"""
+        event = lambda i: {'op': 'c', 'source': {'table': 'users'}, 'after': {'id': i}, 'ts_ms': 1640995200000}
+        messages = [
+            kafka_message(event(0), partition=0, offset=10),
+            kafka_message(main.UndecodableMessage(b'{oops', 'bad json'), partition=0, offset=11),
+            kafka_message({'source': {'table': 'users'}}, partition=0, offset=12),
+            kafka_message(event(3), partition=0, offset=13),
+            kafka_message(event(4), partition=1, offset=7),
+        ]
+        consumer = MagicMock()
+        consumer._closed = False
+        serve(consumer, messages)
+        mock_consumer_cls.return_value = consumer
+        insert = mock_bq_client.return_value.insert_rows_json
+        insert.return_value = []
+
+        with patch('main.process_events', wraps=main.process_events) as process_events:
+            body, status = main.consume_events(Mock())
+
+        assert status == 200
+        assert [len(call.args[0]) for call in process_events.call_args_list] == [3, 1]
+        rows = insert.call_args[0][1]
+        assert [json.loads(row['event_data'])['id'] for row in rows] == [0, 3, 4]
+        assert (body['events_processed'], body['events_failed']) == (3, 2)
+        assert body['offsets']['committed'] == {'codet.prod.users-0': 14, 'codet.prod.users-1': 8}
+
+
+class TestTableRouting:
+    """Test that routed source tables go to their own typed tables through their own batches"""
+
+    ROUTES = parse_routes({'orders': {'table': 'orders_changes',
+                                           'columns': {'id': 'INT64', 'total': 'FLOAT64', 'paid': 'BOOL'}}})
+
+    def test_process_events_builds_typed_rows(self):
+        """Test that routed events become typed rows without event_data and others stay as they were"""
+        events = [
+            {'op': 'c', 'source': {'table': 'orders'}, 'after': {'id': '5', 'total': 9.5, 'paid': 1},
+             'ts_ms': 1640995200000},
+            {'op': 'c', 'source': {'table': 'users'}, 'after': {'id': 1}, 'ts_ms': 1640995200000},
+        ]
+        positions = [('codet.prod.orders', 0, 3), ('codet.prod.users', 0, 4)]
+
+        with patch('main.dumps', wraps=main.dumps) as dumps:
+            rows, failed = main.process_events(events, positions=positions, routes=self.ROUTES)
+
+        assert failed == 0
+        assert list(rows[0]) == list(self.ROUTES['orders'].fields)
+        assert (rows[0]['id'], rows[0]['total'], rows[0]['paid']) == (5, 9.5, True)
+        assert rows[0]['event_id'] == 'codet.prod.orders:0:3'
+        assert 'event_data' in rows[1]
+        # Only the unrouted event's payload was serialized
+        assert dumps.call_count == 1
+
+    def test_routed_schema(self):
+        """Test that a route's table keeps the metadata columns and adds its typed columns"""
+        schema = main.get_bigquery_schema(self.ROUTES['orders'])
+
+        assert [field.name for field in schema] == list(self.ROUTES['orders'].fields)
+        assert {field.name: field.field_type for field in schema}['total'] == 'FLOAT64'
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_consume_routes_rows_per_destination(self, mock_bq_client, mock_consumer_cls, mock_create_table, *_):
+        """Test per-destination inserts, table creation and offsets held by either destination's rows"""
+        order = lambda i: {'op': 'u', 'source': {'table': 'orders'}, 'after': {'id': i, 'total': '1.5'},
+                           'ts_ms': 1640995200000}
+        user = lambda i: {'op': 'c', 'source': {'table': 'users'}, 'after': {'id': i}, 'ts_ms': 1640995200000}
+        messages = [
+            kafka_message(user(1), offset=20),
+            kafka_message(order(2), offset=21),
+            kafka_message(user(3), offset=22),
+        ]
+        consumer = MagicMock()
+        consumer._closed = False
+        serve(consumer, messages)
+        mock_consumer_cls.return_value = consumer
+        insert = mock_bq_client.return_value.insert_rows_json
+        # The routed table rejects its insert, so the partition must stay at the order's offset
+        insert.side_effect = lambda table, rows, **_: (
+            [{'index': 0, 'errors': [{'reason': 'backendError'}]}] if table.endswith('orders_changes') else [])
+
+        with patch('main.TABLE_ROUTES', self.ROUTES), patch('main.INSERT_RETRY_MAX_ATTEMPTS', 1):
+            body, status = main.consume_events(Mock())
+
+        assert status == 200
+        mock_create_table.assert_any_call(mock_bq_client.return_value, self.ROUTES['orders'])
+        tables = {call.args[0]: call.args[1] for call in insert.call_args_list}
+        assert [json.loads(row['event_data'])['id'] for row in tables[main.get_table_id()]] == [1, 3]
+        routed = tables[main.get_table_id('orders_changes')]
+        assert [(row['id'], row['total'], row['paid']) for row in routed] == [(2, 1.5, None)]
+        assert 'event_data' not in routed[0]
+        assert body['routes']['orders_changes']['sink']['rows_failed'] == 1
+        assert body['offsets']['committed'] == {'codet.prod.users-0': 21}
+
+
+class TestChangeCoalescing:
+    """Test that opted-in tables' repeated updates are merged before insert"""
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_consume_coalesces_updates(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test merged rows, the reported reduction ratio and offsets past every merged message"""
+        # Both rows belong to user 7; they are keyed on their own ids
+        update = lambda i, version: {'op': 'u', 'source': {'table': 'users'},
+                                     'after': {'id': i, 'user_id': 7, 'v': version}, 'ts_ms': 1640995200000}
+        messages = [kafka_message(update(1, version), offset=30 + version) for version in range(4)]
+        messages.append(kafka_message(update(2, 0), offset=34))
+        consumer = MagicMock()
+        consumer._closed = False
+        serve(consumer, messages)
+        mock_consumer_cls.return_value = consumer
+        insert = mock_bq_client.return_value.insert_rows_json
+        insert.return_value = []
+
+        with patch('main.COALESCE_TABLES', frozenset({'users'})):
+            body, status = main.consume_events(Mock())
+
+        assert status == 200
+        rows = insert.call_args[0][1]
+        assert [(json.loads(row['event_data']), row['change_count']) for row in rows] == [
+            ({'id': 1, 'user_id': 7, 'v': 3}, 4), ({'id': 2, 'user_id': 7, 'v': 0}, 1)]
+        assert not any('_row_key' in row for row in rows)
+        assert body['coalescing'] == {'rows_in': 5, 'rows_out': 2, 'tables': {'users': 3}, 'reduction_ratio': 0.6}
+        assert body['events_processed'] == 5
+        assert body['offsets']['committed'] == {'codet.prod.users-0': 35}
+
+    def test_existing_table_gains_change_count(self):
+        """Test that opting in adds change_count to the schema and to an existing table"""
+        client = Mock()
+        table = Mock()
+        table.schema = main.get_bigquery_schema()
+
+        with patch('main.COALESCE_TABLES', frozenset({'users'})):
+            schema = main.get_bigquery_schema()
+            main.add_missing_columns(client, table, schema)
+
+        assert schema[-1].name == 'change_count'
+        assert [field.name for field in table.schema] == [field.name for field in schema]
+        client.update_table.assert_called_once_with(table, ['schema'])
+
+
+class TestEventFiltering:
+    """Test that filtered tables, ops and columns are dropped before they cost anything"""
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_consume_filters_and_projects(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test denied topics skipped undecoded, ops filtered, columns projected and offsets moved on"""
+        raw = lambda op, table, after: json.dumps({'op': op, 'source': {'table': table}, 'after': after,
+                                                   'ts_ms': 1640995200000}).encode('utf-8')
+        messages = [
+            kafka_message(raw('c', 'audit_log', {'id': 1}), topic='codet.prod.audit_log', offset=5),
+            kafka_message(raw('c', 'users', {'id': 1, 'email': 'a@example.com', 'password_hash': 'x'}), offset=40),
+            kafka_message(raw('r', 'users', {'id': 2}), offset=41),
+            kafka_message(raw('u', 'users', {'id': 3, 'password_hash': 'y'}), offset=42),
+        ]
+        consumer = MagicMock()
+        consumer._closed = False
+        serve(consumer, messages)
+        mock_consumer_cls.return_value = consumer
+        insert = mock_bq_client.return_value.insert_rows_json
+        insert.return_value = []
+        event_filter = main.load_event_filter(json.dumps({
+            'deny_tables': ['audit_log'],
+            'ops': ['c', 'u', 'd'],
+            'tables': {'users': {'exclude_columns': ['password_hash']}},
+        }))
+
+        with patch('main.EVENT_FILTER', event_filter), \
+                patch('main.decode_event_or_error', wraps=main.decode_event_or_error) as decode:
+            body, status = main.consume_events(Mock())
+
+        assert status == 200
+        assert decode.call_count == 3
+        rows = insert.call_args[0][1]
+        assert [json.loads(row['event_data']) for row in rows] == [{'id': 1, 'email': 'a@example.com'}, {'id': 3}]
+        assert (body['events_processed'], body['events_failed'], body['events_filtered']) == (2, 0, 2)
+        assert body['offsets']['committed'] == {'codet.prod.audit_log-0': 6, 'codet.prod.users-0': 43}
+
+
+class TestBackpressure:
+    """Test that partitions pause while the memory budget is exhausted"""
+
+    @patch('main.BATCH_LINGER_MS', 0)
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_pause_until_batches_written(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that an exhausted budget pauses the assignment and a written batch resumes it"""
+        partition = main.kafka.TopicPartition('codet.prod.users', 0)
+        consumer = MagicMock()
+        consumer._closed = False
+        consumer.assignment.return_value = {partition}
+        consumer.paused.return_value = set()
+        messages = [
+            kafka_message(json.dumps({'op': 'c', 'source': {'table': 'users'}, 'after': {'id': i},
+                                      'ts_ms': 1640995200000}).encode('utf-8'), offset=i)
+            for i in range(3)
+        ]
+        serve(consumer, messages)
+        mock_consumer_cls.return_value = consumer
+        insert = mock_bq_client.return_value.insert_rows_json
+        insert.return_value = []
+        budget = main.MemoryBudget(256, on_change=main.BUFFERED_BYTES.set)
+
+        with patch('main.MEMORY_BUDGET', budget):
+            body, status = main.consume_events(Mock())
+
+        assert status == 200
+        consumer.pause.assert_called_once_with(partition)
+        consumer.resume.assert_called_once_with(partition)
+        assert body['events_processed'] == 3
+        assert body['backpressure']['pauses'] == 1
+        assert body['backpressure']['buffered_bytes'] == 0
+        assert body['backpressure']['peak_bytes'] >= 256
+        assert body['metrics']['bi_consumer_buffered_bytes'] == {'total': 0}
+
+
+class TestWriteAhead:
+    """Test that sealed batches are spooled until written and replayed by the next run"""
+
+    def _messages(self, count):
+        return [
+            kafka_message(json.dumps({'op': 'c', 'source': {'table': 'users'}, 'after': {'id': i},
+                                      'ts_ms': 1640995200000}).encode('utf-8'), offset=i)
+            for i in range(count)
+        ]
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_batch_spooled_until_written(self, mock_bq_client, mock_consumer_cls, mock_create_table,
+                                         mock_kafka_config, mock_validate, tmp_path):
+        """Test that a batch is on disk while it is inserted and gone once the insert succeeds"""
+        consumer = MagicMock()
+        serve(consumer, self._messages(2))
+        mock_consumer_cls.return_value = consumer
+        pending_during_insert = []
+        insert = mock_bq_client.return_value.insert_rows_json
+        insert.side_effect = lambda *args, **kwargs: pending_during_insert.append(
+            main.get_write_ahead_spool().pending) or []
+
+        with patch('main.WRITE_AHEAD_DIR', str(tmp_path)):
+            body, status = main.consume_events(Mock())
+
+        assert status == 200
+        assert pending_during_insert == [1]
+        assert body['write_ahead']['batches_spooled'] == 1
+        assert body['write_ahead']['pending_batches'] == 0
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_unfinished_batch_replayed_first(self, mock_bq_client, mock_consumer_cls, mock_create_table,
+                                             mock_kafka_config, mock_validate, tmp_path):
+        """Test that a batch left by a previous run is written before consuming, and not decoded again"""
+        messages = self._messages(3)
+        rows, _ = main.process_events([json.loads(m.value) for m in messages[:2]],
+                                      positions=[(m.topic, m.partition, m.offset) for m in messages[:2]])
+        spool = main.WriteAheadSpool(str(tmp_path))
+        spool.append(rows, positions=[main.row_position(row) for row in rows])
+        spool.close()
+        consumer = MagicMock()
+        serve(consumer, messages)
+        mock_consumer_cls.return_value = consumer
+        insert = mock_bq_client.return_value.insert_rows_json
+        insert.return_value = []
+
+        with patch('main.WRITE_AHEAD_DIR', str(tmp_path)):
+            body, status = main.consume_events(Mock())
+
+        assert status == 200
+        assert [kwargs['row_ids'] for _, kwargs in insert.call_args_list] == [
+            ['codet.prod.users:0:0', 'codet.prod.users:0:1'], ['codet.prod.users:0:2']]
+        assert insert.call_args_list[0][0][1][0]['event_timestamp'] == rows[0]['event_timestamp']
+        assert body['events_processed'] == 1
+        assert body['write_ahead']['replay'] == {'batches_replayed': 1, 'rows_replayed': 2, 'batches_kept': 0}
+        assert body['write_ahead']['events_skipped'] == 2
+        assert body['offsets']['committed'] == {'codet.prod.users-0': 3}
+
+
+class TestBackfill:
+    """Test the backfill entry point: direct assignment, load-job writes and checkpoints"""
+
+    def _request(self, **params):
+        return Mock(args={}, get_json=Mock(return_value=dict({'topics': ['codet.prod.users']}, **params)))
+
+    def _consumer(self, log_end=3):
+        consumer = MagicMock()
+        consumer.partitions_for_topic.return_value = {0}
+        consumer.beginning_offsets.side_effect = lambda tps: {tp: 0 for tp in tps}
+        consumer.end_offsets.side_effect = lambda tps: {tp: log_end for tp in tps}
+        messages = [
+            kafka_message({'op': 'r', 'source': {'table': 'users'}, 'after': {'id': i}, 'ts_ms': 1640995200000 + i},
+                          offset=i)
+            for i in range(log_end + 2)
+        ]
+        serve(consumer, messages)
+        return consumer
+
+    def _sink(self):
+        sink = MagicMock()
+        sink.durable_on_write = False
+        sink.write.return_value = True
+        sink.close.return_value = True
+        sink.stats = {'sink': 'load_job', 'rows_written': 0, 'rows_failed': 0}
+        return sink
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={'group_id': 'marketing-bi-consumer'})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.create_sink')
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_backfill_reads_range_and_resumes(self, mock_bq_client, mock_consumer_cls, mock_create_sink,
+                                              mock_create_table, mock_kafka_config, _, tmp_path):
+        """Test that a backfill reads its range outside the group, loads it and is complete on the next call"""
+        consumer = self._consumer()
+        mock_consumer_cls.return_value = consumer
+        sink = self._sink()
+        mock_create_sink.return_value = sink
+
+        with patch('main.BACKFILL_CHECKPOINT_DIR', str(tmp_path)):
+            body, status = main.backfill_events(self._request(name='rebuild'))
+            again, _ = main.backfill_events(self._request(name='rebuild'))
+            conflict, conflict_status = main.backfill_events(self._request(name='rebuild', start_offset=1))
+
+        assert status == 200
+        assert mock_consumer_cls.call_args.kwargs['group_id'] is None
+        assert mock_create_sink.call_args.kwargs['sink_type'] == main.SINK_LOAD_JOB
+        assert mock_create_sink.call_args.kwargs['staging_subdir'] == 'backfill-rebuild'
+        consumer.assign.assert_called_once_with([main.kafka.TopicPartition('codet.prod.users', 0)])
+        consumer.seek.assert_called_once_with(main.kafka.TopicPartition('codet.prod.users', 0), 0)
+        consumer.subscribe.assert_not_called()
+        consumer.commit.assert_not_called()
+        consumer.pause.assert_called_once_with(main.kafka.TopicPartition('codet.prod.users', 0))
+        # Offsets past the planned end are left alone
+        rows = [row for call in sink.write.call_args_list for row in call.args[0]]
+        assert [row['operation'] for row in rows] == ['READ'] * 3
+        assert body['events_processed'] == 3
+        assert (body['complete'], body['resumed']) == (True, False)
+        assert body['progress'] == {'partitions': 1, 'partitions_done': 1, 'offsets_total': 3, 'offsets_remaining': 0}
+        assert json.loads((tmp_path / 'rebuild.json').read_text())['positions'] == {'codet.prod.users-0': 3}
+        assert (again['complete'], again['resumed'], again['events_processed']) == (True, True, 0)
+        assert conflict_status == 409
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.create_sink')
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_failed_load_keeps_checkpoint(self, mock_bq_client, mock_consumer_cls, mock_create_sink,
+                                          mock_create_table, mock_kafka_config, _, tmp_path):
+        """Test that rows whose load job failed are read again by the next call"""
+        mock_consumer_cls.return_value = self._consumer()
+        sink = self._sink()
+        sink.close.return_value = False
+        mock_create_sink.return_value = sink
+
+        with patch('main.BACKFILL_CHECKPOINT_DIR', str(tmp_path)):
+            body, status = main.backfill_events(self._request(name='rebuild'))
+
+        assert status == 200
+        assert body['complete'] is False
+        assert body['progress']['offsets_remaining'] == 3
+
+    def test_invalid_request(self):
+        """Test that bad parameters are a client error"""
+        body, status = main.backfill_events(Mock(args={'topics': ''}, get_json=Mock(return_value=None)))
+
+        assert status == 400
+        assert 'topic' in body['error']
+
+
+class TestOffsetCommits:
+    """Test that offsets are committed only after their rows are flushed"""
+
+    def _consumer(self, count, partition=0, per_poll=None):
+        consumer = MagicMock()
+        consumer._closed = False
+        messages = [
+            kafka_message({'op': 'c', 'source': {'table': 'users'}, 'after': {'id': i}, 'ts_ms': 1640995200000 + i},
+                          partition=partition, offset=100 + i)
+            for i in range(count)
+        ]
+        serve(consumer, messages, per_poll)
+        return consumer
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_commit_after_successful_flush(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that the final commit covers every inserted row and is reported"""
+        consumer = self._consumer(3)
+        mock_consumer_cls.return_value = consumer
+        mock_bq_client.return_value.insert_rows_json.return_value = []
+
+        body, status = main.consume_events(Mock())
+
+        assert status == 200
+        consumer.commit.assert_called_once_with(offsets={
+            main.kafka.TopicPartition('codet.prod.users', 0): main.kafka.OffsetAndMetadata(103, '')
+        })
+        assert body['offsets']['committed'] == {'codet.prod.users-0': 103}
+        consumer.seek.assert_not_called()
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_failed_batch_not_committed_and_rewound(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that a failed insert keeps its offsets uncommitted and re-reads them next time"""
+        consumer = self._consumer(3)
+        mock_consumer_cls.return_value = consumer
+        mock_bq_client.return_value.insert_rows_json.return_value = [{'errors': ['backendError']}]
+
+        body, status = main.consume_events(Mock())
+
+        assert status == 200
+        assert body['events_failed'] == 3
+        # The group is pinned at the first failed row rather than left to auto_offset_reset
+        assert body['offsets']['committed'] == {'codet.prod.users-0': 100}
+        consumer.seek.assert_called_once_with(main.kafka.TopicPartition('codet.prod.users', 0), 100)
+        assert body['offsets']['failed_partitions'] == ['codet.prod.users-0']
+
+    @patch('main.OFFSET_COMMIT_INTERVAL_MS', 0)
+    @patch('main.MAX_BATCH_SIZE', 2)
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_async_commits_follow_flushed_batches(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that periodic async commits never run ahead of inserted batches"""
+        consumer = self._consumer(5, per_poll=2)
+        consumer.commit_async.side_effect = lambda offsets, callback: callback(offsets, None)
+        mock_consumer_cls.return_value = consumer
+        mock_bq_client.return_value.insert_rows_json.return_value = []
+
+        body, _ = main.consume_events(Mock())
+
+        committed = [list(call.kwargs['offsets'].values())[0].offset for call in consumer.commit_async.call_args_list]
+        # The lingering last row is flushed and committed once the broker has nothing more
+        assert committed == [102, 104, 105]
+        assert body['offsets']['committed'] == {'codet.prod.users-0': 105}
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_revoked_partitions_committed_then_forgotten(self, mock_bq_client, mock_consumer_cls, *_):
+        """Test that a rebalance flushes and commits revoked partitions, which are not committed again"""
+        consumer = self._consumer(3)
+        polls = consumer.poll.side_effect
+        revoked = [main.kafka.TopicPartition('codet.prod.users', 0)]
+
+        def poll(**kwargs):
+            if consumer.poll.call_count == 2:
+                # The group rebalances inside poll() before the buffered rows were inserted
+                listener = consumer.subscribe.call_args.kwargs['listener']
+                assert not mock_bq_client.return_value.insert_rows_json.called
+                listener.on_partitions_revoked(revoked)
+            return polls(**kwargs)
+
+        consumer.poll.side_effect = poll
+        mock_consumer_cls.return_value = consumer
+        mock_bq_client.return_value.insert_rows_json.return_value = []
+
+        with patch('main.BATCH_LINGER_MS', 60000):
+            body, status = main.consume_events(Mock())
+
+        assert status == 200
+        assert isinstance(consumer.subscribe.call_args.kwargs['listener'], main.kafka.ConsumerRebalanceListener)
+        consumer.commit.assert_called_once_with(offsets={
+            main.kafka.TopicPartition('codet.prod.users', 0): main.kafka.OffsetAndMetadata(103, '')
+        })
+        assert body['offsets']['committed'] == {}
+        assert body['events_processed'] == 3
+
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.create_sink')
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_deferred_sink_commits_only_after_close(self, mock_bq_client, mock_consumer_cls, mock_create_sink, *_):
+        """Test that rows written to a load-job style sink stay uncommitted when close fails"""
+        consumer = self._consumer(2)
+        mock_consumer_cls.return_value = consumer
+        sink = MagicMock()
+        sink.durable_on_write = False
+        sink.write.return_value = True
+        sink.close.return_value = False
+        sink.stats = {'sink': 'load_job', 'rows_written': 2, 'rows_failed': 0}
+        mock_create_sink.return_value = sink
+
+        body, _ = main.consume_events(Mock())
+
+        assert body['offsets']['committed'] == {'codet.prod.users-0': 100}
+        consumer.seek.assert_called_once_with(main.kafka.TopicPartition('codet.prod.users', 0), 100)
+
+
+    @patch('main.INSERT_WORKERS', 1)
+    @patch('main.PIPELINE_DRAIN_TIMEOUT_S', 0)
+    @patch('main.validate_environment', return_value=True)
+    @patch('main.get_kafka_config', return_value={})
+    @patch('main.create_bigquery_table_if_not_exists', return_value=True)
+    @patch('main.create_sink')
+    @patch('main.kafka.KafkaConsumer')
+    @patch('main.bigquery.Client')
+    def test_unfinished_drain_rewinds_and_leaves_sinks_open(self, mock_bq_client, mock_consumer_cls,
+                                                            mock_create_sink, *_):
+        """Test that a batch still being inserted after the drain timeout is re-read, not committed past"""
+        consumer = self._consumer(2)
+        mock_consumer_cls.return_value = consumer
+        release = threading.Event()
+        sink = MagicMock()
+        sink.durable_on_write = True
+        sink.write.side_effect = lambda rows: release.wait(5)
+        sink.stats = {'sink': 'insert_all', 'rows_written': 0, 'rows_failed': 0}
+        mock_create_sink.return_value = sink
+
+        try:
+            body, status = main.consume_events(Mock())
+        finally:
+            release.set()
+
+        assert status == 200
+        sink.close.assert_not_called()
+        assert body['offsets']['committed'] == {'codet.prod.users-0': 100}
+        consumer.seek.assert_called_once_with(main.kafka.TopicPartition('codet.prod.users', 0), 100)
+
+
+class TestDeadLetters:
+    """Test dead-lettering of undecodable, invalid and rejected messages and their replay"""
+
+    def _consumer(self):
+        consumer = MagicMock()
+        consumer._closed = False
+        good = {'op': 'c', 'source': {'table': 'users'}, 'after': {'id': 1, 'email': 'a@example.com'},
+                'ts_ms': 1640995200000}
+        messages = [
+            kafka_message(main.decode_event_or_error(b'{"op": "c",'), offset=10),
+            kafka_message({'op': 'c'}, offset=11),
+            kafka_message(good, offset=12),
+            kafka_message(dict(good, after={'id': 2}), offset=13),
+        ]
+        serve(consumer, messages)
+        return consumer
+
+    @pytest.fixture
+    def environment(self, tmp_path):
+        with patch('main.validate_environment', return_value=True), \
+                patch('main.get_kafka_config', return_value={}), \
+                patch('main.create_bigquery_table_if_not_exists', return_value=True), \
+                patch('main.DEAD_LETTER_MODE', 'file'), \
+                patch('main.DEAD_LETTER_SPOOL_DIR', str(tmp_path)), \
+                patch('main.kafka.KafkaConsumer') as mock_consumer_cls, \
+                patch('main.bigquery.Client') as mock_bq_client:
+            yield mock_bq_client, mock_consumer_cls
+
+    def test_failures_spooled_and_replayed(self, environment):
+        """Test that every kind of failure reaches the spool, offsets move past it, and replay loads it"""
+        mock_bq_client, mock_consumer_cls = environment
+        consumer = self._consumer()
+        mock_consumer_cls.return_value = consumer
+        insert = mock_bq_client.return_value.insert_rows_json
+        insert.return_value = [{'index': 1, 'errors': [{'reason': 'invalid', 'message': 'bad email'}]}]
+
+        body, status = main.consume_events(Mock())
+
+        assert status == 200
+        assert body['events_failed'] == 3
+        assert body['dead_letters']['records'] == 3
+        assert body['dead_letters']['by_stage'] == {'decode': 1, 'validate': 1, 'insert': 1}
+        # Dead-lettered messages no longer hold their partition back
+        assert body['offsets']['committed'] == {'codet.prod.users-0': 14}
+
+        insert.reset_mock()
+        insert.return_value = []
+        body, status = main.replay_dead_letters(Mock())
+
+        assert status == 200
+        assert body['replay']['records_replayed'] == 3
+        # Only the rejected row decodes and validates; it keeps its original event_id
+        assert body['rows_written'] == 1
+        assert body['still_failing'] == 2
+        rows = insert.call_args.args[1]
+        assert [row['event_id'] for row in rows] == ['codet.prod.users:0:13']
+        assert json.loads(rows[0]['event_data']) == {'id': 2}
+
+    def test_replay_requires_dead_letter_mode(self):
+        """Test that replay is refused when dead-lettering is disabled"""
+        body, status = main.replay_dead_letters(Mock())
+
+        assert status == 400
+        assert 'not enabled' in body['error']
+
+
 class TestSecurityFeatures:
     """Test security-related functionality"""
     
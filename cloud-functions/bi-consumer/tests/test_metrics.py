@@ -0,0 +1,96 @@
+"""
+Unit tests for the Prometheus-style metrics registry
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import MetricsRegistry
+
+
+class TestExposition:
+    """Test the Prometheus text format"""
+
+    def test_counter_and_histogram_render(self):
+        """Test HELP/TYPE lines, escaped labels, cumulative buckets, _sum and _count"""
+        registry = MetricsRegistry()
+        events = registry.counter('events_total', 'Events seen', ('topic',))
+        latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+        events.inc(2, 'a"b')
+        latency.observe(0.05)
+        latency.observe(0.5)
+        latency.observe(5)
+
+        assert registry.render().splitlines() == [
+            '# HELP events_total Events seen',
+            '# TYPE events_total counter',
+            'events_total{topic="a\\"b"} 2',
+            '# HELP latency_seconds Latency',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1"} 2',
+            'latency_seconds_bucket{le="+Inf"} 3',
+            'latency_seconds_sum 5.55',
+            'latency_seconds_count 3',
+        ]
+
+    def test_gauge_render_and_summary(self):
+        """Test that a gauge renders and summarizes its current value"""
+        registry = MetricsRegistry()
+        buffered = registry.gauge('buffered_bytes', 'Buffered bytes')
+        snapshot = registry.snapshot()
+        buffered.set(512)
+        buffered.inc(-128)
+
+        assert registry.render().splitlines() == [
+            '# HELP buffered_bytes Buffered bytes',
+            '# TYPE buffered_bytes gauge',
+            'buffered_bytes 384',
+        ]
+        assert registry.summary(since=snapshot) == {'buffered_bytes': {'total': 384}}
+
+    def test_registration_is_idempotent(self):
+        """Test that asking for a metric twice returns the same instance"""
+        registry = MetricsRegistry()
+        assert registry.counter('c', 'doc') is registry.counter('c', 'doc')
+
+
+class TestSummary:
+    """Test the per-invocation response summary"""
+
+    def test_quantiles_interpolate_within_buckets(self):
+        """Test p50/p99 estimates follow histogram_quantile"""
+        registry = MetricsRegistry()
+        latency = registry.histogram('latency_seconds', 'Latency', buckets=(1.0, 2.0, 4.0))
+        latency.observe_many([0.5] * 50 + [3.0] * 50)
+
+        summary = registry.summary()['latency_seconds']
+
+        assert summary['count'] == 100
+        assert summary['sum'] == pytest.approx(175.0)
+        assert summary['p50'] == pytest.approx(1.0)
+        assert summary['p99'] == pytest.approx(3.96)
+
+    def test_summary_since_snapshot(self):
+        """Test that only observations made after the snapshot are summarized"""
+        registry = MetricsRegistry()
+        events = registry.counter('events_total', 'Events', ('status',))
+        latency = registry.histogram('latency_seconds', 'Latency', labelnames=('sink',))
+        events.inc(5, 'ok')
+        latency.observe(0.2, 'insert_all')
+        snapshot = registry.snapshot()
+
+        events.inc(1, 'ok')
+        events.inc(1, 'failed')
+        latency.observe(0.3, 'load_job')
+
+        summary = registry.summary(since=snapshot)
+        assert summary['events_total'] == {'failed': 1, 'ok': 1}
+        assert summary['latency_seconds']['count'] == 1
+        assert summary['latency_seconds']['sum'] == pytest.approx(0.3)
+        assert registry.summary()['latency_seconds']['count'] == 2
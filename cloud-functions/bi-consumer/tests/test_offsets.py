@@ -0,0 +1,178 @@
+"""
+Unit tests for commit-after-flush offset tracking
+"""
+
+import os
+import sys
+import threading
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from offsets import OffsetTracker
+
+ORDERS = ('codet.prod.orders', 0)
+USERS = ('codet.prod.users', 1)
+
+
+def consume(tracker, partition, offsets, buffered=True):
+    for offset in offsets:
+        tracker.consumed(partition, offset, buffered=buffered)
+
+
+class TestOffsetTracker:
+    """Test which positions become committable and when"""
+
+    def test_nothing_committable_until_batch_durable(self):
+        """Test that open and in-flight rows hold the position back"""
+        tracker = OffsetTracker()
+        consume(tracker, ORDERS, range(10, 13))
+        assert tracker.committable() == {ORDERS: 10}
+
+        batch = [{}, {}, {}]
+        tracker.seal(batch)
+        assert tracker.committable() == {ORDERS: 10}
+
+        tracker.complete(batch, True)
+        assert tracker.committable() == {ORDERS: 13}
+
+    def test_out_of_order_completion(self):
+        """Test that a later batch finishing first does not move the position past an earlier one"""
+        tracker = OffsetTracker()
+        first, second = [{}], [{}]
+        consume(tracker, ORDERS, [0, 1])
+        tracker.seal(first)
+        consume(tracker, ORDERS, [2, 3])
+        tracker.seal(second)
+
+        tracker.complete(second, True)
+        assert tracker.committable() == {ORDERS: 0}
+
+        tracker.complete(first, True)
+        assert tracker.committable() == {ORDERS: 4}
+
+    def test_failed_batch_pins_only_its_partitions(self):
+        """Test that a failed batch stops its partitions and leaves the others alone"""
+        tracker = OffsetTracker()
+        failed, ok = [{}], [{}]
+        consume(tracker, ORDERS, [5, 6])
+        tracker.seal(failed)
+        consume(tracker, ORDERS, [7])
+        consume(tracker, USERS, [40, 41])
+        tracker.seal(ok)
+
+        tracker.complete(failed, False)
+        tracker.complete(ok, True)
+
+        assert tracker.committable() == {ORDERS: 5, USERS: 42}
+        assert tracker.rewind_positions() == {ORDERS: 5}
+        assert tracker.stats['failed_partitions'] == ['codet.prod.orders-0']
+
+    def test_unfinished_batch_rewound(self):
+        """Test that a batch neither written nor failed is re-read from its first offset"""
+        tracker = OffsetTracker()
+        abandoned = [{}]
+        consume(tracker, ORDERS, [5, 6])
+        tracker.seal(abandoned)
+        consume(tracker, ORDERS, [7])
+        consume(tracker, USERS, [40], buffered=False)
+
+        assert tracker.rewind_positions() == {ORDERS: 5}
+        tracker.complete(abandoned, True)
+        assert tracker.rewind_positions() == {ORDERS: 7}
+
+    def test_dropped_partitions_not_committed_or_rewound(self):
+        """Test that a revoked partition is forgotten, even when a batch holding it fails afterwards"""
+        tracker = OffsetTracker()
+        in_flight = [{}]
+        consume(tracker, ORDERS, [5, 6])
+        consume(tracker, USERS, [40])
+        tracker.seal(in_flight)
+
+        tracker.drop([ORDERS])
+        tracker.complete(in_flight, False)
+
+        assert tracker.committable() == {USERS: 40}
+        assert tracker.rewind_positions() == {USERS: 40}
+
+    def test_unbuffered_messages_do_not_hold_position(self):
+        """Test that messages that produced no row count as handled"""
+        tracker = OffsetTracker()
+        consume(tracker, USERS, [3, 4], buffered=False)
+
+        assert tracker.committable() == {USERS: 5}
+
+    def test_committed_positions_not_offered_again(self):
+        """Test that only positions ahead of the last successful commit are returned"""
+        tracker = OffsetTracker()
+        consume(tracker, USERS, [0], buffered=False)
+        positions = tracker.committable()
+
+        tracker.committed(positions, RuntimeError("coordinator moved"))
+        assert tracker.committable() == positions
+
+        tracker.committed(positions)
+        assert tracker.committable() == {}
+        stats = tracker.stats
+        assert stats['committed'] == {'codet.prod.users-1': 1}
+        assert stats['commits'] == 1
+        assert stats['commit_failures'] == 1
+
+    def test_complete_from_other_threads(self):
+        """Test that insert workers can acknowledge batches concurrently"""
+        tracker = OffsetTracker()
+        batches = []
+        for offset in range(200):
+            tracker.consumed(ORDERS, offset)
+            batch = [{}]
+            tracker.seal(batch)
+            batches.append(batch)
+
+        threads = [threading.Thread(target=lambda part: [tracker.complete(b, True) for b in part], args=(batches[i::4],))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert tracker.committable() == {ORDERS: 200}
+        assert tracker.stats['batches_acked'] == 200
+
+    def test_pin_holds_partition(self):
+        """Test that a pinned message stops its partition like a failed batch"""
+        tracker = OffsetTracker()
+        consume(tracker, USERS, [3, 4, 5], buffered=False)
+        tracker.pin(USERS, 4)
+
+        assert tracker.committable() == {USERS: 4}
+        assert tracker.rewind_positions() == {USERS: 4}
+
+    def test_buffers_seal_independently(self):
+        """Test that sealing one destination's batch leaves another buffer's rows holding the position"""
+        tracker = OffsetTracker()
+        routed, default = [{}], [{}, {}]
+        tracker.consumed(USERS, 0)
+        tracker.consumed(USERS, 1, buffer='users_changes')
+        tracker.consumed(USERS, 2)
+
+        tracker.seal(default)
+        tracker.complete(default, True)
+        assert tracker.committable() == {USERS: 1}
+
+        tracker.seal(routed, 'users_changes')
+        tracker.complete(routed, True)
+        assert tracker.committable() == {USERS: 3}
+
+    def test_rekeyed_batch_stays_in_flight(self):
+        """Test that a batch tracked under a stand-in holds its position until the stand-in completes"""
+        tracker = OffsetTracker()
+        batch = [{}, {}]
+        consume(tracker, USERS, [0, 1])
+        tracker.seal(batch)
+        staged = object()
+        tracker.rekey(batch, staged)
+
+        tracker.complete(batch, True)
+        assert tracker.committable() == {USERS: 0}
+        tracker.complete(staged, True)
+        assert tracker.committable() == {USERS: 2}
@@ -0,0 +1,133 @@
+"""
+Unit tests for the pipelined insert stage
+Tests ordering, backpressure, failure accounting and drain behaviour
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import InsertPipeline
+
+
+class TestInsertPipeline:
+    """Test the bounded insert pipeline"""
+
+    def test_single_worker_preserves_batch_order(self):
+        """Test that one worker inserts batches in submission order"""
+        inserted = []
+        pipeline = InsertPipeline(lambda rows: inserted.append(rows) or True, workers=1)
+
+        for i in range(5):
+            pipeline.submit([{'n': i}])
+        stats = pipeline.drain(timeout=5)
+
+        assert inserted == [[{'n': i}] for i in range(5)]
+        assert stats['batches_inserted'] == 5
+        assert stats['rows_inserted'] == 5
+        assert stats['rows_failed'] == 0
+
+    def test_failed_and_raising_batches_are_counted(self):
+        """Test that failed inserts and worker exceptions count as failed rows"""
+        def insert(rows):
+            if rows[0]['n'] == 1:
+                return False
+            if rows[0]['n'] == 2:
+                raise RuntimeError("boom")
+            return True
+
+        pipeline = InsertPipeline(insert, workers=2)
+        pipeline.submit([{'n': 0}, {'n': 0}])
+        pipeline.submit([{'n': 1}, {'n': 1}, {'n': 1}])
+        pipeline.submit([{'n': 2}])
+        stats = pipeline.drain(timeout=5)
+
+        assert stats['rows_inserted'] == 2
+        assert stats['rows_failed'] == 4
+        assert stats['batches_failed'] == 2
+
+    def test_backpressure_blocks_when_queue_full(self):
+        """Test that submit blocks while workers are busy and the queue is full"""
+        release = threading.Event()
+        pipeline = InsertPipeline(lambda rows: release.wait(5), workers=1, max_pending_batches=1)
+
+        pipeline.submit([{'n': 0}])  # picked up by the worker
+        time.sleep(0.05)
+        pipeline.submit([{'n': 1}])  # fills the queue
+
+        blocked = threading.Thread(target=pipeline.submit, args=([{'n': 2}],))
+        blocked.start()
+        time.sleep(0.05)
+        assert blocked.is_alive()
+
+        release.set()
+        blocked.join(5)
+        stats = pipeline.drain(timeout=5)
+
+        assert stats['backpressure_waits'] == 1
+        assert stats['batches_inserted'] == 3
+
+    def test_drain_timeout_holds_with_full_queue(self):
+        """Test that drain returns on time while the queue is full and the worker is blocked"""
+        release = threading.Event()
+        pipeline = InsertPipeline(lambda rows: release.wait(5), workers=1, max_pending_batches=1)
+        pipeline.submit([{'n': 0}])  # picked up by the worker
+        time.sleep(0.05)
+        pipeline.submit([{'n': 1}])  # fills the queue
+
+        started = time.monotonic()
+        pipeline.drain(timeout=0.1)
+        assert time.monotonic() - started < 1
+        assert pipeline.rows_in_flight == 2
+
+        # Without room for its sentinel the worker still exits once the queue is empty
+        release.set()
+        pipeline.drain(timeout=5)
+        assert pipeline.rows_in_flight == 0
+        assert pipeline.stats['batches_inserted'] == 2
+
+    def test_wait_idle_keeps_workers(self):
+        """Test waiting for in-flight batches without draining the pipeline"""
+        release = threading.Event()
+        pipeline = InsertPipeline(lambda rows: release.wait(5), workers=1)
+        pipeline.submit([{'n': 0}])
+
+        assert pipeline.wait_idle(timeout=0.05) is False
+        release.set()
+        assert pipeline.wait_idle(timeout=5) is True
+        pipeline.submit([{'n': 1}])
+        assert pipeline.drain(timeout=5)['batches_inserted'] == 2
+
+    def test_rows_in_flight(self):
+        """Test that queued and running batches count as in flight until their insert returns"""
+        release = threading.Event()
+        pipeline = InsertPipeline(lambda rows: release.wait(5), workers=1, max_pending_batches=2)
+
+        pipeline.submit([{'n': 0}, {'n': 1}])
+        pipeline.submit([{'n': 2}])
+        assert pipeline.rows_in_flight == 3
+
+        release.set()
+        pipeline.drain(timeout=5)
+        assert pipeline.rows_in_flight == 0
+
+    def test_submit_after_drain_rejected(self):
+        """Test that a drained pipeline refuses new batches"""
+        pipeline = InsertPipeline(lambda rows: True, workers=1)
+        pipeline.drain(timeout=5)
+
+        with pytest.raises(RuntimeError):
+            pipeline.submit([{'n': 0}])
+
+    def test_invalid_configuration(self):
+        """Test that invalid worker and queue sizes are rejected"""
+        with pytest.raises(ValueError):
+            InsertPipeline(lambda rows: True, workers=0)
+        with pytest.raises(ValueError):
+            InsertPipeline(lambda rows: True, max_pending_batches=0)
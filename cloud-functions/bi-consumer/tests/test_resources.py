@@ -0,0 +1,84 @@
+"""
+Unit tests for the warm-instance resource registry
+"""
+
+import os
+import sys
+from unittest.mock import Mock
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resources import ResourceRegistry
+
+
+class TestResourceRegistry:
+    """Test lazy creation, reuse, health checks and invalidation"""
+
+    def test_created_once_and_reused(self):
+        """Test that the factory runs only on first use"""
+        registry = ResourceRegistry()
+        factory = Mock(side_effect=lambda: object())
+
+        first = registry.get('client', factory)
+        second = registry.get('client', factory)
+
+        assert first is second
+        assert factory.call_count == 1
+        assert registry.stats['created'] == 1
+        assert registry.stats['reused'] == 1
+
+    def test_unhealthy_resource_rebuilt_and_closed(self):
+        """Test that a failed health check closes and replaces the resource"""
+        registry = ResourceRegistry()
+        close = Mock()
+        healthy = {'value': True}
+
+        first = registry.get('consumer', object, health_check=lambda r: healthy['value'], close=close)
+        healthy['value'] = False
+        second = registry.get('consumer', object, health_check=lambda r: healthy['value'], close=close)
+
+        assert first is not second
+        close.assert_called_once_with(first)
+        assert registry.stats['rebuilt'] == 1
+
+    def test_raising_health_check_counts_as_unhealthy(self):
+        """Test that a health check exception triggers a rebuild"""
+        registry = ResourceRegistry()
+        registry.get('client', object)
+
+        def broken(resource):
+            raise RuntimeError("connection reset")
+
+        registry.get('client', object, health_check=broken)
+        assert registry.stats['rebuilt'] == 1
+
+    def test_invalidate_closes_and_clears_ready_flag(self):
+        """Test that invalidation drops the resource and its readiness memo"""
+        registry = ResourceRegistry()
+        close = Mock()
+        registry.get('table', object, close=close)
+        registry.mark_ready('table')
+
+        registry.invalidate('table')
+
+        close.assert_called_once()
+        assert registry.peek('table') is None
+        assert registry.is_ready('table') is False
+
+    def test_close_errors_are_swallowed(self):
+        """Test that a failing close does not break invalidation"""
+        registry = ResourceRegistry()
+        registry.get('client', object, close=Mock(side_effect=RuntimeError("already closed")))
+
+        registry.invalidate('client')
+        assert registry.peek('client') is None
+
+    def test_ready_memo(self):
+        """Test readiness flags"""
+        registry = ResourceRegistry()
+        assert registry.is_ready('table') is False
+        registry.mark_ready('table')
+        assert registry.is_ready('table') is True
+        registry.mark_ready('table', False)
+        assert registry.is_ready('table') is False
@@ -0,0 +1,82 @@
+"""
+Unit tests for the insert retry engine
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retry import RetryBudget, RetryPolicy, is_retryable_exception, is_retryable_reason
+
+
+class HttpError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class TestRetryClassification:
+    """Test which failures are worth another attempt"""
+
+    def test_row_reasons(self):
+        """Test that only rows whose every error is transient are retried"""
+        assert is_retryable_reason(['backendError'])
+        assert is_retryable_reason(['stopped'])
+        assert not is_retryable_reason(['invalid'])
+        assert not is_retryable_reason(['stopped', 'invalid'])
+        assert not is_retryable_reason([])
+
+    def test_request_errors(self):
+        """Test that throttling and server errors are retried but client errors are not"""
+        assert is_retryable_exception(HttpError(503))
+        assert is_retryable_exception(HttpError(429))
+        assert is_retryable_exception(ConnectionError())
+        assert not is_retryable_exception(HttpError(400))
+        assert not is_retryable_exception(HttpError(404))
+        assert not is_retryable_exception(ValueError())
+
+
+class TestRetryPolicy:
+    """Test backoff, attempt limits and the shared budget"""
+
+    def test_backoff_is_jittered_and_capped(self):
+        """Test that delays stay within the exponential ceiling and never exceed the cap"""
+        policy = RetryPolicy(base_delay_ms=100, max_delay_ms=1000, rng=random.Random(7))
+
+        for attempt, ceiling in [(1, 0.1), (2, 0.2), (3, 0.4), (4, 0.8), (5, 1.0), (10, 1.0)]:
+            delays = [policy.backoff_s(attempt) for _ in range(200)]
+            assert all(0 <= delay <= ceiling for delay in delays)
+            assert len(set(delays)) > 100
+
+    def test_attempt_limit(self):
+        """Test that retries stop once max_attempts have been made"""
+        sleeps = []
+        policy = RetryPolicy(max_attempts=3, sleep=sleeps.append)
+
+        assert policy.allow_retry(1)
+        assert policy.allow_retry(2)
+        assert not policy.allow_retry(3)
+        assert len(sleeps) == 2
+
+    def test_budget_shared_across_policies(self):
+        """Test that every writer draws on the same per-invocation budget"""
+        budget = RetryBudget(3)
+        first = RetryPolicy(budget=budget, sleep=lambda _: None)
+        second = RetryPolicy(budget=budget, sleep=lambda _: None)
+
+        assert first.allow_retry(1)
+        assert second.allow_retry(1)
+        assert first.allow_retry(2)
+        assert not second.allow_retry(2)
+        assert budget.stats == {'retries': 3, 'retries_denied': 1}
+        assert first.stats['budget_remaining'] == 0
+
+    def test_rejects_zero_attempts(self):
+        """Test that at least one attempt is required"""
+        with pytest.raises(ValueError):
+            RetryPolicy(max_attempts=0)
@@ -0,0 +1,99 @@
+"""
+Unit tests for per-table routing
+"""
+
+import json
+import os
+import sys
+from datetime import date, datetime
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routing import METADATA_FIELDS, Route, load_routes, parse_routes
+
+USERS_ROUTE = {
+    'users': {
+        'table': 'users_changes',
+        'columns': {'id': 'INT64', 'email': 'string', 'active': 'BOOL', 'created_at': 'TIMESTAMP'},
+    }
+}
+
+
+class TestRoute:
+    """Test typed column projection"""
+
+    def test_project_converts_values(self):
+        """Test that payload values are converted to their column types"""
+        route = parse_routes(USERS_ROUTE)['users']
+        values, failed = route.project({'id': '7', 'email': 'a@example.com', 'active': 'true',
+                                        'created_at': 1640995200000000, 'ignored': 'x'})
+
+        assert failed == 0
+        assert values == {'id': 7, 'email': 'a@example.com', 'active': True,
+                          'created_at': datetime(2022, 1, 1)}
+
+    def test_timestamp_units_and_text(self):
+        """Test that epoch seconds, milliseconds, microseconds and ISO text all convert"""
+        route = Route('t', 'dest', {'at': 'TIMESTAMP', 'day': 'DATE'})
+        expected = datetime(2022, 1, 1)
+        for value in (1640995200, 1640995200000, 1640995200000000, '2022-01-01T00:00:00Z',
+                      '2022-01-01T01:00:00+01:00'):
+            assert route.project({'at': value, 'day': 18993})[0] == {'at': expected, 'day': date(2022, 1, 1)}
+
+    def test_unconvertible_value_becomes_null(self):
+        """Test that a bad value is written as NULL and counted instead of failing the row"""
+        route = parse_routes(USERS_ROUTE)['users']
+        values, failed = route.project({'id': 'seven', 'active': 'maybe'})
+
+        assert failed == 2
+        assert values == {'id': None, 'email': None, 'active': None, 'created_at': None}
+
+    def test_fields_keep_metadata_and_optional_event_data(self):
+        """Test the destination column order, with and without event_data"""
+        route = Route('users', 'users_changes', {'id': 'INT64'})
+        assert route.fields == METADATA_FIELDS[:5] + ('id',) + METADATA_FIELDS[5:]
+
+        route = Route('users', 'users_changes', {'id': 'INT64'}, keep_event_data=True)
+        assert 'event_data' in route.fields
+
+
+class TestRouteConfig:
+    """Test parsing and validation of the routing config"""
+
+    def test_empty_config_means_no_routes(self):
+        """Test that an unset config routes nothing"""
+        assert load_routes('') == {}
+        assert load_routes('  ') == {}
+
+    def test_load_inline_and_from_file(self, tmp_path):
+        """Test that routes load from inline JSON and from a file path"""
+        path = tmp_path / 'routes.json'
+        path.write_text(json.dumps(USERS_ROUTE))
+
+        for value in (json.dumps(USERS_ROUTE), str(path)):
+            routes = load_routes(value)
+            assert list(routes) == ['users']
+            assert routes['users'].table == 'users_changes'
+            assert routes['users'].columns['email'] == 'STRING'
+
+    @pytest.mark.parametrize('config, message', [
+        ({'users': {'columns': {'id': 'INT64'}}}, 'needs a destination table'),
+        ({'users': {'table': 'u', 'columns': {}}}, 'has no columns'),
+        ({'users': {'table': 'u', 'columns': {'operation': 'STRING'}}}, 'reserved column names'),
+        ({'users': {'table': 'u', 'columns': {'id': 'GEOGRAPHY'}}}, 'unsupported column types'),
+        ({'users': {'table': 'u', 'columns': {'id': 'INT64'}},
+          'orders': {'table': 'u', 'columns': {'id': 'INT64'}}}, 'both routed to u'),
+        ([], 'JSON object'),
+    ])
+    def test_invalid_config_rejected(self, config, message):
+        """Test that a bad routing config fails loudly"""
+        with pytest.raises(ValueError, match=message):
+            parse_routes(config)
+
+    def test_invalid_json_rejected(self):
+        """Test that malformed JSON is reported as a config error"""
+        with pytest.raises(ValueError, match='not valid JSON'):
+            load_routes('{"users": ')
@@ -0,0 +1,120 @@
+"""
+Unit tests for the consumer group runner
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from runner import ConsumerGroupRunner, merge_stats
+
+
+class TestMergeStats:
+    """Test aggregation of per-worker stats"""
+
+    def test_numbers_sum_and_nested_dicts_merge(self):
+        """Test that counters add up, nested dicts merge and lists concatenate"""
+        merged = merge_stats([
+            {'events_processed': 3, 'sink': {'sink': 'insert_all', 'requests': 1}, 'batch_rows': [3]},
+            {'events_processed': 4, 'sink': {'sink': 'insert_all', 'requests': 2}, 'batch_rows': [2, 2]},
+        ])
+
+        assert merged == {
+            'events_processed': 7,
+            'sink': {'sink': 'insert_all', 'requests': 3},
+            'batch_rows': [3, 2, 2],
+        }
+
+    def test_gauges_take_the_maximum(self):
+        """Test that depth and target gauges are not summed"""
+        merged = merge_stats([{'max_queue_depth': 2, 'target_bytes': 100}, {'max_queue_depth': 5, 'target_bytes': 50}])
+
+        assert merged == {'max_queue_depth': 5, 'target_bytes': 100}
+
+    def test_positions_take_the_maximum(self):
+        """Test that a partition reported by two workers keeps its furthest committed position"""
+        merged = merge_stats([
+            {'offsets': {'commits': 2, 'committed': {'codet.prod.users-0': 120, 'codet.prod.users-1': 7}}},
+            {'offsets': {'commits': 1, 'committed': {'codet.prod.users-0': 150}}},
+        ])
+
+        assert merged == {'offsets': {'commits': 3, 'committed': {'codet.prod.users-0': 150,
+                                                                  'codet.prod.users-1': 7}}}
+
+    def test_single_worker_is_copied(self):
+        """Test that merging one worker's stats returns an equal, independent dict"""
+        stats = {'batching': {'batch_rows': [1]}}
+        merged = merge_stats([stats])
+
+        merged['batching']['batch_rows'].append(2)
+        assert stats == {'batching': {'batch_rows': [1]}}
+
+
+class TestConsumerGroupRunner:
+    """Test starting, stopping and collecting consumer workers"""
+
+    def test_results_in_worker_order(self):
+        """Test that every worker runs once on its own thread"""
+        threads = set()
+
+        def worker_fn(worker, stop_event):
+            threads.add(threading.current_thread().name)
+            return {'worker': worker}
+
+        results = ConsumerGroupRunner(worker_fn, workers=3).run()
+
+        assert results == [{'worker': 0}, {'worker': 1}, {'worker': 2}]
+        assert threads == {'consumer-worker-0', 'consumer-worker-1', 'consumer-worker-2'}
+
+    def test_failure_stops_other_workers_and_is_raised(self):
+        """Test that one failing worker makes the others wind down before the error surfaces"""
+        stopped = []
+
+        def worker_fn(worker, stop_event):
+            if worker == 0:
+                raise RuntimeError("broker went away")
+            assert stop_event.wait(timeout=5)
+            stopped.append(worker)
+            return {'worker': worker}
+
+        with pytest.raises(RuntimeError, match="broker went away"):
+            ConsumerGroupRunner(worker_fn, workers=3).run()
+        assert sorted(stopped) == [1, 2]
+
+    def test_stop_ends_all_workers(self):
+        """Test that stop() is seen by every worker"""
+        started = threading.Barrier(3)
+
+        def worker_fn(worker, stop_event):
+            started.wait(timeout=5)
+            return {'stopped': stop_event.wait(timeout=5)}
+
+        runner = ConsumerGroupRunner(worker_fn, workers=2)
+        thread = threading.Thread(target=lambda: setattr(runner, 'results', runner.run()))
+        thread.start()
+        started.wait(timeout=5)
+        runner.stop()
+        thread.join(timeout=5)
+
+        assert runner.results == [{'stopped': True}, {'stopped': True}]
+
+    def test_external_stop_event_stops_workers(self):
+        """Test that setting the stop_event passed to run() stops the workers, e.g. on SIGTERM"""
+        shutdown = threading.Event()
+
+        def worker_fn(worker, stop_event):
+            if worker == 0:
+                shutdown.set()
+            return {'stopped': stop_event.wait(timeout=5)}
+
+        assert ConsumerGroupRunner(worker_fn, workers=2).run(shutdown) == [{'stopped': True}, {'stopped': True}]
+
+    def test_rejects_zero_workers(self):
+        """Test that at least one worker is required"""
+        with pytest.raises(ValueError):
+            ConsumerGroupRunner(lambda worker, stop_event: {}, workers=0)
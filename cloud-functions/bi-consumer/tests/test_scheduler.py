@@ -0,0 +1,59 @@
+"""
+Unit tests for the invocation deadline scheduler
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import DeadlineScheduler
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDeadlineScheduler:
+    """Test the drain reserve and broker wait budgets"""
+
+    def test_drain_reserve_scales_with_rows_in_flight(self):
+        """Test that more buffered rows start the drain phase earlier, up to the cap"""
+        scheduler = DeadlineScheduler(60000, drain_base_ms=5000, drain_per_row_ms=2, clock=FakeClock())
+
+        assert scheduler.drain_reserve_s(0) == pytest.approx(5.0)
+        assert scheduler.drain_reserve_s(1000) == pytest.approx(7.0)
+        # Never more than half the invocation
+        assert scheduler.drain_reserve_s(10 ** 6) == pytest.approx(30.0)
+
+    def test_should_drain(self):
+        """Test that consuming stops once only the reserve is left"""
+        clock = FakeClock()
+        scheduler = DeadlineScheduler(60000, drain_base_ms=5000, drain_per_row_ms=2, clock=clock)
+
+        clock.now += 52.0
+        assert not scheduler.should_drain(0)
+        assert scheduler.should_drain(2000)
+        clock.now += 3.0
+        assert scheduler.should_drain(0)
+        assert scheduler.stats == {'elapsed_ms': 55000, 'remaining_ms': 5000}
+
+    def test_poll_timeout_bounded_by_linger_idle_and_drain(self):
+        """Test that a broker wait ends at the earliest of the three"""
+        clock = FakeClock()
+        scheduler = DeadlineScheduler(60000, drain_base_ms=5000, drain_per_row_ms=0, clock=clock)
+
+        assert scheduler.poll_timeout_s(idle_remaining_s=10.0) == pytest.approx(10.0)
+        assert scheduler.poll_timeout_s(linger_remaining_s=0.25, idle_remaining_s=10.0) == pytest.approx(0.25)
+        clock.now += 53.0
+        assert scheduler.poll_timeout_s(idle_remaining_s=10.0) == pytest.approx(2.0)
+        assert scheduler.poll_timeout_s(idle_remaining_s=-1.0) == 0.0
@@ -0,0 +1,163 @@
+"""
+Unit tests for the in-process secret cache
+Tests TTLs, single-flight loads, stale-while-revalidate and invalidation
+"""
+
+import os
+import sys
+import threading
+import time
+from unittest.mock import Mock
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from secret_cache import SecretCache
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+class TestSecretCache:
+    """Test secret caching behaviour"""
+
+    def test_hit_after_miss(self):
+        """Test that a second lookup is served from memory"""
+        loader = Mock(return_value='s3cr3t')
+        cache = SecretCache(loader, clock=FakeClock())
+
+        assert cache.get('kafka-password') == 's3cr3t'
+        assert cache.get('kafka-password') == 's3cr3t'
+
+        loader.assert_called_once_with('kafka-password')
+        assert cache.stats['misses'] == 1
+        assert cache.stats['hits'] == 1
+
+    def test_expired_entry_reloaded(self):
+        """Test that entries past the stale window are loaded synchronously"""
+        clock = FakeClock()
+        loader = Mock(side_effect=['v1', 'v2'])
+        cache = SecretCache(loader, ttl_s=10, stale_ttl_s=20, clock=clock)
+
+        assert cache.get('name') == 'v1'
+        clock.now += 25
+        assert cache.get('name') == 'v2'
+        assert cache.stats['misses'] == 2
+
+    def test_stale_while_revalidate(self):
+        """Test that stale values are served while one background refresh runs"""
+        clock = FakeClock()
+        release = threading.Event()
+        values = iter(['v1', 'v2'])
+
+        def loader(name):
+            value = next(values)
+            if value == 'v2':
+                release.wait(2)
+            return value
+
+        cache = SecretCache(loader, ttl_s=10, stale_ttl_s=100, clock=clock)
+        cache.get('name')
+        clock.now += 50
+
+        assert cache.get('name') == 'v1'
+        assert cache.get('name') == 'v1'
+        assert cache.stats['stale_hits'] == 2
+
+        release.set()
+        wait_for(lambda: cache.stats['refreshes'] == 1)
+        assert cache.get('name') == 'v2'
+
+    def test_failed_refresh_keeps_stale_value(self):
+        """Test that a refresh returning nothing leaves the old secret in place"""
+        clock = FakeClock()
+        cache = SecretCache(Mock(side_effect=['v1', None]), ttl_s=10, stale_ttl_s=100, clock=clock)
+        cache.get('name')
+        clock.now += 50
+
+        assert cache.get('name') == 'v1'
+        wait_for(lambda: cache.stats['refreshes'] == 1)
+        assert cache.stats['refresh_failures'] == 1
+        assert cache.get('name') == 'v1'
+
+    def test_single_flight(self):
+        """Test that concurrent misses share one lookup"""
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def loader(name):
+            calls.append(name)
+            started.set()
+            release.wait(2)
+            return 'value'
+
+        cache = SecretCache(loader)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('name'))) for _ in range(5)]
+        threads[0].start()
+        started.wait(2)
+        for thread in threads[1:]:
+            thread.start()
+        wait_for(lambda: cache.stats['coalesced'] >= 4)
+        release.set()
+        for thread in threads:
+            thread.join(2)
+
+        assert calls == ['name']
+        assert results == ['value'] * 5
+
+    def test_negative_results_cached_briefly(self):
+        """Test that missing secrets are cached for the negative TTL"""
+        clock = FakeClock()
+        loader = Mock(return_value=None)
+        cache = SecretCache(loader, negative_ttl_s=5, clock=clock)
+
+        assert cache.get('missing') is None
+        assert cache.get('missing') is None
+        assert loader.call_count == 1
+
+        clock.now += 6
+        cache.get('missing')
+        assert loader.call_count == 2
+
+    def test_invalidate(self):
+        """Test that invalidated secrets are fetched again"""
+        loader = Mock(side_effect=['old', 'new', 'other'])
+        cache = SecretCache(loader)
+        cache.get('kafka-password')
+
+        cache.invalidate('kafka-password')
+
+        assert cache.get('kafka-password') == 'new'
+        assert cache.stats['invalidations'] == 1
+
+    def test_invalidation_during_load_not_cached(self):
+        """Test that a load racing an invalidation does not repopulate the cache"""
+        cache = None
+
+        def loader(name):
+            if loader.calls == 0:
+                cache.invalidate(name)
+            loader.calls += 1
+            return f"v{loader.calls}"
+
+        loader.calls = 0
+        cache = SecretCache(loader)
+
+        assert cache.get('name') == 'v1'
+        assert cache.get('name') == 'v2'
@@ -0,0 +1,143 @@
+"""
+Unit tests for the streaming service mode
+"""
+
+import json
+import os
+import sys
+import urllib.request
+from urllib.error import HTTPError
+from unittest.mock import patch
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import service
+from structured_logging import get_correlation_id
+
+
+def ok_round(processed=3):
+    return {'status': 'success', 'events_processed': processed, 'events_failed': 1, 'execution_time_ms': 5}, 200
+
+
+class TestConsumerService:
+    """Test the round loop"""
+
+    def test_rounds_run_until_stopped(self):
+        """Test that rounds repeat with the service's stop event and round budget until stop()"""
+        consumer_service = service.ConsumerService(round_ms=30000)
+        calls = []
+
+        def run_consumers(scheduler, stop_event):
+            calls.append((scheduler.deadline - scheduler.started, stop_event, get_correlation_id()))
+            if len(calls) == 3:
+                consumer_service.stop()
+            return ok_round()
+
+        with patch('main.run_consumers', side_effect=run_consumers):
+            consumer_service.run()
+
+        assert len(calls) == 3
+        assert all(budget == pytest.approx(30.0) and stop is consumer_service.stop_event for budget, stop, _ in calls)
+        # Every round logs under its own correlation ID
+        assert len({correlation_id for _, _, correlation_id in calls}) == 3
+        assert consumer_service.stats == {'rounds': 3, 'failed_rounds': 0, 'events_processed': 9,
+                                          'events_failed': 3}
+
+    def test_failed_rounds_back_off(self):
+        """Test that failing rounds wait with doubling backoff instead of spinning"""
+        consumer_service = service.ConsumerService(error_backoff_s=1.0, max_backoff_s=3.0)
+        waits = []
+
+        def wait(timeout):
+            waits.append(timeout)
+            if len(waits) == 4:
+                consumer_service.stop_event.set()
+            return consumer_service.stop_event.is_set()
+
+        with patch('main.run_consumers', return_value=({'error': 'Kafka error'}, 500)), \
+                patch.object(consumer_service.stop_event, 'wait', side_effect=wait):
+            consumer_service.run()
+
+        assert waits == [1.0, 2.0, 3.0, 3.0]
+        assert consumer_service.stats['failed_rounds'] == 4
+
+    def test_round_exception_counts_as_failure(self):
+        """Test that an unexpected exception fails the round without killing the service"""
+        consumer_service = service.ConsumerService()
+        with patch('main.run_consumers', side_effect=RuntimeError('boom')):
+            assert consumer_service.run_round() is False
+        assert consumer_service.stats['failed_rounds'] == 1
+
+    def test_health_is_cached(self):
+        """Test that probes within the cache window reuse one health check"""
+        consumer_service = service.ConsumerService(health_cache_s=60)
+        with patch('main.health_check', return_value=({'status': 'healthy'}, 200)) as health_check:
+            consumer_service.health()
+            consumer_service.health()
+
+        assert health_check.call_count == 1
+
+
+class TestHttpEndpoints:
+    """Test the probe and metrics endpoints"""
+
+    def _get(self, server, path):
+        url = f"http://127.0.0.1:{server.server_address[1]}{path}"
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                return response.status, response.headers['Content-Type'], response.read().decode('utf-8')
+        except HTTPError as e:
+            return e.code, e.headers['Content-Type'], e.read().decode('utf-8')
+
+    def test_endpoints(self):
+        """Test /livez, /healthz, /metrics and unknown paths"""
+        consumer_service = service.ConsumerService()
+        server = service.start_http_server(consumer_service, port=0)
+        try:
+            with patch('main.health_check', return_value=({'status': 'unhealthy'}, 503)):
+                status, _, body = self._get(server, '/healthz')
+                assert (status, json.loads(body)['status']) == (503, 'unhealthy')
+
+            status, _, body = self._get(server, '/livez')
+            assert (status, json.loads(body)['status']) == (200, 'live')
+
+            status, content_type, body = self._get(server, '/metrics')
+            assert status == 200
+            assert content_type.startswith('text/plain; version=0.0.4')
+            assert '# TYPE bi_consumer_service_rounds_total counter' in body
+
+            assert self._get(server, '/nope')[0] == 404
+        finally:
+            server.shutdown()
+
+    def test_replay_dead_letters(self):
+        """Test that POST /replay-dead-letters runs one replay at a time"""
+        consumer_service = service.ConsumerService()
+        server = service.start_http_server(consumer_service, port=0)
+        url = f"http://127.0.0.1:{server.server_address[1]}/replay-dead-letters"
+        try:
+            with patch('main.replay_dead_letters', return_value=({'status': 'success'}, 200)) as replay:
+                with urllib.request.urlopen(urllib.request.Request(url, data=b'', method='POST'), timeout=5) as response:
+                    assert (response.status, json.loads(response.read())['status']) == (200, 'success')
+                replay.assert_called_once()
+
+                consumer_service._replay_lock.acquire()
+                with pytest.raises(HTTPError) as busy:
+                    urllib.request.urlopen(urllib.request.Request(url, data=b'', method='POST'), timeout=5)
+                assert busy.value.code == 409
+                replay.assert_called_once()
+        finally:
+            server.shutdown()
+
+    def test_stuck_round_fails_liveness(self):
+        """Test that a round running far past its budget reports the service as stuck"""
+        consumer_service = service.ConsumerService(round_ms=1000, max_backoff_s=1.0)
+        consumer_service._round_started = 0.0
+
+        with patch('service.time.monotonic', return_value=2.5):
+            assert consumer_service.live()
+        with patch('service.time.monotonic', return_value=3.5):
+            assert not consumer_service.live()
@@ -0,0 +1,478 @@
+"""
+Unit tests for the BigQuery sinks
+Runs both backends against local fakes and compares their payload size
+(benchmarks/bench_sinks.py measures throughput)
+"""
+
+import gzip
+import json
+import os
+import sys
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+import pytest
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from retry import RetryBudget, RetryPolicy
+from sinks import (
+    LOAD_FORMAT_PARQUET, STREAM_TYPE_COMMITTED, STREAM_TYPE_PENDING,
+    InsertAllSink, LoadJobSink, StorageWriteSink, build_row_message_class,
+)
+
+TABLE_PATH = 'projects/test-project/datasets/marketing_events/tables/user_events'
+
+
+class FakeAppendRowsStream:
+    """Local stand-in for writer.AppendRowsStream that records every request"""
+
+    def __init__(self, client, template):
+        self.client = client
+        self.template = template
+        self.requests = []
+        self.closed = False
+
+    def send(self, request):
+        self.requests.append(request)
+        self.client.wire_bytes += type(request).serialize(request).__len__()
+        future = Future()
+        if self.client.fail_appends:
+            future.set_exception(RuntimeError("append rejected"))
+        else:
+            future.set_result(Mock(error=Mock(code=0)))
+        return future
+
+    def close(self):
+        self.closed = True
+
+
+class FakeWriteClient:
+    """Local stand-in for BigQueryWriteClient"""
+
+    def __init__(self, fail_appends=False):
+        self.fail_appends = fail_appends
+        self.wire_bytes = 0
+        self.streams = []
+        self.finalized = []
+        self.commits = []
+
+    def create_write_stream(self, parent, write_stream):
+        stream = Mock()
+        stream.name = f"{parent}/streams/s{len(self.streams)}"
+        stream.type_ = write_stream.type_
+        self.streams.append(stream)
+        return stream
+
+    def finalize_write_stream(self, name):
+        self.finalized.append(name)
+
+    def batch_commit_write_streams(self, request):
+        self.commits.append(list(request.write_streams))
+        return Mock(stream_errors=[])
+
+
+def make_rows(count):
+    """Build rows the way process_event does for realistic Debezium payloads"""
+    rows = []
+    for i in range(count):
+        event = {
+            'op': 'u',
+            'source': {'table': 'users'},
+            'after': {'id': i, 'email': f'user{i}@example.com', 'name': f'User {i}', 'plan': 'pro', 'score': i * 1.5},
+            'ts_ms': 1640995200000 + i,
+        }
+        rows.append(main.process_event(event))
+    return rows
+
+
+def make_storage_sink(client, stream_type=STREAM_TYPE_COMMITTED):
+    streams = []
+
+    def factory(write_client, template):
+        streams.append(FakeAppendRowsStream(write_client, template))
+        return streams[-1]
+
+    sink = StorageWriteSink(TABLE_PATH, main.get_bigquery_schema(), write_client=client,
+                            stream_type=stream_type, append_stream_factory=factory)
+    return sink, streams[0]
+
+
+class TestRowMessage:
+    """Test protobuf row encoding from the BigQuery schema"""
+
+    def test_message_class_matches_schema(self):
+        """Test that every schema column becomes a proto field"""
+        message_cls = build_row_message_class(main.get_bigquery_schema())
+        field_names = [field.name for field in message_cls.DESCRIPTOR.fields]
+
+        assert field_names == [field.name for field in main.get_bigquery_schema()]
+
+    def test_unsupported_type_rejected(self):
+        """Test that schema types without a proto mapping are rejected"""
+        with pytest.raises(ValueError):
+            build_row_message_class([Mock(name='geo', field_type='GEOGRAPHY')])
+
+    def test_row_round_trip(self):
+        """Test that timestamps and dates use Storage Write API encodings"""
+        sink, _ = make_storage_sink(FakeWriteClient())
+        row = {
+            'event_id': '1',
+            'event_timestamp': datetime(2022, 1, 1),
+            'partition_date': datetime(2022, 1, 2).date(),
+            'event_data': '{"id": 1}',
+        }
+
+        decoded = sink._message_cls.FromString(sink.serialize_rows([row])[0])
+
+        assert decoded.event_id == '1'
+        assert decoded.event_timestamp == 1640995200000000
+        assert decoded.partition_date == 18994
+        assert json.loads(decoded.event_data) == {'id': 1}
+        assert not decoded.HasField('user_email')
+
+
+class TestStorageWriteSink:
+    """Test the Storage Write API sink against a fake write stream"""
+
+    def test_committed_stream_appends_with_offsets(self):
+        """Test that appends carry increasing offsets and the schema template"""
+        client = FakeWriteClient()
+        sink, stream = make_storage_sink(client)
+
+        assert sink.write(make_rows(3)) is True
+        assert sink.write(make_rows(2)) is True
+        assert sink.close() is True
+
+        assert [request.offset for request in stream.requests] == [0, 3]
+        assert stream.template.proto_rows.writer_schema.proto_descriptor.name == 'BiConsumerRow'
+        assert stream.closed
+        assert client.finalized == [client.streams[0].name]
+        assert client.commits == []
+        assert sink.stats['rows_written'] == 5
+
+    def test_pending_stream_commits_on_close(self):
+        """Test that pending streams are batch-committed when the sink closes"""
+        client = FakeWriteClient()
+        sink, _ = make_storage_sink(client, STREAM_TYPE_PENDING)
+
+        sink.write(make_rows(4))
+        assert sink.stats['rows_pending_commit'] == 4
+        assert sink.close() is True
+
+        assert client.commits == [[client.streams[0].name]]
+        assert sink.stats['rows_pending_commit'] == 0
+
+    def test_failed_append_counted(self):
+        """Test that rejected appends are reported as failed rows"""
+        sink, _ = make_storage_sink(FakeWriteClient(fail_appends=True))
+
+        assert sink.write(make_rows(2)) is False
+        assert sink.stats['rows_failed'] == 2
+
+    def test_failed_append_keeps_offset(self):
+        """Test that the append after a failed one reuses its offset on a fresh connection"""
+        client = FakeWriteClient(fail_appends=True)
+        sink, failed_stream = make_storage_sink(client)
+
+        assert sink.write(make_rows(2)) is False
+        client.fail_appends = False
+        assert sink.write(make_rows(3)) is True
+        assert sink.write(make_rows(1)) is True
+
+        assert failed_stream.closed
+        assert [request.offset for request in failed_stream.requests] == [0]
+        assert [request.offset for request in sink._append_stream.requests] == [0, 3]
+        assert sink.stats['rows_written'] == 4
+
+    def test_invalid_stream_type(self):
+        """Test that unknown stream types are rejected"""
+        with pytest.raises(ValueError):
+            StorageWriteSink(TABLE_PATH, main.get_bigquery_schema(), write_client=FakeWriteClient(),
+                             stream_type='BUFFERED')
+
+
+class FakeLoadClient:
+    """Mocked load-job client that captures staged file contents at submit time"""
+
+    def __init__(self, fail=False, fail_submit=False):
+        self.fail = fail
+        self.fail_submit = fail_submit
+        self.loaded = []
+        self.uris = []
+
+    def _job(self):
+        job = Mock(job_id=f"job-{len(self.loaded) + len(self.uris)}")
+        if self.fail:
+            job.result.side_effect = RuntimeError("load job failed")
+        return job
+
+    def load_table_from_file(self, file_obj, destination, job_config=None):
+        if self.fail_submit:
+            raise RuntimeError("load job not submitted")
+        self.loaded.append((os.path.basename(file_obj.name), file_obj.read(), job_config))
+        return self._job()
+
+    def load_table_from_uri(self, uri, destination, job_config=None):
+        self.uris.append(uri)
+        return self._job()
+
+
+def make_load_sink(client, staging_dir, **kwargs):
+    return LoadJobSink(client, 'marketing_events.user_events', main.get_bigquery_schema(),
+                       str(staging_dir), **kwargs)
+
+
+class TestLoadJobSink:
+    """Test the micro-batch load job sink against a local staging directory"""
+
+    def test_rows_staged_as_gzip_ndjson(self, tmp_path):
+        """Test that one load job is submitted per sealed NDJSON file"""
+        client = FakeLoadClient()
+        sink = make_load_sink(client, tmp_path)
+
+        assert sink.write(make_rows(3)) is True
+        assert sink.write(make_rows(2)) is True
+        assert sink.close() is True
+
+        assert len(client.loaded) == 1
+        name, data, job_config = client.loaded[0]
+        lines = [json.loads(line) for line in gzip.decompress(data).splitlines()]
+        assert name.endswith('.ndjson.gz')
+        assert len(lines) == 5
+        assert lines[0]['event_data'] == {'id': 0, 'email': 'user0@example.com', 'name': 'User 0',
+                                          'plan': 'pro', 'score': 0.0}
+        assert lines[0]['event_timestamp'] == '2022-01-01T00:00:00'
+        assert job_config.source_format == 'NEWLINE_DELIMITED_JSON'
+        assert os.listdir(tmp_path) == []
+        assert sink.stats['load_jobs'] == 1
+        assert sink.stats['rows_written'] == 5
+
+    def test_rotation_by_size(self, tmp_path):
+        """Test that files are sealed once they pass the size limit"""
+        client = FakeLoadClient()
+        sink = make_load_sink(client, tmp_path, max_file_bytes=1)
+
+        sink.write(make_rows(2))
+        sink.write(make_rows(2))
+        sink.close()
+
+        assert len(client.loaded) == 2
+        assert sink.stats['files_staged'] == 2
+
+    def test_rotation_by_age(self, tmp_path):
+        """Test that an old staging file is sealed without further writes"""
+        client = FakeLoadClient()
+        sink = make_load_sink(client, tmp_path, max_file_age_s=0.05)
+
+        sink.write(make_rows(1))
+        time.sleep(0.1)
+        sink.maybe_rotate()
+
+        assert len(client.loaded) == 1
+        sink.close()
+
+    def test_failed_job_is_loaded_once_after_restart(self, tmp_path):
+        """Test that a failed load's file is dropped, so only the re-read rows load after a restart"""
+        sink = make_load_sink(FakeLoadClient(fail=True), tmp_path)
+        sink.write(make_rows(2))
+
+        assert sink.close() is False
+        assert sink.stats['rows_failed'] == 2
+        assert os.listdir(tmp_path) == []
+
+        # A crash also leaves files behind: their offsets were never committed either
+        (tmp_path / 'left-by-crash.ndjson.gz').write_bytes(b'')
+        (tmp_path / 'left-by-crash-2.ndjson.gz.open').write_bytes(b'')
+        retry_client = FakeLoadClient()
+        retry_sink = make_load_sink(retry_client, tmp_path)
+        assert retry_sink.stats['files_discarded'] == 2
+        # The rows come back from Kafka and are staged again
+        retry_sink.write(make_rows(2))
+        assert retry_sink.close() is True
+        assert len(retry_client.loaded) == 1
+        assert os.listdir(tmp_path) == []
+
+    def test_failed_submit_fails_close(self, tmp_path):
+        """Test that rows whose load job was never submitted are not reported durable"""
+        sink = make_load_sink(FakeLoadClient(fail_submit=True), tmp_path)
+        sink.write(make_rows(2))
+
+        assert sink.close() is False
+        assert sink.stats['rows_failed'] == 2
+        assert os.listdir(tmp_path) == []
+
+        assert sink.close() is True
+
+    def test_source_uri_prefix_loads_from_bucket(self, tmp_path):
+        """Test that a mounted-bucket staging dir loads from its gs:// URI"""
+        client = FakeLoadClient()
+        sink = make_load_sink(client, tmp_path, source_uri_prefix='gs://staging-bucket/bi/')
+
+        sink.write(make_rows(1))
+        sink.close()
+
+        assert client.loaded == []
+        assert client.uris[0].startswith('gs://staging-bucket/bi/')
+        assert client.uris[0].endswith('.ndjson.gz')
+
+    def test_parquet_staging(self, tmp_path):
+        """Test that Parquet staging writes typed columns"""
+        pq = pytest.importorskip('pyarrow.parquet')
+        client = FakeLoadClient()
+        sink = make_load_sink(client, tmp_path, file_format=LOAD_FORMAT_PARQUET)
+
+        sink.write(make_rows(4))
+        sink.close()
+
+        name, data, job_config = client.loaded[0]
+        staged = tmp_path / name
+        staged.write_bytes(data)
+        table = pq.read_table(staged)
+        assert table.num_rows == 4
+        assert str(table.schema.field('event_timestamp').type) == 'timestamp[us, tz=UTC]'
+        assert job_config.source_format == 'PARQUET'
+
+    def test_invalid_format(self, tmp_path):
+        """Test that unknown staging formats are rejected"""
+        with pytest.raises(ValueError):
+            make_load_sink(FakeLoadClient(), tmp_path, file_format='csv')
+
+
+class TestInsertAllSink:
+    """Test row-level retries and insert IDs for streaming inserts"""
+
+    def _sink(self, client, budget=None, max_attempts=5):
+        policy = RetryPolicy(max_attempts=max_attempts, budget=budget, sleep=lambda _: None)
+        return InsertAllSink(client, 'marketing_events.user_events', retry_policy=policy)
+
+    def _rows(self, count):
+        return [{'event_id': f'codet.prod.users:0:{i}', 'event_data': '{}'} for i in range(count)]
+
+    def test_only_retryable_rows_resent(self):
+        """Test that transient row failures are re-sent alone and content errors are not"""
+        client = Mock()
+        client.insert_rows_json.side_effect = [
+            [
+                {'index': 1, 'errors': [{'reason': 'backendError', 'message': 'try again'}]},
+                {'index': 2, 'errors': [{'reason': 'invalid', 'message': 'no such field: x'}]},
+                {'index': 3, 'errors': [{'reason': 'stopped', 'message': ''}]},
+            ],
+            [],
+        ]
+        rows = self._rows(4)
+        sink = self._sink(client)
+
+        assert sink.write(rows) is True
+
+        retry_call = client.insert_rows_json.call_args_list[1]
+        assert retry_call.args[1] == [rows[1], rows[3]]
+        assert retry_call.kwargs['row_ids'] == ['codet.prod.users:0:1', 'codet.prod.users:0:3']
+        assert sink.stats['rows_written'] == 3
+        assert sink.stats['rows_rejected'] == 1
+        assert sink.stats['rows_retried'] == 2
+        assert sink.stats['requests'] == 2
+        assert sink.stats['rows_failed'] == 0
+
+    def test_row_ids_are_event_ids(self):
+        """Test that every row is sent with its event_id as insertId"""
+        client = Mock()
+        client.insert_rows_json.return_value = []
+        rows = self._rows(3)
+
+        self._sink(client).write(rows)
+
+        client.insert_rows_json.assert_called_once_with(
+            'marketing_events.user_events', rows, row_ids=[row['event_id'] for row in rows]
+        )
+
+    def test_budget_exhaustion_fails_remaining_rows(self):
+        """Test that rows still failing when the invocation budget runs out fail the batch"""
+        client = Mock()
+        client.insert_rows_json.return_value = [{'index': 0, 'errors': [{'reason': 'rateLimitExceeded'}]}]
+        budget = RetryBudget(2)
+
+        sink = self._sink(client, budget=budget)
+        assert sink.write(self._rows(3)) is False
+
+        assert client.insert_rows_json.call_count == 3
+        assert sink.stats['rows_written'] == 2
+        assert sink.stats['rows_failed'] == 1
+        assert budget.stats['retries_denied'] == 1
+
+    def test_request_errors_retried_when_transient(self):
+        """Test that a 503 is retried for the whole batch but a 400 is not"""
+        unavailable = Exception("unavailable")
+        unavailable.code = 503
+        bad_request = Exception("bad request")
+        bad_request.code = 400
+        client = Mock()
+        client.insert_rows_json.side_effect = [unavailable, []]
+
+        assert self._sink(client).write(self._rows(2)) is True
+        assert client.insert_rows_json.call_count == 2
+
+        client.insert_rows_json.reset_mock(side_effect=True)
+        client.insert_rows_json.side_effect = [bad_request]
+        sink = self._sink(client)
+        assert sink.write(self._rows(2)) is False
+        assert client.insert_rows_json.call_count == 1
+        assert sink.stats['rows_failed'] == 2
+
+    def test_unattributed_errors_fail_batch(self):
+        """Test that errors without row indexes fail the whole batch without retrying"""
+        client = Mock()
+        client.insert_rows_json.return_value = [{'errors': ['notFound']}]
+
+        sink = self._sink(client)
+        assert sink.write(self._rows(2)) is False
+        assert client.insert_rows_json.call_count == 1
+        assert sink.stats['rows_failed'] == 2
+
+
+class TestSinkComparison:
+    """Compare both sinks on the same workload"""
+
+    def test_storage_write_sends_fewer_bytes(self):
+        """Test that protobuf batches are smaller on the wire than insertAll JSON"""
+        rows = make_rows(500)
+        batches = [rows[i:i + 50] for i in range(0, len(rows), 50)]
+
+        bq_client = Mock()
+        bq_client.insert_rows_json.return_value = []
+        insert_all = InsertAllSink(bq_client, 'marketing_events.user_events')
+        for batch in batches:
+            insert_all.write(batch)
+
+        write_client = FakeWriteClient()
+        storage_write, _ = make_storage_sink(write_client)
+        for batch in batches:
+            storage_write.write(batch)
+
+        assert storage_write.stats['rows_written'] == insert_all.stats['rows_written'] == len(rows)
+        assert write_client.wire_bytes < insert_all.stats['bytes_sent']
+
+
+class TestSinkSelection:
+    """Test BIGQUERY_SINK backend selection"""
+
+    def test_default_sink_is_insert_all(self):
+        """Test that the legacy streaming insert path stays the default"""
+        assert isinstance(main.create_sink(Mock()), InsertAllSink)
+
+    @patch('main.PROJECT_ID', '')
+    @patch('main.BIGQUERY_SINK', 'storage_write')
+    def test_storage_write_requires_project(self):
+        """Test that the Storage Write sink needs a project for the table path"""
+        with pytest.raises(ValueError):
+            main.create_sink(Mock())
+
+    @patch('main.BIGQUERY_SINK', 'carrier-pigeon')
+    def test_unknown_sink_rejected(self):
+        """Test that unknown sink names fail fast"""
+        with pytest.raises(ValueError):
+            main.create_sink(Mock())
@@ -0,0 +1,156 @@
+"""
+Unit tests for correlation context, JSON formatting and event log rate limiting
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+from unittest.mock import Mock
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import InsertPipeline
+from structured_logging import (
+    TEXT_FORMAT, ContextFormatter, EventLogLimiter, JsonFormatter, correlation_context, get_correlation_id,
+)
+
+
+def record(msg='hello %s', args=('world',), exc_info=None, **extra):
+    entry = logging.LogRecord('bi-consumer', logging.WARNING, __file__, 1, msg, args, exc_info)
+    entry.__dict__.update(extra)
+    return entry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCorrelationContext:
+    """Test correlation IDs carried in a context variable"""
+
+    def test_nested_contexts_restore(self):
+        """Test that leaving a context restores the enclosing ID"""
+        with correlation_context('outer'):
+            with correlation_context() as inner:
+                assert get_correlation_id() == inner != 'outer'
+            assert get_correlation_id() == 'outer'
+        assert get_correlation_id() == '-'
+
+    def test_contexts_are_per_thread(self):
+        """Test that a concurrent invocation in another thread does not see or change our ID"""
+        seen = []
+        entered = threading.Event()
+        release = threading.Event()
+
+        def other_invocation():
+            with correlation_context('other'):
+                entered.set()
+                release.wait(5)
+                seen.append(get_correlation_id())
+
+        with correlation_context('ours'):
+            thread = threading.Thread(target=other_invocation)
+            thread.start()
+            entered.wait(5)
+            assert get_correlation_id() == 'ours'
+            release.set()
+            thread.join()
+        assert seen == ['other']
+
+    def test_insert_workers_inherit_the_id(self):
+        """Test that pipeline worker threads log under the invocation's ID"""
+        seen = []
+        with correlation_context('invocation'):
+            pipeline = InsertPipeline(lambda rows: seen.append(get_correlation_id()) or True, workers=2)
+        pipeline.submit([{'id': 1}])
+        pipeline.drain(timeout=5)
+
+        assert seen == ['invocation']
+
+
+class TestFormatters:
+    """Test the text and JSON formatters"""
+
+    def test_text_format_includes_correlation_id(self):
+        """Test that the text format is filled from the context, with '-' outside an invocation"""
+        formatter = ContextFormatter(TEXT_FORMAT)
+
+        assert formatter.format(record()).endswith('hello world - -')
+        with correlation_context('abc'):
+            assert formatter.format(record()).endswith('hello world - abc')
+
+    def test_json_line(self):
+        """Test that a record becomes one JSON object with severity, extras and exception"""
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            exc_info = sys.exc_info()
+
+        with correlation_context('abc'):
+            line = JsonFormatter().format(record(exc_info=exc_info, topic='codet.prod.users'))
+
+        assert '\n' not in line
+        entry = json.loads(line)
+        assert entry['severity'] == 'WARNING'
+        assert entry['message'] == 'hello world'
+        assert entry['correlation_id'] == 'abc'
+        assert entry['topic'] == 'codet.prod.users'
+        assert 'ValueError: boom' in entry['exception']
+
+
+class TestEventLogLimiter:
+    """Test rate limiting of per-event warnings"""
+
+    def test_burst_then_suppressed_then_reported(self):
+        """Test that a key emits its burst, counts the rest and reports them in the next window"""
+        log = Mock()
+        log.isEnabledFor.return_value = True
+        clock = FakeClock()
+        limiter = EventLogLimiter(log, burst=2, interval_s=10, clock=clock)
+
+        for i in range(5):
+            limiter.warning('invalid', "Event %d is invalid", i)
+        limiter.warning('other', "Different problem")
+        clock.now = 10.0
+        limiter.warning('invalid', "Event %d is invalid", 5)
+
+        messages = [c[0][1] % c[0][2:] for c in log.log.call_args_list]
+        assert messages == ['Event 0 is invalid', 'Event 1 is invalid', 'Different problem',
+                            'Event 5 is invalid (3 similar suppressed)']
+        assert limiter.stats == {'emitted': 4, 'suppressed': 3}
+
+    def test_suppressed_messages_are_not_formatted(self):
+        """Test that arguments of suppressed warnings are never turned into strings"""
+        log = Mock()
+        log.isEnabledFor.return_value = True
+        limiter = EventLogLimiter(log, burst=1, interval_s=60, clock=FakeClock())
+        formatted = []
+
+        class Expensive:
+            def __str__(self):
+                formatted.append(self)
+                return 'expensive'
+
+        limiter.warning('invalid', "Event %s", 'first')
+        limiter.warning('invalid', "Event %s", Expensive())
+
+        assert log.log.call_count == 1
+        assert formatted == []
+
+    def test_disabled_level_is_free(self):
+        """Test that nothing is counted when the level is disabled"""
+        log = Mock()
+        log.isEnabledFor.return_value = False
+        limiter = EventLogLimiter(log, burst=1)
+
+        limiter.warning('invalid', "Event")
+
+        log.log.assert_not_called()
+        assert limiter.stats == {'emitted': 0, 'suppressed': 0}
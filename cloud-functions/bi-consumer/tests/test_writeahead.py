@@ -0,0 +1,111 @@
+"""
+Unit tests for the write-ahead spool of sealed batches
+"""
+
+import os
+import sys
+from datetime import date, datetime
+
+# Add the parent directory to the path so we can import the function modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from writeahead import WriteAheadSpool
+
+USERS = 'codet.prod.users'
+
+
+def rows(*ids):
+    return [{'event_id': f"{USERS}:0:{i}", 'event_timestamp': datetime(2022, 1, 1, 0, 0, i),
+             'partition_date': date(2022, 1, 1), 'event_data': '{}'} for i in ids]
+
+
+def segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.seg'))
+
+
+class TestWriteAheadSpool:
+    """Test spooling, acknowledgement, recovery and replay of batches"""
+
+    def test_acknowledged_spool_is_truncated(self, tmp_path):
+        """Test that nothing stays on disk once every batch is acknowledged"""
+        spool = WriteAheadSpool(str(tmp_path))
+        first = spool.append(rows(0, 1))
+        second = spool.append(rows(2), destination='users_typed')
+
+        assert spool.pending == 2 and spool.total_bytes > 0
+        spool.ack(first)
+        spool.ack(second)
+        spool.ack(second)
+        assert spool.pending == 0 and spool.total_bytes == 0
+        assert [os.path.getsize(tmp_path / name) for name in segments(tmp_path)] == [0]
+        assert spool.stats['batches_acked'] == 2
+
+    def test_unacknowledged_batches_replayed_after_restart(self, tmp_path):
+        """Test that a new spool replays what the last one left, rows and positions intact"""
+        spool = WriteAheadSpool(str(tmp_path))
+        spool.ack(spool.append(rows(0)))
+        spool.append(rows(1, 3), destination='users_typed',
+                     positions=[(USERS, 0, 1), (USERS, 0, 2), (USERS, 0, 3), None])
+        spool.close()
+
+        replayed = []
+        resumed = WriteAheadSpool(str(tmp_path))
+        stats = resumed.replay(lambda batch: replayed.append(batch) or True)
+
+        assert stats == {'batches_replayed': 1, 'rows_replayed': 2, 'batches_kept': 0}
+        assert [batch.rows for batch in replayed] == [rows(1, 3)]
+        assert replayed[0].destination == 'users_typed'
+        assert replayed[0].positions == [(USERS, 0, 1), (USERS, 0, 2), (USERS, 0, 3)]
+        assert resumed.pending == 0
+        assert WriteAheadSpool(str(tmp_path)).pending == 0
+
+    def test_replay_stops_at_first_failure(self, tmp_path):
+        """Test that batches after a failed one are kept for the next replay"""
+        spool = WriteAheadSpool(str(tmp_path))
+        for i in range(3):
+            spool.append(rows(i))
+
+        attempts = []
+        stats = spool.replay(lambda batch: attempts.append(batch.sequence) or batch.sequence == 0)
+
+        assert attempts == [0, 1]
+        assert stats['batches_replayed'] == 1 and stats['batches_kept'] == 2
+        assert WriteAheadSpool(str(tmp_path)).pending == 2
+
+    def test_acknowledged_segments_deleted_oldest_first(self, tmp_path):
+        """Test that fully acknowledged segments go once no older batch needs them"""
+        spool = WriteAheadSpool(str(tmp_path), segment_bytes=1)
+        first, second, third = (spool.append(rows(i)) for i in range(3))
+
+        spool.ack(second)
+        assert len(segments(tmp_path)) == 4
+        spool.ack(first)
+        assert len(segments(tmp_path)) == 3
+        spool.close()
+
+        resumed = WriteAheadSpool(str(tmp_path))
+        assert resumed.pending == 1
+        assert resumed.replay(lambda batch: batch.sequence == third)['batches_replayed'] == 1
+
+    def test_torn_tail_ignored(self, tmp_path):
+        """Test that a record cut short by a crash ends its segment"""
+        spool = WriteAheadSpool(str(tmp_path))
+        spool.append(rows(0))
+        spool.append(rows(1))
+        spool.close()
+        path = tmp_path / segments(tmp_path)[0]
+        os.truncate(path, os.path.getsize(path) - 5)
+
+        resumed = WriteAheadSpool(str(tmp_path))
+
+        assert resumed.pending == 1
+        assert resumed.stats['corrupt_tails'] == 1
+        assert resumed.append(rows(2)) == 1
+
+    def test_full_spool_refuses_batches(self, tmp_path):
+        """Test that batches over the size cap are left unspooled and counted"""
+        spool = WriteAheadSpool(str(tmp_path), max_bytes=400)
+
+        assert spool.append(rows(0)) == 0
+        assert spool.append(rows(1, 2, 3)) is None
+        assert spool.stats['batches_unspooled'] == 1
@@ -0,0 +1,313 @@
+"""
+Write-ahead spool for the BI Consumer
+Keeps sealed batches on local disk until their sink has made them durable
+
+A batch is appended when it is sealed, before it is handed to the sink, and
+acknowledged once the sink reports it durable or failed (a failed batch pins
+its partitions, so it is re-read from Kafka anyway). What stays
+unacknowledged are batches the drain phase abandoned when it ran out of time
+and batches in flight when the instance died. The next run replays those
+first, so they land without waiting for their partitions to be re-read; the
+consumer skips them when Kafka delivers them again.
+
+The spool is append-only: segment files of framed records, each with a
+CRC32, holding either a batch (its rows, destination and the Kafka positions
+it covers) or the acknowledgement of one. Segments are read back through
+mmap where the filesystem allows it; a record cut short by a crash ends its
+segment. The oldest segments are deleted once all their batches are
+acknowledged, and the active one is truncated whenever nothing is
+outstanding, so in steady state the spool holds only the batches in flight.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (topic, partition, offset) of a Kafka record
+Position = Tuple[str, int, int]
+
+_SEGMENT_PREFIX = 'write-ahead-'
+_SEGMENT_SUFFIX = '.seg'
+
+# Record header: magic, kind, sequence, payload length, CRC32 of kind, sequence and payload
+_HEADER = struct.Struct('<4scQII')
+_MAGIC = b'BIW1'
+_BATCH = b'B'
+_ACK = b'A'
+
+# Rows carry datetimes and dates; they are tagged so replayed rows match the originals
+_DATETIME_TAG = '$datetime'
+_DATE_TAG = '$date'
+
+
+class SpooledBatch:
+    """A batch read back from the spool"""
+
+    __slots__ = ('sequence', 'destination', 'rows', 'positions')
+
+    def __init__(self, sequence: int, destination: Optional[str], rows: List[Dict[str, Any]],
+                 positions: List[Position]):
+        self.sequence = sequence
+        self.destination = destination
+        self.rows = rows
+        self.positions = positions
+
+
+class WriteAheadSpool:
+    """Append-only, checksummed spool of sealed batches, split into segments"""
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024,
+                 segment_bytes: int = 8 * 1024 * 1024, fsync: bool = False):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._segment_bytes = segment_bytes
+        self._fsync = fsync
+        self._lock = threading.Lock()
+        # Unacknowledged batch sequences per segment, oldest segment first
+        self._segments: Dict[str, Set[int]] = {}
+        self._sizes: Dict[str, int] = {}
+        self._active: Optional[str] = None
+        self._file: Any = None
+        self._next_sequence = 0
+        self._total_bytes = 0
+        self._full = False
+        self.stats = {'batches_spooled': 0, 'batches_acked': 0, 'batches_unspooled': 0, 'corrupt_tails': 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    @property
+    def pending(self) -> int:
+        """Batches spooled and not yet acknowledged"""
+        with self._lock:
+            return sum(len(sequences) for sequences in self._segments.values())
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def append(self, rows: List[Dict[str, Any]], destination: Optional[str] = None,
+               positions: Iterable[Optional[Position]] = ()) -> Optional[int]:
+        """Spool a sealed batch; returns its sequence, or None when the spool is full"""
+        payload = json.dumps({'destination': destination, 'positions': _ranges(positions), 'rows': rows},
+                             default=_encode, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            if self._max_bytes > 0 and self._total_bytes + _HEADER.size + len(payload) > self._max_bytes:
+                self.stats['batches_unspooled'] += 1
+                if not self._full:
+                    self._full = True
+                    logger.warning(f"Write-ahead spool is full ({self._total_bytes} bytes): "
+                                   f"batches are written without it until it drains")
+                return None
+            self._full = False
+            sequence = self._next_sequence
+            self._next_sequence += 1
+            self._write(_BATCH, sequence, payload)
+            self._segments[self._active].add(sequence)
+            self.stats['batches_spooled'] += 1
+            return sequence
+
+    def ack(self, sequence: int) -> None:
+        """Forget a batch its sink has finished with"""
+        with self._lock:
+            for sequences in self._segments.values():
+                if sequence in sequences:
+                    sequences.discard(sequence)
+                    break
+            else:
+                # Already acknowledged, e.g. replayed while a straggling insert was still running
+                return
+            self.stats['batches_acked'] += 1
+            if not any(self._segments.values()):
+                self._truncate()
+                return
+            self._write(_ACK, sequence, b'')
+            self._drop_acknowledged()
+
+    def replay(self, handler: Callable[[SpooledBatch], bool]) -> Dict[str, int]:
+        """Hand unacknowledged batches to handler oldest first, stopping at the first it cannot write"""
+        with self._lock:
+            outstanding = {path: set(sequences) for path, sequences in self._segments.items() if sequences}
+        stats = {'batches_replayed': 0, 'rows_replayed': 0, 'batches_kept': 0}
+        remaining = sum(len(sequences) for sequences in outstanding.values())
+        for path, sequences in outstanding.items():
+            # Read the whole segment first: acknowledging may truncate it, which a live mapping must not see
+            records = [(sequence, payload) for kind, sequence, payload in self._records(path)
+                       if kind == _BATCH and sequence in sequences]
+            for sequence, payload in records:
+                record = json.loads(payload, object_hook=_decode)
+                batch = SpooledBatch(sequence, record['destination'], record['rows'], _positions(record['positions']))
+                try:
+                    ok = handler(batch)
+                except Exception as e:
+                    logger.error(f"Replay of spooled batch {sequence} failed: {e}", exc_info=True)
+                    ok = False
+                if not ok:
+                    stats['batches_kept'] = remaining
+                    logger.warning(f"Keeping {remaining} spooled batches for the next replay")
+                    return stats
+                self.ack(sequence)
+                remaining -= 1
+                stats['batches_replayed'] += 1
+                stats['rows_replayed'] += len(batch.rows)
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._active = None
+
+    def _write(self, kind: bytes, sequence: int, payload: bytes) -> None:
+        if self._active is None or self._sizes[self._active] >= self._segment_bytes:
+            self._rotate()
+        header = _HEADER.pack(_MAGIC, kind, sequence, len(payload), _checksum(kind, sequence, payload))
+        self._file.write(header + payload)
+        if self._fsync:
+            os.fsync(self._file.fileno())
+        size = len(header) + len(payload)
+        self._sizes[self._active] += size
+        self._total_bytes += size
+
+    def _rotate(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._active = os.path.join(self._directory,
+                                    f"{_SEGMENT_PREFIX}{time.time_ns()}-{uuid.uuid4().hex[:8]}{_SEGMENT_SUFFIX}")
+        # Unbuffered: a record is in the page cache as soon as write() returns, so it survives a crash
+        self._file = open(self._active, 'ab', buffering=0)
+        self._segments[self._active] = set()
+        self._sizes[self._active] = 0
+        self._drop_acknowledged()
+
+    def _truncate(self) -> None:
+        # Nothing outstanding: keep the active segment, emptied, and delete the rest
+        for path in list(self._segments):
+            if path != self._active:
+                self._remove(path)
+        if self._active is not None:
+            self._file.truncate(0)
+            self._total_bytes -= self._sizes[self._active]
+            self._sizes[self._active] = 0
+
+    def _drop_acknowledged(self) -> None:
+        # Only a prefix is deleted, so acknowledgements stay on disk while older batches do
+        for path in list(self._segments):
+            if path == self._active or self._segments[path]:
+                return
+            self._remove(path)
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self._total_bytes -= self._sizes.pop(path)
+        del self._segments[path]
+
+    def _recover(self) -> None:
+        # Batches left by a previous instance (or a previous spool of this one) are pending until replayed
+        paths = sorted(os.path.join(self._directory, name) for name in os.listdir(self._directory)
+                       if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX))
+        for path in paths:
+            self._segments[path] = set()
+            self._sizes[path] = os.path.getsize(path)
+            self._total_bytes += self._sizes[path]
+            for kind, sequence, _ in self._records(path):
+                self._next_sequence = max(self._next_sequence, sequence + 1)
+                if kind == _BATCH:
+                    self._segments[path].add(sequence)
+                    continue
+                for sequences in self._segments.values():
+                    sequences.discard(sequence)
+        self._drop_acknowledged()
+        if self._segments:
+            logger.info(f"Write-ahead spool holds {sum(len(s) for s in self._segments.values())} "
+                        f"unacknowledged batches in {len(self._segments)} segments")
+
+    def _records(self, path: str) -> Iterator[Tuple[bytes, int, bytes]]:
+        data = _map(path)
+        try:
+            position = 0
+            while position + _HEADER.size <= len(data):
+                magic, kind, sequence, length, checksum = _HEADER.unpack_from(data, position)
+                end = position + _HEADER.size + length
+                if magic != _MAGIC or end > len(data):
+                    break
+                payload = data[position + _HEADER.size:end]
+                if _checksum(kind, sequence, payload) != checksum:
+                    break
+                yield kind, sequence, payload
+                position = end
+            if position < len(data):
+                self.stats['corrupt_tails'] += 1
+                logger.warning(f"Ignoring torn or corrupt records in {os.path.basename(path)} from byte {position}")
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+def _map(path: str) -> Any:
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Some FUSE mounts cannot be mapped
+            return f.read()
+
+
+def _checksum(kind: bytes, sequence: int, payload: bytes) -> int:
+    return zlib.crc32(payload, zlib.crc32(kind + sequence.to_bytes(8, 'little')))
+
+
+def _ranges(positions: Iterable[Optional[Position]]) -> List[Any]:
+    # [topic, partition, [[first, last], ...]] per partition; a batch's offsets are mostly consecutive
+    offsets: Dict[Tuple[str, int], List[int]] = {}
+    for position in positions:
+        if position is not None:
+            offsets.setdefault((position[0], position[1]), []).append(position[2])
+    ranges = []
+    for (topic, partition), values in offsets.items():
+        spans: List[List[int]] = []
+        for offset in sorted(values):
+            if spans and offset <= spans[-1][1] + 1:
+                spans[-1][1] = max(spans[-1][1], offset)
+            else:
+                spans.append([offset, offset])
+        ranges.append([topic, partition, spans])
+    return ranges
+
+
+def _positions(ranges: List[Any]) -> List[Position]:
+    return [(topic, partition, offset) for topic, partition, spans in ranges
+            for first, last in spans for offset in range(first, last + 1)]
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {_DATETIME_TAG: value.isoformat()}
+    if isinstance(value, date):
+        return {_DATE_TAG: value.isoformat()}
+    return str(value)
+
+
+def _decode(record: Dict[str, Any]) -> Any:
+    if len(record) == 1:
+        if _DATETIME_TAG in record:
+            return datetime.fromisoformat(record[_DATETIME_TAG])
+        if _DATE_TAG in record:
+            return date.fromisoformat(record[_DATE_TAG])
+    return record